@@ -0,0 +1,125 @@
+"""
+Benchmark for concurrent bot updates with the sync and the async database manager
+
+Each simulated update reads the user's state and active account and writes the
+state back, the pattern every handler step follows. Updates run concurrently on
+one event loop, as in the bot. With the sync DatabaseManager every query blocks
+the loop; with AsyncDatabaseManager the loop keeps serving other updates while
+a query waits on the database.
+
+On SQLite a per-statement delay is injected in the thread that runs the
+statement (the caller for the sync driver, the aiosqlite worker for the async
+one) to stand in for network round trips to a database server.
+
+Usage:
+    python benchmarks/bench_async_db.py [updates] [concurrency] [delay_ms]
+    DATABASE_URL=postgresql://... python benchmarks/bench_async_db.py  # PostgreSQL, real latency
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+from sqlalchemy import event
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.db_manager import DatabaseManager
+from database.async_db_manager import AsyncDatabaseManager
+
+
+def inject_delay(db: DatabaseManager, async_db: AsyncDatabaseManager, delay: float):
+    """Sleep for delay seconds before every SQLite statement, in the thread that executes it"""
+    def trace(statement):
+        time.sleep(delay)
+
+    @event.listens_for(db.engine, 'connect')
+    def on_sync_connect(dbapi_connection, connection_record):
+        dbapi_connection.set_trace_callback(trace)
+
+    @event.listens_for(async_db.engine.sync_engine, 'connect')
+    def on_async_connect(dbapi_connection, connection_record):
+        dbapi_connection.run_async(lambda connection: connection.set_trace_callback(trace))
+
+    # Connections opened before the listeners were added would run without the delay
+    db.engine.dispose()
+
+
+def create_users(db: DatabaseManager, count: int):
+    users = []
+    for index in range(count):
+        user_id = f"bench_{uuid.uuid4().hex[:12]}"
+        account_number = str(uuid.uuid4().int)[:16]
+        db.get_or_create_user(user_id)
+        db._insert_account(user_id, account_number, "hash", "hash")
+        users.append(user_id)
+    return users
+
+
+async def sync_update(db: DatabaseManager, user_id: str):
+    """One handler step on the sync manager (blocks the event loop)"""
+    db.get_user_state(user_id)
+    db.get_active_account(user_id)
+    db.update_user_state(user_id, "state")
+
+
+async def async_update(db: AsyncDatabaseManager, user_id: str):
+    """One handler step on the async manager"""
+    await db.get_user_state(user_id)
+    await db.get_active_account(user_id)
+    await db.update_user_state(user_id, "state")
+
+
+async def run(label, func, db, users, updates, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    errors = 0
+
+    async def handle(index):
+        nonlocal errors
+        async with semaphore:
+            try:
+                await func(db, users[index % len(users)])
+            except Exception:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(handle(index) for index in range(updates)))
+    elapsed = time.perf_counter() - start
+    print(f"{label:<6} updates={updates:<6} concurrency={concurrency:<4} total={elapsed:7.2f}s  "
+          f"updates/s={updates / elapsed:9.1f}  errors={errors}")
+
+
+async def bench(db: DatabaseManager, async_db: AsyncDatabaseManager, updates: int, concurrency: int):
+    users = create_users(db, concurrency)
+    await run("sync", sync_update, db, users, updates, concurrency)
+    await run("async", async_update, async_db, users, updates, concurrency)
+    await async_db.dispose()
+
+
+def main():
+    updates = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    delay_ms = float(sys.argv[3]) if len(sys.argv) > 3 else 2.0
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_url = os.getenv('DATABASE_URL', '')
+        if not db_url.startswith('postgresql://'):
+            db_url = f"sqlite:///{os.path.join(tmp_dir, 'bench_async_db.db')}"
+        db = DatabaseManager(db_url=db_url)
+        async_db = AsyncDatabaseManager(db)
+        backend = db.engine.url.get_backend_name()
+        if backend == 'sqlite':
+            inject_delay(db, async_db, delay_ms / 1000)
+            print(f"Database: {backend} (+{delay_ms:g} ms per statement)")
+        else:
+            print(f"Database: {backend}")
+
+        asyncio.run(bench(db, async_db, updates, concurrency))
+        db.engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Benchmark for the admin dashboard statistics
+
+Compares the old calculate_stats (eleven count() queries, every Account row
+loaded to sum balances, two extra sessions for the admin account) with the
+single aggregate DatabaseManager.get_dashboard_stats, and with the cached
+calculate_stats serving concurrent /api/stats polls.
+
+The accounts and transactions are bulk inserted, so seeding a million
+accounts takes well under a minute on SQLite.
+
+Usage:
+    python benchmarks/bench_dashboard_stats.py [accounts] [polls] [threads]
+    python benchmarks/bench_dashboard_stats.py 1000000
+    DATABASE_URL=postgresql://... python benchmarks/bench_dashboard_stats.py  # PostgreSQL
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, insert
+
+from database.db_manager import DatabaseManager
+from database.models import User, Account, Transaction, Lock
+from web.utils import calculate_stats, stats_cache
+
+
+def seed(db: DatabaseManager, accounts: int, batch: int = 50_000):
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    with db.engine.begin() as conn:
+        for start in range(0, accounts, batch):
+            count = min(batch, accounts - start)
+            conn.execute(insert(User), [
+                {'user_id': f"u{index}", 'username': None, 'is_admin': index == 0, 'created_at': now}
+                for index in range(start, start + count)
+            ])
+            conn.execute(insert(Account), [
+                {'account_number': f"{index:016d}", 'user_id': f"u{index}", 'password_hash': "hash",
+                 'balance': rng.randint(0, 100_000) / 100, 'is_active': index % 10 != 0, 'created_at': now}
+                for index in range(start, start + count)
+            ])
+            conn.execute(insert(Transaction), [
+                {'from_account': f"{index:016d}", 'to_account': None, 'amount': 1, 'fee': 0.01,
+                 'transaction_type': rng.choice(('buy', 'sell', 'send')),
+                 'status': rng.choice(('pending', 'success', 'success')),
+                 'created_at': now - timedelta(hours=rng.randint(0, 72))}
+                for index in range(start, start + count)
+            ])
+        conn.execute(insert(Lock), [
+            {'user_id': f"u{index}", 'locked_until': now + timedelta(minutes=10), 'reason': "bench"}
+            for index in range(1, min(accounts, 1000))
+        ])
+
+
+def legacy_stats(db: DatabaseManager):
+    """The body of the old web.utils.calculate_stats"""
+    session = db.get_session()
+    try:
+        stats = {
+            'total_users': session.query(User).count(),
+            'total_accounts': session.query(Account).count(),
+            'active_accounts': session.query(Account).filter(Account.is_active == True).count(),
+            'total_transactions': session.query(Transaction).count(),
+            'pending_transactions': session.query(Transaction).filter(Transaction.status == 'pending').count(),
+            'success_transactions': session.query(Transaction).filter(Transaction.status == 'success').count(),
+            'total_balance': sum(float(acc.balance or 0) for acc in session.query(Account).all()),
+            'buy_count': session.query(Transaction).filter(Transaction.transaction_type == 'buy').count(),
+            'sell_count': session.query(Transaction).filter(Transaction.transaction_type == 'sell').count(),
+            'send_count': session.query(Transaction).filter(Transaction.transaction_type == 'send').count(),
+            'recent_transactions': session.query(Transaction).filter(
+                Transaction.created_at >= datetime.utcnow() - timedelta(days=1)).count(),
+            'locked_users': session.query(Lock).filter(Lock.locked_until > datetime.utcnow()).count(),
+        }
+        admin_account_number = db.get_admin_account_number()
+        admin_account = session.query(Account).filter(Account.account_number == admin_account_number).first()
+        stats['admin_balance'] = float(admin_account.balance) if admin_account else 0.0
+        stats['total_fees'] = float(session.query(func.sum(Transaction.fee)).filter(
+            Transaction.status == 'success').scalar() or 0)
+        return stats
+    finally:
+        session.close()
+
+
+def timed(label, func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"{label:<10} {elapsed * 1000:10.1f} ms per computation")
+    return result
+
+
+def main():
+    accounts = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    polls = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    threads = int(sys.argv[3]) if len(sys.argv) > 3 else 16
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_url = os.getenv('DATABASE_URL', '')
+        if not db_url.startswith('postgresql://'):
+            db_url = f"sqlite:///{os.path.join(tmp_dir, 'bench_dashboard_stats.db')}"
+        db = DatabaseManager(db_url=db_url, role='admin')
+        print(f"Database: {db.engine.url.get_backend_name()}")
+
+        start = time.perf_counter()
+        seed(db, accounts)
+        print(f"Seeded {accounts} users, accounts and transactions in {time.perf_counter() - start:.1f}s")
+
+        legacy = timed("legacy", lambda: legacy_stats(db), 3)
+        aggregate = timed("aggregate", db.get_dashboard_stats, 3)
+        for key, value in legacy.items():
+            assert abs(float(value) - float(aggregate[key])) < 0.01, f"{key}: {value} != {aggregate[key]}"
+
+        # Concurrent admins polling /api/stats
+        stats_cache.invalidate()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(lambda _: calculate_stats(db), range(polls)))
+        elapsed = time.perf_counter() - start
+        metrics = stats_cache.snapshot()
+        print(f"cached     {polls} polls from {threads} threads in {elapsed * 1000:.1f} ms, "
+              f"{metrics['computations']} computation(s), {metrics['waits']} waited")
+        db.engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark for the PDF font loading and embedding
+
+Compares the old font setup (every TrueType font found parsed and
+registered when utils.pdf_generator is imported, embedded with reportlab's
+defaults: all of ASCII plus the naming table in every subset) with the
+current one (the bundled font registered on the first PDF, only the used
+glyphs embedded, subsets cached across documents). The old setup only
+found fonts on Windows and fell back to Helvetica elsewhere, so it is
+reproduced here with the bundled font; Helvetica is reported for size only,
+since it cannot draw Persian.
+
+Each setup runs in a fresh interpreter so import time is measured cold;
+the median of RUNS interpreters is shown.
+
+Usage:
+    python benchmarks/bench_pdf_fonts.py [statements] [transactions]
+    python benchmarks/bench_pdf_fonts.py 200 10
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Add parent directory to path
+sys.path.insert(0, ROOT)
+
+MODES = ('helvetica', 'legacy', 'current')
+RUNS = 5
+
+
+def run_mode(mode: str, statements: int, transactions: int) -> dict:
+    """Import utils.pdf_generator the mode's way and render the statements; runs in the child process"""
+    # Shared by every mode; not part of what is measured
+    import config  # noqa: F401
+    import database.models  # noqa: F401
+    import reportlab.platypus  # noqa: F401
+    import reportlab.lib.styles  # noqa: F401
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+
+    started = time.perf_counter()
+    from utils import pdf_generator
+    if mode == 'legacy':
+        # What the old module did on import when it found its fonts
+        pdfmetrics.registerFont(TTFont(pdf_generator.PERSIAN_FONT, pdf_generator.BUNDLED_FONT_PATH))
+        pdfmetrics.registerFont(TTFont(pdf_generator.PERSIAN_FONT_BOLD, pdf_generator.BUNDLED_FONT_BOLD_PATH))
+        pdfmetrics.registerFontFamily(pdf_generator.PERSIAN_FONT, bold=pdf_generator.PERSIAN_FONT_BOLD)
+    elif mode == 'helvetica':
+        # The old fallback when no font was found
+        pdfmetrics.registerFont(pdfmetrics.Font(pdf_generator.PERSIAN_FONT, 'Helvetica', 'WinAnsiEncoding'))
+        pdfmetrics.registerFont(pdfmetrics.Font(pdf_generator.PERSIAN_FONT_BOLD, 'Helvetica-Bold', 'WinAnsiEncoding'))
+    if mode != 'current':
+        pdf_generator._fonts_registered = True
+    import_seconds = time.perf_counter() - started
+
+    sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+    from bench_pdf_generator import make_statements
+    data = make_statements(statements, transactions)
+
+    timings, sizes = [], []
+    for account_number, rows in data:
+        started = time.perf_counter()
+        pdf = pdf_generator.generate_transactions_pdf(rows, account_number).getvalue()
+        timings.append(time.perf_counter() - started)
+        sizes.append(len(pdf))
+
+    result = {
+        'import_ms': import_seconds * 1000,
+        'first_pdf_ms': timings[0] * 1000,
+        'avg_pdf_ms': sum(timings[1:]) / max(1, len(timings) - 1) * 1000,
+        'avg_kb': sum(sizes) / len(sizes) / 1024,
+    }
+    if mode == 'current':
+        info = pdfmetrics.getFont(pdf_generator.PERSIAN_FONT).subset_cache_info()
+        result['subset_cache'] = f"{info.hits} hits, {info.misses} misses"
+    return result
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        print(json.dumps(run_mode(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))))
+        return
+
+    statements = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    transactions = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    print(f"{statements} statements of {transactions} transactions")
+    print(f"{'':10} {'import':>10} {'first PDF':>11} {'per PDF':>10} {'size':>10}")
+    for mode in MODES:
+        results = []
+        for _ in range(RUNS):
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', mode,
+                                     str(statements), str(transactions)],
+                                    check=True, capture_output=True, text=True, cwd=ROOT).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+        result = {key: statistics.median(r[key] for r in results) if key != 'subset_cache' else results[0][key]
+                  for key in results[0]}
+        print(f"{mode:10} {result['import_ms']:8.1f}ms {result['first_pdf_ms']:9.1f}ms "
+              f"{result['avg_pdf_ms']:8.1f}ms {result['avg_kb']:7.1f} KB  {result.get('subset_cache', '')}")
+
+if __name__ == '__main__':
+    main()
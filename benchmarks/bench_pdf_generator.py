@@ -0,0 +1,162 @@
+"""
+Benchmark for the statement PDF generator
+
+Compares the old generate_transactions_pdf (getSampleStyleSheet, every
+ParagraphStyle, the TableStyle and the header row built per statement, and
+arabic_reshaper/bidi run on every label and number of every statement) with
+the current one, which shapes each distinct string once and reuses the
+module-level styles and header.
+
+Usage:
+    python benchmarks/bench_pdf_generator.py [statements] [transactions]
+    python benchmarks/bench_pdf_generator.py 1000 10
+"""
+import random
+import re
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import BytesIO
+from types import SimpleNamespace
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import arabic_reshaper
+import bidi.algorithm as bidi_algorithm
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER, TA_RIGHT
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import cm
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+
+from utils import pdf_generator
+from utils.pdf_generator import (
+    PERSIAN_FONT, PERSIAN_FONT_BOLD, convert_to_jalali, convert_to_jalali_short,
+    generate_transactions_pdf, register_fonts, reshape_persian_text
+)
+
+
+def legacy_reshape(text: str) -> str:
+    """The old reshape_persian_text"""
+    try:
+        html_pattern = r'<[^>]+>'
+        tags = re.findall(html_pattern, text)
+        if tags:
+            parts = re.split(html_pattern, text)
+            result_parts = []
+            tag_index = 0
+            for part in parts:
+                if part:
+                    result_parts.append(bidi_algorithm.get_display(arabic_reshaper.reshape(part)))
+                if tag_index < len(tags):
+                    result_parts.append(tags[tag_index])
+                    tag_index += 1
+            return ''.join(result_parts)
+        return bidi_algorithm.get_display(arabic_reshaper.reshape(text))
+    except Exception:
+        return text
+
+
+def legacy_generate(transactions, account_number: str) -> BytesIO:
+    """The body of the old generate_transactions_pdf"""
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=2*cm, leftMargin=2*cm, topMargin=2*cm, bottomMargin=2*cm)
+    elements = []
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle('CustomTitle', parent=styles['Heading1'], fontName=PERSIAN_FONT_BOLD, fontSize=18,
+                                 textColor=colors.HexColor('#1a1a1a'), spaceAfter=30, alignment=TA_CENTER)
+    normal_style = ParagraphStyle('CustomNormal', parent=styles['Normal'], fontName=PERSIAN_FONT, fontSize=10,
+                                  alignment=TA_RIGHT)
+    elements.append(Paragraph(legacy_reshape("۱۰ گردش آخر حساب"), title_style))
+    elements.append(Spacer(1, 0.5*cm))
+    elements.append(Paragraph(legacy_reshape(f"شماره حساب: <b>{account_number}</b>"), normal_style))
+    elements.append(Spacer(1, 0.3*cm))
+    elements.append(Paragraph(legacy_reshape(f"تاریخ گزارش: {convert_to_jalali(datetime.now())}"), normal_style))
+    elements.append(Spacer(1, 0.5*cm))
+    table_cell_style = ParagraphStyle('TableCell', parent=styles['Normal'], fontName=PERSIAN_FONT, fontSize=9,
+                                      alignment=TA_CENTER)
+    table_header_style = ParagraphStyle('TableHeader', parent=styles['Normal'], fontName=PERSIAN_FONT_BOLD,
+                                        fontSize=10, alignment=TA_CENTER, textColor=colors.whitesmoke)
+    table_data = [[Paragraph(legacy_reshape(label), table_header_style)
+                   for label in ('نوع', 'از حساب', 'به حساب', 'مبلغ', 'کارمزد', 'وضعیت', 'تاریخ')]]
+    for trans in transactions:
+        trans_type = {'buy': 'خرید', 'send': 'ارسال', 'sell': 'فروش'}.get(trans.transaction_type,
+                                                                         trans.transaction_type)
+        status = {'pending': 'در انتظار', 'success': 'موفق', 'failed': 'ناموفق'}.get(trans.status, trans.status)
+        fee_value = float(trans.fee) if trans.fee is not None else 0.0
+        table_data.append([
+            Paragraph(legacy_reshape(cell), table_cell_style)
+            for cell in (trans_type, str(trans.from_account or '-'), str(trans.to_account or '-'),
+                         f"{float(trans.amount):,.2f}", f"{fee_value:,.2f}", status,
+                         convert_to_jalali_short(trans.created_at))
+        ])
+    table = Table(table_data, colWidths=[2*cm, 3*cm, 3*cm, 2.5*cm, 2*cm, 2*cm, 3*cm])
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4a90e2')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), PERSIAN_FONT_BOLD),
+        ('FONTSIZE', (0, 0), (-1, 0), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+        ('FONTNAME', (0, 1), (-1, -1), PERSIAN_FONT),
+        ('FONTSIZE', (0, 1), (-1, -1), 9),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey]),
+    ]))
+    elements.append(table)
+    doc.build(elements)
+    buffer.seek(0)
+    return buffer
+
+
+def make_statements(statements: int, transactions: int):
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    return [(f"{index:016d}", [
+        SimpleNamespace(transaction_type=rng.choice(('buy', 'sell', 'send')),
+                        status=rng.choice(('pending', 'success', 'failed')),
+                        from_account=f"{rng.randint(0, 10**16):016d}", to_account=rng.choice((None, f"{index:016d}")),
+                        amount=Decimal(rng.randint(1, 10**7)) / 100, fee=Decimal(rng.randint(0, 10**4)) / 100,
+                        created_at=now - timedelta(minutes=rng.randint(0, 10**5)))
+        for _ in range(transactions)
+    ]) for index in range(statements)]
+
+
+def timed(label, generate, statements):
+    start = time.perf_counter()
+    size = 0
+    for account_number, transactions in statements:
+        size += len(generate(transactions, account_number).getvalue())
+    elapsed = time.perf_counter() - start
+    print(f"{label:<8} {elapsed:8.2f}s  {elapsed / len(statements) * 1000:7.2f} ms per statement  "
+          f"{size / len(statements) / 1024:6.1f} KB per statement")
+    return elapsed
+
+
+def main():
+    statements = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    transactions = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    data = make_statements(statements, transactions)
+
+    # Same shaped text as before
+    samples = {"شماره حساب: <b>1234</b>", "تاریخ گزارش: 1403/01/01 10:00:00", "1,234.50", "-", "در انتظار"}
+    for text in samples:
+        assert reshape_persian_text(text) == legacy_reshape(text), text
+
+    # Loaded up front so neither side pays for parsing the font
+    register_fonts()
+    print(f"{statements} statements of {transactions} transactions, font {PERSIAN_FONT}")
+    legacy = timed("legacy", legacy_generate, data)
+    pdf_generator._shape_text.cache_clear()
+    current = timed("current", generate_transactions_pdf, data)
+    print(f"speedup  {legacy / current:8.2f}x  shaping cache {pdf_generator._shape_text.cache_info()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Microbenchmark for encrypted user state round trips
+
+Compares the old behaviour (PBKDF2 key derivation and a new Fernet object on
+every encrypt/decrypt call) with the cached KeyManager cipher.
+
+Usage:
+    python benchmarks/bench_state_encryption.py [rounds]
+"""
+import json
+import os
+import sys
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import Fernet
+import config
+from utils.encryption import derive_encryption_key, encrypt_state, decrypt_state, get_key_manager
+
+
+SAMPLE_STATE = {
+    'action': 'send_pers',
+    'step': 'enter_password',
+    'destination': '1234567890123456',
+    'amount': 125.5,
+    'fee': 0.13,
+    'last_bot_message_id': 4242
+}
+
+
+def legacy_round_trip(state: dict) -> dict:
+    """State round trip as it was done before the key manager"""
+    f = Fernet(derive_encryption_key(config.ENCRYPTION_KEY))
+    token = f.encrypt(json.dumps(state).encode()).decode()
+    f = Fernet(derive_encryption_key(config.ENCRYPTION_KEY))
+    return json.loads(f.decrypt(token.encode()).decode())
+
+
+def cached_round_trip(state: dict) -> dict:
+    return decrypt_state(encrypt_state(state))
+
+
+def run(label, func, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func(SAMPLE_STATE)
+    elapsed = time.perf_counter() - start
+    per_trip_ms = elapsed / rounds * 1000
+    print(f"{label:<10} rounds={rounds:<6} total={elapsed:8.3f}s  per round trip={per_trip_ms:9.4f} ms")
+    return per_trip_ms
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+
+    start = time.perf_counter()
+    get_key_manager()
+    print(f"Key derivation at startup: {(time.perf_counter() - start) * 1000:.2f} ms")
+
+    legacy_ms = run("legacy", legacy_round_trip, rounds)
+    cached_ms = run("cached", cached_round_trip, rounds * 100)
+    print(f"Speedup: {legacy_ms / cached_ms:,.0f}x")
+    print(f"Key manager timings: {get_key_manager().get_timings()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark for PERS sends under parallel load
+
+Compares the old read-modify-verify sequence used by SendHandler (three
+separate balance commits, a pending transaction, re-reads and a status update)
+with the atomic DatabaseManager.transfer on a temporary SQLite database.
+
+Usage:
+    python benchmarks/bench_transfer.py [sends] [threads]
+    DATABASE_URL=postgresql://... python benchmarks/bench_transfer.py  # PostgreSQL
+"""
+import os
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.db_manager import DatabaseManager
+
+
+def create_accounts(db: DatabaseManager, senders: int):
+    accounts = []
+    for index in range(senders + 2):
+        user_id = f"bench_{uuid.uuid4().hex[:12]}"
+        account_number = str(uuid.uuid4().int)[:16]
+        db.get_or_create_user(user_id)
+        db._insert_account(user_id, account_number, "hash", "hash")
+        db.set_account_balance(account_number, 1_000_000)
+        accounts.append(account_number)
+    return accounts[:-2], accounts[-2], accounts[-1]
+
+
+def legacy_send(db: DatabaseManager, from_account: str, to_account: str, fee_account: str, amount: float, fee: float):
+    """One attempt of the old SendHandler._process_transaction_with_retry loop body"""
+    before = [db.get_account_balance(a) for a in (from_account, to_account, fee_account)]
+    db.update_account_balance(from_account, -(amount + fee))
+    db.update_account_balance(to_account, amount)
+    db.update_account_balance(fee_account, fee)
+    transaction = db.create_transaction(from_account, to_account, amount, fee, 'send')
+    after = [db.get_account_balance(a) for a in (from_account, to_account, fee_account)]
+    expected = [before[0] - amount - fee, before[1] + amount, before[2] + fee]
+    ok = all(abs(a - e) < 0.01 for a, e in zip(after, expected))
+    db.update_transaction_status(transaction.id, 'success' if ok else 'failed')
+    return ok
+
+
+def atomic_send(db: DatabaseManager, from_account: str, to_account: str, fee_account: str, amount: float, fee: float):
+    return db.transfer(from_account, to_account, fee_account, amount, fee, uuid.uuid4().hex) is not None
+
+
+def run(label, func, db, senders, receiver, fee_account, sends, threads):
+    def send(index):
+        return func(db, senders[index % len(senders)], receiver, fee_account, 1.0, 0.01)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(send, range(sends)))
+    elapsed = time.perf_counter() - start
+    mismatches = results.count(False)
+    print(f"{label:<8} sends={sends:<6} threads={threads:<3} total={elapsed:7.2f}s  "
+          f"sends/s={sends / elapsed:9.1f}  verify mismatches={mismatches}")
+
+
+def main():
+    sends = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_url = os.getenv('DATABASE_URL', '')
+        if not db_url.startswith('postgresql://'):
+            db_url = f"sqlite:///{os.path.join(tmp_dir, 'bench_transfer.db')}"
+        db = DatabaseManager(db_url=db_url)
+        print(f"Database: {db.engine.url.get_backend_name()}")
+
+        senders, receiver, fee_account = create_accounts(db, threads)
+        run("legacy", legacy_send, db, senders, receiver, fee_account, sends, threads)
+        run("atomic", atomic_send, db, senders, receiver, fee_account, sends, threads)
+        db.engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,25 @@
+import asyncio
+import functools
 import logging
 import sys
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
 from database.db_manager import DatabaseManager
+from database.async_db_manager import AsyncDatabaseManager
+from database.state_cache import WRITE_BEHIND
+from database.update_context import bind_update_context
+from database.unit_of_work import track_queries
+from utils.concurrency import PerUserUpdateProcessor
 from utils.lock_manager import LockManager
-from utils.encryption import decrypt_state, encrypt_state
-from utils.message_manager import send_and_save_message, edit_and_save_message
+from utils.encryption import get_key_manager
+from utils.hashing_service import get_hashing_service
+from utils.pdf_service import get_pdf_service
+from utils.statement_cache import get_statement_cache
+from utils.statement_export import get_statement_export_service
+from utils.message_manager import send_and_save_message, edit_and_save_message, get_message_deleter
+from utils.outbox import OutboxDispatcher
+from utils.rate_limiter import TelegramRateLimiter
+from utils.scheduler import TaskScheduler
 from handlers.start import StartHandler
 from handlers.account import AccountHandler
 from handlers.balance import BalanceHandler
@@ -35,9 +49,44 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+def track_update_queries(callback):
+    """Count the queries, commits and sessions one update uses and log them"""
+    @functools.wraps(callback)
+    async def wrapper(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        with track_queries() as stats:
+            try:
+                return await callback(self, update, context)
+            finally:
+                logger.debug(f"Update {update.update_id} ({callback.__name__}): {stats.queries} queries, "
+                             f"{stats.commits} commits, {stats.sessions} sessions")
+    return wrapper
+
+
+def coalesce_state_writes(callback):
+    """Write the conversation state changes of one update once, when the update is handled"""
+    @functools.wraps(callback)
+    async def wrapper(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        async with self.db.state_cache.coalesce_writes():
+            return await callback(self, update, context)
+    return wrapper
+
+
+def load_update_context(callback):
+    """Load the user's lock, agreement, state and active account with one query before routing"""
+    @functools.wraps(callback)
+    async def wrapper(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        update_context = await self.db.load_update_context(str(update.effective_user.id))
+        with bind_update_context(update_context):
+            return await callback(self, update, context)
+    return wrapper
+
+
 class BalanceBot:
     def __init__(self):
-        self.db = DatabaseManager()
+        # Derive state encryption keys once at startup instead of on first message
+        get_key_manager()
+        # Sync manager creates and migrates the schema; the bot queries through the async one
+        self.db = AsyncDatabaseManager(DatabaseManager())
         self.lock_manager = LockManager(self.db)
         
         # Initialize handlers
@@ -49,11 +98,24 @@ class BalanceBot:
         self.sell_handler = SellHandler(self.db, self.lock_manager)
         self.transactions_handler = TransactionsHandler(self.db, self.lock_manager)
         self.contact_handler = ContactHandler(self.db, self.lock_manager)
+        self._state_flusher = None
+        self.outbox = None
+        self._outbox_task = None
+        self.scheduler = None
+        self._scheduler_task = None
+        self._rate_limiter_reporter = None
+        self.rate_limiter = TelegramRateLimiter() if config.RATE_LIMIT_ENABLED else None
     
+    @track_update_queries
+    @coalesce_state_writes
+    @load_update_context
     async def handle_start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /start command"""
         await self.start_handler.handle_start(update, context)
     
+    @track_update_queries
+    @coalesce_state_writes
+    @load_update_context
     async def handle_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle callback queries"""
         query = update.callback_query
@@ -61,7 +123,7 @@ class BalanceBot:
         user_id = str(update.effective_user.id)
         
         # Check if user is locked
-        is_locked, lock_message = self.lock_manager.check_lock(user_id)
+        is_locked, lock_message = await self.lock_manager.check_lock(user_id)
         if is_locked:
             await query.answer()
             await edit_and_save_message(update, context, lock_message, self.db, user_id)
@@ -71,7 +133,7 @@ class BalanceBot:
         
         # Check agreement acceptance (except for agreement-related callbacks)
         if callback_data not in ["accept_agreement", "decline_agreement"]:
-            if not self.db.has_accepted_agreement(user_id):
+            if not await self.db.has_accepted_agreement(user_id):
                 await query.answer()
                 await self.start_handler.show_agreement(update, context)
                 return
@@ -105,23 +167,30 @@ class BalanceBot:
             await self.sell_handler.start_sell(update, context)
         elif callback_data == "transactions":
             await self.transactions_handler.start_transactions(update, context)
+        elif callback_data == "statement_export":
+            await self.transactions_handler.start_statement_export(update, context)
+        elif callback_data in ("statement_export_pdf", "statement_export_csv"):
+            await self.transactions_handler.handle_statement_format(update, context, callback_data.rsplit('_', 1)[1])
         elif callback_data == "contact":
             await self.contact_handler.start_contact(update, context)
         elif callback_data == "confirm_sell":
             await self.sell_handler.handle_confirm_sell(update, context)
     
+    @track_update_queries
+    @coalesce_state_writes
+    @load_update_context
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle text messages"""
         user_id = str(update.effective_user.id)
         
         # Check if user is locked
-        is_locked, lock_message = self.lock_manager.check_lock(user_id)
+        is_locked, lock_message = await self.lock_manager.check_lock(user_id)
         if is_locked:
             await update.message.reply_text(lock_message)
             return
         
         # Check agreement acceptance
-        if not self.db.has_accepted_agreement(user_id):
+        if not await self.db.has_accepted_agreement(user_id):
             # Handle /start command even without agreement
             if update.message.text and update.message.text.startswith('/start'):
                 await self.start_handler.handle_start(update, context)
@@ -130,8 +199,7 @@ class BalanceBot:
             return
         
         # Get user state
-        encrypted_state = self.db.get_user_state(user_id)
-        state = decrypt_state(encrypted_state)
+        state = await self.db.get_state(user_id)
         
         action = state.get('action', '')
         step = state.get('step', '')
@@ -172,6 +240,11 @@ class BalanceBot:
         elif action == 'transactions':
             if step == 'enter_password':
                 await self.transactions_handler.handle_password_input(update, context)
+        elif action == 'statement_export':
+            if step == 'enter_range':
+                await self.transactions_handler.handle_statement_range_input(update, context)
+            elif step == 'enter_password':
+                await self.transactions_handler.handle_statement_password_input(update, context)
         elif action == 'contact':
             if step == 'enter_password':
                 await self.contact_handler.handle_password_input(update, context)
@@ -182,16 +255,15 @@ class BalanceBot:
                 error_text = "لطفا از دکمه‌های منو استفاده کنید."
                 
                 # Check if user has account
-                account = self.db.get_active_account(user_id)
+                account = await self.db.get_active_account(user_id)
                 if account:
                     # Count invalid messages
                     invalid_count = state.get('invalid_message_count', 0) + 1
                     state['invalid_message_count'] = invalid_count
-                    encrypted_state = encrypt_state(state)
-                    self.db.update_user_state(user_id, encrypted_state)
+                    await self.db.set_state(user_id, state)
                     
                     if invalid_count >= 3:
-                        self.lock_manager.lock_user(user_id, "ارسال پیام‌های نامربوط بیش از حد")
+                        await self.lock_manager.lock_user(user_id, "ارسال پیام‌های نامربوط بیش از حد")
                         lock_text = "تعداد پیام‌های نامربوط شما بیش از حد مجاز بود. اکانت شما به مدت ۱۰ دقیقه قفل شد."
                         await update.message.reply_text(lock_text)
                     else:
@@ -201,20 +273,87 @@ class BalanceBot:
                 else:
                     await update.message.reply_text(error_text)
     
-    def run(self):
-        """Run the bot"""
-        # Create application
-        application = Application.builder().token(config.BOT_TOKEN).build()
+    async def _post_init(self, application: Application):
+        if self.db.state_cache.mode == WRITE_BEHIND:
+            self._state_flusher = asyncio.create_task(
+                self.db.state_cache.run_flusher(config.STATE_CACHE_FLUSH_SECONDS)
+            )
+        # Notifications queued by handlers and the web panel go out through the application's Bot
+        self.outbox = OutboxDispatcher(self.db, application.bot)
+        self._outbox_task = asyncio.create_task(self.outbox.run())
+        # Timed deletions stored in scheduled_tasks, including those pending from before a restart
+        self.scheduler = TaskScheduler(self.db, application.bot)
+        self._scheduler_task = asyncio.create_task(self.scheduler.run())
+        if self.rate_limiter and config.RATE_LIMIT_LOG_SECONDS:
+            self._rate_limiter_reporter = asyncio.create_task(
+                self.rate_limiter.run_reporter(config.RATE_LIMIT_LOG_SECONDS)
+            )
+    
+    async def _post_stop(self, application: Application):
+        if self._state_flusher:
+            self._state_flusher.cancel()
+        if self._rate_limiter_reporter:
+            self._rate_limiter_reporter.cancel()
+        if self._outbox_task:
+            # Let the batch in flight finish; unsent messages stay in the outbox for the next start
+            self.outbox.stop()
+            await self._outbox_task
+            logger.info(f"Outbox: {self.outbox.snapshot()}")
+        if self._scheduler_task:
+            # Tasks not yet due stay in the table for the next start
+            self.scheduler.stop()
+            await self._scheduler_task
+            logger.info(f"Scheduler: {self.scheduler.snapshot()}")
+        # Deletions still queued go out while the Bot is open
+        await get_message_deleter().drain()
+        logger.info(f"Message deletion: {get_message_deleter().snapshot()}")
+        if self.rate_limiter:
+            logger.info(f"Rate limiter: {self.rate_limiter.snapshot()}")
+        logger.info(f"PDF rendering: {get_pdf_service().get_metrics()}")
+        logger.info(f"Statement exports: {get_statement_export_service().get_metrics()}")
+        logger.info(f"Statement cache: {get_statement_cache().snapshot()}")
+        # Write-behind states are flushed by self.db.dispose() on shutdown
+        logger.info(f"State cache: {self.db.get_state_cache_stats()}")
+    
+    def build_application(self) -> Application:
+        """Create the Telegram application with the bot's handlers"""
+        builder = (
+            Application.builder()
+            .token(config.BOT_TOKEN)
+            # Different users' updates run in parallel, each user's updates in order
+            .concurrent_updates(PerUserUpdateProcessor(config.BOT_CONCURRENT_UPDATES))
+            .post_init(self._post_init)
+            .post_stop(self._post_stop)
+        )
+        if self.rate_limiter:
+            # Every Bot API call (handlers, message_manager, outbox) goes through the limiter
+            builder = builder.rate_limiter(self.rate_limiter)
+        application = builder.build()
         
         # Add handlers
         application.add_handler(CommandHandler("start", self.handle_start))
         application.add_handler(CallbackQueryHandler(self.handle_callback))
         application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
+        return application
+    
+    def run(self, **polling_options):
+        """Run the bot (polling_options are passed to run_polling, e.g. stop_signals=None)"""
+        application = self.build_application()
         
         # Start the bot
         logger.info("Bot is starting...")
         print("به ربات پرس بات خوش آمدید.")
-        application.run_polling(allowed_updates=Update.ALL_TYPES)
+        try:
+            # Keep the event loop open so the async engine can be disposed on it
+            application.run_polling(allowed_updates=Update.ALL_TYPES, close_loop=False, **polling_options)
+        finally:
+            loop = asyncio.get_event_loop()
+            loop.run_until_complete(self.db.dispose())
+            loop.close()
+            self.db.sync.engine.dispose()
+            get_hashing_service().shutdown()
+            get_pdf_service().shutdown()
+            get_statement_export_service().shutdown()
 
 
 def main():
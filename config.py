@@ -17,8 +17,127 @@ SUPPORT_CHAT_ID = int(os.getenv('SUPPORT_CHAT_ID', 0)) if os.getenv('SUPPORT_CHA
 # For development/testing, SQLite will be used automatically if PostgreSQL fails
 DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///balancebot.db')
 
+# Database connection pools
+# The bot and the web admin panel use separate pools (roles 'bot' and 'admin').
+# DB_POOL_SIZE, DB_MAX_OVERFLOW, ... apply to both; DB_BOT_POOL_SIZE, DB_ADMIN_POOL_SIZE, ... override per role.
+# Postgres max_connections must cover (pool_size + max_overflow) of every role in every process.
+def _pool_setting(role, name, default):
+    return os.getenv(f'DB_{role}_{name}', os.getenv(f'DB_{name}', default))
+
+
+DB_POOL_SETTINGS = {
+    role.lower(): {
+        'pool_size': int(_pool_setting(role, 'POOL_SIZE', pool_size)),
+        'max_overflow': int(_pool_setting(role, 'MAX_OVERFLOW', max_overflow)),
+        'pool_timeout': float(_pool_setting(role, 'POOL_TIMEOUT', 30)),  # seconds to wait for a free connection
+        'pool_recycle': int(_pool_setting(role, 'POOL_RECYCLE', 1800)),  # seconds before a connection is replaced
+        'pre_ping': _pool_setting(role, 'POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+    }
+    for role, pool_size, max_overflow in (('BOT', 10, 10), ('ADMIN', 5, 5))
+}
+
 # Encryption Configuration
 ENCRYPTION_KEY = os.getenv('ENCRYPTION_KEY', '').encode() if os.getenv('ENCRYPTION_KEY') else b'default_key_change_in_production_32bytes!!'
+# Previous encryption keys (comma separated), still accepted for decrypting
+# states written before a key rotation. New states always use ENCRYPTION_KEY.
+ENCRYPTION_KEY_PREVIOUS = [key.strip().encode() for key in os.getenv('ENCRYPTION_KEY_PREVIOUS', '').split(',') if key.strip()]
+
+# Password hashing (ARGON2ID) worker pool
+# Each hash uses 64 MB, so the number of parallel hashes is HASH_MEMORY_BUDGET_MB / 64
+# Set HASH_WORKERS to override the computed number of workers
+HASH_MEMORY_BUDGET_MB = int(os.getenv('HASH_MEMORY_BUDGET_MB', 256))
+HASH_WORKERS = int(os.getenv('HASH_WORKERS', 0))
+
+# Updates processed at the same time (updates of one user always run one after another)
+BOT_CONCURRENT_UPDATES = int(os.getenv('BOT_CONCURRENT_UPDATES', 64))
+
+# Conversation state cache (bot process)
+# write_through: state changes are written by the end of each update
+# write_behind: state changes are written every STATE_CACHE_FLUSH_SECONDS and on shutdown
+STATE_CACHE_MODE = os.getenv('STATE_CACHE_MODE', 'write_through')
+STATE_CACHE_SIZE = int(os.getenv('STATE_CACHE_SIZE', 10000))  # users kept in memory
+STATE_CACHE_TTL_SECONDS = float(os.getenv('STATE_CACHE_TTL_SECONDS', 600))
+STATE_CACHE_FLUSH_SECONDS = float(os.getenv('STATE_CACHE_FLUSH_SECONDS', 5))
+
+# Admin dashboard statistics are recomputed at most once per this many seconds
+STATS_CACHE_TTL_SECONDS = float(os.getenv('STATS_CACHE_TTL_SECONDS', 5))
+
+# Admin panel change sync: changes up to SYNC_OVERLAP_SECONDS before the client's cursor are sent
+# again (covers late commits), deletions are remembered for SYNC_TOMBSTONE_RETENTION_HOURS
+SYNC_OVERLAP_SECONDS = float(os.getenv('SYNC_OVERLAP_SECONDS', 5))
+SYNC_TOMBSTONE_RETENTION_HOURS = float(os.getenv('SYNC_TOMBSTONE_RETENTION_HOURS', 24))
+
+# Admin panel live events (/api/events): committed changes are also sent with PostgreSQL NOTIFY so
+# the web process sees the bot's writes. Streams are served by one asyncio thread on SSE_HOST:SSE_PORT
+# (the panel redirects there; SSE_PUBLIC_URL overrides the address behind a proxy), at most SSE_MAX_CLIENTS
+EVENT_BUS_PG_NOTIFY = os.getenv('EVENT_BUS_PG_NOTIFY', 'true').lower() == 'true'
+SSE_HOST = os.getenv('SSE_HOST', '0.0.0.0')
+SSE_PORT = int(os.getenv('SSE_PORT', 5001))
+SSE_PUBLIC_URL = os.getenv('SSE_PUBLIC_URL', '')
+SSE_MAX_CLIENTS = int(os.getenv('SSE_MAX_CLIENTS', 5000))
+SSE_HEARTBEAT_SECONDS = float(os.getenv('SSE_HEARTBEAT_SECONDS', 15))
+SSE_QUEUE_SIZE = int(os.getenv('SSE_QUEUE_SIZE', 1000))  # events buffered per client before the oldest are dropped
+
+# Notification outbox: messages are written with the change they report and sent by the bot process.
+# OUTBOX_WORKERS requests in flight, OUTBOX_BATCH_SIZE messages claimed per round, backoff doubling from
+# OUTBOX_BACKOFF_SECONDS up to OUTBOX_MAX_BACKOFF_SECONDS, dead-lettered after OUTBOX_MAX_ATTEMPTS
+OUTBOX_WORKERS = int(os.getenv('OUTBOX_WORKERS', 8))
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 50))
+OUTBOX_POLL_SECONDS = float(os.getenv('OUTBOX_POLL_SECONDS', 2))
+OUTBOX_LEASE_SECONDS = float(os.getenv('OUTBOX_LEASE_SECONDS', 60))  # a claimed message is retried after this if unreported
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 8))
+OUTBOX_BACKOFF_SECONDS = float(os.getenv('OUTBOX_BACKOFF_SECONDS', 2))
+OUTBOX_MAX_BACKOFF_SECONDS = float(os.getenv('OUTBOX_MAX_BACKOFF_SECONDS', 300))
+OUTBOX_RETENTION_HOURS = float(os.getenv('OUTBOX_RETENTION_HOURS', 72))  # sent messages; dead letters are kept
+
+# Telegram API rate limits of the bot process: a global token bucket and one per chat (groups have a
+# lower limit); a RetryAfter pauses the chat and is retried up to RATE_LIMIT_MAX_RETRIES times.
+# The limiter's queues and wait times are logged every RATE_LIMIT_LOG_SECONDS (0: only at shutdown)
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+RATE_LIMIT_GLOBAL_PER_SECOND = float(os.getenv('RATE_LIMIT_GLOBAL_PER_SECOND', 30))
+RATE_LIMIT_GLOBAL_BURST = float(os.getenv('RATE_LIMIT_GLOBAL_BURST', 30))
+RATE_LIMIT_CHAT_PER_SECOND = float(os.getenv('RATE_LIMIT_CHAT_PER_SECOND', 1))
+RATE_LIMIT_CHAT_BURST = float(os.getenv('RATE_LIMIT_CHAT_BURST', 3))
+RATE_LIMIT_GROUP_PER_MINUTE = float(os.getenv('RATE_LIMIT_GROUP_PER_MINUTE', 20))
+RATE_LIMIT_GROUP_BURST = float(os.getenv('RATE_LIMIT_GROUP_BURST', 3))
+RATE_LIMIT_MAX_RETRIES = int(os.getenv('RATE_LIMIT_MAX_RETRIES', 2))
+RATE_LIMIT_LOG_SECONDS = float(os.getenv('RATE_LIMIT_LOG_SECONDS', 300))
+
+# Messages scheduled for deletion within this many seconds are deleted together (one request per chat)
+MESSAGE_DELETE_BATCH_SECONDS = float(os.getenv('MESSAGE_DELETE_BATCH_SECONDS', 0.2))
+
+# Scheduled tasks (timed message deletions): one scheduler task in the bot fires up to SCHEDULER_BATCH_SIZE
+# due tasks at a time; it sleeps until the next deadline, at most SCHEDULER_POLL_SECONDS
+SCHEDULER_BATCH_SIZE = int(os.getenv('SCHEDULER_BATCH_SIZE', 200))
+SCHEDULER_POLL_SECONDS = float(os.getenv('SCHEDULER_POLL_SECONDS', 30))
+SCHEDULER_LEASE_SECONDS = float(os.getenv('SCHEDULER_LEASE_SECONDS', 60))  # a claimed task is retried after this if unfinished
+SCHEDULER_MAX_ATTEMPTS = int(os.getenv('SCHEDULER_MAX_ATTEMPTS', 5))
+
+# Statement PDFs are rendered by PDF_WORKERS worker processes; up to PDF_QUEUE_LIMIT more wait for a
+# free worker (beyond that users are asked to try again), a render is abandoned after PDF_RENDER_TIMEOUT_SECONDS
+PDF_WORKERS = int(os.getenv('PDF_WORKERS', 2))
+PDF_QUEUE_LIMIT = int(os.getenv('PDF_QUEUE_LIMIT', 20))
+PDF_RENDER_TIMEOUT_SECONDS = float(os.getenv('PDF_RENDER_TIMEOUT_SECONDS', 30))
+
+# Generated statements are cached (keyed by the account's newest transaction) in STATEMENT_CACHE_MEMORY_MB of
+# memory; with STATEMENT_CACHE_DIR set, statements evicted from memory are kept there up to STATEMENT_CACHE_DISK_MB
+STATEMENT_CACHE_MEMORY_MB = int(os.getenv('STATEMENT_CACHE_MEMORY_MB', 32))
+STATEMENT_CACHE_DIR = os.getenv('STATEMENT_CACHE_DIR', '')
+STATEMENT_CACHE_DISK_MB = int(os.getenv('STATEMENT_CACHE_DISK_MB', 256))
+
+# Full-history statement exports read STATEMENT_EXPORT_CHUNK_SIZE rows at a time and are written to a temporary
+# file (the panel's kept in memory up to STATEMENT_EXPORT_SPOOL_MB); the bot runs up to STATEMENT_EXPORT_WORKERS
+# exports at once in worker processes. A PDF's pages stay in memory until it is saved (about 17 MB for 20000 rows),
+# so PDFs are limited to STATEMENT_PDF_MAX_ROWS rows (0: no limit); CSV exports have no limit
+STATEMENT_EXPORT_CHUNK_SIZE = int(os.getenv('STATEMENT_EXPORT_CHUNK_SIZE', 1000))
+STATEMENT_EXPORT_SPOOL_MB = int(os.getenv('STATEMENT_EXPORT_SPOOL_MB', 8))
+STATEMENT_EXPORT_WORKERS = int(os.getenv('STATEMENT_EXPORT_WORKERS', 2))
+STATEMENT_PDF_MAX_ROWS = int(os.getenv('STATEMENT_PDF_MAX_ROWS', 20000))
+
+# TrueType fonts for the Persian text of PDFs; empty uses the bundled DejaVu Sans (utils/fonts).
+# Registered on the first PDF, not at import
+PDF_FONT_PATH = os.getenv('PDF_FONT_PATH', '')
+PDF_FONT_BOLD_PATH = os.getenv('PDF_FONT_BOLD_PATH', '')
 
 # Application Constants
 PERS_TO_TOMAN = 1000  # 1 PERS = 1000 Toman = 10000 Rial
@@ -28,7 +147,6 @@ SELL_FEE_PERCENT = 0.01  # 1% for selling
 LOCK_DURATION_MINUTES = 10
 MESSAGE_TIMEOUT_MINUTES = 5
 MAX_RETRY_ATTEMPTS = 3
-TRANSACTION_RETRY_TIMEOUT_SECONDS = 120  # 2 minutes
 
 # Commitment Text
 COMMITMENT_TEXT = """متن تعهدنامه و شرایط استفاده از سامانه
@@ -0,0 +1,302 @@
+"""Asyncio database manager for the bot process (SQLAlchemy AsyncEngine)"""
+
+import logging
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from types import MappingProxyType
+from typing import Dict, Optional
+
+from sqlalchemy.engine import URL
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from database.db_manager import DatabaseManager
+from database.pool import get_pool_options, instrument_engine
+from database.state_cache import StateCache
+from database.update_context import AccountSnapshot, UpdateContext, discard_update_context, get_update_context
+from database.unit_of_work import UnitOfWork, UnitOfWorkRolledBack, bind_session, count_session, install_query_counters
+from utils.concurrency import KeyedLock
+from utils.hashing_service import get_hashing_service
+import config
+
+logger = logging.getLogger(__name__)
+
+# Async drivers: asyncpg for PostgreSQL, aiosqlite for the SQLite fallback
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite'
+}
+
+# DatabaseManager methods exposed as coroutines with the same name and arguments
+MIRRORED_METHODS = (
+    # Users
+    'get_or_create_user', 'update_user_username',
+    'reencrypt_user_states', 'accept_agreement',
+    'set_admin_status', 'is_admin', 'get_current_admin_user_id', 'get_admin_account_number',
+    # Accounts
+    'get_account_by_number', 'get_user_accounts', 'get_password_hash',
+    'update_account_balance', 'set_account_balance', 'update_account_user_and_activate',
+    'get_account_balance', 'account_exists',
+    # Transactions
+    'create_transaction', 'update_transaction_status', 'create_transaction_log',
+    'get_account_transactions', 'get_statement_version',
+    # Locks
+    'lock_user', 'unlock_user', 'get_lock_info',
+    # Withdrawal requests
+    'create_withdrawal_request', 'get_withdrawal_requests', 'get_withdrawal_request',
+    'confirm_withdrawal_request', 'complete_withdrawal_request',
+    # Outbox
+    'enqueue_notification', 'claim_outbox_batch', 'mark_outbox_sent', 'mark_outbox_failed',
+    'get_outbox_stats', 'prune_outbox',
+    # Scheduled tasks
+    'schedule_task', 'claim_due_tasks', 'complete_scheduled_tasks', 'next_scheduled_task_due',
+    # Static media
+    'get_static_file_id', 'save_static_file_id', 'forget_static_file_id',
+)
+
+# Writes that change what the current update's UpdateContext describes
+CONTEXT_WRITES = frozenset((
+    'accept_agreement', 'set_admin_status', 'delete_user', 'lock_user', 'unlock_user',
+    '_insert_account', 'update_account_balance', 'set_account_balance',
+    'update_account_user_and_activate', 'transfer',
+))
+
+
+def to_async_url(url: URL) -> URL:
+    """Swap the sync driver of a database URL for its asyncio driver"""
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend}")
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+_current_session: ContextVar[Optional[tuple]] = ContextVar('current_async_session', default=None)
+
+
+class AsyncDatabaseManager:
+    """
+    Awaitable counterpart of DatabaseManager
+
+    Queries go through an AsyncEngine, so waiting on the database never blocks
+    the event loop. The repository logic is not duplicated: each call runs the
+    DatabaseManager method with AsyncSession.run_sync, on a session whose I/O is
+    done by the async driver. Schema creation and migrations stay in the sync
+    manager, which is created first.
+
+    The web admin panel keeps using the sync DatabaseManager.
+    """
+
+    def __init__(self, sync_manager: DatabaseManager = None, db_url: str = None, role: str = 'bot'):
+        self.sync = sync_manager or DatabaseManager(db_url=db_url, role=role)
+        self.role = self.sync.role
+
+        self.engine = create_async_engine(
+            to_async_url(self.sync.engine.url),
+            echo=False,
+            **get_pool_options(self.role, use_async=True)
+        )
+        self.SessionLocal = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.pool_metrics = instrument_engine(self.engine.sync_engine, self.role)
+        install_query_counters(self.engine.sync_engine)
+        # Balance changes of one account run one at a time in this process
+        self.account_locks = KeyedLock()
+        # Decrypted conversation states (get_state / set_state)
+        self.state_cache = StateCache(
+            self,
+            max_entries=config.STATE_CACHE_SIZE,
+            ttl_seconds=config.STATE_CACHE_TTL_SECONDS,
+            mode=config.STATE_CACHE_MODE
+        )
+
+    async def _run(self, method_name: str, *args, **kwargs):
+        method = getattr(self.sync, method_name)
+        if method_name in CONTEXT_WRITES:
+            discard_update_context()
+
+        def call(uow: UnitOfWork):
+            # The sync method's get_session() returns the unit's session
+            with bind_session(uow):
+                return method(*args, **kwargs)
+
+        current = _current_session.get()
+        if current is not None and current[0] is self:
+            session, uow = current[1], current[2]
+            return await session.run_sync(lambda sync_session: call(uow))
+
+        async with self.SessionLocal() as session:
+            count_session()
+            result = await session.run_sync(lambda sync_session: call(UnitOfWork(self.sync, sync_session)))
+            await session.commit()
+            return result
+
+    @asynccontextmanager
+    async def unit_of_work(self):
+        """
+        Share one AsyncSession between awaited repository calls and commit once
+
+        Keep the block free of awaits on network I/O: the connection (and on
+        SQLite the write lock) is held until the block ends. As in the sync
+        unit of work, a repository rollback inside the block discards the whole
+        block and raises UnitOfWorkRolledBack.
+        """
+        current = _current_session.get()
+        if current is not None and current[0] is self:
+            yield current[1]
+            return
+
+        async with self.SessionLocal() as session:
+            count_session()
+            uow = UnitOfWork(self.sync, session.sync_session)
+            token = _current_session.set((self, session, uow))
+            try:
+                yield session
+                if uow.rolled_back:
+                    await session.rollback()
+                    raise UnitOfWorkRolledBack("A repository call rolled back inside the unit of work")
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                raise
+            finally:
+                _current_session.reset(token)
+
+    async def load_update_context(self, user_id: str) -> UpdateContext:
+        """Snapshot of the user, active lock, active account and state from one query"""
+        user_id = str(user_id)
+        user, lock, account = await self._run('get_user_lock_and_account', user_id)
+        if user is None:
+            return UpdateContext(user_id=user_id, user_exists=False, username=None, agreement_accepted=False,
+                                 is_admin=False, locked_until=None, lock_reason=None, account=None)
+
+        # The state column came with the same row; later get_state() calls are cache hits
+        state = await self.state_cache.prime(user_id, user.encrypted_state)
+        return UpdateContext(
+            user_id=user_id,
+            user_exists=True,
+            username=user.username,
+            agreement_accepted=bool(user.agreement_accepted),
+            is_admin=bool(user.is_admin),
+            locked_until=lock.locked_until if lock else None,
+            lock_reason=lock.reason if lock else None,
+            account=AccountSnapshot(
+                account_number=account.account_number,
+                user_id=account.user_id,
+                balance=account.balance,
+                is_active=account.is_active,
+                created_at=account.created_at
+            ) if account else None,
+            state=MappingProxyType(state)
+        )
+
+    async def has_accepted_agreement(self, user_id: str) -> bool:
+        """Check if user has accepted the agreement"""
+        context = get_update_context(user_id)
+        if context is not None:
+            return context.agreement_accepted
+        return await self._run('has_accepted_agreement', user_id)
+
+    async def get_active_account(self, user_id: str):
+        """Active account of the user (from the update context when it is loaded)"""
+        context = get_update_context(user_id)
+        if context is not None:
+            return context.account
+        return await self._run('get_active_account', user_id)
+
+    async def is_user_locked(self, user_id: str) -> bool:
+        context = get_update_context(user_id)
+        if context is not None:
+            return context.is_locked
+        return await self._run('is_user_locked', user_id)
+
+    async def get_state(self, user_id: str) -> dict:
+        """Decrypted conversation state of the user (cached)"""
+        return await self.state_cache.get(user_id)
+
+    async def set_state(self, user_id: str, state: dict):
+        """Store the user's conversation state (encrypted when written)"""
+        await self.state_cache.set(user_id, state)
+
+    async def clear_state(self, user_id: str):
+        """Reset the user's conversation state"""
+        await self.state_cache.clear(user_id)
+
+    async def get_user_state(self, user_id: str) -> Optional[str]:
+        """Encrypted state as stored; pending cached writes of the user are flushed first"""
+        await self.state_cache.flush({str(user_id)})
+        return await self._run('get_user_state', user_id)
+
+    async def update_user_state(self, user_id: str, encrypted_state: str):
+        """Store an already encrypted state, bypassing the state cache"""
+        self.state_cache.invalidate(user_id)
+        await self._run('update_user_state', user_id, encrypted_state)
+
+    async def delete_user(self, user_id: str) -> bool:
+        """Delete a user and all associated data (accounts, locks, transactions)"""
+        self.state_cache.invalidate(user_id)
+        return await self._run('delete_user', user_id)
+
+    async def transfer(self, from_account: str, to_account: str, fee_account: str, amount: float, fee: float,
+                       idempotency_key: str, user_id: str = None, username: str = None,
+                       transaction_type: str = 'send', recipient_message=None) -> Optional[Dict]:
+        """
+        DatabaseManager.transfer, holding the locks of the sender and recipient accounts
+
+        The fee account only receives credits and is not locked, so transfers of
+        different users do not queue behind each other on the admin account.
+        """
+        async with self.account_locks.hold(from_account, to_account):
+            return await self._run('transfer', from_account, to_account, fee_account, amount, fee,
+                                   idempotency_key, user_id=user_id, username=username,
+                                   transaction_type=transaction_type, recipient_message=recipient_message)
+
+    async def create_account(self, user_id: str, account_number: str, password: str):
+        """Create an account, hashing the password and account number in the hashing worker pool"""
+        existing_account = await self.get_account_by_number(account_number)
+        if existing_account:
+            logger.warning(f"Account {account_number} already exists, returning existing account")
+            return existing_account
+
+        hashing_service = get_hashing_service()
+        password_hash = await hashing_service.hash_password_async(password)
+        account_number_hash = await hashing_service.hash_account_number_async(account_number)
+        return await self._run('_insert_account', user_id, account_number, password_hash, account_number_hash)
+
+    async def verify_password(self, account_number: str, password: str) -> bool:
+        """Verify an account password in the hashing worker pool"""
+        password_hash = await self.get_password_hash(account_number)
+        if password_hash:
+            return await get_hashing_service().verify_password_async(password_hash, password)
+        return False
+
+    async def reset_account_password(self, account_number: str, new_password: str) -> bool:
+        """Reset account password, hashing it in the hashing worker pool"""
+        password_hash = await get_hashing_service().hash_password_async(new_password)
+        return await self._run('_set_password_hash', account_number, password_hash)
+
+    def get_pool_stats(self) -> dict:
+        """Connection pool telemetry for this manager's role"""
+        return self.pool_metrics.snapshot()
+
+    def get_state_cache_stats(self) -> dict:
+        """State cache hit/miss and write counters"""
+        return self.state_cache.snapshot()
+
+    async def dispose(self):
+        """Write pending cached states and close all pooled connections"""
+        try:
+            await self.state_cache.flush()
+        finally:
+            await self.engine.dispose()
+
+
+def _mirrored(name: str):
+    async def method(self, *args, **kwargs):
+        return await self._run(name, *args, **kwargs)
+
+    method.__name__ = name
+    method.__qualname__ = f"AsyncDatabaseManager.{name}"
+    method.__doc__ = getattr(DatabaseManager, name).__doc__
+    return method
+
+
+for _name in MIRRORED_METHODS:
+    setattr(AsyncDatabaseManager, _name, _mirrored(_name))
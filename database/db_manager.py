@@ -1,14 +1,20 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, Session
-from sqlalchemy.exc import SQLAlchemyError, OperationalError
+from sqlalchemy import create_engine, update, and_, case, func, literal, select
+from sqlalchemy.orm import sessionmaker, Session, aliased
+from sqlalchemy.exc import SQLAlchemyError, OperationalError, IntegrityError
 from datetime import datetime, timedelta
-from typing import Optional, List
+from typing import Callable, Iterator, Optional, List, Dict, Tuple
 from decimal import Decimal
 import config
-from database.models import Base, User, Account, Transaction, Lock, WithdrawalRequest, TransactionLog
-from utils.encryption import hash_password, verify_password, hash_account_number, verify_account_number
+from database.models import Base, User, Account, Transaction, Lock, WithdrawalRequest, TransactionLog, DeletedRow, OutboxMessage, ScheduledTask, StaticMedia
+from database.events import publish_after_commit
+from database.pool import get_pool_options, instrument_engine
+from database.unit_of_work import UnitOfWorkSession, get_current_uow, unit_of_work, count_session, install_query_counters
+from utils.encryption import hash_password, verify_password, hash_account_number, verify_account_number, rotate_state
+from utils.hashing_service import get_hashing_service
+import json
 import logging
 import sys
+import uuid
 
 logger = logging.getLogger(__name__)
 
@@ -25,16 +31,23 @@ if sys.platform == 'win32':
 
 
 class DatabaseManager:
-    def __init__(self):
+    def __init__(self, db_url: str = None, role: str = 'bot'):
+        # An explicit db_url (tests, benchmarks) is used as is
+        explicit_url = db_url is not None
+        # Pool role: 'bot' or 'admin' (web panel); each role has its own pool settings and metrics
+        self.role = role
+        
         # Try to connect to the configured database
-        db_url = config.DATABASE_URL
+        db_url = db_url or config.DATABASE_URL
         
         # If PostgreSQL is configured but not available, fallback to SQLite
         if db_url.startswith('postgresql://'):
             try:
                 logger.info(f"Attempting to connect to PostgreSQL: {db_url.split('@')[-1] if '@' in db_url else 'database'}")
-                self.engine = create_engine(db_url, echo=False)
+                self.engine = create_engine(db_url, echo=False, **get_pool_options(role))
                 self.SessionLocal = sessionmaker(bind=self.engine)
+                self.pool_metrics = instrument_engine(self.engine, role)
+                install_query_counters(self.engine)
                 
                 # Test connection
                 with self.engine.connect() as conn:
@@ -53,6 +66,14 @@ class DatabaseManager:
                 self._migrate_withdrawal_requests_table()
                 # Migrate: Create transaction_logs table if it doesn't exist
                 self._migrate_transaction_logs_table()
+                # Migrate: Add idempotency_key column if it doesn't exist
+                self._migrate_idempotency_key_column()
+                # Migrate: Add updated_at columns if they don't exist
+                self._migrate_updated_at_columns()
+                # Migrate: Create secondary indexes if they don't exist
+                self._migrate_indexes()
+                # Migrate: Key static_media by (file_hash, kind)
+                self._migrate_static_media_key()
                 
                 logger.info("PostgreSQL connection successful!")
                 return
@@ -65,13 +86,17 @@ class DatabaseManager:
                 # Fall through to SQLite setup
         
         # Use SQLite (either configured or as fallback)
-        if db_url.startswith('sqlite://') or not db_url.startswith('postgresql://'):
+        if explicit_url and db_url.startswith('sqlite://'):
+            logger.info(f"Using SQLite database: {db_url}")
+        elif db_url.startswith('sqlite://') or not db_url.startswith('postgresql://'):
             db_url = 'sqlite:///balancebot.db'
             logger.info("Using SQLite database: balancebot.db")
         
         try:
-            self.engine = create_engine(db_url, echo=False)
+            self.engine = create_engine(db_url, echo=False, **get_pool_options(role))
             self.SessionLocal = sessionmaker(bind=self.engine)
+            self.pool_metrics = instrument_engine(self.engine, role)
+            install_query_counters(self.engine)
             
             # Test connection
             with self.engine.connect() as conn:
@@ -90,6 +115,14 @@ class DatabaseManager:
             self._migrate_username_column()
             # Migrate: Create withdrawal_requests table if it doesn't exist
             self._migrate_withdrawal_requests_table()
+            # Migrate: Add idempotency_key column if it doesn't exist
+            self._migrate_idempotency_key_column()
+            # Migrate: Add updated_at columns if they don't exist
+            self._migrate_updated_at_columns()
+            # Migrate: Create secondary indexes if they don't exist
+            self._migrate_indexes()
+            # Migrate: Key static_media by (file_hash, kind)
+            self._migrate_static_media_key()
             
             logger.info("Database connection successful!")
         except Exception as e:
@@ -247,9 +280,156 @@ class DatabaseManager:
         except Exception as e:
             logger.warning(f"Migration warning (may already exist): {e}")
     
+    def _migrate_idempotency_key_column(self):
+        """Migrate: Add idempotency_key column and its unique index to transactions table if they don't exist"""
+        try:
+            from sqlalchemy import inspect, text
+            
+            inspector = inspect(self.engine)
+            columns = [col['name'] for col in inspector.get_columns('transactions')]
+            
+            if 'idempotency_key' not in columns:
+                logger.info("Migrating: Adding idempotency_key column to transactions table...")
+                with self.engine.connect() as conn:
+                    # SQLite
+                    if 'sqlite' in str(self.engine.url):
+                        conn.execute(text("ALTER TABLE transactions ADD COLUMN idempotency_key VARCHAR(64)"))
+                    # PostgreSQL
+                    else:
+                        conn.execute(text("ALTER TABLE transactions ADD COLUMN IF NOT EXISTS idempotency_key VARCHAR(64)"))
+                    # SQLite cannot add a UNIQUE column, so uniqueness comes from an index (same on both)
+                    conn.execute(text(
+                        "CREATE UNIQUE INDEX IF NOT EXISTS ix_transactions_idempotency_key "
+                        "ON transactions (idempotency_key)"
+                    ))
+                    conn.commit()
+                logger.info("Migration completed: idempotency_key column added")
+        except Exception as e:
+            logger.warning(f"Migration warning (may already exist): {e}")
+    
+    def _migrate_updated_at_columns(self):
+        """Migrate: Add updated_at to accounts, transactions and withdrawal_requests (admin panel change sync)"""
+        try:
+            from sqlalchemy import inspect, text
+            
+            inspector = inspect(self.engine)
+            for table in ('accounts', 'transactions', 'withdrawal_requests'):
+                columns = [col['name'] for col in inspector.get_columns(table)]
+                if 'updated_at' in columns:
+                    continue
+                logger.info(f"Migrating: Adding updated_at column to {table} table...")
+                with self.engine.connect() as conn:
+                    # SQLite
+                    if 'sqlite' in str(self.engine.url):
+                        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN updated_at DATETIME"))
+                    # PostgreSQL
+                    else:
+                        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP"))
+                    # Existing rows count as last changed when they were created
+                    conn.execute(text(f"UPDATE {table} SET updated_at = created_at WHERE updated_at IS NULL"))
+                    conn.commit()
+                logger.info(f"Migration completed: updated_at column added to {table}")
+        except Exception as e:
+            logger.warning(f"Migration warning (may already exist): {e}")
+    
+    def _migrate_indexes(self):
+        """Migrate: Create the secondary indexes declared in models.py on existing tables"""
+        try:
+            from sqlalchemy import inspect
+            
+            inspector = inspect(self.engine)
+            is_postgresql = 'sqlite' not in str(self.engine.url)
+            invalid = self._get_invalid_postgresql_indexes() if is_postgresql else set()
+            for table in (User.__table__, Account.__table__, Transaction.__table__, TransactionLog.__table__,
+                          WithdrawalRequest.__table__, Lock.__table__):
+                existing = {index['name'] for index in inspector.get_indexes(table.name)} - invalid
+                for index in table.indexes:
+                    if index.name in existing:
+                        continue
+                    logger.info(f"Migrating: Creating index {index.name} on {table.name}...")
+                    if is_postgresql:
+                        self._create_index_concurrently(index, rebuild=index.name in invalid)
+                    else:
+                        # SQLite: CREATE INDEX IF NOT EXISTS
+                        index.create(self.engine, checkfirst=True)
+                    logger.info(f"Migration completed: {index.name} created")
+        except Exception as e:
+            logger.warning(f"Migration warning (may already exist): {e}")
+    
+    def _migrate_static_media_key(self):
+        """Migrate: static_media was unique on file_hash alone; rebuild it with the (file_hash, kind) key"""
+        try:
+            from sqlalchemy import inspect
+            
+            inspector = inspect(self.engine)
+            # Tables created before the change lack the (file_hash, kind) index
+            if 'ux_static_media_hash_kind' not in {index['name'] for index in inspector.get_indexes('static_media')}:
+                logger.info("Migrating: Rebuilding static_media with the (file_hash, kind) key...")
+                # Only cached file_ids are lost; the files are uploaded again on their next send
+                StaticMedia.__table__.drop(self.engine)
+                StaticMedia.__table__.create(self.engine)
+                logger.info("Migration completed: static_media rebuilt")
+        except Exception as e:
+            logger.warning(f"Migration warning (may already exist): {e}")
+    
+    def _get_invalid_postgresql_indexes(self) -> set:
+        """Names of indexes left INVALID by an interrupted CREATE INDEX CONCURRENTLY"""
+        from sqlalchemy import text
+        
+        with self.engine.connect() as conn:
+            result = conn.execute(text(
+                "SELECT c.relname FROM pg_index i "
+                "JOIN pg_class c ON c.oid = i.indexrelid "
+                "JOIN pg_namespace n ON n.oid = c.relnamespace "
+                "WHERE NOT i.indisvalid AND n.nspname = current_schema()"
+            ))
+            return {row[0] for row in result}
+    
+    def _create_index_concurrently(self, index, rebuild: bool = False):
+        """
+        Build an index on PostgreSQL without blocking writes to the table
+        
+        CREATE INDEX CONCURRENTLY cannot run inside a transaction block, so it
+        uses an AUTOCOMMIT connection. An invalid leftover of a failed build is
+        dropped first, otherwise IF NOT EXISTS would keep it.
+        """
+        from sqlalchemy import text
+        
+        preparer = self.engine.dialect.identifier_preparer
+        index_name = preparer.quote(index.name)
+        table_name = preparer.format_table(index.table)
+        columns = ', '.join(preparer.quote(column.name) for column in index.columns)
+        with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            if rebuild:
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}"))
+            conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name} ON {table_name} ({columns})"))
+    
     def get_session(self) -> Session:
+        # Inside unit_of_work() every repository call shares the unit's session
+        uow = get_current_uow(self)
+        if uow is not None:
+            return UnitOfWorkSession(uow)
+        count_session()
         return self.SessionLocal()
     
+    def unit_of_work(self):
+        """
+        Share one session between repository calls and commit once
+        
+        Usage:
+            with db.unit_of_work():
+                db.update_account_balance(...)
+                db.create_transaction(...)
+        
+        Keep the block free of awaits on network I/O: the connection (and on
+        SQLite the write lock) is held until the block ends.
+        """
+        return unit_of_work(self)
+    
+    def get_pool_stats(self) -> dict:
+        """Connection pool telemetry for this manager's role"""
+        return self.pool_metrics.snapshot()
+    
     # User operations
     def get_or_create_user(self, user_id: str, username: str = None) -> User:
         session = self.get_session()
@@ -309,6 +489,51 @@ class DatabaseManager:
         finally:
             session.close()
     
+    def reencrypt_user_states(self, batch_size: int = 500) -> int:
+        """Re-encrypt all stored user states with the primary encryption key"""
+        rotated_count = 0
+        last_user_id = ''
+        while True:
+            session = self.get_session()
+            try:
+                users = session.query(User).filter(
+                    User.user_id > last_user_id
+                ).order_by(User.user_id).limit(batch_size).all()
+                if not users:
+                    return rotated_count
+                for user in users:
+                    if user.encrypted_state:
+                        try:
+                            user.encrypted_state = rotate_state(user.encrypted_state)
+                            rotated_count += 1
+                        except Exception as e:
+                            logger.warning(f"Could not re-encrypt state for user {user.user_id}: {e}")
+                last_user_id = users[-1].user_id
+                session.commit()
+            except SQLAlchemyError as e:
+                session.rollback()
+                raise e
+            finally:
+                session.close()
+    
+    def get_user_lock_and_account(self, user_id: str) -> Tuple[Optional[User], Optional[Lock], Optional[Account]]:
+        """
+        User, active lock and active account in one query
+        
+        users LEFT JOIN locks (still locked) LEFT JOIN accounts (active);
+        (None, None, None) if the user does not exist.
+        """
+        session = self.get_session()
+        try:
+            row = session.query(User, Lock, Account).outerjoin(
+                Lock, and_(Lock.user_id == User.user_id, Lock.locked_until > datetime.utcnow())
+            ).outerjoin(
+                Account, and_(Account.user_id == User.user_id, Account.is_active == True)
+            ).filter(User.user_id == str(user_id)).first()
+            return tuple(row) if row else (None, None, None)
+        finally:
+            session.close()
+    
     def has_accepted_agreement(self, user_id: str) -> bool:
         """Check if user has accepted the agreement"""
         session = self.get_session()
@@ -335,6 +560,27 @@ class DatabaseManager:
     
     # Account operations
     def create_account(self, user_id: str, account_number: str, password: str) -> Account:
+        existing_account = self.get_account_by_number(account_number)
+        if existing_account:
+            logger.warning(f"Account {account_number} already exists, returning existing account")
+            return existing_account
+        
+        return self._insert_account(user_id, account_number, hash_password(password), hash_account_number(account_number))
+    
+    async def create_account_async(self, user_id: str, account_number: str, password: str) -> Account:
+        """Create an account, hashing the password and account number in the hashing worker pool"""
+        existing_account = self.get_account_by_number(account_number)
+        if existing_account:
+            logger.warning(f"Account {account_number} already exists, returning existing account")
+            return existing_account
+        
+        hashing_service = get_hashing_service()
+        password_hash = await hashing_service.hash_password_async(password)
+        account_number_hash = await hashing_service.hash_account_number_async(account_number)
+        return self._insert_account(user_id, account_number, password_hash, account_number_hash)
+    
+    def _insert_account(self, user_id: str, account_number: str, password_hash: str,
+                        account_number_hash: str) -> Account:
         session = self.get_session()
         try:
             # Check if account already exists
@@ -343,8 +589,6 @@ class DatabaseManager:
                 logger.warning(f"Account {account_number} already exists, returning existing account")
                 return existing_account
             
-            password_hash = hash_password(password)
-            account_number_hash = hash_account_number(account_number)
             account = Account(
                 account_number=account_number,
                 user_id=str(user_id),
@@ -391,16 +635,27 @@ class DatabaseManager:
         finally:
             session.close()
     
-    def verify_password(self, account_number: str, password: str) -> bool:
+    def get_password_hash(self, account_number: str) -> Optional[str]:
         session = self.get_session()
         try:
             account = session.query(Account).filter(Account.account_number == account_number).first()
-            if account:
-                return verify_password(account.password_hash, password)
-            return False
+            return account.password_hash if account else None
         finally:
             session.close()
     
+    def verify_password(self, account_number: str, password: str) -> bool:
+        password_hash = self.get_password_hash(account_number)
+        if password_hash:
+            return verify_password(password_hash, password)
+        return False
+    
+    async def verify_password_async(self, account_number: str, password: str) -> bool:
+        """Verify an account password in the hashing worker pool"""
+        password_hash = self.get_password_hash(account_number)
+        if password_hash:
+            return await get_hashing_service().verify_password_async(password_hash, password)
+        return False
+    
     def update_account_balance(self, account_number: str, amount: float):
         session = self.get_session()
         try:
@@ -433,11 +688,18 @@ class DatabaseManager:
     
     def reset_account_password(self, account_number: str, new_password: str):
         """Reset account password"""
+        return self._set_password_hash(account_number, hash_password(new_password))
+    
+    async def reset_account_password_async(self, account_number: str, new_password: str):
+        """Reset account password, hashing it in the hashing worker pool"""
+        password_hash = await get_hashing_service().hash_password_async(new_password)
+        return self._set_password_hash(account_number, password_hash)
+    
+    def _set_password_hash(self, account_number: str, password_hash: str) -> bool:
         session = self.get_session()
         try:
             account = session.query(Account).filter(Account.account_number == account_number).first()
             if account:
-                password_hash = hash_password(new_password)
                 account.password_hash = password_hash
                 session.commit()
                 return True
@@ -492,6 +754,8 @@ class DatabaseManager:
                 status='pending'
             )
             session.add(transaction)
+            session.flush()
+            self._publish_transaction(session, transaction, 'created')
             session.commit()
             session.refresh(transaction)
             return transaction
@@ -501,12 +765,138 @@ class DatabaseManager:
         finally:
             session.close()
     
+    def transfer(self, from_account: str, to_account: str, fee_account: str, amount: float, fee: float,
+                 idempotency_key: str, user_id: str = None, username: str = None,
+                 transaction_type: str = 'send',
+                 recipient_message: Callable[[float], str] = None) -> Optional[Dict]:
+        """
+        Move amount + fee out of from_account atomically, in one DB transaction
+        
+        The debit is a conditional UPDATE (balance >= amount + fee), so the
+        balance can never go negative and no read-modify-write race exists.
+        Accounts are updated in account number order so concurrent transfers
+        lock rows in the same order. The Transaction row (and TransactionLog row
+        when user_id is given) is written in the same commit.
+        
+        A repeated idempotency_key does not move money again; the original
+        transaction is returned with duplicate=True.
+        
+        recipient_message(new_balance) builds the deposit notice for the owner
+        of to_account; it is queued in the outbox in the same commit.
+        
+        Returns {'transaction_id', 'balances': {account: balance}, 'duplicate'}
+        or None if the balance is insufficient or an account does not exist.
+        """
+        amount_decimal = Decimal(str(amount))
+        fee_decimal = Decimal(str(fee))
+        
+        deltas = {}
+        deltas[from_account] = deltas.get(from_account, Decimal('0')) - amount_decimal - fee_decimal
+        deltas[to_account] = deltas.get(to_account, Decimal('0')) + amount_decimal
+        deltas[fee_account] = deltas.get(fee_account, Decimal('0')) + fee_decimal
+        
+        session = self.get_session()
+        try:
+            # Write first: the unique idempotency_key rejects a duplicate before any balance changes
+            transaction = Transaction(
+                from_account=from_account,
+                to_account=to_account,
+                amount=amount_decimal,
+                fee=fee_decimal,
+                transaction_type=transaction_type,
+                status='success',
+                idempotency_key=idempotency_key
+            )
+            session.add(transaction)
+            try:
+                session.flush()
+            except IntegrityError:
+                session.rollback()
+                return self._get_transfer_result(session, idempotency_key, list(deltas))
+            
+            for account_number in sorted(deltas):
+                delta = deltas[account_number]
+                statement = update(Account).where(Account.account_number == account_number)
+                if delta < 0:
+                    statement = statement.where(Account.balance >= -delta)
+                result = session.execute(
+                    statement.values(balance=Account.balance + delta).execution_options(synchronize_session=False)
+                )
+                if result.rowcount != 1:
+                    session.rollback()
+                    logger.warning(f"Transfer {idempotency_key} rejected: insufficient balance or missing account "
+                                   f"{account_number}")
+                    return None
+            
+            if user_id:
+                if not username:
+                    user = session.query(User).filter(User.user_id == str(user_id)).first()
+                    username = user.username if user else None
+                session.add(TransactionLog(
+                    user_id=str(user_id),
+                    username=username,
+                    transaction_type=transaction_type,
+                    from_account=from_account,
+                    to_account=to_account,
+                    amount=amount_decimal,
+                    fee=fee_decimal,
+                    sheba=None,
+                    status='success',
+                    transaction_id=transaction.id,
+                    created_at=datetime.utcnow()
+                ))
+            
+            balances = self._get_balances(session, list(deltas))
+            transaction_id = transaction.id
+            if recipient_message:
+                recipient = session.query(Account.user_id).filter(Account.account_number == to_account).scalar()
+                if recipient:
+                    self._queue_message(session, recipient, recipient_message(balances[to_account]), 'deposit')
+            self._publish_transaction(session, transaction, 'created')
+            session.commit()
+            return {'transaction_id': transaction_id, 'balances': balances, 'duplicate': False}
+        except SQLAlchemyError as e:
+            session.rollback()
+            logger.error(f"Error processing transfer {idempotency_key}: {e}")
+            raise e
+        finally:
+            session.close()
+    
+    def _publish_transaction(self, session: Session, transaction: Transaction, action: str):
+        publish_after_commit(session, 'transaction', {
+            'action': action,
+            'id': transaction.id,
+            'from_account': transaction.from_account,
+            'to_account': transaction.to_account,
+            'amount': float(transaction.amount),
+            'fee': float(transaction.fee or 0),
+            'transaction_type': transaction.transaction_type,
+            'status': transaction.status,
+        })
+    
+    def _get_transfer_result(self, session: Session, idempotency_key: str, account_numbers: List[str]) -> Optional[Dict]:
+        transaction = session.query(Transaction).filter(Transaction.idempotency_key == idempotency_key).first()
+        if not transaction:
+            return None
+        return {
+            'transaction_id': transaction.id,
+            'balances': self._get_balances(session, account_numbers),
+            'duplicate': True
+        }
+    
+    def _get_balances(self, session: Session, account_numbers: List[str]) -> Dict[str, float]:
+        rows = session.query(Account.account_number, Account.balance).filter(
+            Account.account_number.in_(account_numbers)
+        ).all()
+        return {account_number: float(balance) for account_number, balance in rows}
+    
     def update_transaction_status(self, transaction_id: int, status: str):
         session = self.get_session()
         try:
             transaction = session.query(Transaction).filter(Transaction.id == transaction_id).first()
             if transaction:
                 transaction.status = status
+                self._publish_transaction(session, transaction, 'updated')
                 session.commit()
         except SQLAlchemyError as e:
             session.rollback()
@@ -560,6 +950,53 @@ class DatabaseManager:
         finally:
             session.close()
     
+    def get_statement_version(self, account_number: str) -> Tuple[Optional[int], int, Optional[datetime]]:
+        """
+        (newest transaction id, transaction count, last transaction update) of an account
+        Changes whenever a transaction touching the account is created or updated.
+        """
+        session = self.get_session()
+        try:
+            newest_id, count, updated_at = session.query(
+                func.max(Transaction.id), func.count(Transaction.id), func.max(Transaction.updated_at)
+            ).filter(
+                (Transaction.from_account == account_number) |
+                (Transaction.to_account == account_number)
+            ).one()
+            return newest_id, count, updated_at
+        finally:
+            session.close()
+    
+    def iter_account_transactions(self, account_number: str, start: Optional[datetime] = None,
+                                  end: Optional[datetime] = None, chunk_size: int = 1000) -> Iterator[List]:
+        """
+        Transactions of an account created in [start, end), oldest first, in lists of chunk_size rows
+
+        Rows (id, transaction_type, from_account, to_account, amount, fee, status,
+        created_at) come from a server-side cursor, chunk_size at a time, so a
+        full history is never loaded at once. The session stays open until the
+        iterator is exhausted or closed.
+        """
+        statement = select(
+            Transaction.id, Transaction.transaction_type, Transaction.from_account, Transaction.to_account,
+            Transaction.amount, Transaction.fee, Transaction.status, Transaction.created_at
+        ).where(
+            (Transaction.from_account == account_number) |
+            (Transaction.to_account == account_number)
+        )
+        if start is not None:
+            statement = statement.where(Transaction.created_at >= start)
+        if end is not None:
+            statement = statement.where(Transaction.created_at < end)
+        statement = statement.order_by(Transaction.created_at, Transaction.id).execution_options(yield_per=chunk_size)
+        
+        session = self.get_session()
+        try:
+            for rows in session.execute(statement).partitions():
+                yield rows
+        finally:
+            session.close()
+    
     # Lock operations
     def lock_user(self, user_id: str, reason: str = None):
         session = self.get_session()
@@ -572,6 +1009,9 @@ class DatabaseManager:
             else:
                 lock = Lock(user_id=str(user_id), locked_until=locked_until, reason=reason)
                 session.add(lock)
+            self._touch_user(session, user_id)
+            publish_after_commit(session, 'user', {'action': 'locked', 'user_id': str(user_id),
+                                                   'locked_until': locked_until.isoformat(), 'reason': reason})
             session.commit()
         except SQLAlchemyError as e:
             session.rollback()
@@ -595,6 +1035,8 @@ class DatabaseManager:
             lock = session.query(Lock).filter(Lock.user_id == str(user_id)).first()
             if lock:
                 session.delete(lock)
+                self._touch_user(session, user_id)
+                publish_after_commit(session, 'user', {'action': 'unlocked', 'user_id': str(user_id)})
                 session.commit()
         except SQLAlchemyError as e:
             session.rollback()
@@ -626,14 +1068,19 @@ class DatabaseManager:
             accounts = session.query(Account).filter(Account.user_id == str(user_id)).all()
             for account in accounts:
                 # Delete transactions associated with this account
-                session.query(Transaction).filter(
+                transactions = session.query(Transaction).filter(
                     (Transaction.from_account == account.account_number) |
                     (Transaction.to_account == account.account_number)
-                ).delete()
+                )
+                self._record_deleted_rows(session, 'transactions', [row.id for row in transactions.with_entities(Transaction.id)])
+                transactions.delete()
                 session.delete(account)
+            self._record_deleted_rows(session, 'accounts', [account.account_number for account in accounts])
             
             # Delete the user
             session.delete(user)
+            self._record_deleted_rows(session, 'users', [user.user_id])
+            publish_after_commit(session, 'user', {'action': 'deleted', 'user_id': str(user_id)})
             session.commit()
             return True
         except SQLAlchemyError as e:
@@ -643,6 +1090,34 @@ class DatabaseManager:
         finally:
             session.close()
     
+    def _touch_user(self, session: Session, user_id: str):
+        """Mark the user as changed for the admin panel (its lock is shown with the user)"""
+        session.query(User).filter(User.user_id == str(user_id)).update(
+            {'updated_at': datetime.utcnow()}, synchronize_session=False
+        )
+    
+    def _record_deleted_rows(self, session: Session, table_name: str, keys: List):
+        """Write tombstones for deleted rows (in the caller's transaction) and drop expired ones"""
+        if not keys:
+            return
+        now = datetime.utcnow()
+        session.add_all([DeletedRow(table_name=table_name, row_key=str(key), deleted_at=now) for key in keys])
+        session.query(DeletedRow).filter(
+            DeletedRow.deleted_at < now - timedelta(hours=config.SYNC_TOMBSTONE_RETENTION_HOURS)
+        ).delete(synchronize_session=False)
+    
+    def get_deleted_row_keys(self, table_name: str, since: datetime) -> List[str]:
+        """Primary keys of table_name rows deleted at or after since"""
+        session = self.get_session()
+        try:
+            rows = session.query(DeletedRow.row_key).filter(
+                DeletedRow.table_name == table_name,
+                DeletedRow.deleted_at >= since
+            ).all()
+            return [row.row_key for row in rows]
+        finally:
+            session.close()
+    
     def set_admin_status(self, user_id: str, is_admin: bool) -> bool:
         """Set admin status for a user. Only one admin can exist at a time."""
         session = self.get_session()
@@ -690,13 +1165,80 @@ class DatabaseManager:
     
     def get_admin_account_number(self) -> Optional[str]:
         """Get the admin's active account number from the current admin user"""
-        admin_user_id = self.get_current_admin_user_id()
-        if not admin_user_id:
-            return None
-        
-        admin_account = self.get_active_account(admin_user_id)
-        return admin_account.account_number if admin_account else None
-    
+        with self.unit_of_work():
+            admin_user_id = self.get_current_admin_user_id()
+            if not admin_user_id:
+                return None
+            
+            admin_account = self.get_active_account(admin_user_id)
+            return admin_account.account_number if admin_account else None
+
+    def get_dashboard_stats(self) -> Dict:
+        """
+        Counts and sums for the admin dashboard in one SELECT
+
+        Each table is scanned once by a single-row aggregate subquery
+        (conditional counts via SUM(CASE ...)), and the subqueries are joined
+        into one row, so no Account rows are loaded into Python.
+        """
+        now = datetime.utcnow()
+
+        def count_if(condition):
+            return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+        transaction_stats = select(
+            func.count(Transaction.id).label('total_transactions'),
+            count_if(Transaction.status == 'pending').label('pending_transactions'),
+            count_if(Transaction.status == 'success').label('success_transactions'),
+            count_if(Transaction.transaction_type == 'buy').label('buy_count'),
+            count_if(Transaction.transaction_type == 'sell').label('sell_count'),
+            count_if(Transaction.transaction_type == 'send').label('send_count'),
+            count_if(Transaction.created_at >= now - timedelta(days=1)).label('recent_transactions'),
+            func.coalesce(func.sum(case((Transaction.status == 'success', Transaction.fee))), 0).label('total_fees'),
+        ).subquery()
+
+        # The admin's active account, the same one get_admin_account_number() returns
+        is_admin_account = and_(User.is_admin == True, Account.is_active == True)
+        account_stats = select(
+            func.count(Account.account_number).label('total_accounts'),
+            count_if(Account.is_active == True).label('active_accounts'),
+            func.coalesce(func.sum(Account.balance), 0).label('total_balance'),
+            func.min(case((is_admin_account, Account.account_number))).label('admin_account_number'),
+        ).select_from(Account).join(User, User.user_id == Account.user_id).subquery()
+
+        admin_balance = (
+            select(func.coalesce(func.sum(Account.balance), 0))
+            .where(Account.account_number == account_stats.c.admin_account_number)
+            .scalar_subquery()
+        )
+        total_users = select(func.count(User.user_id)).scalar_subquery()
+        locked_users = select(func.count(Lock.user_id)).where(Lock.locked_until > now).scalar_subquery()
+
+        statement = select(
+            total_users.label('total_users'),
+            locked_users.label('locked_users'),
+            admin_balance.label('admin_balance'),
+            transaction_stats,
+            account_stats,
+        ).select_from(transaction_stats.join(account_stats, literal(True)))
+
+        session = self.get_session()
+        try:
+            row = session.execute(statement).mappings().one()
+            stats = dict(row)
+            for key in ('total_balance', 'admin_balance', 'total_fees'):
+                stats[key] = float(stats[key] or 0)
+            for key in ('total_users', 'total_accounts', 'active_accounts', 'total_transactions',
+                        'pending_transactions', 'success_transactions', 'buy_count', 'sell_count',
+                        'send_count', 'recent_transactions', 'locked_users'):
+                stats[key] = int(stats[key] or 0)
+            return stats
+        except SQLAlchemyError as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+
     # Withdrawal Request operations
     def create_withdrawal_request(self, user_id: str, account_number: str, amount_pers: float, 
                                   amount_toman: float, sheba: str, transaction_id: int = None) -> WithdrawalRequest:
@@ -713,6 +1255,8 @@ class DatabaseManager:
                 transaction_id=transaction_id
             )
             session.add(withdrawal)
+            session.flush()
+            self._publish_withdrawal(session, withdrawal, 'created')
             session.commit()
             session.refresh(withdrawal)
             return withdrawal
@@ -723,6 +1267,17 @@ class DatabaseManager:
         finally:
             session.close()
     
+    def _publish_withdrawal(self, session: Session, withdrawal: WithdrawalRequest, action: str):
+        publish_after_commit(session, 'withdrawal', {
+            'action': action,
+            'id': withdrawal.id,
+            'user_id': withdrawal.user_id,
+            'account_number': withdrawal.account_number,
+            'amount_pers': float(withdrawal.amount_pers),
+            'amount_toman': float(withdrawal.amount_toman),
+            'status': withdrawal.status,
+        })
+    
     def get_withdrawal_requests(self, status: str = None, limit: int = 100) -> List[WithdrawalRequest]:
         """Get withdrawal requests, optionally filtered by status"""
         session = self.get_session()
@@ -756,6 +1311,7 @@ class DatabaseManager:
             withdrawal.status = 'confirmed'
             withdrawal.confirmed_at = datetime.utcnow()
             withdrawal.confirmed_by = str(confirmed_by)
+            self._publish_withdrawal(session, withdrawal, 'updated')
             session.commit()
             return True
         except SQLAlchemyError as e:
@@ -777,6 +1333,7 @@ class DatabaseManager:
                 return False  # Must be confirmed first
             
             withdrawal.status = 'completed'
+            self._publish_withdrawal(session, withdrawal, 'updated')
             session.commit()
             return True
         except SQLAlchemyError as e:
@@ -785,4 +1342,344 @@ class DatabaseManager:
             raise e
         finally:
             session.close()
-
+    
+    # Outbox operations
+    def enqueue_notification(self, chat_id: str, text: str, kind: str,
+                             withdrawal_request_id: int = None) -> int:
+        """
+        Queue a Telegram message in the outbox
+        
+        Inside a unit of work (or transfer) the message commits with the rest of
+        the block, so it is sent if and only if the change it reports is saved.
+        """
+        session = self.get_session()
+        try:
+            message_id = self._queue_message(session, chat_id, text, kind, withdrawal_request_id)
+            session.commit()
+            return message_id
+        except SQLAlchemyError as e:
+            session.rollback()
+            logger.error(f"Error queueing {kind} notification: {e}")
+            raise e
+        finally:
+            session.close()
+    
+    def _queue_message(self, session: Session, chat_id: str, text: str, kind: str,
+                       withdrawal_request_id: int = None) -> int:
+        message = OutboxMessage(
+            chat_id=str(chat_id),
+            text=text,
+            kind=kind,
+            withdrawal_request_id=withdrawal_request_id,
+            next_attempt_at=datetime.utcnow()
+        )
+        session.add(message)
+        session.flush()
+        # Wakes the dispatcher of this process once the message is committed
+        publish_after_commit(session, 'outbox', {'action': 'queued', 'id': message.id, 'kind': kind})
+        return message.id
+    
+    def claim_outbox_batch(self, limit: int, lease_seconds: float) -> List[Dict]:
+        """
+        Claim up to limit due messages for one dispatcher, at most one per chat
+        
+        Only the oldest pending message of a chat is eligible, so a chat's
+        messages go out in order even with several workers. Claimed messages
+        stay pending with next_attempt_at at the end of the lease: if the
+        dispatcher dies before reporting, they are claimed again afterwards.
+        """
+        now = datetime.utcnow()
+        token = uuid.uuid4().hex
+        session = self.get_session()
+        try:
+            older = aliased(OutboxMessage)
+            earlier_pending = select(older.id).where(
+                older.chat_id == OutboxMessage.chat_id,
+                older.status == 'pending',
+                older.id < OutboxMessage.id
+            ).exists()
+            ids = [row[0] for row in session.query(OutboxMessage.id).filter(
+                OutboxMessage.status == 'pending',
+                OutboxMessage.next_attempt_at <= now,
+                ~earlier_pending
+            ).order_by(OutboxMessage.id).limit(limit).all()]
+            if not ids:
+                return []
+            
+            # Another dispatcher may have claimed some of them meanwhile
+            session.execute(
+                update(OutboxMessage).where(
+                    OutboxMessage.id.in_(ids),
+                    OutboxMessage.status == 'pending',
+                    OutboxMessage.next_attempt_at <= now
+                ).values(
+                    claimed_by=token,
+                    attempts=OutboxMessage.attempts + 1,
+                    next_attempt_at=now + timedelta(seconds=lease_seconds)
+                ).execution_options(synchronize_session=False)
+            )
+            rows = session.query(
+                OutboxMessage.id, OutboxMessage.chat_id, OutboxMessage.text, OutboxMessage.kind,
+                OutboxMessage.attempts
+            ).filter(OutboxMessage.id.in_(ids), OutboxMessage.claimed_by == token).order_by(OutboxMessage.id).all()
+            session.commit()
+            return [{'id': row.id, 'chat_id': row.chat_id, 'text': row.text, 'kind': row.kind,
+                     'attempts': row.attempts} for row in rows]
+        except SQLAlchemyError as e:
+            session.rollback()
+            logger.error(f"Error claiming outbox messages: {e}")
+            raise e
+        finally:
+            session.close()
+    
+    def mark_outbox_sent(self, message_ids: List[int]) -> int:
+        """Mark delivered messages sent and complete the withdrawal requests they confirm"""
+        if not message_ids:
+            return 0
+        session = self.get_session()
+        try:
+            now = datetime.utcnow()
+            updated = session.query(OutboxMessage).filter(
+                OutboxMessage.id.in_(message_ids),
+                OutboxMessage.status == 'pending'
+            ).update({'status': 'sent', 'sent_at': now, 'claimed_by': None, 'last_error': None},
+                     synchronize_session=False)
+            withdrawals = session.query(WithdrawalRequest).join(
+                OutboxMessage, OutboxMessage.withdrawal_request_id == WithdrawalRequest.id
+            ).filter(OutboxMessage.id.in_(message_ids), WithdrawalRequest.status == 'confirmed').all()
+            for withdrawal in withdrawals:
+                withdrawal.status = 'completed'
+                self._publish_withdrawal(session, withdrawal, 'updated')
+            session.commit()
+            return updated
+        except SQLAlchemyError as e:
+            session.rollback()
+            logger.error(f"Error marking outbox messages sent: {e}")
+            raise e
+        finally:
+            session.close()
+    
+    def mark_outbox_failed(self, message_id: int, error: str, retry_at: Optional[datetime]):
+        """Record a failed delivery: retry at retry_at, or dead-letter the message if retry_at is None"""
+        session = self.get_session()
+        try:
+            values = {'last_error': error[:1000], 'claimed_by': None}
+            if retry_at is None:
+                values['status'] = 'dead'
+            else:
+                values['next_attempt_at'] = retry_at
+            session.query(OutboxMessage).filter(
+                OutboxMessage.id == message_id,
+                OutboxMessage.status == 'pending'
+            ).update(values, synchronize_session=False)
+            session.commit()
+        except SQLAlchemyError as e:
+            session.rollback()
+            logger.error(f"Error recording outbox failure: {e}")
+            raise e
+        finally:
+            session.close()
+    
+    def retry_outbox_message(self, message_id: int) -> bool:
+        """Put a dead-lettered message back in the queue"""
+        session = self.get_session()
+        try:
+            updated = session.query(OutboxMessage).filter(
+                OutboxMessage.id == message_id,
+                OutboxMessage.status == 'dead'
+            ).update({'status': 'pending', 'attempts': 0, 'next_attempt_at': datetime.utcnow()},
+                     synchronize_session=False)
+            if updated:
+                publish_after_commit(session, 'outbox', {'action': 'queued', 'id': message_id})
+            session.commit()
+            return updated == 1
+        except SQLAlchemyError as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+    
+    def get_outbox_message(self, message_id: int) -> Optional[OutboxMessage]:
+        session = self.get_session()
+        try:
+            return session.query(OutboxMessage).filter(OutboxMessage.id == message_id).first()
+        finally:
+            session.close()
+    
+    def get_outbox_stats(self) -> Dict:
+        """Messages per status and the age of the oldest pending one"""
+        session = self.get_session()
+        try:
+            counts = dict(session.query(OutboxMessage.status, func.count(OutboxMessage.id)).group_by(
+                OutboxMessage.status
+            ).all())
+            oldest = session.query(func.min(OutboxMessage.created_at)).filter(
+                OutboxMessage.status == 'pending'
+            ).scalar()
+            return {
+                'pending': counts.get('pending', 0),
+                'sent': counts.get('sent', 0),
+                'dead': counts.get('dead', 0),
+                'oldest_pending_seconds': (datetime.utcnow() - oldest).total_seconds() if oldest else 0,
+            }
+        finally:
+            session.close()
+    
+    def prune_outbox(self, older_than: datetime) -> int:
+        """Delete messages sent before older_than (dead letters are kept)"""
+        session = self.get_session()
+        try:
+            deleted = session.query(OutboxMessage).filter(
+                OutboxMessage.status == 'sent',
+                OutboxMessage.sent_at < older_than
+            ).delete(synchronize_session=False)
+            session.commit()
+            return deleted
+        except SQLAlchemyError as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+    
+    # Scheduled task operations
+    def schedule_task(self, kind: str, due_at: datetime, chat_id: str = None, message_id: int = None,
+                      payload: dict = None) -> int:
+        """Store a deadline for the task scheduler (e.g. kind='delete_message' with chat_id and message_id)"""
+        session = self.get_session()
+        try:
+            task = ScheduledTask(
+                kind=kind,
+                chat_id=str(chat_id) if chat_id is not None else None,
+                message_id=message_id,
+                payload=json.dumps(payload) if payload is not None else None,
+                due_at=due_at
+            )
+            session.add(task)
+            session.flush()
+            # Wakes the scheduler of this process if the task is due before its next wake-up
+            publish_after_commit(session, 'scheduled_task', {'action': 'scheduled', 'id': task.id, 'kind': kind,
+                                                             'due_at': due_at.isoformat()})
+            session.commit()
+            return task.id
+        except SQLAlchemyError as e:
+            session.rollback()
+            logger.error(f"Error scheduling {kind} task: {e}")
+            raise e
+        finally:
+            session.close()
+    
+    def claim_due_tasks(self, limit: int, lease_seconds: float) -> List[Dict]:
+        """
+        Claim up to limit due tasks, oldest deadline first
+        
+        A claimed task's due_at moves to the end of the lease, so a scheduler
+        that dies before complete_scheduled_tasks() leaves it to be claimed
+        again afterwards.
+        """
+        now = datetime.utcnow()
+        token = uuid.uuid4().hex
+        session = self.get_session()
+        try:
+            ids = [row[0] for row in session.query(ScheduledTask.id).filter(
+                ScheduledTask.due_at <= now
+            ).order_by(ScheduledTask.due_at, ScheduledTask.id).limit(limit).all()]
+            if not ids:
+                return []
+            
+            session.execute(
+                update(ScheduledTask).where(
+                    ScheduledTask.id.in_(ids),
+                    ScheduledTask.due_at <= now
+                ).values(
+                    claimed_by=token,
+                    attempts=ScheduledTask.attempts + 1,
+                    due_at=now + timedelta(seconds=lease_seconds)
+                ).execution_options(synchronize_session=False)
+            )
+            rows = session.query(
+                ScheduledTask.id, ScheduledTask.kind, ScheduledTask.chat_id, ScheduledTask.message_id,
+                ScheduledTask.payload, ScheduledTask.attempts
+            ).filter(ScheduledTask.id.in_(ids), ScheduledTask.claimed_by == token).order_by(ScheduledTask.id).all()
+            session.commit()
+            return [{'id': row.id, 'kind': row.kind, 'chat_id': row.chat_id, 'message_id': row.message_id,
+                     'payload': json.loads(row.payload) if row.payload else None, 'attempts': row.attempts}
+                    for row in rows]
+        except SQLAlchemyError as e:
+            session.rollback()
+            logger.error(f"Error claiming scheduled tasks: {e}")
+            raise e
+        finally:
+            session.close()
+    
+    def complete_scheduled_tasks(self, task_ids: List[int]) -> int:
+        """Remove tasks that have been carried out"""
+        if not task_ids:
+            return 0
+        session = self.get_session()
+        try:
+            deleted = session.query(ScheduledTask).filter(
+                ScheduledTask.id.in_(task_ids)
+            ).delete(synchronize_session=False)
+            session.commit()
+            return deleted
+        except SQLAlchemyError as e:
+            session.rollback()
+            logger.error(f"Error completing scheduled tasks: {e}")
+            raise e
+        finally:
+            session.close()
+    
+    def next_scheduled_task_due(self) -> Optional[datetime]:
+        """Deadline of the earliest task (claimed ones count with the end of their lease)"""
+        session = self.get_session()
+        try:
+            return session.query(func.min(ScheduledTask.due_at)).scalar()
+        finally:
+            session.close()
+    
+    # Static media operations
+    def get_static_file_id(self, file_hash: str, kind: str) -> Optional[str]:
+        """file_id of an uploaded file with this content, if any"""
+        session = self.get_session()
+        try:
+            return session.query(StaticMedia.file_id).filter(
+                StaticMedia.file_hash == file_hash,
+                StaticMedia.kind == kind
+            ).scalar()
+        finally:
+            session.close()
+    
+    def save_static_file_id(self, file_hash: str, name: str, kind: str, file_id: str):
+        """Remember the file_id Telegram returned for an uploaded file"""
+        session = self.get_session()
+        try:
+            media = session.query(StaticMedia).filter(
+                StaticMedia.file_hash == file_hash,
+                StaticMedia.kind == kind
+            ).first()
+            if media is None:
+                session.add(StaticMedia(file_hash=file_hash, name=name, kind=kind, file_id=file_id))
+            else:
+                media.name, media.file_id = name, file_id
+            session.commit()
+        except SQLAlchemyError as e:
+            session.rollback()
+            logger.error(f"Error saving file_id of {name}: {e}")
+            raise e
+        finally:
+            session.close()
+    
+    def forget_static_file_id(self, file_hash: str, kind: str):
+        """Drop a file_id Telegram no longer accepts, so the file is uploaded again"""
+        session = self.get_session()
+        try:
+            session.query(StaticMedia).filter(
+                StaticMedia.file_hash == file_hash,
+                StaticMedia.kind == kind
+            ).delete(synchronize_session=False)
+            session.commit()
+        except SQLAlchemyError as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
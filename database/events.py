@@ -0,0 +1,263 @@
+"""In-process event bus for committed changes, with a PostgreSQL LISTEN/NOTIFY bridge"""
+
+import itertools
+import json
+import logging
+import select
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import event as sa_event, text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# PostgreSQL NOTIFY channel shared by the bot and web processes
+NOTIFY_CHANNEL = 'balancebot_events'
+_PENDING_KEY = 'pending_events'
+
+
+class Event:
+    __slots__ = ('id', 'type', 'data', 'origin', 'created_at')
+
+    def __init__(self, id: int, type: str, data: dict, origin: str, created_at: float = None):
+        self.id = id
+        self.type = type
+        self.data = data
+        self.origin = origin
+        self.created_at = created_at or time.time()
+
+    def to_json(self) -> str:
+        return json.dumps({'type': self.type, 'data': self.data, 'origin': self.origin,
+                           'created_at': self.created_at}, default=str, separators=(',', ':'))
+
+
+class Subscription:
+    """
+    Events delivered to one consumer (e.g. one SSE client)
+
+    A bounded buffer: a consumer that falls behind loses the oldest events
+    (counted in dropped) instead of growing without limit. Clients resync
+    through the "since" list endpoints anyway.
+    """
+
+    def __init__(self, bus: 'EventBus', max_events: int):
+        self.bus = bus
+        self._events = deque(maxlen=max_events)
+        self._condition = threading.Condition()
+        self.dropped = 0
+        self.closed = False
+
+    def put(self, event: Event):
+        with self._condition:
+            if len(self._events) == self._events.maxlen:
+                self.dropped += 1
+            self._events.append(event)
+            self._condition.notify()
+
+    def get(self, timeout: float) -> List[Event]:
+        """All buffered events, waiting up to timeout for the first one"""
+        with self._condition:
+            if not self._events and not self.closed:
+                self._condition.wait(timeout)
+            events = list(self._events)
+            self._events.clear()
+            return events
+
+    def close(self):
+        self.bus.unsubscribe(self)
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+
+class EventBus:
+    """
+    Publish/subscribe for changes committed by this process (and, through
+    PostgresEventListener, by other processes on the same database)
+
+    DatabaseManager write methods queue events on their session with
+    publish_after_commit(); they reach subscribers only once the transaction
+    commits and are dropped on rollback.
+    """
+
+    def __init__(self):
+        # Tells this process's events apart when they come back through NOTIFY
+        self.origin = uuid.uuid4().hex
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._subscribers: List[Subscription] = []
+        self._listeners: List[Callable[[Event], None]] = []
+        self.published = 0
+        self.received = 0
+
+    def publish(self, event_type: str, data: dict) -> Event:
+        event = Event(next(self._ids), event_type, data, self.origin)
+        self.published += 1
+        self._deliver(event)
+        return event
+
+    def receive(self, payload: str) -> Optional[Event]:
+        """Deliver an event published by another process (NOTIFY payload)"""
+        message = json.loads(payload)
+        if message.get('origin') == self.origin:
+            return None
+        event = Event(next(self._ids), message['type'], message['data'], message['origin'], message.get('created_at'))
+        self.received += 1
+        self._deliver(event)
+        return event
+
+    def _deliver(self, event: Event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+            listeners = list(self._listeners)
+        for subscription in subscribers:
+            subscription.put(event)
+        for listener in listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                logger.error(f"Error in event listener: {e}")
+
+    def add_listener(self, listener: Callable[[Event], None]):
+        """Call listener(event) for every event, in the publishing thread; it must not block"""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[Event], None]):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def subscribe(self, max_events: int = 1000) -> Subscription:
+        subscription = Subscription(self, max_events)
+        with self._lock:
+            self._subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+    @property
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            subscribers = list(self._subscribers)
+        return {
+            'published': self.published,
+            'received': self.received,
+            'subscribers': len(subscribers),
+            'dropped': sum(subscription.dropped for subscription in subscribers),
+        }
+
+
+_event_bus = EventBus()
+
+
+def get_event_bus() -> EventBus:
+    return _event_bus
+
+
+def publish_after_commit(session, event_type: str, data: dict):
+    """Queue an event on session; it is published when the session's transaction commits"""
+    session.info.setdefault(_PENDING_KEY, []).append((event_type, data))
+
+
+@sa_event.listens_for(Session, 'before_commit')
+def _notify_other_processes(session):
+    pending = session.info.get(_PENDING_KEY)
+    if not pending:
+        return
+    import config
+    bind = session.get_bind()
+    if not config.EVENT_BUS_PG_NOTIFY or bind.dialect.name != 'postgresql':
+        return
+    # NOTIFY is transactional: listeners get it only if this commit succeeds
+    origin = _event_bus.origin
+    for event_type, data in pending:
+        payload = json.dumps({'type': event_type, 'data': data, 'origin': origin, 'created_at': time.time()},
+                             default=str, separators=(',', ':'))
+        session.execute(text("SELECT pg_notify(:channel, :payload)"), {'channel': NOTIFY_CHANNEL, 'payload': payload})
+
+
+@sa_event.listens_for(Session, 'after_commit')
+def _publish_committed(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    for event_type, data in pending or ():
+        try:
+            _event_bus.publish(event_type, data)
+        except Exception as e:
+            logger.error(f"Error publishing {event_type} event: {e}")
+
+
+@sa_event.listens_for(Session, 'after_rollback')
+def _discard_rolled_back(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+class PostgresEventListener:
+    """
+    Feed NOTIFY messages of other processes (the bot) into this process's bus
+
+    One thread and one dedicated connection, however many subscribers the
+    bus has. Reconnects with backoff if the connection drops.
+    """
+
+    def __init__(self, bus: EventBus, engine, poll_seconds: float = 5.0):
+        self.bus = bus
+        self.engine = engine
+        self.poll_seconds = poll_seconds
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='pg-event-listener', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_seconds + 1)
+
+    def _run(self):
+        backoff = 1
+        while not self._stop.is_set():
+            try:
+                self._listen()
+                backoff = 1
+            except Exception as e:
+                logger.warning(f"Event listener connection lost: {e}; reconnecting in {backoff}s")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 60)
+
+    def _listen(self):
+        # Detached from the pool: it stays in LISTEN for the life of the thread
+        connection = self.engine.raw_connection()
+        connection.detach()
+        try:
+            dbapi_connection = connection.dbapi_connection
+            dbapi_connection.autocommit = True
+            with dbapi_connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+            logger.info(f"Listening for events on {NOTIFY_CHANNEL}")
+            while not self._stop.is_set():
+                if select.select([dbapi_connection], [], [], self.poll_seconds) == ([], [], []):
+                    continue
+                dbapi_connection.poll()
+                while dbapi_connection.notifies:
+                    notify = dbapi_connection.notifies.pop(0)
+                    try:
+                        self.bus.receive(notify.payload)
+                    except (ValueError, KeyError) as e:
+                        logger.warning(f"Ignoring malformed event: {e}")
+        finally:
+            connection.close()
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, String, Integer, Numeric, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy import create_engine, Column, String, Integer, Numeric, Boolean, DateTime, ForeignKey, Text, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -19,6 +19,11 @@ class User(Base):
     
     accounts = relationship("Account", back_populates="user")
     lock = relationship("Lock", back_populates="user", uselist=False)
+    
+    __table_args__ = (
+        Index('ix_users_created_at', 'created_at', 'user_id'),
+        Index('ix_users_updated_at', 'updated_at'),
+    )
 
 
 class Account(Base):
@@ -31,10 +36,18 @@ class Account(Base):
     balance = Column(Numeric(20, 2), default=0.00)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     user = relationship("User", back_populates="accounts")
     transactions_from = relationship("Transaction", foreign_keys="Transaction.from_account", back_populates="from_account_rel")
     transactions_to = relationship("Transaction", foreign_keys="Transaction.to_account", back_populates="to_account_rel")
+    
+    __table_args__ = (
+        Index('ix_accounts_user_id_is_active', 'user_id', 'is_active'),
+        Index('ix_accounts_created_at', 'created_at', 'account_number'),
+        Index('ix_accounts_balance', 'balance', 'account_number'),
+        Index('ix_accounts_updated_at', 'updated_at'),
+    )
 
 
 class Transaction(Base):
@@ -47,10 +60,20 @@ class Transaction(Base):
     fee = Column(Numeric(20, 2), default=0.00)
     transaction_type = Column(String(20), nullable=False)  # buy, send, sell
     status = Column(String(20), default='pending')  # pending, success, failed
+    idempotency_key = Column(String(64), nullable=True, unique=True)  # Set by DatabaseManager.transfer
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     from_account_rel = relationship("Account", foreign_keys=[from_account], back_populates="transactions_from")
     to_account_rel = relationship("Account", foreign_keys=[to_account], back_populates="transactions_to")
+    
+    __table_args__ = (
+        Index('ix_transactions_from_account_created_at', 'from_account', 'created_at'),
+        Index('ix_transactions_to_account_created_at', 'to_account', 'created_at'),
+        Index('ix_transactions_status', 'status'),
+        Index('ix_transactions_type_created_at', 'transaction_type', 'created_at'),
+        Index('ix_transactions_updated_at', 'updated_at'),
+    )
 
 
 class Lock(Base):
@@ -61,6 +84,10 @@ class Lock(Base):
     reason = Column(String(255), nullable=True)
     
     user = relationship("User", back_populates="lock")
+    
+    __table_args__ = (
+        Index('ix_locks_locked_until', 'locked_until'),
+    )
 
 
 class WithdrawalRequest(Base):
@@ -77,10 +104,16 @@ class WithdrawalRequest(Base):
     confirmed_at = Column(DateTime, nullable=True)
     confirmed_by = Column(String(50), nullable=True)  # Admin user_id who confirmed
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     user = relationship("User")
     account = relationship("Account")
     transaction = relationship("Transaction")
+    
+    __table_args__ = (
+        Index('ix_withdrawal_requests_status_created_at', 'status', 'created_at'),
+        Index('ix_withdrawal_requests_updated_at', 'updated_at'),
+    )
 
 
 class TransactionLog(Base):
@@ -103,4 +136,90 @@ class TransactionLog(Base):
     from_account_rel = relationship("Account", foreign_keys=[from_account])
     to_account_rel = relationship("Account", foreign_keys=[to_account])
     transaction = relationship("Transaction")
+    
+    __table_args__ = (
+        Index('ix_transaction_logs_user_id_created_at', 'user_id', 'created_at'),
+    )
+
+
+class DeletedRow(Base):
+    """Tombstone of a deleted row, so admin pages syncing changes can drop it too"""
+    __tablename__ = 'deleted_rows'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    table_name = Column(String(50), nullable=False)
+    row_key = Column(String(50), nullable=False)  # Primary key of the deleted row, as a string
+    deleted_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    
+    __table_args__ = (
+        Index('ix_deleted_rows_table_name_deleted_at', 'table_name', 'deleted_at'),
+    )
 
+
+class OutboxMessage(Base):
+    """
+    Telegram message written in the same transaction as the change it reports,
+    and delivered afterwards by the outbox dispatcher
+    """
+    __tablename__ = 'outbox'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    chat_id = Column(String(50), nullable=False)
+    text = Column(Text, nullable=False)
+    kind = Column(String(30), nullable=False)  # deposit, withdrawal_request, contact, withdrawal_confirmed
+    status = Column(String(20), default='pending', nullable=False)  # pending, sent, dead
+    attempts = Column(Integer, default=0, nullable=False)
+    # Not before this time; while a dispatcher holds the message, the end of its lease
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    claimed_by = Column(String(32), nullable=True)
+    last_error = Column(Text, nullable=True)
+    # Withdrawal request to mark completed once this message is delivered
+    withdrawal_request_id = Column(Integer, ForeignKey('withdrawal_requests.id'), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    sent_at = Column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        Index('ix_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),
+        Index('ix_outbox_chat_id_status_id', 'chat_id', 'status', 'id'),
+    )
+
+
+class ScheduledTask(Base):
+    """
+    Deadline fired by the bot's task scheduler (e.g. deleting a sensitive
+    message MESSAGE_TIMEOUT_MINUTES after it was sent); kept in the database
+    so pending deadlines survive a restart
+    """
+    __tablename__ = 'scheduled_tasks'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String(30), nullable=False)  # delete_message
+    chat_id = Column(String(50), nullable=True)
+    message_id = Column(Integer, nullable=True)
+    payload = Column(Text, nullable=True)  # JSON, for kinds that need more than a chat and message
+    # When the task is due; while a scheduler holds it, the end of its lease
+    due_at = Column(DateTime, nullable=False)
+    claimed_by = Column(String(32), nullable=True)
+    attempts = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    
+    __table_args__ = (
+        Index('ix_scheduled_tasks_due_at', 'due_at'),
+    )
+
+
+class StaticMedia(Base):
+    """Telegram file_id of a file the bot sends repeatedly (e.g. the agreement PDF), keyed by content hash and kind"""
+    __tablename__ = 'static_media'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    file_hash = Column(String(64), nullable=False)  # SHA-256 of the file's bytes
+    name = Column(String(255), nullable=False)  # File name, for reference
+    kind = Column(String(20), nullable=False)  # document, photo
+    file_id = Column(String(255), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    
+    __table_args__ = (
+        # The same bytes sent as a document and as a photo have different file_ids
+        Index('ux_static_media_hash_kind', 'file_hash', 'kind', unique=True),
+    )
@@ -0,0 +1,145 @@
+"""Instrumented connection pool and per-role pool telemetry"""
+
+import threading
+import time
+from typing import Dict
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+import config
+
+
+class PoolMetrics:
+    """Checkout wait time and connection counters for one pool role"""
+
+    def __init__(self, role: str):
+        self.role = role
+        self.pool = None
+        self._lock = threading.Lock()
+
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.peak_in_use = 0
+        self.peak_overflow = 0
+        self.overflow_checkouts = 0
+        self.connections_opened = 0
+        self.connections_invalidated = 0
+
+    def record_checkout(self, wait_seconds: float, in_use: int, overflow: int):
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait_seconds += wait_seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+            self.peak_in_use = max(self.peak_in_use, in_use)
+            if overflow > 0:
+                self.overflow_checkouts += 1
+                self.peak_overflow = max(self.peak_overflow, overflow)
+
+    def record_timeout(self, wait_seconds: float):
+        with self._lock:
+            self.checkout_timeouts += 1
+            self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+
+    def snapshot(self) -> dict:
+        """Return the current counters and live pool state"""
+        pool = self.pool
+        with self._lock:
+            return {
+                'role': self.role,
+                'pool_size': pool.size() if pool else 0,
+                'max_overflow': pool._max_overflow if pool else 0,
+                'in_use': pool.checkedout() if pool else 0,
+                'idle': pool.checkedin() if pool else 0,
+                'overflow': max(0, pool.overflow()) if pool else 0,
+                'peak_in_use': self.peak_in_use,
+                'peak_overflow': self.peak_overflow,
+                'overflow_checkouts': self.overflow_checkouts,
+                'checkouts': self.checkouts,
+                'checkout_timeouts': self.checkout_timeouts,
+                'avg_wait_ms': self.total_wait_seconds / self.checkouts * 1000 if self.checkouts else 0.0,
+                'max_wait_ms': self.max_wait_seconds * 1000,
+                'connections_opened': self.connections_opened,
+                'connections_invalidated': self.connections_invalidated
+            }
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection"""
+
+    metrics: PoolMetrics = None
+
+    def _do_get(self):
+        started_at = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except PoolTimeoutError:
+            if self.metrics:
+                self.metrics.record_timeout(time.perf_counter() - started_at)
+            raise
+        if self.metrics:
+            self.metrics.record_checkout(time.perf_counter() - started_at, self.checkedout(), self.overflow())
+        return record
+
+    def recreate(self):
+        # engine.dispose() replaces the pool; keep reporting into the same metrics
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        if self.metrics:
+            self.metrics.pool = pool
+        return pool
+
+
+class InstrumentedAsyncAdaptedQueuePool(InstrumentedQueuePool, AsyncAdaptedQueuePool):
+    """InstrumentedQueuePool for AsyncEngine (asyncpg / aiosqlite)"""
+
+
+_pool_metrics: Dict[str, PoolMetrics] = {}
+_pool_metrics_lock = threading.Lock()
+
+
+def get_pool_options(role: str, use_async: bool = False) -> dict:
+    """create_engine() keyword arguments for a pool role (see DB_POOL_SETTINGS in config)"""
+    settings = config.DB_POOL_SETTINGS.get(role, config.DB_POOL_SETTINGS['bot'])
+    return {
+        'poolclass': InstrumentedAsyncAdaptedQueuePool if use_async else InstrumentedQueuePool,
+        'pool_size': settings['pool_size'],
+        'max_overflow': settings['max_overflow'],
+        'pool_timeout': settings['pool_timeout'],
+        'pool_recycle': settings['pool_recycle'],
+        'pool_pre_ping': settings['pre_ping']
+    }
+
+
+def instrument_engine(engine, role: str) -> PoolMetrics:
+    """Attach the role's metrics to the engine's pool"""
+    with _pool_metrics_lock:
+        metrics = _pool_metrics.get(role)
+        if metrics is None:
+            metrics = PoolMetrics(role)
+            _pool_metrics[role] = metrics
+
+    pool = engine.pool
+    if isinstance(pool, InstrumentedQueuePool):
+        pool.metrics = metrics
+    metrics.pool = pool
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        metrics.connections_opened += 1
+
+    @event.listens_for(engine, 'invalidate')
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        metrics.connections_invalidated += 1
+
+    return metrics
+
+
+def get_pool_stats() -> dict:
+    """Telemetry for every pool role created in this process"""
+    with _pool_metrics_lock:
+        roles = list(_pool_metrics.values())
+    return {metrics.role: metrics.snapshot() for metrics in roles}
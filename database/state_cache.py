@@ -0,0 +1,233 @@
+"""In-memory cache of decrypted conversation states (users.encrypted_state)"""
+
+import asyncio
+import copy
+import logging
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from utils.encryption import decrypt_state, encrypt_state
+
+logger = logging.getLogger(__name__)
+
+WRITE_THROUGH = 'write_through'
+WRITE_BEHIND = 'write_behind'
+
+
+class _Entry:
+    __slots__ = ('state', 'expires_at', 'dirty')
+
+    def __init__(self, state: dict, expires_at: float, dirty: bool = False):
+        self.state = state
+        self.expires_at = expires_at
+        self.dirty = dirty
+
+
+class _PendingWrites(set):
+    """Users whose state was written during the update being handled"""
+
+    def __init__(self):
+        super().__init__()
+        # Tasks started by a handler inherit the context; once the update is
+        # done their writes must not wait for a flush that already happened
+        self.open = True
+
+
+_pending_writes: ContextVar[Optional[_PendingWrites]] = ContextVar('pending_state_writes', default=None)
+
+
+def _current_pending() -> Optional[_PendingWrites]:
+    pending = _pending_writes.get()
+    return pending if pending is not None and pending.open else None
+
+
+class StateCache:
+    """
+    Bounded LRU/TTL cache of decrypted user states in front of AsyncDatabaseManager
+
+    Reads are served from memory after the first load, so a handler step no
+    longer pays a query and a Fernet decrypt for every get. Writes are
+    coalesced: inside coalesce_writes() (one Telegram update) repeated writes
+    of a user's state are encrypted and stored once, when the update ends.
+
+    Durability:
+        write_through  every write reaches the database by the end of the
+                       update (immediately outside coalesce_writes())
+        write_behind   dirty states are written by flush(): periodically by
+                       run_flusher(), on eviction and on shutdown; a crash
+                       loses the states changed since the last flush
+
+    The cache is per process; a state changed by another process is seen
+    once the entry expires (ttl_seconds).
+    """
+
+    def __init__(self, manager, max_entries: int = 10000, ttl_seconds: float = 600,
+                 mode: str = WRITE_THROUGH):
+        if mode not in (WRITE_THROUGH, WRITE_BEHIND):
+            raise ValueError(f"Unknown state cache mode: {mode}")
+        self.manager = manager
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.mode = mode
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = asyncio.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.writes = 0
+        self.coalesced_writes = 0
+        self.flushes = 0
+
+    async def get(self, user_id: str) -> dict:
+        """Decrypted state of the user (a copy; store changes with set())"""
+        user_id = str(user_id)
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            if entry.dirty or entry.expires_at > time.monotonic():
+                self.hits += 1
+                self._entries.move_to_end(user_id)
+                return copy.deepcopy(entry.state)
+            self.expirations += 1
+            del self._entries[user_id]
+
+        self.misses += 1
+        encrypted_state = await self.manager._run('get_user_state', user_id)
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            # set() stored a newer state while the row was being read
+            return copy.deepcopy(entry.state)
+        state = decrypt_state(encrypted_state)
+        await self._store(user_id, state, dirty=False)
+        return copy.deepcopy(state)
+
+    async def prime(self, user_id: str, encrypted_state: Optional[str]) -> dict:
+        """Use a state read by another query unless a fresher one is cached; returns a copy"""
+        user_id = str(user_id)
+        entry = self._entries.get(user_id)
+        if entry is not None and (entry.dirty or entry.expires_at > time.monotonic()):
+            self.hits += 1
+            return copy.deepcopy(entry.state)
+        self.misses += 1
+        state = decrypt_state(encrypted_state)
+        await self._store(user_id, state, dirty=False)
+        return copy.deepcopy(state)
+
+    async def set(self, user_id: str, state: dict):
+        """Store the user's state; written to the database according to the cache mode"""
+        user_id = str(user_id)
+        entry = self._entries.get(user_id)
+        if entry is not None and entry.dirty:
+            self.coalesced_writes += 1
+        pending = _current_pending()
+        deferred = self.mode == WRITE_BEHIND or pending is not None
+        await self._store(user_id, copy.deepcopy(state), dirty=deferred)
+        if not deferred:
+            await self._write({user_id: state})
+        elif pending is not None:
+            pending.add(user_id)
+
+    async def clear(self, user_id: str):
+        """Reset the user's state to empty"""
+        await self.set(user_id, {})
+
+    def invalidate(self, user_id: str):
+        """Drop the cached state (the database row was changed directly)"""
+        self._entries.pop(str(user_id), None)
+
+    async def flush(self, user_ids=None) -> int:
+        """Write dirty states (all, or only the given users) in one transaction"""
+        states = {}
+        for user_id, entry in list(self._entries.items()):
+            if entry.dirty and (user_ids is None or user_id in user_ids):
+                states[user_id] = entry.state
+                entry.dirty = False
+        if states:
+            try:
+                await self._write(states)
+            except Exception:
+                # Keep the states dirty so the next flush retries them
+                for user_id in states:
+                    entry = self._entries.get(user_id)
+                    if entry is not None:
+                        entry.dirty = True
+                raise
+            self.flushes += 1
+        return len(states)
+
+    @asynccontextmanager
+    async def coalesce_writes(self):
+        """Defer state writes made inside the block and write them once when it ends"""
+        if _current_pending() is not None:
+            yield
+            return
+
+        pending = _PendingWrites()
+        token = _pending_writes.set(pending)
+        try:
+            yield
+        finally:
+            pending.open = False
+            _pending_writes.reset(token)
+            if pending and self.mode == WRITE_THROUGH:
+                await self.flush(pending)
+
+    async def run_flusher(self, interval_seconds: float):
+        """Write-behind loop: flush dirty states every interval_seconds until cancelled"""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"State cache flush failed: {e}")
+
+    def snapshot(self) -> dict:
+        """Cache counters and current size"""
+        lookups = self.hits + self.misses
+        return {
+            'mode': self.mode,
+            'size': len(self._entries),
+            'max_entries': self.max_entries,
+            'dirty': sum(1 for entry in self._entries.values() if entry.dirty),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'expirations': self.expirations,
+            'evictions': self.evictions,
+            'writes': self.writes,
+            'coalesced_writes': self.coalesced_writes,
+            'flushes': self.flushes
+        }
+
+    async def _store(self, user_id: str, state: dict, dirty: bool):
+        entry = self._entries.get(user_id)
+        expires_at = time.monotonic() + self.ttl_seconds
+        if entry is not None:
+            entry.state = state
+            entry.expires_at = expires_at
+            entry.dirty = entry.dirty or dirty
+            self._entries.move_to_end(user_id)
+        else:
+            self._entries[user_id] = _Entry(state, expires_at, dirty)
+
+        evicted = {}
+        while len(self._entries) > self.max_entries:
+            evicted_id, evicted_entry = self._entries.popitem(last=False)
+            self.evictions += 1
+            if evicted_entry.dirty:
+                evicted[evicted_id] = evicted_entry.state
+        if evicted:
+            await self._write(evicted)
+
+    async def _write(self, states: Dict[str, dict]):
+        # Empty states are stored as '' like the handlers' "Clear state"
+        encrypted = {user_id: encrypt_state(state) if state else '' for user_id, state in states.items()}
+        async with self._lock:
+            async with self.manager.unit_of_work():
+                for user_id, encrypted_state in encrypted.items():
+                    await self.manager._run('update_user_state', user_id, encrypted_state)
+        self.writes += len(encrypted)
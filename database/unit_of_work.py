@@ -0,0 +1,182 @@
+"""Unit of work session scope and per-update query counters"""
+
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+
+class UnitOfWorkRolledBack(Exception):
+    """A repository method rolled back inside the unit of work; nothing was committed"""
+
+
+class UnitOfWork:
+    """
+    One session and one commit for a block of repository calls
+
+    While a unit of work is active, DatabaseManager.get_session() hands out the
+    same session wrapped in UnitOfWorkSession, so repository methods share one
+    connection and their commits become flushes. The unit of work commits once
+    when the block ends, or rolls back if it raises.
+
+    If a repository method rolls back inside the block, nothing of the block
+    is committed: the unit of work rolls back at the end and raises
+    UnitOfWorkRolledBack.
+    """
+
+    def __init__(self, manager, session: Session = None):
+        self.manager = manager
+        if session is None:
+            # Objects returned by repository methods stay usable after the final commit
+            session = manager.SessionLocal(expire_on_commit=False)
+            count_session()
+        self.session = session
+        self.rolled_back = False
+
+    def commit(self):
+        self.session.commit()
+
+    def rollback(self):
+        self.session.rollback()
+
+    def close(self):
+        self.session.close()
+
+
+class UnitOfWorkSession:
+    """
+    Session handed to repository methods inside a unit of work
+
+    commit() flushes, close() does nothing; the unit of work owns the real
+    transaction. rollback() rolls back the whole unit of work, so a repository
+    method that rejects its own changes (e.g. a refused transfer) also discards
+    the earlier writes of the block, and the block's later writes are not
+    committed either.
+    """
+
+    def __init__(self, uow: UnitOfWork):
+        self._uow = uow
+        self._session = uow.session
+
+    def commit(self):
+        self._session.flush()
+
+    def close(self):
+        pass
+
+    def rollback(self):
+        if not self._uow.rolled_back:
+            logger.warning("Repository rollback inside a unit of work; earlier writes of the unit are discarded")
+        self._uow.rolled_back = True
+        self._session.rollback()
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+
+_current_uow: ContextVar[Optional[UnitOfWork]] = ContextVar('current_unit_of_work', default=None)
+
+
+def get_current_uow(manager) -> Optional[UnitOfWork]:
+    """The active unit of work of this manager, if any"""
+    uow = _current_uow.get()
+    if uow is not None and uow.manager is manager:
+        return uow
+    return None
+
+
+@contextmanager
+def unit_of_work(manager):
+    """Run the block in one session and commit once (nested blocks join the outer one)"""
+    if get_current_uow(manager) is not None:
+        yield get_current_uow(manager)
+        return
+
+    uow = UnitOfWork(manager)
+    token = _current_uow.set(uow)
+    try:
+        yield uow
+        if uow.rolled_back:
+            # Writes made after the repository rollback must not commit on their own
+            uow.rollback()
+            raise UnitOfWorkRolledBack("A repository call rolled back inside the unit of work")
+        uow.commit()
+    except Exception:
+        uow.rollback()
+        raise
+    finally:
+        _current_uow.reset(token)
+        uow.close()
+
+
+@contextmanager
+def bind_session(uow: UnitOfWork):
+    """
+    Route the manager's repository calls to a unit of work owned by the caller
+
+    The caller commits or rolls back (used by AsyncDatabaseManager, which wraps
+    the sync session of its AsyncSession and commits the AsyncSession itself).
+    """
+    token = _current_uow.set(uow)
+    try:
+        yield
+    finally:
+        _current_uow.reset(token)
+
+
+class QueryStats:
+    """Queries, commits and sessions used while handling one update"""
+
+    def __init__(self):
+        self.queries = 0
+        self.commits = 0
+        self.sessions = 0
+
+    def as_dict(self) -> dict:
+        return {'queries': self.queries, 'commits': self.commits, 'sessions': self.sessions}
+
+
+_current_stats: ContextVar[Optional[QueryStats]] = ContextVar('current_query_stats', default=None)
+
+
+def get_query_stats() -> Optional[QueryStats]:
+    """Counters of the update being handled, if tracking is active"""
+    return _current_stats.get()
+
+
+@contextmanager
+def track_queries():
+    """Count queries, commits and sessions issued inside the block"""
+    stats = QueryStats()
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+
+def count_session():
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.sessions += 1
+
+
+def install_query_counters(engine):
+    """Count statements and commits of this engine into the active QueryStats"""
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        stats = _current_stats.get()
+        if stats is not None:
+            stats.queries += 1
+
+    @event.listens_for(engine, 'commit')
+    def on_commit(conn):
+        stats = _current_stats.get()
+        if stats is not None:
+            stats.commits += 1
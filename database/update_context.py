@@ -0,0 +1,86 @@
+"""Per-update snapshot of the user's lock, agreement, state and active account"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime
+from decimal import Decimal
+from types import MappingProxyType
+from typing import Mapping, Optional
+
+
+@dataclass(frozen=True)
+class AccountSnapshot:
+    """Read-only copy of the user's active account"""
+    account_number: str
+    user_id: str
+    balance: Decimal
+    is_active: bool
+    created_at: Optional[datetime]
+
+
+@dataclass(frozen=True)
+class UpdateContext:
+    """
+    What the handlers need to know about the user at the start of an update
+
+    Built by AsyncDatabaseManager.load_update_context() from one joined query
+    (users LEFT JOIN active lock LEFT JOIN active account). state is the
+    conversation state as it was when the update arrived; handlers that change
+    it go through get_state() / set_state().
+    """
+    user_id: str
+    user_exists: bool
+    username: Optional[str]
+    agreement_accepted: bool
+    is_admin: bool
+    locked_until: Optional[datetime]
+    lock_reason: Optional[str]
+    account: Optional[AccountSnapshot]
+    state: Mapping = field(default_factory=lambda: MappingProxyType({}))
+
+    @property
+    def is_locked(self) -> bool:
+        return self.locked_until is not None and datetime.utcnow() < self.locked_until
+
+
+class _UpdateScope:
+    __slots__ = ('context', 'open')
+
+    def __init__(self, context: UpdateContext):
+        self.context = context
+        # Tasks started by a handler inherit the scope; they must not read
+        # the snapshot after the update is done
+        self.open = True
+
+
+_current_scope: ContextVar[Optional[_UpdateScope]] = ContextVar('current_update_context', default=None)
+
+
+def get_update_context(user_id: str = None) -> Optional[UpdateContext]:
+    """The context of the update being handled (only if it belongs to user_id, when given)"""
+    scope = _current_scope.get()
+    if scope is None or not scope.open or scope.context is None:
+        return None
+    if user_id is not None and scope.context.user_id != str(user_id):
+        return None
+    return scope.context
+
+
+def discard_update_context():
+    """Stop serving the snapshot for the rest of the update (the rows behind it were changed)"""
+    scope = _current_scope.get()
+    if scope is not None:
+        scope.context = None
+
+
+@contextmanager
+def bind_update_context(context: UpdateContext):
+    """Make context the current update's context inside the block"""
+    scope = _UpdateScope(context)
+    token = _current_scope.set(scope)
+    try:
+        yield context
+    finally:
+        scope.open = False
+        _current_scope.reset(token)
@@ -1,18 +1,17 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from database.db_manager import DatabaseManager
-from utils.encryption import encrypt_state, decrypt_state
+from database.async_db_manager import AsyncDatabaseManager
 from utils.lock_manager import LockManager
 from utils.validators import validate_password, validate_account_number
 from utils.generators import generate_account_number, format_account_number
 from utils.message_manager import delete_previous_messages, send_and_save_message, edit_and_save_message
 import config
-import asyncio
 import json
+from datetime import datetime, timedelta
 
 
 class AccountHandler:
-    def __init__(self, db_manager: DatabaseManager, lock_manager: LockManager):
+    def __init__(self, db_manager: AsyncDatabaseManager, lock_manager: LockManager):
         self.db = db_manager
         self.lock_manager = lock_manager
     
@@ -21,7 +20,7 @@ class AccountHandler:
         user_id = str(update.effective_user.id)
         
         # Check if user is locked
-        is_locked, lock_message = self.lock_manager.check_lock(user_id)
+        is_locked, lock_message = await self.lock_manager.check_lock(user_id)
         if is_locked:
             if update.callback_query:
                 await update.callback_query.edit_message_text(lock_message)
@@ -38,8 +37,7 @@ class AccountHandler:
             'password_attempts': 0,
             'confirm_attempts': 0
         }
-        encrypted_state = encrypt_state(state)
-        self.db.update_user_state(user_id, encrypted_state)
+        await self.db.set_state(user_id, state)
         
         # Show account number
         account_text = "✅ اکانت شما ایجاد شد!\n\n"
@@ -56,17 +54,19 @@ class AccountHandler:
         reply_markup = InlineKeyboardMarkup(keyboard)
         
         if update.callback_query:
-            await edit_and_save_message(update, context, account_text, self.db, user_id, reply_markup=reply_markup, parse_mode='Markdown')
+            message = await edit_and_save_message(update, context, account_text, self.db, user_id, reply_markup=reply_markup, parse_mode='Markdown')
         else:
-            await send_and_save_message(context, update.effective_chat.id, account_text, self.db, user_id, reply_markup=reply_markup, parse_mode='Markdown')
+            message = await send_and_save_message(context, update.effective_chat.id, account_text, self.db, user_id, reply_markup=reply_markup, parse_mode='Markdown')
+        # Don't leave the account number in the chat
+        if message:
+            await self._timeout_delete_message(update.effective_chat.id, message.message_id)
     
     async def handle_next_step(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle next step button in account creation"""
         user_id = str(update.effective_user.id)
         
         # Get state
-        encrypted_state = self.db.get_user_state(user_id)
-        state = decrypt_state(encrypted_state)
+        state = await self.db.get_state(user_id)
         
         if state.get('step') == 'show_account_number':
             # Delete previous message
@@ -75,8 +75,7 @@ class AccountHandler:
             
             # Update state
             state['step'] = 'enter_password'
-            encrypted_state = encrypt_state(state)
-            self.db.update_user_state(user_id, encrypted_state)
+            await self.db.set_state(user_id, state)
             
         # Request password
         password_text = "🔐 تعیین رمز عبور\n\n"
@@ -100,14 +99,13 @@ class AccountHandler:
         password = update.message.text.strip()
         
         # Check if user is locked
-        is_locked, lock_message = self.lock_manager.check_lock(user_id)
+        is_locked, lock_message = await self.lock_manager.check_lock(user_id)
         if is_locked:
             await update.message.reply_text(lock_message)
             return
         
         # Get state
-        encrypted_state = self.db.get_user_state(user_id)
-        state = decrypt_state(encrypted_state)
+        state = await self.db.get_state(user_id)
         
         if state.get('action') != 'create_account' or state.get('step') != 'enter_password':
             await update.message.reply_text("لطفا از منوی اصلی شروع کنید.")
@@ -122,7 +120,7 @@ class AccountHandler:
             
             if remaining <= 0:
                 # Lock user
-                self.lock_manager.lock_user(user_id, "تعداد تلاش‌های ناموفق برای وارد کردن رمز")
+                await self.lock_manager.lock_user(user_id, "تعداد تلاش‌های ناموفق برای وارد کردن رمز")
                 await delete_previous_messages(update, context, self.db, user_id, delete_user_message=True)
                 lock_text = "تعداد تلاش‌های شما به پایان رسید. اکانت شما به مدت ۱۰ دقیقه قفل شد."
                 await send_and_save_message(context, update.effective_chat.id, lock_text, self.db, user_id)
@@ -140,8 +138,7 @@ class AccountHandler:
             await send_and_save_message(context, update.effective_chat.id, error_text, self.db, user_id, reply_markup=reply_markup)
             
             # Update state
-            encrypted_state = encrypt_state(state)
-            self.db.update_user_state(user_id, encrypted_state)
+            await self.db.set_state(user_id, state)
             return
         
         # Password is valid, delete previous messages and request confirmation
@@ -153,8 +150,7 @@ class AccountHandler:
         # Save password temporarily in state
         state['password'] = password
         state['step'] = 'confirm_password'
-        encrypted_state = encrypt_state(state)
-        self.db.update_user_state(user_id, encrypted_state)
+        await self.db.set_state(user_id, state)
         
         confirm_text = "✅ رمز شما ثبت شد!\n\n"
         confirm_text += "لطفا برای تایید، دوباره همان رمز ۸ رقمی را وارد کنید:\n\n"
@@ -171,14 +167,13 @@ class AccountHandler:
         password = update.message.text.strip()
         
         # Check if user is locked
-        is_locked, lock_message = self.lock_manager.check_lock(user_id)
+        is_locked, lock_message = await self.lock_manager.check_lock(user_id)
         if is_locked:
             await update.message.reply_text(lock_message)
             return
         
         # Get state
-        encrypted_state = self.db.get_user_state(user_id)
-        state = decrypt_state(encrypted_state)
+        state = await self.db.get_state(user_id)
         
         if state.get('action') != 'create_account' or state.get('step') != 'confirm_password':
             await update.message.reply_text("لطفا از منوی اصلی شروع کنید.")
@@ -192,7 +187,7 @@ class AccountHandler:
             
             if remaining <= 0:
                 # Lock user
-                self.lock_manager.lock_user(user_id, "تعداد تلاش‌های ناموفق برای تایید رمز")
+                await self.lock_manager.lock_user(user_id, "تعداد تلاش‌های ناموفق برای تایید رمز")
                 await delete_previous_messages(update, context, self.db, user_id, delete_user_message=True)
                 lock_text = "تعداد تلاش‌های شما به پایان رسید. اکانت شما به مدت ۱۰ دقیقه قفل شد."
                 await send_and_save_message(context, update.effective_chat.id, lock_text, self.db, user_id)
@@ -210,8 +205,7 @@ class AccountHandler:
             await send_and_save_message(context, update.effective_chat.id, error_text, self.db, user_id, reply_markup=reply_markup)
             
             # Update state
-            encrypted_state = encrypt_state(state)
-            self.db.update_user_state(user_id, encrypted_state)
+            await self.db.set_state(user_id, state)
             return
         
         # Password confirmed, delete previous messages and create account
@@ -219,10 +213,10 @@ class AccountHandler:
         
         # Create account
         account_number = state['account_number']
-        self.db.create_account(user_id, account_number, password)
+        await self.db.create_account(user_id, account_number, password)
         
         # Clear state
-        self.db.update_user_state(user_id, "")
+        await self.db.clear_state(user_id)
         
         # Show success message and main menu
         success_text = "✅ اکانت شما با موفقیت ایجاد شد!\n\n"
@@ -244,7 +238,7 @@ class AccountHandler:
             await delete_previous_messages(update, context, self.db, user_id, delete_user_message=False)
         
         # Clear state
-        self.db.update_user_state(user_id, "")
+        await self.db.clear_state(user_id)
         
         # Show main menu
         from handlers.start import StartHandler
@@ -256,7 +250,7 @@ class AccountHandler:
         user_id = str(update.effective_user.id)
         
         # Check if user is locked
-        is_locked, lock_message = self.lock_manager.check_lock(user_id)
+        is_locked, lock_message = await self.lock_manager.check_lock(user_id)
         if is_locked:
             if update.callback_query:
                 await update.callback_query.edit_message_text(lock_message)
@@ -269,8 +263,7 @@ class AccountHandler:
             'account_attempts': 0,
             'password_attempts': 0
         }
-        encrypted_state = encrypt_state(state)
-        self.db.update_user_state(user_id, encrypted_state)
+        await self.db.set_state(user_id, state)
         
         # Request account number
         account_text = "🔓 بازیابی اکانت\n\n"
@@ -292,14 +285,13 @@ class AccountHandler:
         account_number = update.message.text.strip()
         
         # Check if user is locked
-        is_locked, lock_message = self.lock_manager.check_lock(user_id)
+        is_locked, lock_message = await self.lock_manager.check_lock(user_id)
         if is_locked:
             await update.message.reply_text(lock_message)
             return
         
         # Get state
-        encrypted_state = self.db.get_user_state(user_id)
-        state = decrypt_state(encrypted_state)
+        state = await self.db.get_state(user_id)
         
         if state.get('action') != 'recover_account' or state.get('step') != 'enter_account_number':
             await update.message.reply_text("لطفا از منوی اصلی شروع کنید.")
@@ -313,7 +305,7 @@ class AccountHandler:
             remaining = 3 - state['account_attempts']
             
             if remaining <= 0:
-                self.lock_manager.lock_user(user_id, "تعداد تلاش‌های ناموفق برای وارد کردن شماره حساب")
+                await self.lock_manager.lock_user(user_id, "تعداد تلاش‌های ناموفق برای وارد کردن شماره حساب")
                 await delete_previous_messages(update, context, self.db, user_id, delete_user_message=True)
                 lock_text = "تعداد تلاش‌های شما به پایان رسید. اکانت شما به مدت ۱۰ دقیقه قفل شد."
                 await send_and_save_message(context, update.effective_chat.id, lock_text, self.db, user_id)
@@ -329,18 +321,17 @@ class AccountHandler:
             
             await send_and_save_message(context, update.effective_chat.id, error_text, self.db, user_id, reply_markup=reply_markup)
             
-            encrypted_state = encrypt_state(state)
-            self.db.update_user_state(user_id, encrypted_state)
+            await self.db.set_state(user_id, state)
             return
         
         # Check if account exists
-        account = self.db.get_account_by_number(account_number)
+        account = await self.db.get_account_by_number(account_number)
         if not account:
             state['account_attempts'] = state.get('account_attempts', 0) + 1
             remaining = 3 - state['account_attempts']
             
             if remaining <= 0:
-                self.lock_manager.lock_user(user_id, "تعداد تلاش‌های ناموفق برای وارد کردن شماره حساب")
+                await self.lock_manager.lock_user(user_id, "تعداد تلاش‌های ناموفق برای وارد کردن شماره حساب")
                 await delete_previous_messages(update, context, self.db, user_id, delete_user_message=True)
                 lock_text = "تعداد تلاش‌های شما به پایان رسید. اکانت شما به مدت ۱۰ دقیقه قفل شد."
                 await send_and_save_message(context, update.effective_chat.id, lock_text, self.db, user_id)
@@ -356,8 +347,7 @@ class AccountHandler:
             
             await send_and_save_message(context, update.effective_chat.id, error_text, self.db, user_id, reply_markup=reply_markup)
             
-            encrypted_state = encrypt_state(state)
-            self.db.update_user_state(user_id, encrypted_state)
+            await self.db.set_state(user_id, state)
             return
         
         # Account exists, delete previous messages and request password
@@ -365,8 +355,7 @@ class AccountHandler:
         
         state['account_number'] = account_number
         state['step'] = 'enter_password'
-        encrypted_state = encrypt_state(state)
-        self.db.update_user_state(user_id, encrypted_state)
+        await self.db.set_state(user_id, state)
         
         password_text = "🔐 تایید هویت\n\n"
         password_text += "لطفا رمز عبور ۸ رقمی خود را وارد کنید:\n\n"
@@ -383,14 +372,13 @@ class AccountHandler:
         password = update.message.text.strip()
         
         # Check if user is locked
-        is_locked, lock_message = self.lock_manager.check_lock(user_id)
+        is_locked, lock_message = await self.lock_manager.check_lock(user_id)
         if is_locked:
             await update.message.reply_text(lock_message)
             return
         
         # Get state
-        encrypted_state = self.db.get_user_state(user_id)
-        state = decrypt_state(encrypted_state)
+        state = await self.db.get_state(user_id)
         
         if state.get('action') != 'recover_account' or state.get('step') != 'enter_password':
             await update.message.reply_text("لطفا از منوی اصلی شروع کنید.")
@@ -399,12 +387,12 @@ class AccountHandler:
         account_number = state.get('account_number')
         
         # Verify password
-        if not self.db.verify_password(account_number, password):
+        if not await self.db.verify_password(account_number, password):
             state['password_attempts'] = state.get('password_attempts', 0) + 1
             remaining = 3 - state['password_attempts']
             
             if remaining <= 0:
-                self.lock_manager.lock_user(user_id, "تعداد تلاش‌های ناموفق برای وارد کردن رمز")
+                await self.lock_manager.lock_user(user_id, "تعداد تلاش‌های ناموفق برای وارد کردن رمز")
                 await delete_previous_messages(update, context, self.db, user_id, delete_user_message=True)
                 lock_text = "تعداد تلاش‌های شما به پایان رسید. اکانت شما به مدت ۱۰ دقیقه قفل شد."
                 await send_and_save_message(context, update.effective_chat.id, lock_text, self.db, user_id)
@@ -420,18 +408,17 @@ class AccountHandler:
             
             await send_and_save_message(context, update.effective_chat.id, error_text, self.db, user_id, reply_markup=reply_markup)
             
-            encrypted_state = encrypt_state(state)
-            self.db.update_user_state(user_id, encrypted_state)
+            await self.db.set_state(user_id, state)
             return
         
         # Password correct, activate account and link to current user
-        self.db.update_account_user_and_activate(account_number, user_id)
+        await self.db.update_account_user_and_activate(account_number, user_id)
         
         # Delete previous messages
         await delete_previous_messages(update, context, self.db, user_id, delete_user_message=True)
         
         # Clear state
-        self.db.update_user_state(user_id, "")
+        await self.db.clear_state(user_id)
         
         # Show main menu
         success_text = "✅ اکانت شما با موفقیت بازیابی شد!\n\n"
@@ -444,11 +431,8 @@ class AccountHandler:
         
         await send_and_save_message(context, update.effective_chat.id, success_text, self.db, user_id, reply_markup=reply_markup)
     
-    async def _timeout_delete_message(self, context: ContextTypes.DEFAULT_TYPE, chat_id: int, message_id: int):
-        """Delete message after timeout"""
-        await asyncio.sleep(config.MESSAGE_TIMEOUT_MINUTES * 60)
-        try:
-            await context.bot.delete_message(chat_id=chat_id, message_id=message_id)
-        except:
-            pass
+    async def _timeout_delete_message(self, chat_id: int, message_id: int):
+        """Delete message after MESSAGE_TIMEOUT_MINUTES (a scheduled task, so it survives restarts)"""
+        due_at = datetime.utcnow() + timedelta(minutes=config.MESSAGE_TIMEOUT_MINUTES)
+        await self.db.schedule_task('delete_message', due_at, chat_id=chat_id, message_id=message_id)
 
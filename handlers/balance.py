@@ -1,6 +1,6 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from database.db_manager import DatabaseManager
+from database.async_db_manager import AsyncDatabaseManager
 from utils.lock_manager import LockManager
 from utils.generators import format_account_number, generate_payment_link, generate_qr_code
 from utils.message_manager import delete_previous_messages, send_and_save_message, edit_and_save_message
@@ -8,7 +8,7 @@ import config
 
 
 class BalanceHandler:
-    def __init__(self, db_manager: DatabaseManager, lock_manager: LockManager):
+    def __init__(self, db_manager: AsyncDatabaseManager, lock_manager: LockManager):
         self.db = db_manager
         self.lock_manager = lock_manager
     
@@ -17,14 +17,14 @@ class BalanceHandler:
         user_id = str(update.effective_user.id)
         
         # Check if user is locked
-        is_locked, lock_message = self.lock_manager.check_lock(user_id)
+        is_locked, lock_message = await self.lock_manager.check_lock(user_id)
         if is_locked:
             if update.callback_query:
                 await update.callback_query.edit_message_text(lock_message)
             return
         
         # Get active account
-        account = self.db.get_active_account(user_id)
+        account = await self.db.get_active_account(user_id)
         if not account:
             error_text = "شما هیچ اکانت فعالی ندارید. لطفا ابتدا اکانت بسازید."
             keyboard = [[InlineKeyboardButton("ساخت اکانت", callback_data="create_account")]]
@@ -60,14 +60,14 @@ class BalanceHandler:
         user_id = str(update.effective_user.id)
         
         # Check if user is locked
-        is_locked, lock_message = self.lock_manager.check_lock(user_id)
+        is_locked, lock_message = await self.lock_manager.check_lock(user_id)
         if is_locked:
             if update.callback_query:
                 await update.callback_query.edit_message_text(lock_message)
             return
         
         # Get active account
-        account = self.db.get_active_account(user_id)
+        account = await self.db.get_active_account(user_id)
         if not account:
             error_text = "شما هیچ اکانت فعالی ندارید."
             if update.callback_query:
@@ -75,13 +75,11 @@ class BalanceHandler:
             return
         
         # Save state
-        from utils.encryption import encrypt_state
         state = {
             'action': 'create_payment_link',
             'step': 'enter_amount'
         }
-        encrypted_state = encrypt_state(state)
-        self.db.update_user_state(user_id, encrypted_state)
+        await self.db.set_state(user_id, state)
         
         # Request amount
         amount_text = "🔗 ساخت لینک پرداخت\n\n"
@@ -104,15 +102,13 @@ class BalanceHandler:
         amount_str = update.message.text.strip()
         
         # Check if user is locked
-        is_locked, lock_message = self.lock_manager.check_lock(user_id)
+        is_locked, lock_message = await self.lock_manager.check_lock(user_id)
         if is_locked:
             await update.message.reply_text(lock_message)
             return
         
         # Get state
-        from utils.encryption import decrypt_state, encrypt_state
-        encrypted_state = self.db.get_user_state(user_id)
-        state = decrypt_state(encrypted_state)
+        state = await self.db.get_state(user_id)
         
         if state.get('action') != 'create_payment_link' or state.get('step') != 'enter_amount':
             await update.message.reply_text("لطفا از منوی اصلی شروع کنید.")
@@ -136,7 +132,7 @@ class BalanceHandler:
         await delete_previous_messages(update, context, self.db, user_id, delete_user_message=True)
         
         # Get account to include in payment link
-        account = self.db.get_active_account(user_id)
+        account = await self.db.get_active_account(user_id)
         if not account:
             error_text = "شما هیچ اکانت فعالی ندارید."
             keyboard = [[InlineKeyboardButton("منوی اصلی", callback_data="main_menu")]]
@@ -175,5 +171,5 @@ class BalanceHandler:
         )
         
         # Clear state
-        self.db.update_user_state(user_id, "")
+        await self.db.clear_state(user_id)
 
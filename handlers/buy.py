@@ -1,15 +1,15 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from database.db_manager import DatabaseManager
+from database.async_db_manager import AsyncDatabaseManager
 from utils.lock_manager import LockManager
 from utils.validators import validate_amount, validate_password
-from utils.encryption import encrypt_state, decrypt_state
-from utils.message_manager import delete_previous_messages, send_and_save_message, edit_and_save_message
+from utils.message_manager import (delete_previous_messages, send_and_save_message, edit_and_save_message,
+                                   get_message_deleter)
 import config
 
 
 class BuyHandler:
-    def __init__(self, db_manager: DatabaseManager, lock_manager: LockManager):
+    def __init__(self, db_manager: AsyncDatabaseManager, lock_manager: LockManager):
         self.db = db_manager
         self.lock_manager = lock_manager
     
@@ -18,14 +18,14 @@ class BuyHandler:
         user_id = str(update.effective_user.id)
         
         # Check if user is locked
-        is_locked, lock_message = self.lock_manager.check_lock(user_id)
+        is_locked, lock_message = await self.lock_manager.check_lock(user_id)
         if is_locked:
             if update.callback_query:
                 await update.callback_query.edit_message_text(lock_message)
             return
         
         # Get active account
-        account = self.db.get_active_account(user_id)
+        account = await self.db.get_active_account(user_id)
         if not account:
             error_text = "شما هیچ اکانت فعالی ندارید. لطفا ابتدا اکانت بسازید."
             keyboard = [[InlineKeyboardButton("ساخت اکانت", callback_data="create_account")]]
@@ -40,8 +40,7 @@ class BuyHandler:
             'action': 'buy_pers',
             'step': 'enter_amount'
         }
-        encrypted_state = encrypt_state(state)
-        self.db.update_user_state(user_id, encrypted_state)
+        await self.db.set_state(user_id, state)
         
         # Request amount
         balance = float(account.balance)
@@ -65,14 +64,13 @@ class BuyHandler:
         amount_str = update.message.text.strip()
         
         # Check if user is locked
-        is_locked, lock_message = self.lock_manager.check_lock(user_id)
+        is_locked, lock_message = await self.lock_manager.check_lock(user_id)
         if is_locked:
             await update.message.reply_text(lock_message)
             return
         
         # Get state
-        encrypted_state = self.db.get_user_state(user_id)
-        state = decrypt_state(encrypted_state)
+        state = await self.db.get_state(user_id)
         
         if state.get('action') != 'buy_pers' or state.get('step') != 'enter_amount':
             await update.message.reply_text("لطفا از منوی اصلی شروع کنید.")
@@ -108,8 +106,7 @@ class BuyHandler:
         # Save amount and request password
         state['amount'] = amount
         state['step'] = 'enter_password'
-        encrypted_state = encrypt_state(state)
-        self.db.update_user_state(user_id, encrypted_state)
+        await self.db.set_state(user_id, state)
         
         password_text = "🔐 تایید هویت\n\n"
         password_text += "لطفا رمز عبور ۸ رقمی خود را وارد کنید:\n\n"
@@ -126,32 +123,31 @@ class BuyHandler:
         password = update.message.text.strip()
         
         # Check if user is locked
-        is_locked, lock_message = self.lock_manager.check_lock(user_id)
+        is_locked, lock_message = await self.lock_manager.check_lock(user_id)
         if is_locked:
             await update.message.reply_text(lock_message)
             return
         
         # Get state
-        encrypted_state = self.db.get_user_state(user_id)
-        state = decrypt_state(encrypted_state)
+        state = await self.db.get_state(user_id)
         
         if state.get('action') != 'buy_pers' or state.get('step') != 'enter_password':
             await update.message.reply_text("لطفا از منوی اصلی شروع کنید.")
             return
         
         # Get account
-        account = self.db.get_active_account(user_id)
+        account = await self.db.get_active_account(user_id)
         if not account:
             await update.message.reply_text("اکانت شما یافت نشد.")
             return
         
         # Verify password
-        if not self.db.verify_password(account.account_number, password):
+        if not await self.db.verify_password(account.account_number, password):
             state['password_attempts'] = state.get('password_attempts', 0) + 1
             remaining = 3 - state.get('password_attempts', 0)
             
             if remaining <= 0:
-                self.lock_manager.lock_user(user_id, "تعداد تلاش‌های ناموفق برای وارد کردن رمز")
+                await self.lock_manager.lock_user(user_id, "تعداد تلاش‌های ناموفق برای وارد کردن رمز")
                 await delete_previous_messages(update, context, self.db, user_id, delete_user_message=True)
                 lock_text = "تعداد تلاش‌های شما به پایان رسید. اکانت شما به مدت ۱۰ دقیقه قفل شد."
                 await send_and_save_message(context, update.effective_chat.id, lock_text, self.db, user_id)
@@ -167,8 +163,7 @@ class BuyHandler:
             
             await send_and_save_message(context, update.effective_chat.id, error_text, self.db, user_id, reply_markup=reply_markup)
             
-            encrypted_state = encrypt_state(state)
-            self.db.update_user_state(user_id, encrypted_state)
+            await self.db.set_state(user_id, state)
             return
         
         # Password correct, delete previous messages
@@ -180,7 +175,7 @@ class BuyHandler:
         if from_payment_link:
             # Coming from payment link, directly charge account
             # Update balance immediately
-            self.db.update_account_balance(account.account_number, amount)
+            await self.db.update_account_balance(account.account_number, amount)
         else:
             # Normal buy flow, show payment link (mock Shaparak)
             payment_text = "لینک پرداخت بانکی (شاپرک):\n\n"
@@ -205,16 +200,13 @@ class BuyHandler:
             await asyncio.sleep(3)  # Simulate processing time
             
             # Update balance
-            self.db.update_account_balance(account.account_number, amount)
+            await self.db.update_account_balance(account.account_number, amount)
             
             # Delete processing message
-            try:
-                await processing_msg.delete()
-            except:
-                pass
+            get_message_deleter().schedule(context.bot, processing_msg.chat_id, processing_msg.message_id)
         
         # Create transaction record
-        transaction = self.db.create_transaction(
+        transaction = await self.db.create_transaction(
             from_account=None,
             to_account=account.account_number,
             amount=amount,
@@ -224,7 +216,7 @@ class BuyHandler:
         
         # Create comprehensive transaction log
         username = update.effective_user.username if update.effective_user else None
-        self.db.create_transaction_log(
+        await self.db.create_transaction_log(
             user_id=user_id,
             username=username,
             transaction_type='buy',
@@ -238,7 +230,7 @@ class BuyHandler:
         )
         
         # Show success message
-        new_balance = float(self.db.get_account_balance(account.account_number))
+        new_balance = float(await self.db.get_account_balance(account.account_number))
         success_text = "✅ پرداخت با موفقیت انجام شد!\n\n"
         success_text += "━━━━━━━━━━━━━━━━━━━━\n\n"
         success_text += f"💰 مبلغ اضافه شده: {amount:,.2f} PERS\n"
@@ -262,5 +254,5 @@ class BuyHandler:
         )
         
         # Clear state
-        self.db.update_user_state(user_id, "")
+        await self.db.clear_state(user_id)
 
@@ -1,15 +1,14 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from database.db_manager import DatabaseManager
+from database.async_db_manager import AsyncDatabaseManager
 from utils.lock_manager import LockManager
 from utils.validators import validate_password
-from utils.encryption import encrypt_state, decrypt_state
 from utils.message_manager import delete_previous_messages, send_and_save_message, edit_and_save_message
 import config
 
 
 class ContactHandler:
-    def __init__(self, db_manager: DatabaseManager, lock_manager: LockManager):
+    def __init__(self, db_manager: AsyncDatabaseManager, lock_manager: LockManager):
         self.db = db_manager
         self.lock_manager = lock_manager
     
@@ -18,14 +17,14 @@ class ContactHandler:
         user_id = str(update.effective_user.id)
         
         # Check if user is locked
-        is_locked, lock_message = self.lock_manager.check_lock(user_id)
+        is_locked, lock_message = await self.lock_manager.check_lock(user_id)
         if is_locked:
             if update.callback_query:
                 await update.callback_query.edit_message_text(lock_message)
             return
         
         # Get active account
-        account = self.db.get_active_account(user_id)
+        account = await self.db.get_active_account(user_id)
         if not account:
             error_text = "شما هیچ اکانت فعالی ندارید. لطفا ابتدا اکانت بسازید."
             keyboard = [[InlineKeyboardButton("ساخت اکانت", callback_data="create_account")]]
@@ -40,8 +39,7 @@ class ContactHandler:
             'action': 'contact',
             'step': 'enter_password'
         }
-        encrypted_state = encrypt_state(state)
-        self.db.update_user_state(user_id, encrypted_state)
+        await self.db.set_state(user_id, state)
         
         # Request password
         password_text = "📞 ارتباط با پشتیبانی\n\n"
@@ -62,32 +60,31 @@ class ContactHandler:
         password = update.message.text.strip()
         
         # Check if user is locked
-        is_locked, lock_message = self.lock_manager.check_lock(user_id)
+        is_locked, lock_message = await self.lock_manager.check_lock(user_id)
         if is_locked:
             await update.message.reply_text(lock_message)
             return
         
         # Get state
-        encrypted_state = self.db.get_user_state(user_id)
-        state = decrypt_state(encrypted_state)
+        state = await self.db.get_state(user_id)
         
         if state.get('action') != 'contact' or state.get('step') != 'enter_password':
             await update.message.reply_text("لطفا از منوی اصلی شروع کنید.")
             return
         
         # Get account
-        account = self.db.get_active_account(user_id)
+        account = await self.db.get_active_account(user_id)
         if not account:
             await update.message.reply_text("اکانت شما یافت نشد.")
             return
         
         # Verify password
-        if not self.db.verify_password(account.account_number, password):
+        if not await self.db.verify_password(account.account_number, password):
             state['password_attempts'] = state.get('password_attempts', 0) + 1
             remaining = 3 - state.get('password_attempts', 0)
             
             if remaining <= 0:
-                self.lock_manager.lock_user(user_id, "تعداد تلاش‌های ناموفق برای وارد کردن رمز")
+                await self.lock_manager.lock_user(user_id, "تعداد تلاش‌های ناموفق برای وارد کردن رمز")
                 await delete_previous_messages(update, context, self.db, user_id, delete_user_message=True)
                 lock_text = "تعداد تلاش‌های شما به پایان رسید. اکانت شما به مدت ۱۰ دقیقه قفل شد."
                 await send_and_save_message(context, update.effective_chat.id, lock_text, self.db, user_id)
@@ -103,8 +100,7 @@ class ContactHandler:
             
             await send_and_save_message(context, update.effective_chat.id, error_text, self.db, user_id, reply_markup=reply_markup)
             
-            encrypted_state = encrypt_state(state)
-            self.db.update_user_state(user_id, encrypted_state)
+            await self.db.set_state(user_id, state)
             return
         
         # Password correct, delete previous messages and request message text
@@ -112,8 +108,7 @@ class ContactHandler:
         
         # Update state
         state['step'] = 'enter_message'
-        encrypted_state = encrypt_state(state)
-        self.db.update_user_state(user_id, encrypted_state)
+        await self.db.set_state(user_id, state)
         
         message_text = "✍️ ارسال پیام به پشتیبانی\n\n"
         message_text += "لطفا متن پیام خود را وارد کنید:\n\n"
@@ -132,21 +127,20 @@ class ContactHandler:
         message = update.message.text.strip()
         
         # Check if user is locked
-        is_locked, lock_message = self.lock_manager.check_lock(user_id)
+        is_locked, lock_message = await self.lock_manager.check_lock(user_id)
         if is_locked:
             await update.message.reply_text(lock_message)
             return
         
         # Get state
-        encrypted_state = self.db.get_user_state(user_id)
-        state = decrypt_state(encrypted_state)
+        state = await self.db.get_state(user_id)
         
         if state.get('action') != 'contact' or state.get('step') != 'enter_message':
             await update.message.reply_text("لطفا از منوی اصلی شروع کنید.")
             return
         
         # Get account
-        account = self.db.get_active_account(user_id)
+        account = await self.db.get_active_account(user_id)
         if not account:
             await update.message.reply_text("اکانت شما یافت نشد.")
             return
@@ -160,10 +154,9 @@ class ContactHandler:
         admin_text += f"شماره حساب: {account.account_number}\n\n"
         admin_text += f"متن پیام:\n{message}"
         
-        try:
-            await context.bot.send_message(chat_id=config.ADMIN_USER_ID, text=admin_text)
-        except:
-            pass  # Admin might not be set up yet
+        # Delivered by the outbox dispatcher, so a slow or failing Telegram API does not lose it
+        if config.ADMIN_USER_ID:
+            await self.db.enqueue_notification(config.ADMIN_USER_ID, admin_text, 'contact')
         
         # Show success message
         success_text = "✅ پیام شما با موفقیت ارسال شد!\n\n"
@@ -186,5 +179,5 @@ class ContactHandler:
         )
         
         # Clear state
-        self.db.update_user_state(user_id, "")
+        await self.db.clear_state(user_id)
 
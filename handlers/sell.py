@@ -1,15 +1,14 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from database.db_manager import DatabaseManager
+from database.async_db_manager import AsyncDatabaseManager
 from utils.lock_manager import LockManager
 from utils.validators import validate_amount, validate_sheba, validate_password
-from utils.encryption import encrypt_state, decrypt_state
 from utils.message_manager import delete_previous_messages, send_and_save_message, edit_and_save_message
 import config
 
 
 class SellHandler:
-    def __init__(self, db_manager: DatabaseManager, lock_manager: LockManager):
+    def __init__(self, db_manager: AsyncDatabaseManager, lock_manager: LockManager):
         self.db = db_manager
         self.lock_manager = lock_manager
     
@@ -18,14 +17,14 @@ class SellHandler:
         user_id = str(update.effective_user.id)
         
         # Check if user is locked
-        is_locked, lock_message = self.lock_manager.check_lock(user_id)
+        is_locked, lock_message = await self.lock_manager.check_lock(user_id)
         if is_locked:
             if update.callback_query:
                 await update.callback_query.edit_message_text(lock_message)
             return
         
         # Get active account
-        account = self.db.get_active_account(user_id)
+        account = await self.db.get_active_account(user_id)
         if not account:
             error_text = "شما هیچ اکانت فعالی ندارید. لطفا ابتدا اکانت بسازید."
             keyboard = [[InlineKeyboardButton("ساخت اکانت", callback_data="create_account")]]
@@ -40,8 +39,7 @@ class SellHandler:
             'action': 'sell_pers',
             'step': 'enter_amount'
         }
-        encrypted_state = encrypt_state(state)
-        self.db.update_user_state(user_id, encrypted_state)
+        await self.db.set_state(user_id, state)
         
         # Request amount
         balance = float(account.balance)
@@ -71,14 +69,13 @@ class SellHandler:
         amount_str = update.message.text.strip()
         
         # Check if user is locked
-        is_locked, lock_message = self.lock_manager.check_lock(user_id)
+        is_locked, lock_message = await self.lock_manager.check_lock(user_id)
         if is_locked:
             await update.message.reply_text(lock_message)
             return
         
         # Get state
-        encrypted_state = self.db.get_user_state(user_id)
-        state = decrypt_state(encrypted_state)
+        state = await self.db.get_state(user_id)
         
         if state.get('action') != 'sell_pers' or state.get('step') != 'enter_amount':
             await update.message.reply_text("لطفا از منوی اصلی شروع کنید.")
@@ -98,7 +95,7 @@ class SellHandler:
             return
         
         # Get account
-        account = self.db.get_active_account(user_id)
+        account = await self.db.get_active_account(user_id)
         if not account:
             await update.message.reply_text("اکانت شما یافت نشد.")
             return
@@ -127,8 +124,7 @@ class SellHandler:
         # Save amount and request Sheba
         state['amount'] = amount
         state['step'] = 'enter_sheba'
-        encrypted_state = encrypt_state(state)
-        self.db.update_user_state(user_id, encrypted_state)
+        await self.db.set_state(user_id, state)
         
         sheba_text = "🏦 اطلاعات حساب بانکی\n\n"
         sheba_text += "لطفا شماره شبا (IBAN) خود را وارد کنید:\n\n"
@@ -146,14 +142,13 @@ class SellHandler:
         sheba = update.message.text.strip()
         
         # Check if user is locked
-        is_locked, lock_message = self.lock_manager.check_lock(user_id)
+        is_locked, lock_message = await self.lock_manager.check_lock(user_id)
         if is_locked:
             await update.message.reply_text(lock_message)
             return
         
         # Get state
-        encrypted_state = self.db.get_user_state(user_id)
-        state = decrypt_state(encrypted_state)
+        state = await self.db.get_state(user_id)
         
         if state.get('action') != 'sell_pers' or state.get('step') != 'enter_sheba':
             await update.message.reply_text("لطفا از منوی اصلی شروع کنید.")
@@ -178,15 +173,14 @@ class SellHandler:
         # Save Sheba and show confirmation
         state['sheba'] = sheba
         state['step'] = 'confirm'
-        encrypted_state = encrypt_state(state)
-        self.db.update_user_state(user_id, encrypted_state)
+        await self.db.set_state(user_id, state)
         
         # Calculate amount in Toman
         amount = state.get('amount', 0)
         amount_toman = amount * config.PERS_TO_TOMAN
         
         # Get current balance
-        account = self.db.get_active_account(user_id)
+        account = await self.db.get_active_account(user_id)
         balance = float(account.balance) if account else 0
         
         # Calculate commission
@@ -215,8 +209,7 @@ class SellHandler:
         user_id = str(update.effective_user.id)
         
         # Get state
-        encrypted_state = self.db.get_user_state(user_id)
-        state = decrypt_state(encrypted_state)
+        state = await self.db.get_state(user_id)
         
         if state.get('action') != 'sell_pers' or state.get('step') != 'confirm':
             if update.callback_query:
@@ -229,8 +222,7 @@ class SellHandler:
         
         # Update state to request password
         state['step'] = 'enter_password'
-        encrypted_state = encrypt_state(state)
-        self.db.update_user_state(user_id, encrypted_state)
+        await self.db.set_state(user_id, state)
         
         password_text = "🔐 تایید هویت\n\n"
         password_text += "لطفا رمز عبور ۸ رقمی خود را وارد کنید:\n\n"
@@ -247,32 +239,31 @@ class SellHandler:
         password = update.message.text.strip()
         
         # Check if user is locked
-        is_locked, lock_message = self.lock_manager.check_lock(user_id)
+        is_locked, lock_message = await self.lock_manager.check_lock(user_id)
         if is_locked:
             await update.message.reply_text(lock_message)
             return
         
         # Get state
-        encrypted_state = self.db.get_user_state(user_id)
-        state = decrypt_state(encrypted_state)
+        state = await self.db.get_state(user_id)
         
         if state.get('action') != 'sell_pers' or state.get('step') != 'enter_password':
             await update.message.reply_text("لطفا از منوی اصلی شروع کنید.")
             return
         
         # Get account
-        account = self.db.get_active_account(user_id)
+        account = await self.db.get_active_account(user_id)
         if not account:
             await update.message.reply_text("اکانت شما یافت نشد.")
             return
         
         # Verify password
-        if not self.db.verify_password(account.account_number, password):
+        if not await self.db.verify_password(account.account_number, password):
             state['password_attempts'] = state.get('password_attempts', 0) + 1
             remaining = 3 - state.get('password_attempts', 0)
             
             if remaining <= 0:
-                self.lock_manager.lock_user(user_id, "تعداد تلاش‌های ناموفق برای وارد کردن رمز")
+                await self.lock_manager.lock_user(user_id, "تعداد تلاش‌های ناموفق برای وارد کردن رمز")
                 await delete_previous_messages(update, context, self.db, user_id, delete_user_message=True)
                 lock_text = "تعداد تلاش‌های شما به پایان رسید. اکانت شما به مدت ۱۰ دقیقه قفل شد."
                 await send_and_save_message(context, update.effective_chat.id, lock_text, self.db, user_id)
@@ -288,8 +279,7 @@ class SellHandler:
             
             await send_and_save_message(context, update.effective_chat.id, error_text, self.db, user_id, reply_markup=reply_markup)
             
-            encrypted_state = encrypt_state(state)
-            self.db.update_user_state(user_id, encrypted_state)
+            await self.db.set_state(user_id, state)
             return
         
         # Password correct, delete previous messages and process sell
@@ -317,7 +307,7 @@ class SellHandler:
             return
         
         # Get admin account number for commission
-        admin_account_number = self.db.get_admin_account_number()
+        admin_account_number = await self.db.get_admin_account_number()
         if not admin_account_number:
             error_text = "خطا در پردازش: حساب ادمین یافت نشد."
             keyboard = [[InlineKeyboardButton("منوی اصلی", callback_data="main_menu")]]
@@ -327,7 +317,7 @@ class SellHandler:
             return
         
         # Ensure admin account exists
-        admin_account = self.db.get_account_by_number(admin_account_number)
+        admin_account = await self.db.get_account_by_number(admin_account_number)
         if not admin_account:
             error_text = "خطا در پردازش: حساب ادمین یافت نشد."
             keyboard = [[InlineKeyboardButton("منوی اصلی", callback_data="main_menu")]]
@@ -336,81 +326,75 @@ class SellHandler:
             await send_and_save_message(context, update.effective_chat.id, error_text, self.db, user_id, reply_markup=reply_markup)
             return
         
-        # Deduct amount + commission from user's balance
-        self.db.update_account_balance(account.account_number, -total_deduction)
-        
-        # Add commission to admin's account
-        self.db.update_account_balance(admin_account_number, commission)
-        
-        # Create transaction record
-        transaction = self.db.create_transaction(
-            from_account=account.account_number,
-            to_account=None,
-            amount=amount,
-            fee=commission,
-            transaction_type='sell'
-        )
-        
-        # Create comprehensive transaction log with sheba number
         username = update.effective_user.username if update.effective_user else None
-        self.db.create_transaction_log(
-            user_id=user_id,
-            username=username,
-            transaction_type='sell',
-            from_account=account.account_number,
-            to_account=None,
-            amount=amount,
-            fee=commission,
-            sheba=state.get('sheba'),
-            status='success',
-            transaction_id=transaction.id
-        )
         
         # Calculate amount in Toman
         amount_toman = amount * config.PERS_TO_TOMAN
         
-        # Create withdrawal request
-        withdrawal_request = self.db.create_withdrawal_request(
-            user_id=user_id,
-            account_number=account.account_number,
-            amount_pers=amount,
-            amount_toman=amount_toman,
-            sheba=state.get('sheba'),
-            transaction_id=transaction.id
-        )
-        
-        # Send notification to @PERS_coin_bot_support
-        support_text = f"🔔 درخواست واریز ریالی جدید\n\n"
-        support_text += f"━━━━━━━━━━━━━━━━━━━━\n\n"
-        support_text += f"👤 User ID: {user_id}\n"
-        support_text += f"💼 شماره حساب: {account.account_number}\n"
-        support_text += f"💰 مبلغ: {amount:,.2f} PERS ({amount_toman:,.0f} تومان)\n"
-        support_text += f"💸 کارمزد: {commission:,.2f} PERS (1%)\n"
-        support_text += f"🏦 شبا: {state.get('sheba')}\n"
-        support_text += f"🆔 شماره درخواست: #{withdrawal_request.id}\n\n"
-        support_text += f"━━━━━━━━━━━━━━━━━━━━\n\n"
-        support_text += f"⏰ زمان ثبت: {withdrawal_request.created_at.strftime('%Y-%m-%d %H:%M:%S') if withdrawal_request.created_at else 'نامشخص'}"
-        
-        # Send to support channel/group or admin
-        support_chat_id = config.SUPPORT_CHAT_ID if config.SUPPORT_CHAT_ID else config.ADMIN_USER_ID
-        if support_chat_id:
-            try:
-                await context.bot.send_message(chat_id=support_chat_id, text=support_text)
-            except Exception as e:
-                # Log error but don't fail the transaction
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.warning(f"Failed to send notification to support: {e}")
-        
-        # Also send to admin if different from support
-        if config.ADMIN_USER_ID and config.ADMIN_USER_ID != support_chat_id:
-            try:
-                await context.bot.send_message(chat_id=config.ADMIN_USER_ID, text=support_text)
-            except:
-                pass  # Admin might not be set up yet
+        # Balance changes, transaction, log and withdrawal request commit together
+        async with self.db.account_locks.hold(account.account_number):
+            # The balance checked above may be stale by the time the lock is held
+            balance = float(await self.db.get_account_balance(account.account_number))
+            if total_deduction > balance * 0.99:
+                error_text = "موجودی حساب شما کافی نیست."
+                keyboard = [[InlineKeyboardButton("منوی اصلی", callback_data="main_menu")]]
+                reply_markup = InlineKeyboardMarkup(keyboard)
+
+                await send_and_save_message(context, update.effective_chat.id, error_text, self.db, user_id, reply_markup=reply_markup)
+                return
+
+            async with self.db.unit_of_work():
+                # Deduct amount + commission from user's balance
+                await self.db.update_account_balance(account.account_number, -total_deduction)
+                
+                # Add commission to admin's account
+                await self.db.update_account_balance(admin_account_number, commission)
+                
+                # Create transaction record
+                transaction = await self.db.create_transaction(
+                    from_account=account.account_number,
+                    to_account=None,
+                    amount=amount,
+                    fee=commission,
+                    transaction_type='sell'
+                )
+                
+                # Create comprehensive transaction log with sheba number
+                await self.db.create_transaction_log(
+                    user_id=user_id,
+                    username=username,
+                    transaction_type='sell',
+                    from_account=account.account_number,
+                    to_account=None,
+                    amount=amount,
+                    fee=commission,
+                    sheba=state.get('sheba'),
+                    status='success',
+                    transaction_id=transaction.id
+                )
+                
+                # Create withdrawal request
+                withdrawal_request = await self.db.create_withdrawal_request(
+                    user_id=user_id,
+                    account_number=account.account_number,
+                    amount_pers=amount,
+                    amount_toman=amount_toman,
+                    sheba=state.get('sheba'),
+                    transaction_id=transaction.id
+                )
+                
+                # Notify @PERS_coin_bot_support (and the admin if different) through the outbox,
+                # in the same commit as the request
+                support_text = self._support_notification(user_id, account.account_number, amount, amount_toman,
+                                                          commission, state.get('sheba'), withdrawal_request)
+                support_chat_id = config.SUPPORT_CHAT_ID if config.SUPPORT_CHAT_ID else config.ADMIN_USER_ID
+                if support_chat_id:
+                    await self.db.enqueue_notification(support_chat_id, support_text, 'withdrawal_request')
+                if config.ADMIN_USER_ID and config.ADMIN_USER_ID != support_chat_id:
+                    await self.db.enqueue_notification(config.ADMIN_USER_ID, support_text, 'withdrawal_request')
         
         # Show success message
-        new_balance = float(self.db.get_account_balance(account.account_number))
+        new_balance = float(await self.db.get_account_balance(account.account_number))
         success_text = "✅ درخواست فروش با موفقیت ثبت شد!\n\n"
         success_text += "━━━━━━━━━━━━━━━━━━━━\n\n"
         success_text += f"💼 موجودی: {new_balance:,.2f} PERS\n"
@@ -434,5 +418,20 @@ class SellHandler:
         )
         
         # Clear state
-        self.db.update_user_state(user_id, "")
+        await self.db.clear_state(user_id)
 
+    
+    def _support_notification(self, user_id: str, account_number: str, amount: float, amount_toman: float,
+                              commission: float, sheba: str, withdrawal_request) -> str:
+        """Message announcing a new withdrawal request to support"""
+        support_text = f"🔔 درخواست واریز ریالی جدید\n\n"
+        support_text += f"━━━━━━━━━━━━━━━━━━━━\n\n"
+        support_text += f"👤 User ID: {user_id}\n"
+        support_text += f"💼 شماره حساب: {account_number}\n"
+        support_text += f"💰 مبلغ: {amount:,.2f} PERS ({amount_toman:,.0f} تومان)\n"
+        support_text += f"💸 کارمزد: {commission:,.2f} PERS (1%)\n"
+        support_text += f"🏦 شبا: {sheba}\n"
+        support_text += f"🆔 شماره درخواست: #{withdrawal_request.id}\n\n"
+        support_text += f"━━━━━━━━━━━━━━━━━━━━\n\n"
+        support_text += f"⏰ زمان ثبت: {withdrawal_request.created_at.strftime('%Y-%m-%d %H:%M:%S') if withdrawal_request.created_at else 'نامشخص'}"
+        return support_text
@@ -1,18 +1,17 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from database.db_manager import DatabaseManager
+from database.async_db_manager import AsyncDatabaseManager
 from utils.lock_manager import LockManager
 from utils.validators import validate_account_number, validate_amount, validate_password
-from utils.encryption import encrypt_state, decrypt_state
-from utils.message_manager import delete_previous_messages, send_and_save_message, edit_and_save_message
+from utils.message_manager import (delete_previous_messages, send_and_save_message, edit_and_save_message,
+                                   get_message_deleter)
 import config
-import asyncio
 import logging
-from datetime import datetime, timedelta
+import uuid
 
 
 class SendHandler:
-    def __init__(self, db_manager: DatabaseManager, lock_manager: LockManager):
+    def __init__(self, db_manager: AsyncDatabaseManager, lock_manager: LockManager):
         self.db = db_manager
         self.lock_manager = lock_manager
     
@@ -21,14 +20,14 @@ class SendHandler:
         user_id = str(update.effective_user.id)
         
         # Check if user is locked
-        is_locked, lock_message = self.lock_manager.check_lock(user_id)
+        is_locked, lock_message = await self.lock_manager.check_lock(user_id)
         if is_locked:
             if update.callback_query:
                 await update.callback_query.edit_message_text(lock_message)
             return
         
         # Get active account
-        account = self.db.get_active_account(user_id)
+        account = await self.db.get_active_account(user_id)
         if not account:
             error_text = "شما هیچ اکانت فعالی ندارید. لطفا ابتدا اکانت بسازید."
             keyboard = [[InlineKeyboardButton("ساخت اکانت", callback_data="create_account")]]
@@ -44,8 +43,7 @@ class SendHandler:
             'step': 'enter_destination',
             'destination_attempts': 0
         }
-        encrypted_state = encrypt_state(state)
-        self.db.update_user_state(user_id, encrypted_state)
+        await self.db.set_state(user_id, state)
         
         # Request destination account
         balance = float(account.balance)
@@ -72,14 +70,13 @@ class SendHandler:
         destination = update.message.text.strip()
         
         # Check if user is locked
-        is_locked, lock_message = self.lock_manager.check_lock(user_id)
+        is_locked, lock_message = await self.lock_manager.check_lock(user_id)
         if is_locked:
             await update.message.reply_text(lock_message)
             return
         
         # Get state
-        encrypted_state = self.db.get_user_state(user_id)
-        state = decrypt_state(encrypted_state)
+        state = await self.db.get_state(user_id)
         
         if state.get('action') != 'send_pers' or state.get('step') != 'enter_destination':
             await update.message.reply_text("لطفا از منوی اصلی شروع کنید.")
@@ -93,7 +90,7 @@ class SendHandler:
             remaining = 3 - state['destination_attempts']
             
             if remaining <= 0:
-                self.lock_manager.lock_user(user_id, "تعداد تلاش‌های ناموفق برای وارد کردن شماره حساب مقصد")
+                await self.lock_manager.lock_user(user_id, "تعداد تلاش‌های ناموفق برای وارد کردن شماره حساب مقصد")
                 await delete_previous_messages(update, context, self.db, user_id, delete_user_message=True)
                 lock_text = "تعداد تلاش‌های شما به پایان رسید. اکانت شما به مدت ۱۰ دقیقه قفل شد."
                 await send_and_save_message(context, update.effective_chat.id, lock_text, self.db, user_id)
@@ -109,18 +106,17 @@ class SendHandler:
             
             await send_and_save_message(context, update.effective_chat.id, error_text, self.db, user_id, reply_markup=reply_markup)
             
-            encrypted_state = encrypt_state(state)
-            self.db.update_user_state(user_id, encrypted_state)
+            await self.db.set_state(user_id, state)
             return
         
         # Check if destination account exists
-        dest_account = self.db.get_account_by_number(destination)
+        dest_account = await self.db.get_account_by_number(destination)
         if not dest_account:
             state['destination_attempts'] = state.get('destination_attempts', 0) + 1
             remaining = 3 - state['destination_attempts']
             
             if remaining <= 0:
-                self.lock_manager.lock_user(user_id, "تعداد تلاش‌های ناموفق برای وارد کردن شماره حساب مقصد")
+                await self.lock_manager.lock_user(user_id, "تعداد تلاش‌های ناموفق برای وارد کردن شماره حساب مقصد")
                 await delete_previous_messages(update, context, self.db, user_id, delete_user_message=True)
                 lock_text = "تعداد تلاش‌های شما به پایان رسید. اکانت شما به مدت ۱۰ دقیقه قفل شد."
                 await send_and_save_message(context, update.effective_chat.id, lock_text, self.db, user_id)
@@ -136,12 +132,11 @@ class SendHandler:
             
             await send_and_save_message(context, update.effective_chat.id, error_text, self.db, user_id, reply_markup=reply_markup)
             
-            encrypted_state = encrypt_state(state)
-            self.db.update_user_state(user_id, encrypted_state)
+            await self.db.set_state(user_id, state)
             return
         
         # Check if destination is not the same as sender
-        account = self.db.get_active_account(user_id)
+        account = await self.db.get_active_account(user_id)
         if destination == account.account_number:
             await delete_previous_messages(update, context, self.db, user_id, delete_user_message=True)
             
@@ -166,9 +161,9 @@ class SendHandler:
             # Calculate fee
             fee = min(payment_link_amount * config.TRANSACTION_FEE_PERCENT, config.MAX_TRANSACTION_FEE)
             state['fee'] = fee
+            state['idempotency_key'] = uuid.uuid4().hex
             state['step'] = 'enter_password'
-            encrypted_state = encrypt_state(state)
-            self.db.update_user_state(user_id, encrypted_state)
+            await self.db.set_state(user_id, state)
             
             # Request password directly
             password_text = "🔐 تایید هویت\n\n"
@@ -182,8 +177,7 @@ class SendHandler:
         else:
             # Request amount normally
             state['step'] = 'enter_amount'
-            encrypted_state = encrypt_state(state)
-            self.db.update_user_state(user_id, encrypted_state)
+            await self.db.set_state(user_id, state)
             
             balance = float(account.balance)
             amount_text = "💰 تعیین مبلغ\n\n"
@@ -202,14 +196,13 @@ class SendHandler:
         amount_str = update.message.text.strip()
         
         # Check if user is locked
-        is_locked, lock_message = self.lock_manager.check_lock(user_id)
+        is_locked, lock_message = await self.lock_manager.check_lock(user_id)
         if is_locked:
             await update.message.reply_text(lock_message)
             return
         
         # Get state
-        encrypted_state = self.db.get_user_state(user_id)
-        state = decrypt_state(encrypted_state)
+        state = await self.db.get_state(user_id)
         
         if state.get('action') != 'send_pers' or state.get('step') != 'enter_amount':
             await update.message.reply_text("لطفا از منوی اصلی شروع کنید.")
@@ -229,7 +222,7 @@ class SendHandler:
             return
         
         # Get account
-        account = self.db.get_active_account(user_id)
+        account = await self.db.get_active_account(user_id)
         if not account:
             await update.message.reply_text("اکانت شما یافت نشد.")
             return
@@ -259,9 +252,10 @@ class SendHandler:
         # Save amount and request password
         state['amount'] = amount
         state['fee'] = fee
+        # One key per confirmed send, so a repeated confirmation cannot move money twice
+        state['idempotency_key'] = uuid.uuid4().hex
         state['step'] = 'enter_password'
-        encrypted_state = encrypt_state(state)
-        self.db.update_user_state(user_id, encrypted_state)
+        await self.db.set_state(user_id, state)
         
         password_text = "لطفا رمز عبور خود را وارد کنید:"
         
@@ -276,32 +270,31 @@ class SendHandler:
         password = update.message.text.strip()
         
         # Check if user is locked
-        is_locked, lock_message = self.lock_manager.check_lock(user_id)
+        is_locked, lock_message = await self.lock_manager.check_lock(user_id)
         if is_locked:
             await update.message.reply_text(lock_message)
             return
         
         # Get state
-        encrypted_state = self.db.get_user_state(user_id)
-        state = decrypt_state(encrypted_state)
+        state = await self.db.get_state(user_id)
         
         if state.get('action') != 'send_pers' or state.get('step') != 'enter_password':
             await update.message.reply_text("لطفا از منوی اصلی شروع کنید.")
             return
         
         # Get account
-        account = self.db.get_active_account(user_id)
+        account = await self.db.get_active_account(user_id)
         if not account:
             await update.message.reply_text("اکانت شما یافت نشد.")
             return
         
         # Verify password
-        if not self.db.verify_password(account.account_number, password):
+        if not await self.db.verify_password(account.account_number, password):
             state['password_attempts'] = state.get('password_attempts', 0) + 1
             remaining = 3 - state.get('password_attempts', 0)
             
             if remaining <= 0:
-                self.lock_manager.lock_user(user_id, "تعداد تلاش‌های ناموفق برای وارد کردن رمز")
+                await self.lock_manager.lock_user(user_id, "تعداد تلاش‌های ناموفق برای وارد کردن رمز")
                 await delete_previous_messages(update, context, self.db, user_id, delete_user_message=True)
                 lock_text = "تعداد تلاش‌های شما به پایان رسید. اکانت شما به مدت ۱۰ دقیقه قفل شد."
                 await send_and_save_message(context, update.effective_chat.id, lock_text, self.db, user_id)
@@ -317,8 +310,7 @@ class SendHandler:
             
             await send_and_save_message(context, update.effective_chat.id, error_text, self.db, user_id, reply_markup=reply_markup)
             
-            encrypted_state = encrypt_state(state)
-            self.db.update_user_state(user_id, encrypted_state)
+            await self.db.set_state(user_id, state)
             return
         
         # Password correct, delete previous messages and process transaction
@@ -336,25 +328,21 @@ class SendHandler:
         # Get username for logging
         username = update.effective_user.username if update.effective_user else None
         
-        # Process transaction with retry logic
-        success = await self._process_transaction_with_retry(
+        # Process transaction
+        success = await self._process_transaction(
             account.account_number,
             destination,
             amount,
             fee,
+            state.get('idempotency_key') or uuid.uuid4().hex,
             context,
-            update.effective_chat.id,
-            processing_msg.message_id,
             user_id=user_id,
             username=username
         )
         
         if success:
             # Delete processing message
-            try:
-                await processing_msg.delete()
-            except:
-                pass
+            get_message_deleter().schedule(context.bot, processing_msg.chat_id, processing_msg.message_id)
             
             # Show success message
             success_text = f"✅ تراکنش با موفقیت انجام شد!\n\n"
@@ -377,10 +365,7 @@ class SendHandler:
             )
         else:
             # Delete processing message
-            try:
-                await processing_msg.delete()
-            except:
-                pass
+            get_message_deleter().schedule(context.bot, processing_msg.chat_id, processing_msg.message_id)
             
             # Show error message
             error_text = "❌ خطا در پردازش تراکنش\n\n"
@@ -403,120 +388,48 @@ class SendHandler:
             )
         
         # Clear state
-        self.db.update_user_state(user_id, "")
+        await self.db.clear_state(user_id)
     
-    async def _process_transaction_with_retry(self, from_account: str, to_account: str, 
-                                            amount: float, fee: float, context: ContextTypes.DEFAULT_TYPE,
-                                            chat_id: int, processing_msg_id: int, user_id: str = None, username: str = None) -> bool:
-        """Process transaction with retry logic and verify 3 accounts"""
-        start_time = datetime.utcnow()
-        timeout = timedelta(seconds=config.TRANSACTION_RETRY_TIMEOUT_SECONDS)
+    async def _process_transaction(self, from_account: str, to_account: str, amount: float, fee: float,
+                                   idempotency_key: str, context: ContextTypes.DEFAULT_TYPE,
+                                   user_id: str = None, username: str = None) -> bool:
+        """Process the transaction atomically, queueing the recipient's notice in the same commit"""
+        logger = logging.getLogger(__name__)
         
         # Get admin account number from admin's actual account
-        admin_account_number = self.db.get_admin_account_number()
+        admin_account_number = await self.db.get_admin_account_number()
         if not admin_account_number:
             # Admin account not found, cannot process transaction with fee
-            logger = logging.getLogger(__name__)
             logger.error("Admin account not found. Cannot process transaction with fee.")
             return False
         
-        # Ensure admin account exists
-        admin_account = self.db.get_account_by_number(admin_account_number)
-        if not admin_account:
-            logger = logging.getLogger(__name__)
-            logger.error(f"Admin account {admin_account_number} not found in database.")
+        def recipient_message(new_balance: float) -> str:
+            notification_text = "✅ واریز به حساب شما\n\n"
+            notification_text += "━━━━━━━━━━━━━━━━━━━━\n\n"
+            notification_text += f"💰 مبلغ واریزی: {amount:,.2f} PERS\n\n"
+            notification_text += f"از حساب: {from_account}\n\n"
+            notification_text += f"💼 موجودی جدید حساب: {new_balance:,.2f} PERS\n\n"
+            notification_text += "━━━━━━━━━━━━━━━━━━━━"
+            return notification_text
+        
+        # Debit, credit, fee, transaction record, log and the recipient's notice in a single DB
+        # transaction; the outbox dispatcher sends the notice, so Telegram never delays the transfer
+        result = await self.db.transfer(
+            from_account=from_account,
+            to_account=to_account,
+            fee_account=admin_account_number,
+            amount=amount,
+            fee=fee,
+            idempotency_key=idempotency_key,
+            user_id=user_id,
+            username=username,
+            recipient_message=recipient_message
+        )
+        if not result:
             return False
         
-        while datetime.utcnow() - start_time < timeout:
-            # Get current balances
-            from_balance_before = self.db.get_account_balance(from_account)
-            to_balance_before = self.db.get_account_balance(to_account)
-            admin_balance_before = self.db.get_account_balance(admin_account_number)
-            
-            # Perform transaction
-            self.db.update_account_balance(from_account, -(amount + fee))
-            self.db.update_account_balance(to_account, amount)
-            self.db.update_account_balance(admin_account_number, fee)
-            
-            # Create transaction record
-            transaction = self.db.create_transaction(
-                from_account=from_account,
-                to_account=to_account,
-                amount=amount,
-                fee=fee,
-                transaction_type='send'
-            )
-            
-            # Verify balances
-            from_balance_after = self.db.get_account_balance(from_account)
-            to_balance_after = self.db.get_account_balance(to_account)
-            admin_balance_after = self.db.get_account_balance(admin_account_number)
-            
-            # Expected balances
-            expected_from = from_balance_before - amount - fee
-            expected_to = to_balance_before + amount
-            expected_admin = admin_balance_before + fee
-            
-            # Check if balances match
-            if (abs(from_balance_after - expected_from) < 0.01 and
-                abs(to_balance_after - expected_to) < 0.01 and
-                abs(admin_balance_after - expected_admin) < 0.01):
-                # Transaction successful
-                self.db.update_transaction_status(transaction.id, 'success')
-                
-                # Create comprehensive transaction log
-                if user_id:
-                    self.db.create_transaction_log(
-                        user_id=user_id,
-                        username=username,
-                        transaction_type='send',
-                        from_account=from_account,
-                        to_account=to_account,
-                        amount=amount,
-                        fee=fee,
-                        sheba=None,
-                        status='success',
-                        transaction_id=transaction.id
-                    )
-                
-                # Send notification to recipient
-                try:
-                    dest_account = self.db.get_account_by_number(to_account)
-                    if dest_account:
-                        recipient_user_id = dest_account.user_id
-                        new_balance = float(self.db.get_account_balance(to_account))
-                        
-                        # Format notification message
-                        notification_text = "✅ واریز به حساب شما\n\n"
-                        notification_text += "━━━━━━━━━━━━━━━━━━━━\n\n"
-                        notification_text += f"💰 مبلغ واریزی: {amount:,.2f} PERS\n\n"
-                        notification_text += f"از حساب: {from_account}\n\n"
-                        notification_text += f"💼 موجودی جدید حساب: {new_balance:,.2f} PERS\n\n"
-                        notification_text += "━━━━━━━━━━━━━━━━━━━━"
-                        
-                        # Send message to recipient (ignore errors if user blocked bot)
-                        try:
-                            await context.bot.send_message(chat_id=int(recipient_user_id), text=notification_text)
-                        except Exception as e:
-                            # User might have blocked the bot, ignore the error
-                            logger = logging.getLogger(__name__)
-                            logger.warning(f"Could not send notification to user {recipient_user_id}: {e}")
-                except Exception as e:
-                    # Log error but don't fail the transaction
-                    logger = logging.getLogger(__name__)
-                    logger.warning(f"Error sending notification to recipient: {e}")
-                
-                return True
-            else:
-                # Rollback
-                self.db.update_account_balance(from_account, amount + fee)
-                self.db.update_account_balance(to_account, -amount)
-                self.db.update_account_balance(admin_account_number, -fee)
-                self.db.update_transaction_status(transaction.id, 'failed')
-                
-                # Wait a bit before retry
-                await asyncio.sleep(0.5)
-        
-        # Timeout reached
-        return False
-
+        if result['duplicate']:
+            # Already processed (e.g. the same confirmation delivered twice); recipient was notified then
+            logger.info(f"Transfer {idempotency_key} already processed as transaction {result['transaction_id']}")
+        
+        return True
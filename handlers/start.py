@@ -1,17 +1,19 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from database.db_manager import DatabaseManager
-from utils.encryption import encrypt_state, decrypt_state
+from database.async_db_manager import AsyncDatabaseManager
 from utils.lock_manager import LockManager
+from utils.message_manager import get_message_deleter
+from utils.static_media import StaticMediaRegistry
 import asyncio
 import os
 import logging
 
 
 class StartHandler:
-    def __init__(self, db_manager: DatabaseManager, lock_manager: LockManager):
+    def __init__(self, db_manager: AsyncDatabaseManager, lock_manager: LockManager):
         self.db = db_manager
         self.lock_manager = lock_manager
+        self.static_media = StaticMediaRegistry(db_manager)
     
     async def handle_start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /start command"""
@@ -19,13 +21,13 @@ class StartHandler:
         username = update.effective_user.username  # Get username from Telegram
         
         # Check if user is locked
-        is_locked, lock_message = self.lock_manager.check_lock(user_id)
+        is_locked, lock_message = await self.lock_manager.check_lock(user_id)
         if is_locked:
             await update.message.reply_text(lock_message)
             return
         
         # Get or create user (and update username if available)
-        user = self.db.get_or_create_user(user_id, username)
+        user = await self.db.get_or_create_user(user_id, username)
         
         # Check for payment link parameter (deep link)
         # Format: /start pay_{destination_account}_{amount}
@@ -48,22 +50,20 @@ class StartHandler:
                     destination_account = None
                 
                 # Check if user has accepted agreement
-                if not self.db.has_accepted_agreement(user_id):
+                if not await self.db.has_accepted_agreement(user_id):
                     # Store payment link info in state for later use after agreement
-                    from utils.encryption import encrypt_state
                     state = {
                         'pending_payment_link': True,
                         'payment_link_amount': amount,
                         'payment_link_destination': destination_account
                     }
-                    encrypted_state = encrypt_state(state)
-                    self.db.update_user_state(user_id, encrypted_state)
+                    await self.db.set_state(user_id, state)
                     # Show agreement first
                     await self.show_agreement(update, context)
                     return
                 
                 # Check if user has account
-                account = self.db.get_active_account(user_id)
+                account = await self.db.get_active_account(user_id)
                 if not account:
                     # User doesn't have account
                     from utils.message_manager import send_and_save_message
@@ -79,7 +79,7 @@ class StartHandler:
                 
                 # Check if destination account exists
                 if destination_account:
-                    dest_account = self.db.get_account_by_number(destination_account)
+                    dest_account = await self.db.get_account_by_number(destination_account)
                     if not dest_account:
                         from utils.message_manager import send_and_save_message
                         from telegram import InlineKeyboardButton, InlineKeyboardMarkup
@@ -121,7 +121,6 @@ class StartHandler:
                         return
                 
                 # User has account, start send process with pre-filled destination and amount
-                from utils.encryption import encrypt_state
                 from utils.message_manager import send_and_save_message
                 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
                 import config
@@ -141,8 +140,7 @@ class StartHandler:
                         'payment_link_amount': amount,
                         'from_payment_link': True
                     }
-                    encrypted_state = encrypt_state(state)
-                    self.db.update_user_state(user_id, encrypted_state)
+                    await self.db.set_state(user_id, state)
                     
                     send_text = "🔗 لینک پرداخت\n\n"
                     send_text += "━━━━━━━━━━━━━━━━━━━━\n\n"
@@ -161,8 +159,7 @@ class StartHandler:
                         'amount': amount,
                         'from_payment_link': True
                     }
-                    encrypted_state = encrypt_state(state)
-                    self.db.update_user_state(user_id, encrypted_state)
+                    await self.db.set_state(user_id, state)
                     
                     buy_text = "🔗 لینک پرداخت\n\n"
                     buy_text += "━━━━━━━━━━━━━━━━━━━━\n\n"
@@ -179,13 +176,13 @@ class StartHandler:
                 pass
         
         # Check if user has accepted agreement
-        if not self.db.has_accepted_agreement(user_id):
+        if not await self.db.has_accepted_agreement(user_id):
             # Show agreement first
             await self.show_agreement(update, context)
             return
         
         # Check if user has active account
-        active_account = self.db.get_active_account(user_id)
+        active_account = await self.db.get_active_account(user_id)
         
         if active_account:
             # User has account, show main menu
@@ -222,17 +219,18 @@ class StartHandler:
         pdf_message_id = None
         if os.path.exists(pdf_path):
             try:
-                with open(pdf_path, 'rb') as pdf_file:
-                    pdf_message = await context.bot.send_document(
-                        chat_id=chat_id,
-                        document=pdf_file,
-                        caption=agreement_text
-                    )
-                    pdf_message_id = pdf_message.message_id
-                    # Store PDF message ID in user_data for later deletion
-                    if 'agreement_messages' not in context.user_data:
-                        context.user_data['agreement_messages'] = []
-                    context.user_data['agreement_messages'].append(pdf_message_id)
+                # Uploaded once, then sent by its Telegram file_id
+                pdf_message = await self.static_media.send_document(
+                    context.bot,
+                    chat_id,
+                    pdf_path,
+                    caption=agreement_text
+                )
+                pdf_message_id = pdf_message.message_id
+                # Store PDF message ID in user_data for later deletion
+                if 'agreement_messages' not in context.user_data:
+                    context.user_data['agreement_messages'] = []
+                context.user_data['agreement_messages'].append(pdf_message_id)
             except Exception as e:
                 # If PDF sending fails, send text message instead
                 logging.error(f"Error sending PDF: {e}")
@@ -289,7 +287,7 @@ class StartHandler:
         user_id = str(update.effective_user.id)
         
         # Mark agreement as accepted
-        self.db.accept_agreement(user_id)
+        await self.db.accept_agreement(user_id)
         
         # Send confirmation message
         confirmation_text = """✅ موافقت‌نامه با موفقیت پذیرفته شد!
@@ -302,10 +300,8 @@ class StartHandler:
         confirmation_message_id = None
         if update.callback_query:
             # Delete the message with buttons
-            try:
-                await update.callback_query.message.delete()
-            except:
-                pass
+            get_message_deleter().schedule(context.bot, update.effective_chat.id,
+                                           update.callback_query.message.message_id)
             # Send confirmation message
             confirmation_message = await context.bot.send_message(
                 chat_id=update.effective_chat.id,
@@ -324,14 +320,13 @@ class StartHandler:
             context.user_data['agreement_messages'].append(confirmation_message_id)
         
         # Check if there's a pending payment link
-        encrypted_state = self.db.get_user_state(user_id)
-        if encrypted_state:
-            state = decrypt_state(encrypted_state)
+        state = await self.db.get_state(user_id)
+        if state:
             if state.get('pending_payment_link') and state.get('payment_link_amount'):
                 # User clicked payment link before accepting agreement
                 amount = state.get('payment_link_amount')
                 destination_account = state.get('payment_link_destination')
-                active_account = self.db.get_active_account(user_id)
+                active_account = await self.db.get_active_account(user_id)
                 
                 if not active_account:
                     # User doesn't have account yet
@@ -340,7 +335,7 @@ class StartHandler:
                 
                 # Check if destination account exists
                 if destination_account:
-                    dest_account = self.db.get_account_by_number(destination_account)
+                    dest_account = await self.db.get_account_by_number(destination_account)
                     if not dest_account:
                         from utils.message_manager import send_and_save_message
                         from telegram import InlineKeyboardButton, InlineKeyboardMarkup
@@ -366,7 +361,6 @@ class StartHandler:
                     # Check balance before proceeding
                     from utils.message_manager import send_and_save_message
                     from telegram import InlineKeyboardButton, InlineKeyboardMarkup
-                    from utils.encryption import encrypt_state
                     import config
                     
                     balance = float(active_account.balance)
@@ -393,8 +387,7 @@ class StartHandler:
                         'payment_link_amount': amount,
                         'from_payment_link': True
                     }
-                    encrypted_state = encrypt_state(state)
-                    self.db.update_user_state(user_id, encrypted_state)
+                    await self.db.set_state(user_id, state)
                     
                     send_text = "🔗 لینک پرداخت\n\n"
                     send_text += "━━━━━━━━━━━━━━━━━━━━\n\n"
@@ -409,7 +402,6 @@ class StartHandler:
                     # Old format: start buy process with pre-filled amount (backward compatibility)
                     from utils.message_manager import send_and_save_message
                     from telegram import InlineKeyboardButton, InlineKeyboardMarkup
-                    from utils.encryption import encrypt_state
                     
                     state = {
                         'action': 'buy_pers',
@@ -417,8 +409,7 @@ class StartHandler:
                         'amount': amount,
                         'from_payment_link': True
                     }
-                    encrypted_state = encrypt_state(state)
-                    self.db.update_user_state(user_id, encrypted_state)
+                    await self.db.set_state(user_id, state)
                     
                     buy_text = "🔗 لینک پرداخت\n\n"
                     buy_text += "━━━━━━━━━━━━━━━━━━━━\n\n"
@@ -434,7 +425,7 @@ class StartHandler:
                 return
         
         # Show welcome or main menu
-        active_account = self.db.get_active_account(user_id)
+        active_account = await self.db.get_active_account(user_id)
         
         if active_account:
             await self.show_main_menu(update, context)
@@ -443,12 +434,8 @@ class StartHandler:
         
         # Delete agreement messages (PDF and confirmation) after showing menu
         if 'agreement_messages' in context.user_data:
-            chat_id = update.effective_chat.id
-            for msg_id in context.user_data['agreement_messages']:
-                try:
-                    await context.bot.delete_message(chat_id=chat_id, message_id=msg_id)
-                except:
-                    pass
+            get_message_deleter().schedule(context.bot, update.effective_chat.id,
+                                           *context.user_data['agreement_messages'])
             # Clear the list
             context.user_data['agreement_messages'] = []
     
@@ -496,7 +483,7 @@ class StartHandler:
         user_id = str(update.effective_user.id)
         
         # Get account info for personalized welcome
-        account = self.db.get_active_account(user_id)
+        account = await self.db.get_active_account(user_id)
         
         keyboard = [
             [InlineKeyboardButton("💰 موجودی حساب", callback_data="balance")],
@@ -504,6 +491,7 @@ class StartHandler:
             [InlineKeyboardButton("📤 ارسال پرس", callback_data="send_pers")],
             [InlineKeyboardButton("💸 فروش پرس", callback_data="sell_pers")],
             [InlineKeyboardButton("📋 ۱۰ گردش آخر", callback_data="transactions")],
+            [InlineKeyboardButton("📄 صورت‌حساب کامل", callback_data="statement_export")],
             [InlineKeyboardButton("📞 ارتباط با ما", callback_data="contact")]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -548,10 +536,10 @@ class StartHandler:
         
         # Update username if available (in case it changed)
         if username:
-            self.db.get_or_create_user(user_id, username)
+            await self.db.get_or_create_user(user_id, username)
         
         # Check if user is locked
-        is_locked, lock_message = self.lock_manager.check_lock(user_id)
+        is_locked, lock_message = await self.lock_manager.check_lock(user_id)
         if is_locked:
             await query.edit_message_text(lock_message)
             return
@@ -1,16 +1,21 @@
+import asyncio
+from datetime import datetime, timedelta
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
-from database.db_manager import DatabaseManager
+from database.async_db_manager import AsyncDatabaseManager
 from utils.lock_manager import LockManager
 from utils.validators import validate_password
-from utils.encryption import encrypt_state, decrypt_state
-from utils.pdf_generator import generate_transactions_pdf
+from utils.pdf_service import RenderQueueFull, get_pdf_service
+from utils.statement_cache import get_statement_cache, statement_key
+from utils.statement_export import (TELEGRAM_UPLOAD_LIMIT, StatementRangeError, StatementTooLarge,
+                                    get_statement_export_service, jalali_label, parse_jalali_range)
 from utils.message_manager import delete_previous_messages, send_and_save_message, edit_and_save_message
 import config
 
 
 class TransactionsHandler:
-    def __init__(self, db_manager: DatabaseManager, lock_manager: LockManager):
+    def __init__(self, db_manager: AsyncDatabaseManager, lock_manager: LockManager):
         self.db = db_manager
         self.lock_manager = lock_manager
     
@@ -19,14 +24,14 @@ class TransactionsHandler:
         user_id = str(update.effective_user.id)
         
         # Check if user is locked
-        is_locked, lock_message = self.lock_manager.check_lock(user_id)
+        is_locked, lock_message = await self.lock_manager.check_lock(user_id)
         if is_locked:
             if update.callback_query:
                 await update.callback_query.edit_message_text(lock_message)
             return
         
         # Get active account
-        account = self.db.get_active_account(user_id)
+        account = await self.db.get_active_account(user_id)
         if not account:
             error_text = "شما هیچ اکانت فعالی ندارید. لطفا ابتدا اکانت بسازید."
             keyboard = [[InlineKeyboardButton("ساخت اکانت", callback_data="create_account")]]
@@ -41,8 +46,7 @@ class TransactionsHandler:
             'action': 'transactions',
             'step': 'enter_password'
         }
-        encrypted_state = encrypt_state(state)
-        self.db.update_user_state(user_id, encrypted_state)
+        await self.db.set_state(user_id, state)
         
         # Request password
         password_text = "📋 ۱۰ گردش آخر\n\n"
@@ -57,64 +61,70 @@ class TransactionsHandler:
         else:
             await send_and_save_message(context, update.effective_chat.id, password_text, self.db, user_id, reply_markup=reply_markup)
     
+    async def _verify_password(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: str,
+                               account, state: dict, password: str) -> bool:
+        """Check the account password; a wrong one is counted in state and answered (3 wrong ones lock the user)"""
+        if await self.db.verify_password(account.account_number, password):
+            return True
+        
+        state['password_attempts'] = state.get('password_attempts', 0) + 1
+        remaining = 3 - state.get('password_attempts', 0)
+        
+        if remaining <= 0:
+            await self.lock_manager.lock_user(user_id, "تعداد تلاش‌های ناموفق برای وارد کردن رمز")
+            await delete_previous_messages(update, context, self.db, user_id, delete_user_message=True)
+            lock_text = "تعداد تلاش‌های شما به پایان رسید. اکانت شما به مدت ۱۰ دقیقه قفل شد."
+            await send_and_save_message(context, update.effective_chat.id, lock_text, self.db, user_id)
+            return False
+        
+        await delete_previous_messages(update, context, self.db, user_id, delete_user_message=True)
+        
+        error_text = "رمز وارد شده اشتباه است.\n\n"
+        error_text += f"⚠️ {remaining} دفعه دیگر مهلت دارید وارد کنید."
+        
+        keyboard = [[InlineKeyboardButton("منوی اصلی", callback_data="main_menu")]]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        
+        await send_and_save_message(context, update.effective_chat.id, error_text, self.db, user_id, reply_markup=reply_markup)
+        
+        await self.db.set_state(user_id, state)
+        return False
+    
     async def handle_password_input(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle password input and generate PDF"""
         user_id = str(update.effective_user.id)
         password = update.message.text.strip()
         
         # Check if user is locked
-        is_locked, lock_message = self.lock_manager.check_lock(user_id)
+        is_locked, lock_message = await self.lock_manager.check_lock(user_id)
         if is_locked:
             await update.message.reply_text(lock_message)
             return
         
         # Get state
-        encrypted_state = self.db.get_user_state(user_id)
-        state = decrypt_state(encrypted_state)
+        state = await self.db.get_state(user_id)
         
         if state.get('action') != 'transactions' or state.get('step') != 'enter_password':
             await update.message.reply_text("لطفا از منوی اصلی شروع کنید.")
             return
         
         # Get account
-        account = self.db.get_active_account(user_id)
+        account = await self.db.get_active_account(user_id)
         if not account:
             await update.message.reply_text("اکانت شما یافت نشد.")
             return
         
         # Verify password
-        if not self.db.verify_password(account.account_number, password):
-            state['password_attempts'] = state.get('password_attempts', 0) + 1
-            remaining = 3 - state.get('password_attempts', 0)
-            
-            if remaining <= 0:
-                self.lock_manager.lock_user(user_id, "تعداد تلاش‌های ناموفق برای وارد کردن رمز")
-                await delete_previous_messages(update, context, self.db, user_id, delete_user_message=True)
-                lock_text = "تعداد تلاش‌های شما به پایان رسید. اکانت شما به مدت ۱۰ دقیقه قفل شد."
-                await send_and_save_message(context, update.effective_chat.id, lock_text, self.db, user_id)
-                return
-            
-            await delete_previous_messages(update, context, self.db, user_id, delete_user_message=True)
-            
-            error_text = "رمز وارد شده اشتباه است.\n\n"
-            error_text += f"⚠️ {remaining} دفعه دیگر مهلت دارید وارد کنید."
-            
-            keyboard = [[InlineKeyboardButton("منوی اصلی", callback_data="main_menu")]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await send_and_save_message(context, update.effective_chat.id, error_text, self.db, user_id, reply_markup=reply_markup)
-            
-            encrypted_state = encrypt_state(state)
-            self.db.update_user_state(user_id, encrypted_state)
+        if not await self._verify_password(update, context, user_id, account, state, password):
             return
         
         # Password correct, delete previous messages and generate PDF
         await delete_previous_messages(update, context, self.db, user_id, delete_user_message=True)
         
-        # Get transactions
-        transactions = self.db.get_account_transactions(account.account_number, limit=10)
+        # Newest transaction, count and last update: the statement is unchanged while they are
+        newest_id, count, updated_at = await self.db.get_statement_version(account.account_number)
         
-        if not transactions:
+        if not count:
             no_transactions_text = "📋 ۱۰ گردش آخر\n\n"
             no_transactions_text += "شما هنوز هیچ تراکنشی انجام نداده‌اید.\n\n"
             no_transactions_text += "💡 پس از انجام اولین تراکنش، می‌توانید آن را در این بخش مشاهده کنید."
@@ -132,13 +142,9 @@ class TransactionsHandler:
             )
             
             # Clear state
-            self.db.update_user_state(user_id, "")
+            await self.db.clear_state(user_id)
             return
         
-        # Generate PDF
-        pdf_buffer = generate_transactions_pdf(transactions, account.account_number)
-        
-        # Send PDF
         pdf_text = "📋 ۱۰ گردش آخر حساب شما\n\n"
         pdf_text += "فایل PDF شامل جزئیات ۱۰ گردش آخر حساب شما آماده شده است.\n\n"
         pdf_text += "💡 می‌توانید این فایل را ذخیره کرده و برای مراجعات بعدی استفاده کنید."
@@ -146,14 +152,196 @@ class TransactionsHandler:
         keyboard = [[InlineKeyboardButton("منوی اصلی", callback_data="main_menu")]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        await context.bot.send_document(
+        cache = get_statement_cache()
+        cache_key = statement_key(account.account_number, newest_id, count, updated_at)
+        
+        # Sent before: Telegram still has the file
+        file_id = cache.get_file_id(cache_key)
+        if file_id is not None:
+            try:
+                await context.bot.send_document(
+                    chat_id=update.effective_chat.id,
+                    document=file_id,
+                    caption=pdf_text,
+                    reply_markup=reply_markup
+                )
+                await self.db.clear_state(user_id)
+                return
+            except BadRequest:
+                # file_id no longer accepted, upload the PDF again
+                cache.forget_file_id(cache_key)
+        
+        pdf_bytes = cache.get(account.account_number, cache_key)
+        if pdf_bytes is None:
+            transactions = await self.db.get_account_transactions(account.account_number, limit=10)
+            
+            # Generate PDF in the rendering pool
+            try:
+                pdf_bytes = await get_pdf_service().render_transactions(user_id, transactions, account.account_number)
+            except (RenderQueueFull, asyncio.TimeoutError):
+                busy_text = "⏳ در حال حاضر درخواست‌های زیادی در حال پردازش است.\n\n"
+                busy_text += "لطفا چند لحظه دیگر دوباره تلاش کنید."
+                
+                keyboard = [[InlineKeyboardButton("📋 تلاش دوباره", callback_data="transactions")],
+                            [InlineKeyboardButton("منوی اصلی", callback_data="main_menu")]]
+                
+                await send_and_save_message(context, update.effective_chat.id, busy_text, self.db, user_id,
+                                            reply_markup=InlineKeyboardMarkup(keyboard))
+                
+                # Clear state
+                await self.db.clear_state(user_id)
+                return
+            cache.put(account.account_number, cache_key, pdf_bytes)
+        
+        # Send PDF
+        message = await context.bot.send_document(
             chat_id=update.effective_chat.id,
-            document=pdf_buffer,
+            document=pdf_bytes,
             filename=f"transactions_{account.account_number}.pdf",
             caption=pdf_text,
             reply_markup=reply_markup
         )
+        cache.set_file_id(cache_key, message.document.file_id)
         
         # Clear state
-        self.db.update_user_state(user_id, "")
-
+        await self.db.clear_state(user_id)
+    
+    async def start_statement_export(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Start a full-history statement export: choose the format"""
+        user_id = str(update.effective_user.id)
+        
+        # Check if user is locked
+        is_locked, lock_message = await self.lock_manager.check_lock(user_id)
+        if is_locked:
+            if update.callback_query:
+                await update.callback_query.edit_message_text(lock_message)
+            return
+        
+        account = await self.db.get_active_account(user_id)
+        if not account:
+            error_text = "شما هیچ اکانت فعالی ندارید. لطفا ابتدا اکانت بسازید."
+            keyboard = [[InlineKeyboardButton("ساخت اکانت", callback_data="create_account")]]
+            if update.callback_query:
+                await update.callback_query.edit_message_text(error_text, reply_markup=InlineKeyboardMarkup(keyboard))
+            return
+        
+        await self.db.set_state(user_id, {'action': 'statement_export', 'step': 'choose_format'})
+        
+        format_text = "📄 صورت‌حساب کامل\n\n"
+        format_text += "همه تراکنش‌های حساب شما در بازه تاریخ دلخواه.\n"
+        if config.STATEMENT_PDF_MAX_ROWS:
+            format_text += f"فایل PDF حداکثر {config.STATEMENT_PDF_MAX_ROWS:,} تراکنش دارد؛ برای بازه‌های بزرگ‌تر CSV را انتخاب کنید.\n"
+        format_text += "لطفا نوع فایل را انتخاب کنید:"
+        
+        keyboard = [
+            [InlineKeyboardButton("📄 PDF", callback_data="statement_export_pdf"),
+             InlineKeyboardButton("📊 CSV (اکسل)", callback_data="statement_export_csv")],
+            [InlineKeyboardButton("منوی اصلی", callback_data="main_menu")]
+        ]
+        await edit_and_save_message(update, context, format_text, self.db, user_id,
+                                    reply_markup=InlineKeyboardMarkup(keyboard))
+    
+    async def handle_statement_format(self, update: Update, context: ContextTypes.DEFAULT_TYPE, fmt: str):
+        """Format chosen, ask for the date range"""
+        user_id = str(update.effective_user.id)
+        
+        state = await self.db.get_state(user_id)
+        if state.get('action') != 'statement_export':
+            await self.start_statement_export(update, context)
+            return
+        
+        await self.db.set_state(user_id, {'action': 'statement_export', 'step': 'enter_range', 'format': fmt})
+        
+        today = jalali_label(datetime.now())
+        range_text = "📅 بازه تاریخ صورت‌حساب را به شمسی وارد کنید:\n\n"
+        range_text += f"مثال: {today[:4]}/01/01 تا {today}"
+        
+        keyboard = [[InlineKeyboardButton("منوی اصلی", callback_data="main_menu")]]
+        await edit_and_save_message(update, context, range_text, self.db, user_id,
+                                    reply_markup=InlineKeyboardMarkup(keyboard))
+    
+    async def handle_statement_range_input(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Date range entered, ask for the password"""
+        user_id = str(update.effective_user.id)
+        state = await self.db.get_state(user_id)
+        
+        keyboard = [[InlineKeyboardButton("منوی اصلی", callback_data="main_menu")]]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        
+        await delete_previous_messages(update, context, self.db, user_id, delete_user_message=True)
+        
+        try:
+            start, end = parse_jalali_range(update.message.text)
+        except StatementRangeError:
+            error_text = "❌ بازه تاریخ نامعتبر است.\n\n"
+            error_text += "لطفا دو تاریخ شمسی وارد کنید، مثلا: 1403/01/01 تا 1403/06/31"
+            await send_and_save_message(context, update.effective_chat.id, error_text, self.db, user_id,
+                                        reply_markup=reply_markup)
+            return
+        
+        state.update({'step': 'enter_password', 'start': start.isoformat(), 'end': end.isoformat()})
+        await self.db.set_state(user_id, state)
+        
+        password_text = f"📅 بازه: {jalali_label(start)} تا {jalali_label(end - timedelta(days=1))}\n\n"
+        password_text += "لطفا رمز عبور ۸ رقمی خود را وارد کنید:"
+        await send_and_save_message(context, update.effective_chat.id, password_text, self.db, user_id,
+                                    reply_markup=reply_markup)
+    
+    async def handle_statement_password_input(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Password entered, export the statement and send it"""
+        user_id = str(update.effective_user.id)
+        password = update.message.text.strip()
+        
+        state = await self.db.get_state(user_id)
+        account = await self.db.get_active_account(user_id)
+        if not account:
+            await update.message.reply_text("اکانت شما یافت نشد.")
+            return
+        
+        if not await self._verify_password(update, context, user_id, account, state, password):
+            return
+        
+        await delete_previous_messages(update, context, self.db, user_id, delete_user_message=True)
+        await self.db.clear_state(user_id)
+        
+        keyboard = [[InlineKeyboardButton("منوی اصلی", callback_data="main_menu")]]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        
+        start, end = datetime.fromisoformat(state['start']), datetime.fromisoformat(state['end'])
+        period = f"{jalali_label(start)} تا {jalali_label(end - timedelta(days=1))}"
+        
+        await context.bot.send_chat_action(chat_id=update.effective_chat.id, action='upload_document')
+        # Rows are streamed from the database into a temporary file in the export worker processes
+        try:
+            export = await get_statement_export_service().export(self.db.sync, account.account_number, start, end,
+                                                                 state.get('format', 'pdf'))
+        except StatementTooLarge:
+            text = f"❌ صورت‌حساب PDF حداکثر {config.STATEMENT_PDF_MAX_ROWS:,} تراکنش دارد.\n\n"
+            text += "لطفا بازه کوتاه‌تری انتخاب کنید یا صورت‌حساب را به صورت CSV بگیرید."
+            await send_and_save_message(context, update.effective_chat.id, text, self.db, user_id,
+                                        reply_markup=reply_markup)
+            return
+        try:
+            if not export.rows:
+                text = f"📄 در بازه {period} تراکنشی انجام نشده است."
+                await send_and_save_message(context, update.effective_chat.id, text, self.db, user_id,
+                                            reply_markup=reply_markup)
+                return
+            if export.size > TELEGRAM_UPLOAD_LIMIT:
+                text = "❌ حجم صورت‌حساب این بازه برای ارسال در تلگرام زیاد است.\n\n"
+                text += "لطفا بازه کوتاه‌تری انتخاب کنید."
+                await send_and_save_message(context, update.effective_chat.id, text, self.db, user_id,
+                                            reply_markup=reply_markup)
+                return
+            
+            caption = f"📄 صورت‌حساب {period}\n\n"
+            caption += f"تعداد تراکنش‌ها: {export.rows:,}"
+            await context.bot.send_document(
+                chat_id=update.effective_chat.id,
+                document=export.file,
+                filename=export.filename,
+                caption=caption,
+                reply_markup=reply_markup
+            )
+        finally:
+            export.close()
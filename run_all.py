@@ -77,17 +77,8 @@ def run_bot():
         logger.info("Initializing bot...")
         bot = BalanceBot()
         
-        # Create application
-        from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters
-        from telegram import Update
-        
         global bot_application
-        bot_application = Application.builder().token(config.BOT_TOKEN).build()
-        
-        # Add handlers
-        bot_application.add_handler(CommandHandler("start", bot.handle_start))
-        bot_application.add_handler(CallbackQueryHandler(bot.handle_callback))
-        bot_application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, bot.handle_message))
+        bot_application = bot.build_application()
         
         logger.info("Bot is running...")
         print("Welcome to BalanceBot.")
@@ -98,7 +89,12 @@ def run_bot():
         asyncio.set_event_loop(loop)
         
         # Run polling
-        bot_application.run_polling(allowed_updates=Update.ALL_TYPES, stop_signals=None)
+        from telegram import Update
+        try:
+            bot_application.run_polling(allowed_updates=Update.ALL_TYPES, stop_signals=None, close_loop=False)
+        finally:
+            loop.run_until_complete(bot.db.dispose())
+            loop.close()
         
     except KeyboardInterrupt:
         logger.info("Bot stopped by user")
@@ -117,7 +113,7 @@ def run_web():
     try:
         # Import web app
         sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
-        from web.app import app
+        from web.app import app, event_streams
         
         global web_app
         web_app = app
@@ -137,6 +133,9 @@ def run_web():
         print("  (from ADMIN_PASSWORD in .env)")
         print("\n" + "="*60 + "\n")
         
+        # Live events (/api/events) are served from their own port by one thread
+        event_streams.start()
+        
         # Run Flask app (disable reloader in threaded mode)
         app.run(debug=False, host='0.0.0.0', port=5000, use_reloader=False)
         
@@ -0,0 +1,47 @@
+"""
+فیکسچرهای مشترک تست‌ها
+- db_manager: DatabaseManager روی یک پایگاه داده SQLite موقت
+- async_db: AsyncDatabaseManager روی همان پایگاه داده
+- client: کلاینت تست پنل ادمین که از db_manager استفاده می‌کند
+هر فایل تست فقط داده‌های اولیه (seed) خودش را تعریف می‌کند.
+"""
+import pytest
+import pytest_asyncio
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.db_manager import DatabaseManager
+from database.async_db_manager import AsyncDatabaseManager
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """URL of a temporary SQLite database"""
+    return f"sqlite:///{tmp_path / 'test.db'}"
+
+
+@pytest.fixture
+def db_manager(db_path):
+    """Create a database manager on a temporary SQLite database"""
+    manager = DatabaseManager(db_url=db_path)
+    yield manager
+    manager.engine.dispose()
+
+
+@pytest_asyncio.fixture
+async def async_db(db_manager):
+    """Async database manager over db_manager"""
+    manager = AsyncDatabaseManager(db_manager)
+    yield manager
+    await manager.dispose()
+
+
+@pytest.fixture
+def client(db_manager, monkeypatch):
+    """Test client of the admin panel using db_manager"""
+    import web.app
+    monkeypatch.setattr(web.app, 'db_manager', db_manager)
+    return web.app.app.test_client()
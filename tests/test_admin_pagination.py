@@ -0,0 +1,164 @@
+"""
+تست برای صفحه‌بندی لیست کاربران و حساب‌ها در پنل ادمین
+این تست بررسی می‌کند که:
+1. پیمایش همه صفحه‌ها با cursor همه ردیف‌ها را دقیقا یک بار و به ترتیب درست برمی‌گرداند
+2. فیلترها (قفل، ادمین، فعال، بازه موجودی، جستجو) روی سرور اعمال می‌شوند
+3. تعداد کوئری هر صفحه به عمق صفحه بستگی ندارد
+4. پارامترهای نامعتبر خطای 400 می‌دهند
+"""
+import random
+import pytest
+import sys
+import os
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert
+from database.models import User, Account
+from database.unit_of_work import track_queries
+
+USERS = 57
+
+
+@pytest.fixture
+def seeded(db_manager):
+    """کاربران با تاریخ ثبت و موجودی تصادفی (با مقادیر تکراری برای بررسی ترتیب)"""
+    rng = random.Random(7)
+    start = datetime(2024, 1, 1)
+    users, accounts = [], []
+    for index in range(USERS):
+        user_id = f"user{index:03d}"
+        # Repeated timestamps and balances exercise the tie-breaker
+        created_at = start + timedelta(days=rng.randint(0, 10))
+        users.append({'user_id': user_id, 'username': f"name{index}", 'is_admin': index == 3,
+                      'created_at': created_at})
+        accounts.append({'account_number': f"{index + 1000:016d}", 'user_id': user_id, 'password_hash': "hash",
+                         'balance': Decimal(rng.randint(0, 5) * 10), 'is_active': index % 4 != 0,
+                         'created_at': created_at})
+    with db_manager.engine.begin() as conn:
+        conn.execute(insert(User), users)
+        conn.execute(insert(Account), accounts)
+    db_manager.lock_user("user005", "تست")
+    db_manager.lock_user("user006", "تست")
+    return users, accounts
+
+
+def fetch_all(client, url, key, limit=10):
+    """All rows of a list endpoint, page by page"""
+    rows, cursor, pages = [], None, 0
+    while True:
+        response = client.get(url + f"&limit={limit}" + (f"&after={cursor}" if cursor else ""))
+        assert response.status_code == 200, response.get_json()
+        data = response.get_json()
+        assert len(data[key]) <= limit
+        rows.extend(data[key])
+        pages += 1
+        cursor = data['next_cursor']
+        if not cursor:
+            return rows, pages
+
+
+class TestUsersPagination:
+    """تست صفحه‌بندی کاربران"""
+
+    @pytest.mark.parametrize('sort,order', [('created_at', 'desc'), ('created_at', 'asc'),
+                                            ('balance', 'desc'), ('balance', 'asc')])
+    def test_walk_all_pages(self, client, seeded, sort, order):
+        """تست: پیمایش همه صفحه‌ها، بدون تکرار و جاافتادگی"""
+        rows, pages = fetch_all(client, f"/api/users?sort={sort}&order={order}", 'users')
+
+        assert sorted(row['user_id'] for row in rows) == sorted(u['user_id'] for u in seeded[0])
+        assert pages == 6
+        keys = [(row[sort], row['user_id']) for row in rows]
+        assert keys == sorted(keys, reverse=(order == 'desc'))
+        print(f"[TEST] ✅ {len(rows)} کاربر در {pages} صفحه ({sort} {order})")
+
+    def test_balance_is_active_account(self, client, seeded):
+        """تست: موجودی و تعداد حساب کاربر"""
+        users = {row['user_id']: row for row in client.get("/api/users?limit=200").get_json()['users']}
+        _, accounts = seeded
+        for account in accounts:
+            expected = float(account['balance']) if account['is_active'] else 0.0
+            assert users[account['user_id']]['balance'] == expected
+            assert users[account['user_id']]['account_count'] == 1
+
+    def test_filters(self, client, seeded):
+        """تست: فیلترها روی سرور"""
+        locked = client.get("/api/users?locked=true").get_json()
+        assert {row['user_id'] for row in locked['users']} == {"user005", "user006"}
+        assert all(row['is_locked'] for row in locked['users'])
+        assert locked['total'] == 2
+
+        unlocked = client.get("/api/users?locked=false&limit=200").get_json()['users']
+        assert len(unlocked) == USERS - 2
+
+        admins = client.get("/api/users?admin=true").get_json()['users']
+        assert [row['user_id'] for row in admins] == ["user003"]
+
+        inactive = client.get("/api/users?active=false&limit=200").get_json()['users']
+        assert {row['user_id'] for row in inactive} == {f"user{i:03d}" for i in range(0, USERS, 4)}
+
+        rich = client.get("/api/users?min_balance=30&max_balance=40&limit=200").get_json()['users']
+        assert rich and all(30 <= row['balance'] <= 40 for row in rich)
+
+        search = client.get("/api/users?q=user01").get_json()['users']
+        assert {row['user_id'] for row in search} == {f"user{i:03d}" for i in range(10, 20)}
+
+    def test_constant_queries_per_page(self, client, seeded):
+        """تست: تعداد کوئری صفحه اول و صفحه آخر برابر است"""
+        first = client.get("/api/users?limit=10").get_json()
+        with track_queries() as first_stats:
+            client.get("/api/users?limit=10")
+        cursor = first['next_cursor']
+        for _ in range(4):
+            cursor = client.get(f"/api/users?limit=10&after={cursor}").get_json()['next_cursor']
+        with track_queries() as deep_stats:
+            client.get(f"/api/users?limit=10&after={cursor}")
+
+        # page, account counts of the page, capped total
+        assert first_stats.queries == deep_stats.queries == 3
+
+    def test_invalid_parameters(self, client, seeded):
+        """تست: پارامترهای نامعتبر"""
+        assert client.get("/api/users?after=not-a-cursor").status_code == 400
+        assert client.get("/api/users?sort=username").status_code == 400
+        assert client.get("/api/users?locked=maybe").status_code == 400
+        assert client.get("/api/users?min_balance=abc").status_code == 400
+
+
+class TestAccountsPagination:
+    """تست صفحه‌بندی حساب‌ها"""
+
+    @pytest.mark.parametrize('sort,order', [('created_at', 'desc'), ('balance', 'asc')])
+    def test_walk_all_pages(self, client, seeded, sort, order):
+        """تست: پیمایش همه صفحه‌های حساب‌ها"""
+        rows, _ = fetch_all(client, f"/api/accounts?sort={sort}&order={order}", 'accounts', limit=8)
+
+        assert sorted(row['account_number'] for row in rows) == sorted(a['account_number'] for a in seeded[1])
+        keys = [(row[sort], row['account_number']) for row in rows]
+        assert keys == sorted(keys, reverse=(order == 'desc'))
+
+    def test_filters(self, client, seeded):
+        """تست: فیلتر وضعیت و موجودی حساب‌ها"""
+        data = client.get("/api/accounts?active=true&min_balance=20&limit=200").get_json()
+        expected = {a['account_number'] for a in seeded[1] if a['is_active'] and a['balance'] >= 20}
+        assert {row['account_number'] for row in data['accounts']} == expected
+        assert data['total'] == len(expected)
+        assert data['total_is_estimate'] is False
+
+    def test_total_is_capped(self, client, seeded, monkeypatch):
+        """تست: تعداد کل تا سقف شمرده می‌شود"""
+        import web.pagination
+        monkeypatch.setattr(web.pagination, 'COUNT_CAP', 20)
+
+        data = client.get("/api/accounts?limit=5").get_json()
+
+        assert data['total'] == 20
+        assert data['total_is_estimate'] is True
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
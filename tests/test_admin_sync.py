@@ -0,0 +1,184 @@
+"""
+تست برای همگام‌سازی تغییرات (since) در پنل ادمین
+این تست بررسی می‌کند که:
+1. با cursor فقط ردیف‌های درج‌شده، تغییرکرده یا حذف‌شده برگردانده می‌شوند
+2. تغییر موجودی با انتقال اتمی، قفل کاربر و تغییر وضعیت تراکنش و درخواست واریز دیده می‌شوند
+3. ردیف‌هایی که دیگر با فیلتر نمی‌خوانند در deleted می‌آیند
+4. تغییرات خیلی زیاد یا cursor خیلی قدیمی باعث بارگذاری دوباره (reset) می‌شوند
+5. مهاجرت ستون updated_at را به دیتابیس قدیمی اضافه می‌کند
+"""
+import pytest
+import sys
+import os
+from datetime import datetime, timedelta
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import inspect, text
+import config
+from database.db_manager import DatabaseManager
+
+
+@pytest.fixture
+def client(client, monkeypatch):
+    # Changes made by the test right after a request must not be re-sent
+    monkeypatch.setattr(config, 'SYNC_OVERLAP_SECONDS', 0)
+    return client
+
+
+@pytest.fixture
+def seeded(db_manager):
+    """سه کاربر با یک حساب، یک تراکنش و یک درخواست واریز"""
+    accounts = {}
+    for index, user_id in enumerate(("alice", "bob", "carol")):
+        account_number = f"{index + 1000:016d}"
+        db_manager.get_or_create_user(user_id)
+        db_manager._insert_account(user_id, account_number, "hash", "hash")
+        db_manager.set_account_balance(account_number, 100)
+        accounts[user_id] = account_number
+    transaction = db_manager.create_transaction(accounts["carol"], None, 10, 0.1, 'sell')
+    withdrawal = db_manager.create_withdrawal_request("carol", accounts["carol"], 10, 10000, "IR" + "0" * 24,
+                                                      transaction_id=transaction.id)
+    return accounts, transaction.id, withdrawal.id
+
+
+def delta(client, url, cursor):
+    separator = '&' if '?' in url else '?'
+    response = client.get(f"{url}{separator}since={cursor}")
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+class TestAdminSync:
+    """تست همگام‌سازی تغییرات"""
+
+    def test_no_changes(self, client, seeded):
+        """تست: بدون تغییر، دلتا خالی است"""
+        for url, key in (("/api/users", 'users'), ("/api/accounts", 'accounts'),
+                         ("/api/transactions", 'transactions'), ("/api/withdrawals", 'withdrawals')):
+            cursor = client.get(url).get_json()['cursor']
+            data = delta(client, url, cursor)
+            assert data[key] == [] and data['deleted'] == [] and data['reset'] is False, url
+        print("[TEST] ✅ بدون تغییر، دلتا خالی است")
+
+    def test_transfer_and_lock_changes(self, client, db_manager, seeded):
+        """تست: انتقال، قفل و حساب جدید در دلتا دیده می‌شوند"""
+        accounts, _, _ = seeded
+        users_cursor = client.get("/api/users").get_json()['cursor']
+        accounts_cursor = client.get("/api/accounts").get_json()['cursor']
+        transactions_cursor = client.get("/api/transactions").get_json()['cursor']
+
+        # transfer() changes balances with a Core UPDATE statement
+        result = db_manager.transfer(accounts["alice"], accounts["bob"], accounts["alice"], 5, 0, "sync-1")
+        db_manager.lock_user("carol", "تست")
+        db_manager.get_or_create_user("dave")
+
+        users = delta(client, "/api/users", users_cursor)
+        assert {row['user_id'] for row in users['users']} == {"alice", "bob", "carol", "dave"}
+        assert next(row for row in users['users'] if row['user_id'] == "carol")['is_locked'] is True
+        assert next(row for row in users['users'] if row['user_id'] == "bob")['balance'] == 105
+
+        changed_accounts = delta(client, "/api/accounts", accounts_cursor)['accounts']
+        assert {row['account_number']: row['balance'] for row in changed_accounts} == {
+            accounts["alice"]: 95, accounts["bob"]: 105
+        }
+
+        transactions = delta(client, "/api/transactions", transactions_cursor)['transactions']
+        assert [row['id'] for row in transactions] == [result['transaction_id']]
+        print("[TEST] ✅ تغییرات انتقال و قفل در دلتا آمدند")
+
+    def test_status_changes(self, client, db_manager, seeded):
+        """تست: تغییر وضعیت تراکنش و درخواست واریز"""
+        _, transaction_id, withdrawal_id = seeded
+        transactions_cursor = client.get("/api/transactions").get_json()['cursor']
+        pending_cursor = client.get("/api/withdrawals?status=pending").get_json()['cursor']
+
+        db_manager.update_transaction_status(transaction_id, 'success')
+        db_manager.confirm_withdrawal_request(withdrawal_id, "admin")
+
+        transactions = delta(client, "/api/transactions", transactions_cursor)['transactions']
+        assert [(row['id'], row['status']) for row in transactions] == [(transaction_id, 'success')]
+
+        # Confirmed requests drop out of the pending list
+        pending = delta(client, "/api/withdrawals?status=pending", pending_cursor)
+        assert pending['withdrawals'] == []
+        assert pending['deleted'] == [str(withdrawal_id)]
+
+    def test_rows_leaving_filter_are_deleted(self, client, db_manager, seeded):
+        """تست: حسابی که غیرفعال می‌شود از لیست حساب‌های فعال حذف می‌شود"""
+        accounts, _, _ = seeded
+        cursor = client.get("/api/accounts?active=true").get_json()['cursor']
+
+        assert client.post(f"/api/accounts/{accounts['bob']}/toggle").status_code == 200
+
+        data = delta(client, "/api/accounts?active=true", cursor)
+        assert data['accounts'] == []
+        assert data['deleted'] == [accounts["bob"]]
+
+    def test_deleted_user(self, client, db_manager, seeded):
+        """تست: حذف کاربر، حساب و تراکنش‌هایش در deleted می‌آید"""
+        accounts, transaction_id, withdrawal_id = seeded
+        db_manager.create_transaction(accounts["alice"], accounts["bob"], 1, 0, 'send')
+        cursors = {url: client.get(url).get_json()['cursor']
+                   for url in ("/api/users", "/api/accounts", "/api/transactions")}
+
+        assert db_manager.delete_user("alice") is True
+
+        assert delta(client, "/api/users", cursors["/api/users"])['deleted'] == ["alice"]
+        assert delta(client, "/api/accounts", cursors["/api/accounts"])['deleted'] == [accounts["alice"]]
+        assert len(delta(client, "/api/transactions", cursors["/api/transactions"])['deleted']) == 1
+
+    def test_overlap_resends_recent_changes(self, client, db_manager, seeded, monkeypatch):
+        """تست: تغییرات کمی قبل از cursor دوباره فرستاده می‌شوند"""
+        accounts, _, _ = seeded
+        cursor = client.get("/api/accounts").get_json()['cursor']
+        monkeypatch.setattr(config, 'SYNC_OVERLAP_SECONDS', 60)
+
+        data = delta(client, "/api/accounts", cursor)
+
+        assert {row['account_number'] for row in data['accounts']} == set(accounts.values())
+
+    def test_reset(self, client, db_manager, seeded, monkeypatch):
+        """تست: تغییرات زیاد یا cursor قدیمی باعث reset می‌شود"""
+        import web.sync
+        old_cursor = (datetime.utcnow() - timedelta(hours=config.SYNC_TOMBSTONE_RETENTION_HOURS + 1)).isoformat()
+        assert delta(client, "/api/users", old_cursor)['reset'] is True
+
+        cursor = client.get("/api/users").get_json()['cursor']
+        for user_id in ("dave", "erin", "frank"):
+            db_manager.get_or_create_user(user_id)
+        monkeypatch.setattr(web.sync, 'MAX_DELTA_ROWS', 2)
+        data = delta(client, "/api/users", cursor)
+        assert data['reset'] is True
+        assert 'users' not in data
+
+        assert client.get("/api/users?since=yesterday").status_code == 400
+
+    def test_migration_adds_updated_at(self, tmp_path):
+        """تست: مهاجرت ستون updated_at را به جداول قدیمی اضافه می‌کند"""
+        db_url = f"sqlite:///{tmp_path / 'legacy.db'}"
+        manager = DatabaseManager(db_url=db_url)
+        manager.get_or_create_user("old")
+        manager._insert_account("old", "1234567890123456", "hash", "hash")
+        with manager.engine.connect() as conn:
+            for table in ('accounts', 'transactions', 'withdrawal_requests'):
+                conn.execute(text(f"DROP INDEX ix_{table}_updated_at"))
+                conn.execute(text(f"ALTER TABLE {table} DROP COLUMN updated_at"))
+            conn.commit()
+        manager.engine.dispose()
+
+        manager = DatabaseManager(db_url=db_url)
+        try:
+            inspector = inspect(manager.engine)
+            for table in ('accounts', 'transactions', 'withdrawal_requests'):
+                assert 'updated_at' in {column['name'] for column in inspector.get_columns(table)}
+                assert f"ix_{table}_updated_at" in {index['name'] for index in inspector.get_indexes(table)}
+            with manager.engine.connect() as conn:
+                assert conn.execute(text("SELECT updated_at = created_at FROM accounts")).scalar() == 1
+        finally:
+            manager.engine.dispose()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
@@ -6,6 +6,7 @@
 3. بررسی می‌کند که کاربر می‌تواند از ربات استفاده کند
 """
 import pytest
+import pytest_asyncio
 import sys
 import os
 from unittest.mock import Mock, AsyncMock, patch, MagicMock
@@ -15,6 +16,7 @@ from datetime import datetime
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from database.db_manager import DatabaseManager
+from database.async_db_manager import AsyncDatabaseManager
 from handlers.start import StartHandler
 from utils.lock_manager import LockManager
 from telegram import Update, CallbackQuery, User, Chat, Message
@@ -29,15 +31,31 @@ class TestAgreementFlow:
         """ایجاد یک نمونه از DatabaseManager"""
         return DatabaseManager()
     
+    @pytest_asyncio.fixture
+    async def async_db_manager(self, db_manager):
+        """ایجاد یک نمونه از AsyncDatabaseManager روی همان دیتابیس"""
+        manager = AsyncDatabaseManager(db_manager)
+        yield manager
+        # Close aiosqlite connections (their threads keep pytest alive otherwise)
+        await manager.dispose()
+    
     @pytest.fixture
-    def lock_manager(self, db_manager):
+    def lock_manager(self, async_db_manager):
         """ایجاد یک نمونه از LockManager"""
-        return LockManager(db_manager)
+        return LockManager(async_db_manager)
     
     @pytest.fixture
-    def start_handler(self, db_manager, lock_manager):
+    def start_handler(self, async_db_manager, lock_manager):
         """ایجاد یک نمونه از StartHandler"""
-        return StartHandler(db_manager, lock_manager)
+        return StartHandler(async_db_manager, lock_manager)
+    
+    @pytest_asyncio.fixture
+    async def balance_bot(self):
+        """ایجاد یک نمونه از BalanceBot"""
+        from bot import BalanceBot
+        bot = BalanceBot()
+        yield bot
+        await bot.db.dispose()
     
     @pytest.fixture
     def mock_user(self):
@@ -189,11 +207,9 @@ class TestAgreementFlow:
         print(f"[TEST] ✅ پس از تایید موافقت‌نامه، کاربر به مرحله بعدی هدایت شد")
     
     @pytest.mark.asyncio
-    async def test_callback_after_agreement_acceptance(self, db_manager, lock_manager,
+    async def test_callback_after_agreement_acceptance(self, db_manager, lock_manager, balance_bot,
                                                        mock_update_with_callback, mock_context, mock_user):
         """تست: بررسی که callback های دیگر پس از تایید موافقت‌نامه کار می‌کنند"""
-        from bot import BalanceBot
-        
         user_id = str(mock_user.id)
         
         # اطمینان از وجود کاربر
@@ -206,7 +222,7 @@ class TestAgreementFlow:
         mock_update_with_callback.callback_query.data = "main_menu"
         
         # ایجاد bot instance
-        bot = BalanceBot()
+        bot = balance_bot
         
         # اجرای handle_callback
         await bot.handle_callback(mock_update_with_callback, mock_context)
@@ -240,11 +256,9 @@ class TestAgreementFlow:
         print(f"[TEST] ✅ تایید موافقت‌نامه در دیتابیس ماندگار است")
     
     @pytest.mark.asyncio
-    async def test_agreement_acceptance_then_immediate_use(self, db_manager, lock_manager,
+    async def test_agreement_acceptance_then_immediate_use(self, db_manager, lock_manager, balance_bot,
                                                           mock_user, mock_chat):
         """تست: بررسی مشکل گزارش شده - تایید موافقت‌نامه اما جلو نرفتن"""
-        from bot import BalanceBot
-        
         user_id = str(mock_user.id)
         
         # اطمینان از وجود کاربر و عدم تایید موافقت‌نامه
@@ -257,7 +271,7 @@ class TestAgreementFlow:
         print(f"\n[TEST] وضعیت اولیه موافقت‌نامه: {initial_status}")
         
         # شبیه‌سازی کلیک روی accept_agreement
-        bot = BalanceBot()
+        bot = balance_bot
         
         # ایجاد update برای accept_agreement
         update_accept = Mock(spec=Update)
@@ -0,0 +1,171 @@
+"""
+تست برای پردازش هم‌زمان به‌روزرسانی‌ها
+این تست بررسی می‌کند که:
+1. قفل کلیددار برای یک کلید ترتیبی و برای کلیدهای مختلف موازی است
+2. به‌روزرسانی‌های یک کاربر هیچ‌وقت در هم نمی‌روند و به ترتیب رسیدن اجرا می‌شوند
+3. به‌روزرسانی‌های کاربران مختلف هم‌زمان و حداکثر به اندازه سقف تعیین‌شده اجرا می‌شوند
+4. انتقال‌های هم‌زمان از یک حساب موجودی را منفی نمی‌کنند
+"""
+import asyncio
+import random
+import pytest
+import sys
+import os
+import uuid
+from types import SimpleNamespace
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.concurrency import KeyedLock, PerUserUpdateProcessor
+
+
+def make_update(user_id):
+    return SimpleNamespace(effective_user=SimpleNamespace(id=user_id))
+
+
+class TestKeyedLock:
+    """تست قفل کلیددار"""
+
+    @pytest.mark.asyncio
+    async def test_same_key_serialized_other_keys_parallel(self):
+        """تست: یک کلید ترتیبی، کلیدهای مختلف موازی"""
+        locks = KeyedLock()
+        running = {}
+        peak = {'same': 0, 'total': 0}
+
+        async def work(key):
+            async with locks.hold(key):
+                running[key] = running.get(key, 0) + 1
+                peak['same'] = max(peak['same'], running[key])
+                peak['total'] = max(peak['total'], sum(running.values()))
+                await asyncio.sleep(0.01)
+                running[key] -= 1
+
+        await asyncio.gather(*(work(key) for key in ['a', 'a', 'a', 'b', 'c']))
+
+        assert peak['same'] == 1
+        assert peak['total'] >= 3
+        # Entries are dropped once nobody holds or waits for them
+        assert len(locks) == 0
+        print("[TEST] ✅ قفل کلیددار درست کار می‌کند")
+
+    @pytest.mark.asyncio
+    async def test_multiple_keys_do_not_deadlock(self):
+        """تست: قفل دو حساب در ترتیب مخالف بن‌بست ایجاد نمی‌کند"""
+        locks = KeyedLock()
+
+        async def work(first, second):
+            for _ in range(20):
+                async with locks.hold(first, second):
+                    await asyncio.sleep(0)
+
+        await asyncio.wait_for(asyncio.gather(work('1', '2'), work('2', '1')), timeout=5)
+        assert len(locks) == 0
+
+
+class TestPerUserUpdateProcessor:
+    """تست پردازشگر به‌روزرسانی‌ها"""
+
+    @pytest.mark.asyncio
+    async def test_stress_no_interleaving_per_user(self):
+        """تست فشار: مراحل یک کاربر در هم نمی‌روند و ترتیب حفظ می‌شود"""
+        limit = 16
+        processor = PerUserUpdateProcessor(limit)
+        rng = random.Random(1234)
+        users = range(40)
+        updates_per_user = 10
+
+        active_users = set()
+        running = {'now': 0, 'peak': 0}
+        handled = {user: [] for user in users}
+        interleaved = []
+
+        async def handle(user, sequence, delay):
+            if user in active_users:
+                interleaved.append((user, sequence))
+            active_users.add(user)
+            running['now'] += 1
+            running['peak'] = max(running['peak'], running['now'])
+            # Two steps of one update, like reading and then writing the state
+            await asyncio.sleep(delay)
+            handled[user].append(sequence)
+            await asyncio.sleep(delay)
+            running['now'] -= 1
+            active_users.discard(user)
+
+        # Users' updates arrive randomly interleaved, each user's in sequence
+        arrivals = [user for user in users for _ in range(updates_per_user)]
+        rng.shuffle(arrivals)
+        next_sequence = {user: 0 for user in users}
+        tasks = []
+        for user in arrivals:
+            sequence = next_sequence[user]
+            next_sequence[user] += 1
+            coroutine = handle(user, sequence, rng.uniform(0, 0.003))
+            tasks.append(asyncio.create_task(processor.process_update(make_update(user), coroutine)))
+        await asyncio.wait_for(asyncio.gather(*tasks), timeout=30)
+
+        assert interleaved == [], f"به‌روزرسانی‌های هم‌پوشان: {interleaved[:5]}"
+        for user in users:
+            assert handled[user] == list(range(updates_per_user)), f"ترتیب کاربر {user} به هم خورد"
+        assert 1 < running['peak'] <= limit
+        assert processor.processed == len(users) * updates_per_user
+        assert processor.waited > 0
+        assert len(processor.user_locks) == 0
+        print(f"[TEST] ✅ {processor.processed} به‌روزرسانی، حداکثر {running['peak']} هم‌زمان")
+
+    @pytest.mark.asyncio
+    async def test_update_without_user_is_not_serialized(self):
+        """تست: به‌روزرسانی بدون کاربر منتظر قفل نمی‌ماند"""
+        processor = PerUserUpdateProcessor(4)
+        release = asyncio.Event()
+        done = []
+
+        async def blocked():
+            await release.wait()
+
+        async def channel_post():
+            done.append(True)
+
+        user_task = asyncio.create_task(processor.process_update(make_update(1), blocked()))
+        await asyncio.sleep(0)
+        await asyncio.wait_for(processor.process_update(SimpleNamespace(effective_user=None), channel_post()), 1)
+        assert done == [True]
+
+        release.set()
+        await user_task
+
+
+class TestConcurrentTransfers:
+    """تست انتقال‌های هم‌زمان"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_transfers_never_overdraw(self, db_manager, async_db):
+        """تست: انتقال‌های هم‌زمان از یک حساب بیش از موجودی برداشت نمی‌کنند"""
+        user_id = f"conc_{uuid.uuid4().hex[:8]}"
+        db_manager.get_or_create_user(user_id)
+        accounts = [str(uuid.uuid4().int)[:16] for _ in range(6)]
+        for account_number in accounts:
+            db_manager._insert_account(user_id, account_number, "hash", "hash")
+        source, fee_account, recipients = accounts[0], accounts[1], accounts[2:]
+        db_manager.set_account_balance(source, 100)
+
+        async def send(index):
+            return await async_db.transfer(
+                source, recipients[index % len(recipients)], fee_account, 30, 1,
+                idempotency_key=f"conc-{index}"
+            )
+
+        results = await asyncio.gather(*(send(index) for index in range(10)))
+
+        succeeded = [result for result in results if result]
+        assert len(succeeded) == 3
+        assert float(db_manager.get_account_balance(source)) == pytest.approx(100 - 3 * 31)
+        assert float(db_manager.get_account_balance(fee_account)) == pytest.approx(3)
+        assert len(async_db.account_locks) == 0
+        print("[TEST] ✅ موجودی حساب در انتقال‌های هم‌زمان منفی نشد")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
@@ -0,0 +1,160 @@
+"""
+تست برای آمار داشبورد ادمین
+این تست بررسی می‌کند که:
+1. همه آمار داشبورد با یک کوئری محاسبه می‌شوند و با شمارش مستقیم برابرند
+2. چند درخواست هم‌زمان فقط یک بار آمار را محاسبه می‌کنند
+3. آمار تا پایان مدت اعتبار از کش خوانده می‌شود
+"""
+import threading
+import time
+import pytest
+import sys
+import os
+import uuid
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.models import Account
+from database.unit_of_work import track_queries
+from web.utils import SingleFlightCache, calculate_stats, stats_cache
+
+
+@pytest.fixture(autouse=True)
+def fresh_stats_cache():
+    stats_cache.invalidate()
+    yield
+    stats_cache.invalidate()
+
+
+@pytest.fixture
+def seeded(db_manager):
+    """سه کاربر (یکی ادمین)، یک اکانت غیرفعال، یک انتقال و یک قفل"""
+    accounts = {}
+    for user_id, balance in (("admin", 10), ("alice", 100), ("bob", 50)):
+        account_number = str(uuid.uuid4().int)[:16]
+        db_manager.get_or_create_user(user_id)
+        db_manager._insert_account(user_id, account_number, "hash", "hash")
+        db_manager.set_account_balance(account_number, balance)
+        accounts[user_id] = account_number
+    inactive = str(uuid.uuid4().int)[:16]
+    db_manager._insert_account("bob", inactive, "hash", "hash")
+    db_manager.set_account_balance(inactive, 5)
+    session = db_manager.get_session()
+    session.query(Account).filter(Account.account_number == inactive).update({'is_active': False})
+    session.commit()
+    session.close()
+    db_manager.set_admin_status("admin", True)
+    db_manager.transfer(accounts["alice"], accounts["bob"], accounts["admin"], 20, 0.5, "stats-1")
+    db_manager.create_transaction(accounts["bob"], None, 3, 0.03, 'sell')
+    db_manager.lock_user("bob", "تست")
+    return accounts
+
+
+class TestDashboardStats:
+    """تست آمار داشبورد"""
+
+    def test_one_query_matches_counts(self, db_manager, seeded):
+        """تست: آمار با یک کوئری و برابر با شمارش مستقیم"""
+        with track_queries() as stats:
+            result = db_manager.get_dashboard_stats()
+
+        assert stats.queries == 1
+        assert result['total_users'] == 3
+        assert result['total_accounts'] == 4
+        assert result['total_transactions'] == 2
+        assert result['send_count'] == 1
+        assert result['sell_count'] == 1
+        assert result['buy_count'] == 0
+        assert result['success_transactions'] == 1
+        assert result['pending_transactions'] == 1
+        assert result['recent_transactions'] == 2
+        assert result['locked_users'] == 1
+        assert result['total_balance'] == pytest.approx(165)
+        assert result['total_fees'] == pytest.approx(0.5)
+        assert result['admin_account_number'] == db_manager.get_admin_account_number() == seeded["admin"]
+        assert result['admin_balance'] == pytest.approx(10.5)
+        print("[TEST] ✅ آمار داشبورد با یک کوئری محاسبه شد")
+
+    def test_empty_database(self, db_manager):
+        """تست: دیتابیس خالی"""
+        result = calculate_stats(db_manager)
+
+        assert result['total_users'] == 0
+        assert result['total_balance'] == 0.0
+        assert result['admin_account_number'] == 'ندارد'
+
+    def test_cached_until_ttl(self, db_manager, seeded):
+        """تست: آمار تا پایان مدت اعتبار از کش خوانده می‌شود"""
+        first = calculate_stats(db_manager)
+        db_manager.get_or_create_user("carol")
+
+        with track_queries() as stats:
+            second = calculate_stats(db_manager)
+
+        assert stats.queries == 0
+        assert second['total_users'] == first['total_users']
+
+        stats_cache.invalidate()
+        assert calculate_stats(db_manager)['total_users'] == first['total_users'] + 1
+
+
+class TestSingleFlightCache:
+    """تست کش تک‌پرواز"""
+
+    def test_concurrent_callers_compute_once(self):
+        """تست: درخواست‌های هم‌زمان فقط یک محاسبه انجام می‌دهند"""
+        cache = SingleFlightCache(ttl_seconds=60)
+        calls = []
+
+        def compute():
+            calls.append(threading.get_ident())
+            time.sleep(0.1)
+            return {'value': 42}
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get('stats', compute))) for _ in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(calls) == 1
+        assert results == [{'value': 42}] * 16
+        assert cache.computations == 1
+        assert cache.waits == 15
+        print("[TEST] ✅ ۱۶ درخواست هم‌زمان، یک محاسبه")
+
+    def test_stale_value_served_while_refreshing(self):
+        """تست: هنگام به‌روزرسانی مقدار قبلی برگردانده می‌شود"""
+        cache = SingleFlightCache(ttl_seconds=0)
+        cache.get('stats', lambda: 1)
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow():
+            started.set()
+            release.wait()
+            return 2
+
+        refresher = threading.Thread(target=lambda: cache.get('stats', slow))
+        refresher.start()
+        started.wait()
+        assert cache.get('stats', lambda: 3) == 1
+        release.set()
+        refresher.join()
+
+    def test_failed_computation_is_not_cached(self):
+        """تست: خطای محاسبه کش نمی‌شود"""
+        cache = SingleFlightCache(ttl_seconds=60)
+
+        def fail():
+            raise RuntimeError("db down")
+
+        with pytest.raises(RuntimeError):
+            cache.get('stats', fail)
+        assert cache.get('stats', lambda: 7) == 7
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
@@ -0,0 +1,94 @@
+"""
+تست برای مدیریت کلیدهای رمزنگاری وضعیت کاربر
+این تست بررسی می‌کند که:
+1. کلید فقط یک بار مشتق می‌شود و برای همه درخواست‌ها استفاده می‌شود
+2. وضعیت‌های رمز شده با کلید قبلی پس از چرخش کلید قابل خواندن هستند
+3. چرخش وضعیت، آن را با کلید اصلی جدید رمز می‌کند
+4. زمان‌بندی‌ها ثبت می‌شوند
+"""
+import pytest
+import sys
+import os
+from unittest.mock import patch
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import InvalidToken
+from utils import encryption
+from utils.encryption import KeyManager, encrypt_state, decrypt_state, rotate_state, get_key_manager
+
+
+class TestKeyManager:
+    """تست مدیریت کلیدهای رمزنگاری"""
+
+    def test_key_derived_once(self):
+        """تست: کلید فقط یک بار مشتق می‌شود"""
+        manager = get_key_manager()
+
+        with patch.object(encryption, 'derive_encryption_key', side_effect=AssertionError("نباید دوباره مشتق شود")):
+            for _ in range(5):
+                state = decrypt_state(encrypt_state({'action': 'buy_pers', 'step': 'enter_amount'}))
+                assert state == {'action': 'buy_pers', 'step': 'enter_amount'}
+
+        assert get_key_manager() is manager, "باید همان نمونه مدیر کلید استفاده شود"
+        print("[TEST] ✅ کلید فقط یک بار مشتق شد")
+
+    def test_old_key_still_decrypts_after_rotation(self):
+        """تست: وضعیت رمز شده با کلید قبلی پس از چرخش کلید خوانده می‌شود"""
+        old_manager = KeyManager(b'old_key_for_rotation_test')
+        old_token = old_manager.encrypt(b'{"step": "confirm"}')
+
+        rotated_manager = KeyManager(b'new_key_for_rotation_test', [b'old_key_for_rotation_test'])
+        assert rotated_manager.key_count == 2
+        assert rotated_manager.decrypt(old_token) == b'{"step": "confirm"}'
+
+        # کلید جدید به تنهایی نباید بتواند توکن قدیمی را باز کند
+        new_only_manager = KeyManager(b'new_key_for_rotation_test')
+        with pytest.raises(InvalidToken):
+            new_only_manager.decrypt(old_token)
+
+        print("[TEST] ✅ وضعیت قدیمی پس از چرخش کلید قابل خواندن است")
+
+    def test_rotate_reencrypts_with_primary_key(self):
+        """تست: چرخش توکن آن را با کلید اصلی رمز می‌کند"""
+        manager = KeyManager(b'first_key_for_rotate_test')
+        token = manager.encrypt(b'{"action": "contact"}')
+
+        manager.add_primary_key(b'second_key_for_rotate_test')
+        rotated = manager.rotate(token)
+
+        assert manager.retire_key(b'first_key_for_rotate_test') is True
+        assert manager.decrypt(rotated) == b'{"action": "contact"}'
+        with pytest.raises(InvalidToken):
+            manager.decrypt(token)
+
+        print("[TEST] ✅ چرخش توکن با کلید اصلی جدید انجام شد")
+
+    def test_primary_key_cannot_be_retired(self):
+        """تست: کلید اصلی قابل حذف نیست"""
+        manager = KeyManager(b'only_key_for_retire_test')
+        assert manager.retire_key(b'only_key_for_retire_test') is False
+        assert manager.key_count == 1
+
+    def test_rotate_state_keeps_content(self):
+        """تست: چرخش وضعیت محتوای آن را تغییر نمی‌دهد"""
+        state = {'action': 'sell_pers', 'amount': 10.5}
+        assert decrypt_state(rotate_state(encrypt_state(state))) == state
+        assert rotate_state("") == ""
+
+    def test_timings_recorded(self):
+        """تست: زمان‌بندی رمزنگاری و رمزگشایی ثبت می‌شود"""
+        manager = KeyManager(b'timings_key_for_test')
+        token = manager.encrypt(b'{}')
+        manager.decrypt(token)
+
+        timings = manager.get_timings()
+        assert timings['encrypt_count'] == 1
+        assert timings['decrypt_count'] == 1
+        assert timings['derive_seconds'] > 0
+        print(f"[TEST] ✅ زمان‌بندی‌ها: {timings}")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
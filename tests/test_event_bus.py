@@ -0,0 +1,257 @@
+"""
+تست برای رویدادهای زنده پنل ادمین (/api/events)
+این تست بررسی می‌کند که:
+1. متدهای نوشتن DatabaseManager بعد از commit رویداد منتشر می‌کنند
+2. با rollback (یا انتقال ردشده) هیچ رویدادی منتشر نمی‌شود
+3. داخل unit of work رویدادها فقط با commit نهایی منتشر می‌شوند
+4. صف هر مشترک محدود است و قدیمی‌ترین رویدادها کنار گذاشته می‌شوند
+5. جریان SSE رویدادها، heartbeat و تغییرات آمار را می‌فرستد و تعداد اتصال‌ها محدود است
+6. همه جریان‌ها از یک نخ asyncio سرویس می‌گیرند و پنل به پورت آن هدایت می‌کند
+"""
+import json
+import pytest
+import socket
+import sys
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from database.db_manager import DatabaseManager
+from database.events import EventBus, get_event_bus
+
+
+@pytest.fixture
+def subscription():
+    subscription = get_event_bus().subscribe()
+    yield subscription
+    subscription.close()
+
+
+@pytest.fixture
+def accounts(db_manager):
+    for user_id, account_number in (("alice", "1000000000000001"), ("bob", "1000000000000002")):
+        db_manager.get_or_create_user(user_id)
+        db_manager._insert_account(user_id, account_number, "hash", "hash")
+        db_manager.set_account_balance(account_number, 100)
+    return "1000000000000001", "1000000000000002"
+
+
+@pytest.fixture
+def client(client, monkeypatch):
+    import web.app
+    import web.utils
+    monkeypatch.setattr(config, 'SSE_HEARTBEAT_SECONDS', 0.05)
+    monkeypatch.setattr(config, 'SSE_HOST', '127.0.0.1')
+    monkeypatch.setattr(config, 'SSE_PORT', 0)
+    monkeypatch.setattr(web.utils.stats_cache, 'ttl_seconds', 0)
+    yield client
+    web.app.event_streams.stop()
+
+
+def open_stream(client):
+    """Follow the panel's redirect and open the stream; returns the socket's file and the status line"""
+    response = client.get("/api/events")
+    assert response.status_code == 307
+    url = urlsplit(response.headers['Location'])
+    sock = socket.create_connection((url.hostname, url.port), timeout=5)
+    sock.sendall(f"GET {url.path} HTTP/1.1\r\nHost: {url.netloc}\r\nAccept: text/event-stream\r\n\r\n".encode())
+    stream = sock.makefile('rb')
+    sock.close()
+    status = stream.readline().decode()
+    headers = {}
+    for line in iter(stream.readline, b'\r\n'):
+        name, _, value = line.decode().partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return stream, status, headers
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def drain(subscription):
+    return [(event.type, event.data) for event in subscription.get(timeout=0)]
+
+
+def read_messages(body, count):
+    """The next count SSE messages (events and comments) of a stream"""
+    messages, buffer = [], ""
+    while len(messages) < count:
+        buffer += body.readline().decode()
+        while "\n\n" in buffer and len(messages) < count:
+            message, buffer = buffer.split("\n\n", 1)
+            messages.append(message)
+    return messages
+
+
+def next_event(body):
+    """The next event of a stream, skipping keepalive comments"""
+    while True:
+        message = read_messages(body, 1)[0]
+        if not message.startswith(":"):
+            return parse_message(message)
+
+
+def parse_message(message):
+    fields = dict(line.split(": ", 1) for line in message.splitlines() if not line.startswith(":"))
+    return fields.get('event'), json.loads(fields['data']) if 'data' in fields else None
+
+
+class TestEventBus:
+    """تست انتشار رویداد از متدهای نوشتن"""
+
+    def test_write_methods_publish_after_commit(self, db_manager, accounts, subscription):
+        """تست: تراکنش، درخواست واریز و قفل کاربر رویداد دارند"""
+        alice, bob = accounts
+        drain(subscription)
+
+        result = db_manager.transfer(alice, bob, alice, 5, 0, "event-1")
+        transaction = db_manager.create_transaction(alice, None, 10, 0.1, 'sell')
+        db_manager.update_transaction_status(transaction.id, 'success')
+        withdrawal = db_manager.create_withdrawal_request("alice", alice, 10, 10000, "IR" + "0" * 24)
+        db_manager.confirm_withdrawal_request(withdrawal.id, "admin")
+        db_manager.lock_user("bob", "تست")
+        db_manager.unlock_user("bob")
+
+        events = drain(subscription)
+        assert [(event_type, data['action']) for event_type, data in events] == [
+            ('transaction', 'created'), ('transaction', 'created'), ('transaction', 'updated'),
+            ('withdrawal', 'created'), ('withdrawal', 'updated'), ('user', 'locked'), ('user', 'unlocked'),
+        ]
+        assert events[0][1]['id'] == result['transaction_id']
+        assert events[0][1]['amount'] == 5
+        assert events[2][1] == dict(events[1][1], action='updated', status='success')
+        assert events[4][1]['status'] == 'confirmed'
+        assert events[5][1]['user_id'] == "bob"
+        print("[TEST] ✅ رویدادها بعد از commit منتشر شدند")
+
+    def test_no_event_on_rollback(self, db_manager, accounts, subscription):
+        """تست: انتقال ردشده یا تکراری رویدادی ندارد"""
+        alice, bob = accounts
+        assert db_manager.transfer(alice, bob, alice, 1000, 0, "too-much") is None
+        db_manager.transfer(alice, bob, alice, 1, 0, "once")
+        drain(subscription)
+
+        assert db_manager.transfer(alice, bob, alice, 1, 0, "once")['duplicate'] is True
+
+        assert drain(subscription) == []
+
+    def test_unit_of_work_publishes_on_final_commit(self, db_manager, accounts, subscription):
+        """تست: رویدادهای unit of work فقط با commit نهایی و فقط اگر commit شود"""
+        alice, bob = accounts
+        drain(subscription)
+
+        with db_manager.unit_of_work():
+            db_manager.transfer(alice, bob, alice, 1, 0, "uow-1")
+            db_manager.lock_user("alice", "تست")
+            assert drain(subscription) == []
+        assert [event_type for event_type, _ in drain(subscription)] == ['transaction', 'user']
+
+        with pytest.raises(RuntimeError):
+            with db_manager.unit_of_work():
+                db_manager.transfer(alice, bob, alice, 1, 0, "uow-2")
+                raise RuntimeError("boom")
+        assert drain(subscription) == []
+
+    def test_subscription_is_bounded(self):
+        """تست: مشترک کند فقط آخرین رویدادها را نگه می‌دارد"""
+        bus = EventBus()
+        subscription = bus.subscribe(max_events=3)
+        for index in range(5):
+            bus.publish('transaction', {'id': index})
+
+        assert [event.data['id'] for event in subscription.get(timeout=0)] == [2, 3, 4]
+        assert subscription.dropped == 2
+        subscription.close()
+        assert bus.subscriber_count == 0
+
+    def test_events_of_other_processes(self):
+        """تست: رویداد NOTIFY پردازه دیگر تحویل داده می‌شود ولی رویداد خود این پردازه نه"""
+        bus, other = EventBus(), EventBus()
+        subscription = bus.subscribe()
+        payload = other.publish('user', {'action': 'locked', 'user_id': "x"}).to_json()
+
+        assert bus.receive(payload) is not None
+        assert bus.receive(bus.publish('user', {}).to_json()) is None
+        assert [event.origin for event in subscription.get(timeout=0)] == [other.origin, bus.origin]
+
+
+class TestEventStream:
+    """تست جریان SSE"""
+
+    def test_stream(self, client, db_manager, accounts):
+        """تست: آمار اولیه، رویداد، تغییر آمار و heartbeat"""
+        import web.app
+        body, status, headers = open_stream(client)
+        try:
+            assert " 200 " in status
+            assert headers['content-type'].startswith('text/event-stream')
+            # retry hint, then the full statistics
+            retry, first = read_messages(body, 2)
+            assert retry.startswith("retry:")
+            event, stats = parse_message(first)
+            assert event == 'stats' and stats['total_transactions'] == 0
+
+            db_manager.transfer(accounts[0], accounts[1], accounts[0], 5, 0, "sse-1")
+
+            event, data = parse_message(read_messages(body, 1)[0])
+            assert event == 'transaction' and data['action'] == 'created'
+            event, stats = parse_message(read_messages(body, 1)[0])
+            # Only the figures that changed
+            assert event == 'stats' and stats == {'total_transactions': 1, 'send_count': 1,
+                                                  'success_transactions': 1, 'recent_transactions': 1}
+            assert read_messages(body, 1)[0] == ": keepalive"
+            assert web.app.event_streams.clients == 1
+        finally:
+            body.close()
+        wait_for(lambda: web.app.event_streams.clients == 0)
+        print("[TEST] ✅ جریان SSE رویدادها و آمار را فرستاد")
+
+    def test_many_streams_one_thread(self, client, db_manager, accounts):
+        """تست: همه جریان‌ها از یک نخ سرویس می‌گیرند و رویداد به همه می‌رسد"""
+        import web.app
+        streams = [open_stream(client)[0] for _ in range(50)]
+        try:
+            for body in streams:
+                read_messages(body, 2)
+            assert web.app.event_streams.clients == 50
+            assert sum(thread.name == 'sse-server' for thread in threading.enumerate()) == 1
+
+            db_manager.transfer(accounts[0], accounts[1], accounts[0], 5, 0, "sse-many")
+            for body in streams:
+                assert next_event(body)[0] == 'transaction'
+        finally:
+            for body in streams:
+                body.close()
+        wait_for(lambda: web.app.event_streams.clients == 0)
+        print("[TEST] ✅ 50 جریان همزمان با یک نخ")
+
+    def test_client_limit(self, client, monkeypatch):
+        """تست: بیش از SSE_MAX_CLIENTS اتصال رد می‌شود"""
+        import web.app
+        monkeypatch.setattr(config, 'SSE_MAX_CLIENTS', 1)
+        first, status, _ = open_stream(client)
+        try:
+            read_messages(first, 2)
+            second, status, _ = open_stream(client)
+            second.close()
+            assert " 503 " in status
+            assert web.app.event_streams.snapshot()['refused'] >= 1
+        finally:
+            first.close()
+        wait_for(lambda: web.app.event_streams.clients == 0)
+        third, status, _ = open_stream(client)
+        third.close()
+        assert " 200 " in status
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
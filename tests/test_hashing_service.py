@@ -0,0 +1,143 @@
+"""
+تست برای سرویس هش غیرهمزمان ARGON2ID
+این تست بررسی می‌کند که:
+1. هش و بررسی رمز بدون مسدود کردن حلقه رویداد انجام می‌شود
+2. تعداد هش‌های همزمان از سقف حافظه بیشتر نمی‌شود
+3. عمق صف و زمان انتظار در معیارها ثبت می‌شوند
+4. کارهای ناموفق جدا از کارهای انجام‌شده شمرده می‌شوند
+"""
+import pytest
+import asyncio
+import sys
+import os
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import hashing_service
+from utils.hashing_service import HashingService, workers_for_budget, HASH_MEMORY_MB
+from utils.encryption import verify_password
+
+
+def slow_identity(value):
+    time.sleep(0.05)
+    return value
+
+
+def failing(value):
+    raise ValueError(value)
+
+
+class TestHashingService:
+    """تست سرویس هش"""
+
+    def test_workers_for_budget(self):
+        """تست: تعداد کارگرها از سقف حافظه محاسبه می‌شود"""
+        assert HASH_MEMORY_MB == 64
+        assert workers_for_budget(256) == 4
+        assert workers_for_budget(100) == 1
+        assert workers_for_budget(0) == 1, "حداقل یک کارگر لازم است"
+        print("[TEST] ✅ تعداد کارگرها درست محاسبه شد")
+
+    def test_hash_and_verify_in_process_pool(self):
+        """تست: هش و بررسی رمز در استخر پردازه"""
+        service = HashingService(max_workers=1)
+
+        async def scenario():
+            password_hash = await service.hash_password_async("12345678")
+            assert verify_password(password_hash, "12345678")
+            assert await service.verify_password_async(password_hash, "12345678") is True
+            assert await service.verify_password_async(password_hash, "87654321") is False
+
+        try:
+            asyncio.run(scenario())
+        finally:
+            service.shutdown()
+
+        metrics = service.get_metrics()
+        assert metrics['completed'] == 3
+        assert metrics['failed'] == 0
+        print(f"[TEST] ✅ هش در استخر پردازه انجام شد: {metrics}")
+
+    def test_concurrency_capped_and_queue_measured(self):
+        """تست: کارهای اضافه در صف می‌مانند و عمق صف ثبت می‌شود"""
+        service = HashingService(max_workers=2, use_processes=False)
+        peak = {'in_flight': 0}
+
+        async def watched(value):
+            result = await service._run(slow_identity, value)
+            return result
+
+        async def watch():
+            while True:
+                peak['in_flight'] = max(peak['in_flight'], service.in_flight)
+                await asyncio.sleep(0.005)
+
+        async def scenario():
+            watcher = asyncio.create_task(watch())
+            results = await asyncio.gather(*(watched(i) for i in range(6)))
+            watcher.cancel()
+            return results
+
+        try:
+            results = asyncio.run(scenario())
+        finally:
+            service.shutdown()
+
+        assert results == list(range(6))
+        assert peak['in_flight'] <= 2, "بیش از سقف کارگرها همزمان اجرا شد"
+        metrics = service.get_metrics()
+        assert metrics['max_queue_depth'] >= 4
+        assert metrics['queue_depth'] == 0
+        assert metrics['in_flight'] == 0
+        assert metrics['max_wait_seconds'] > 0
+        print(f"[TEST] ✅ سقف همزمانی رعایت شد: {metrics}")
+
+    def test_failures_not_counted_as_completed(self):
+        """تست: کار ناموفق جدا از کارهای انجام‌شده شمرده می‌شود"""
+        service = HashingService(max_workers=1, use_processes=False)
+
+        async def scenario():
+            with pytest.raises(ValueError):
+                await service._run(failing, "bad")
+            return await service._run(slow_identity, "ok")
+
+        try:
+            assert asyncio.run(scenario()) == "ok"
+        finally:
+            service.shutdown()
+
+        metrics = service.get_metrics()
+        assert metrics['completed'] == 1 and metrics['failed'] == 1
+        assert metrics['avg_run_seconds'] >= 0.05
+        assert metrics['avg_failed_seconds'] < 0.05
+
+    def test_event_loop_not_blocked(self):
+        """تست: حلقه رویداد هنگام هش کردن پاسخگو می‌ماند"""
+        service = HashingService(max_workers=1)
+
+        async def scenario():
+            ticks = 0
+            task = asyncio.create_task(service.hash_password_async("12345678"))
+            while not task.done():
+                ticks += 1
+                await asyncio.sleep(0.001)
+            await task
+            return ticks
+
+        try:
+            ticks = asyncio.run(scenario())
+        finally:
+            service.shutdown()
+
+        assert ticks > 1, "حلقه رویداد در طول هش مسدود شد"
+        print(f"[TEST] ✅ حلقه رویداد در طول هش {ticks} بار اجرا شد")
+
+    def test_shared_service(self):
+        """تست: سرویس مشترک فقط یک بار ساخته می‌شود"""
+        assert hashing_service.get_hashing_service() is hashing_service.get_hashing_service()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
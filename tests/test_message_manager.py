@@ -0,0 +1,132 @@
+"""
+تست برای حذف پیام‌ها در پس‌زمینه
+این تست بررسی می‌کند که:
+1. delete_previous_messages منتظر حذف پیام‌ها نمی‌ماند و شناسه پیام قبلی ربات را از وضعیت پاک می‌کند
+2. پاک کردن وضعیت با بقیه تغییرات وضعیت همان به‌روزرسانی یک بار نوشته می‌شود
+3. پیام‌های هر چت با یک درخواست deleteMessages (حداکثر ۱۰۰ پیام) حذف می‌شوند
+4. بدون deleteMessages پیام‌ها یکی‌یکی حذف می‌شوند و خطای حذف نادیده گرفته می‌شود
+"""
+import asyncio
+import pytest
+import sys
+import os
+from types import SimpleNamespace
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram.error import BadRequest
+from utils.encryption import decrypt_state
+from utils.message_manager import MessageDeleter, delete_previous_messages, get_message_deleter
+
+
+class BulkBot:
+    """Bot with deleteMessages; each call waits for release to be set"""
+
+    def __init__(self):
+        self.calls = []
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def delete_messages(self, chat_id, message_ids):
+        await self.release.wait()
+        self.calls.append((chat_id, list(message_ids)))
+        return True
+
+
+class SingleBot:
+    """Bot without deleteMessages; message 2 cannot be deleted"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def delete_message(self, chat_id, message_id):
+        self.calls.append((chat_id, message_id))
+        if message_id == 2:
+            raise BadRequest("Message to delete not found")
+        return True
+
+
+def make_update(chat_id, message_id):
+    return SimpleNamespace(message=SimpleNamespace(message_id=message_id),
+                           effective_chat=SimpleNamespace(id=chat_id))
+
+
+class TestDeletePreviousMessages:
+    """تست حذف پیام‌های قبلی"""
+
+    @pytest.mark.asyncio
+    async def test_returns_before_deletion(self, db_manager, async_db):
+        """تست: پاسخ منتظر حذف نمی‌ماند و دو پیام با یک درخواست حذف می‌شوند"""
+        db_manager.get_or_create_user("500")
+        await async_db.set_state("500", {'action': 'send', 'last_bot_message_id': 41})
+        bot = BulkBot()
+        bot.release.clear()
+        writes = async_db.state_cache.writes
+
+        async with async_db.state_cache.coalesce_writes():
+            await delete_previous_messages(make_update(500, 42), SimpleNamespace(bot=bot), async_db, "500")
+            state = await async_db.get_state("500")
+            state['step'] = 'amount'
+            await async_db.set_state("500", state)
+
+        assert bot.calls == []
+        # The cleared message id and the handler's change went out in one state write
+        assert async_db.state_cache.writes == writes + 1
+        assert decrypt_state(db_manager.get_user_state("500")) == {'action': 'send', 'step': 'amount'}
+
+        bot.release.set()
+        await get_message_deleter().drain()
+        assert bot.calls == [(500, [42, 41])]
+        print("[TEST] ✅ حذف پیام‌ها در پس‌زمینه انجام شد")
+
+    @pytest.mark.asyncio
+    async def test_without_previous_message(self, db_manager, async_db):
+        """تست: بدون پیام قبلی ربات فقط پیام کاربر حذف می‌شود و وضعیت نوشته نمی‌شود"""
+        db_manager.get_or_create_user("501")
+        bot = BulkBot()
+        writes = async_db.state_cache.writes
+
+        await delete_previous_messages(make_update(501, 7), SimpleNamespace(bot=bot), async_db, "501",
+                                       delete_user_message=False)
+        await delete_previous_messages(make_update(501, 8), SimpleNamespace(bot=bot), async_db, "501")
+        await get_message_deleter().drain()
+
+        assert bot.calls == [(501, [8])]
+        assert async_db.state_cache.writes == writes
+
+
+class TestMessageDeleter:
+    """تست حذف دسته‌ای پیام‌ها"""
+
+    @pytest.mark.asyncio
+    async def test_groups_per_chat(self):
+        """تست: پیام‌های هر چت با هم و در دسته‌های حداکثر ۱۰۰تایی حذف می‌شوند"""
+        deleter = MessageDeleter(batch_seconds=0.01)
+        bot = BulkBot()
+        deleter.schedule(bot, 1, *range(1, 151))
+        deleter.schedule(bot, 2, 5, None)
+        deleter.schedule(bot, 1, 150, 151)
+        await deleter.drain()
+
+        assert sorted((chat_id, len(ids)) for chat_id, ids in bot.calls) == [(1, 51), (1, 100), (2, 1)]
+        assert deleter.snapshot() == {'scheduled': 153, 'deleted': 152, 'failed': 0, 'requests': 3, 'pending': 0}
+
+        deleter.schedule(bot, 3, 9)
+        await deleter.drain()
+        assert bot.calls[-1] == (3, [9])
+
+    @pytest.mark.asyncio
+    async def test_falls_back_to_single_deletes(self):
+        """تست: بدون deleteMessages پیام‌ها یکی‌یکی حذف و خطاها شمرده می‌شوند"""
+        deleter = MessageDeleter(batch_seconds=0)
+        bot = SingleBot()
+        deleter.schedule(bot, 1, 1, 2, 3)
+        await deleter.drain()
+
+        assert bot.calls == [(1, 1), (1, 2), (1, 3)]
+        assert (deleter.deleted, deleter.failed, deleter.requests) == (2, 1, 3)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
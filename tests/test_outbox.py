@@ -0,0 +1,224 @@
+"""
+تست برای صف پایدار اعلان‌ها (outbox)
+این تست بررسی می‌کند که:
+1. اعلان واریز در همان تراکنش انتقال ثبت می‌شود و با rollback از بین می‌رود
+2. از هر چت فقط قدیمی‌ترین پیام در انتظار برداشته می‌شود (حفظ ترتیب) و پیام رهاشده پس از پایان مهلت دوباره برداشته می‌شود
+3. ارسال‌کننده پیام‌ها را دسته‌ای می‌فرستد، با backoff دوباره امتحان می‌کند و پیام‌های ناموفق را به صف پیام‌های مرده می‌برد
+4. تایید درخواست واریز در پنل پیام را در صف می‌گذارد و درخواست بعد از ارسال پیام تکمیل می‌شود
+"""
+import asyncio
+import pytest
+import sys
+import os
+from datetime import datetime, timedelta
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram.error import BadRequest, NetworkError, RetryAfter
+import config
+from database.models import OutboxMessage
+from utils.outbox import OutboxDispatcher
+
+
+class FakeBot:
+    """Bot that records sent messages; errors[chat_id] lists exceptions to raise first"""
+
+    def __init__(self, errors=None):
+        self.errors = errors or {}
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        if self.errors.get(chat_id):
+            raise self.errors[chat_id].pop(0)
+        self.sent.append((chat_id, text))
+
+
+@pytest.fixture
+def db_manager(db_manager):
+    """alice و bob هر کدام با یک حساب و موجودی 100"""
+    for user_id, account_number in (("alice", "1000000000000001"), ("bob", "1000000000000002")):
+        db_manager.get_or_create_user(user_id)
+        db_manager._insert_account(user_id, account_number, "hash", "hash")
+        db_manager.set_account_balance(account_number, 100)
+    return db_manager
+
+
+def outbox_rows(db_manager):
+    session = db_manager.get_session()
+    try:
+        return [(row.chat_id, row.kind, row.status) for row in session.query(OutboxMessage).order_by(OutboxMessage.id)]
+    finally:
+        session.close()
+
+
+def due_now(db_manager):
+    """Make every pending message due (skips the backoff wait)"""
+    session = db_manager.get_session()
+    try:
+        session.query(OutboxMessage).update({'next_attempt_at': datetime.utcnow() - timedelta(seconds=1)})
+        session.commit()
+    finally:
+        session.close()
+
+
+class TestOutboxWrites:
+    """تست ثبت پیام در outbox"""
+
+    def test_transfer_queues_recipient_notice(self, db_manager):
+        """تست: اعلان واریز با انتقال commit می‌شود"""
+        result = db_manager.transfer("1000000000000001", "1000000000000002", "1000000000000001", 5, 0, "t-1",
+                                     recipient_message=lambda balance: f"موجودی جدید: {balance}")
+
+        assert outbox_rows(db_manager) == [("bob", 'deposit', 'pending')]
+        message = db_manager.get_outbox_message(1)
+        assert message.text == f"موجودی جدید: {result['balances']['1000000000000002']}"
+        print("[TEST] ✅ اعلان واریز در همان تراکنش ثبت شد")
+
+    def test_no_notice_without_transfer(self, db_manager):
+        """تست: انتقال ردشده، تکراری یا rollback شده اعلانی ندارد"""
+        notice = lambda balance: "واریز"
+        assert db_manager.transfer("1000000000000001", "1000000000000002", "1000000000000001", 500, 0, "big",
+                                   recipient_message=notice) is None
+        db_manager.transfer("1000000000000001", "1000000000000002", "1000000000000001", 1, 0, "once",
+                            recipient_message=notice)
+        db_manager.transfer("1000000000000001", "1000000000000002", "1000000000000001", 1, 0, "once",
+                            recipient_message=notice)
+        with pytest.raises(RuntimeError):
+            with db_manager.unit_of_work():
+                db_manager.enqueue_notification("alice", "پیام", 'contact')
+                raise RuntimeError("boom")
+
+        assert outbox_rows(db_manager) == [("bob", 'deposit', 'pending')]
+
+    def test_claim_keeps_chat_order(self, db_manager):
+        """تست: از هر چت فقط قدیمی‌ترین پیام برداشته می‌شود"""
+        first = db_manager.enqueue_notification("alice", "اول", 'contact')
+        second = db_manager.enqueue_notification("alice", "دوم", 'contact')
+        other = db_manager.enqueue_notification("bob", "سوم", 'contact')
+
+        batch = db_manager.claim_outbox_batch(10, 60)
+        assert [message['id'] for message in batch] == [first, other]
+        assert all(message['attempts'] == 1 for message in batch)
+        # Claimed messages are leased, and alice's second message waits for the first
+        assert db_manager.claim_outbox_batch(10, 60) == []
+
+        db_manager.mark_outbox_sent([first, other])
+        assert [message['id'] for message in db_manager.claim_outbox_batch(10, 60)] == [second]
+
+    def test_expired_lease_is_claimed_again(self, db_manager):
+        """تست: پیام دیسپچر ازکارافتاده پس از پایان مهلت دوباره برداشته می‌شود"""
+        message_id = db_manager.enqueue_notification("alice", "پیام", 'contact')
+        assert len(db_manager.claim_outbox_batch(10, 60)) == 1
+        due_now(db_manager)
+
+        batch = db_manager.claim_outbox_batch(10, 60)
+        assert [(message['id'], message['attempts']) for message in batch] == [(message_id, 2)]
+
+
+class TestOutboxDispatcher:
+    """تست ارسال‌کننده outbox"""
+
+    @pytest.mark.asyncio
+    async def test_delivers_in_batches(self, db_manager, async_db):
+        """تست: ارسال دسته‌ای و ترتیب پیام‌های هر چت"""
+        for index in range(3):
+            for chat_id in ("alice", "bob", "carol"):
+                db_manager.enqueue_notification(chat_id, f"{chat_id}-{index}", 'contact')
+        bot = FakeBot()
+        dispatcher = OutboxDispatcher(async_db, bot, workers=2)
+
+        rounds = [await dispatcher.run_once() for _ in range(4)]
+
+        assert rounds == [3, 3, 3, 0]
+        assert [text for chat_id, text in bot.sent if chat_id == "alice"] == ["alice-0", "alice-1", "alice-2"]
+        assert {status for _, _, status in outbox_rows(db_manager)} == {'sent'}
+        assert (await async_db.get_outbox_stats())['sent'] == 9
+
+    @pytest.mark.asyncio
+    async def test_retry_and_dead_letter(self, db_manager, async_db, monkeypatch):
+        """تست: تلاش دوباره با backoff، صف پیام‌های مرده و حفظ ترتیب در خطا"""
+        monkeypatch.setattr(config, 'OUTBOX_MAX_ATTEMPTS', 2)
+        for chat_id, text in (("flood", "1"), ("flood", "2"), ("bad", "1"), ("down", "1")):
+            db_manager.enqueue_notification(chat_id, text, 'contact')
+        bot = FakeBot(errors={"flood": [RetryAfter(0)], "bad": [BadRequest("Chat not found")],
+                              "down": [NetworkError("down"), NetworkError("down")]})
+        dispatcher = OutboxDispatcher(async_db, bot)
+
+        assert await dispatcher.run_once() == 3
+        # flood's second message waits behind the first; down backs off
+        stats = await async_db.get_outbox_stats()
+        assert (stats['pending'], stats['dead']) == (3, 1)
+        assert db_manager.get_outbox_message(3).last_error == "BadRequest: Chat not found"
+        assert db_manager.get_outbox_message(4).next_attempt_at > datetime.utcnow()
+
+        due_now(db_manager)
+        await dispatcher.run_once()
+        due_now(db_manager)
+        await dispatcher.run_once()
+
+        assert bot.sent == [("flood", "1"), ("flood", "2")]
+        assert outbox_rows(db_manager)[3] == ("down", 'contact', 'dead')
+        assert dispatcher.snapshot()['dead'] == 2
+
+        assert db_manager.retry_outbox_message(3) is True
+        assert db_manager.get_outbox_message(3).status == 'pending'
+
+    @pytest.mark.asyncio
+    async def test_wakes_on_commit(self, db_manager, async_db, monkeypatch):
+        """تست: پیام جدید بدون انتظار برای دوره poll ارسال می‌شود"""
+        monkeypatch.setattr(config, 'OUTBOX_POLL_SECONDS', 30)
+        bot = FakeBot()
+        dispatcher = OutboxDispatcher(async_db, bot)
+        task = asyncio.create_task(dispatcher.run())
+        try:
+            await asyncio.sleep(0.1)
+            await async_db.enqueue_notification("alice", "فوری", 'contact')
+            for _ in range(100):
+                if bot.sent:
+                    break
+                await asyncio.sleep(0.02)
+            assert bot.sent == [("alice", "فوری")]
+        finally:
+            dispatcher.stop()
+            await task
+
+
+class TestConfirmWithdrawal:
+    """تست تایید درخواست واریز در پنل"""
+
+    @pytest.mark.asyncio
+    async def test_completed_after_delivery(self, db_manager, async_db, client):
+        """تست: تایید پیام را در صف می‌گذارد و پس از ارسال، درخواست تکمیل می‌شود"""
+        withdrawal = db_manager.create_withdrawal_request("alice", "1000000000000001", 10, 10000, "IR" + "0" * 24)
+
+        data = client.post(f"/api/withdrawals/{withdrawal.id}/confirm").get_json()
+        assert data['success'] is True
+        assert db_manager.get_withdrawal_request(withdrawal.id).status == 'confirmed'
+        assert client.get(f"/api/notifications/{data['notification_id']}").get_json()['status'] == 'pending'
+
+        bot = FakeBot()
+        await OutboxDispatcher(async_db, bot).run_once()
+
+        assert bot.sent[0][0] == "alice"
+        assert db_manager.get_withdrawal_request(withdrawal.id).status == 'completed'
+        assert client.get(f"/api/notifications/{data['notification_id']}").get_json()['status'] == 'sent'
+        assert client.get("/api/metrics/outbox").get_json()['sent'] == 1
+        print("[TEST] ✅ درخواست بعد از ارسال پیام تکمیل شد")
+
+    @pytest.mark.asyncio
+    async def test_stays_confirmed_if_undelivered(self, db_manager, async_db, client):
+        """تست: اگر پیام نرسد درخواست تایید شده می‌ماند و پیام قابل ارسال دوباره است"""
+        withdrawal = db_manager.create_withdrawal_request("alice", "1000000000000001", 10, 10000, "IR" + "0" * 24)
+        notification_id = client.post(f"/api/withdrawals/{withdrawal.id}/confirm").get_json()['notification_id']
+
+        await OutboxDispatcher(async_db, FakeBot(errors={"alice": [BadRequest("Chat not found")]})).run_once()
+
+        assert db_manager.get_withdrawal_request(withdrawal.id).status == 'confirmed'
+        assert client.get(f"/api/notifications/{notification_id}").get_json()['status'] == 'dead'
+        assert client.post(f"/api/notifications/{notification_id}/retry").status_code == 200
+        assert client.post(f"/api/notifications/{notification_id}/retry").status_code == 400
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
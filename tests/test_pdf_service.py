@@ -0,0 +1,186 @@
+"""
+تست برای سرویس ساخت PDF گردش حساب
+این تست بررسی می‌کند که:
+1. PDF گردش حساب در استخر پردازه ساخته و به صورت bytes برگردانده می‌شود
+2. درخواست تکراری یک کاربر به همان کار در حال اجرا می‌پیوندد
+3. درخواست‌های بیش از ظرفیت صف رد می‌شوند و کار کندتر از مهلت متوقف می‌شود
+4. زمان انتظار در صف و زمان ساخت در معیارها ثبت می‌شوند
+5. شکل‌دهی متن فارسی برای هر متن فقط یک بار انجام می‌شود و تگ‌ها دست نمی‌خورند
+6. فونت فارسی همراه برنامه هنگام import بارگذاری نمی‌شود و فقط حروف استفاده‌شده در PDF قرار می‌گیرند
+"""
+import pytest
+import asyncio
+import sys
+import os
+import subprocess
+import time
+from datetime import datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfgen import canvas
+from utils import pdf_generator
+from utils.pdf_generator import reshape_persian_text
+from utils.pdf_service import PdfRenderService, RenderQueueFull
+
+
+def slow_bytes(value, seconds=0.1):
+    time.sleep(seconds)
+    return value.encode()
+
+
+def make_transactions(count):
+    return [SimpleNamespace(transaction_type='transfer', status='completed', from_account='1001',
+                            to_account='1002', amount=Decimal('12.5') + i, fee=Decimal('0.1'),
+                            created_at=datetime(2024, 3, 20, 12, i)) for i in range(count)]
+
+
+class TestPdfRenderService:
+    """تست سرویس ساخت PDF"""
+
+    def test_renders_statement_in_process_pool(self):
+        """تست: PDF گردش حساب در استخر پردازه ساخته می‌شود"""
+        service = PdfRenderService(max_workers=1)
+
+        async def scenario():
+            return await service.render_transactions("700", make_transactions(10), "1001")
+
+        try:
+            pdf = asyncio.run(scenario())
+        finally:
+            service.shutdown()
+
+        assert pdf.startswith(b"%PDF")
+        metrics = service.get_metrics()
+        assert metrics['completed'] == 1 and metrics['failed'] == 0
+        assert metrics['avg_render_seconds'] > 0
+        print(f"[TEST] ✅ PDF در استخر پردازه ساخته شد: {len(pdf)} بایت")
+
+    def test_duplicate_requests_share_one_job(self):
+        """تست: درخواست‌های تکراری یک کاربر فقط یک بار PDF می‌سازند"""
+        service = PdfRenderService(max_workers=2, queue_limit=0, use_processes=False)
+
+        async def scenario():
+            return await asyncio.gather(
+                service.render("700", slow_bytes, "a"),
+                service.render("700", slow_bytes, "a"),
+                service.render("701", slow_bytes, "b")
+            )
+
+        try:
+            assert asyncio.run(scenario()) == [b"a", b"a", b"b"]
+        finally:
+            service.shutdown()
+
+        metrics = service.get_metrics()
+        assert metrics['completed'] == 2
+        assert metrics['deduplicated'] == 1
+        assert metrics['rejected'] == 0
+
+    def test_queue_limit(self):
+        """تست: درخواست‌های بیش از ظرفیت کارگرها و صف رد می‌شوند"""
+        service = PdfRenderService(max_workers=1, queue_limit=2, use_processes=False)
+
+        async def scenario():
+            return await asyncio.gather(*(service.render(user_id, slow_bytes, "x", 0.05) for user_id in range(5)),
+                                        return_exceptions=True)
+
+        try:
+            results = asyncio.run(scenario())
+        finally:
+            service.shutdown()
+
+        assert results[:3] == [b"x"] * 3
+        assert all(isinstance(result, RenderQueueFull) for result in results[3:])
+        metrics = service.get_metrics()
+        assert metrics['rejected'] == 2
+        assert metrics['max_queue_depth'] == 3
+        assert metrics['queue_depth'] == 0 and metrics['in_flight'] == 0
+        # The last job waited for the two before it
+        assert metrics['max_wait_seconds'] >= 0.09
+        print(f"[TEST] ✅ صف محدود شد: {metrics}")
+
+    def test_timeout(self):
+        """تست: ساخت کندتر از مهلت متوقف می‌شود و سرویس بعد از آن کار می‌کند"""
+        service = PdfRenderService(max_workers=1, timeout=0.05, use_processes=False)
+
+        async def scenario():
+            with pytest.raises(asyncio.TimeoutError):
+                await service.render("700", slow_bytes, "late", 0.3)
+            return await service.render("700", slow_bytes, "ok", 0)
+
+        try:
+            assert asyncio.run(scenario()) == b"ok"
+        finally:
+            service.shutdown()
+
+        metrics = service.get_metrics()
+        assert metrics['timeouts'] == 1
+        assert metrics['failed'] == 1
+        # Only the render that returned; the timed-out one is averaged separately
+        assert metrics['completed'] == 1
+        assert metrics['avg_failed_render_seconds'] >= 0.05
+        assert metrics['avg_render_seconds'] < 0.05
+
+
+class TestPersianShaping:
+    """تست شکل‌دهی متن فارسی"""
+
+    def test_shaped_once(self):
+        """تست: متن فارسی یک بار شکل داده می‌شود و اعداد از کش عبور نمی‌کنند"""
+        pdf_generator._shape_text.cache_clear()
+        first = reshape_persian_text("شماره حساب: <b>1001</b>")
+        assert reshape_persian_text("شماره حساب: <b>1001</b>") == first
+        assert first.endswith("<b>1001</b>")
+        assert reshape_persian_text("1,234.50") == "1,234.50"
+
+        info = pdf_generator._shape_text.cache_info()
+        assert (info.hits, info.misses) == (1, 1)
+
+
+class TestPdfFonts:
+    """تست فونت فارسی PDF"""
+
+    def test_not_loaded_on_import(self):
+        """تست: import ماژول فونت را بارگذاری نمی‌کند"""
+        code = ("from reportlab.pdfbase import pdfmetrics; from utils import pdf_generator; "
+                "print(pdf_generator.PERSIAN_FONT in pdfmetrics.getRegisteredFontNames())")
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True)
+        assert output.stdout.strip() == "False"
+
+    def test_embeds_used_glyphs_once(self):
+        """تست: فقط حروف استفاده‌شده جاسازی می‌شوند و زیرمجموعه فونت بین PDFها مشترک است"""
+        pdf_generator.register_fonts()
+        font = pdfmetrics.getFont(pdf_generator.PERSIAN_FONT)
+        assert font.face.filename == pdf_generator.BUNDLED_FONT_PATH
+
+        misses = font.subset_cache_info().misses
+        first = pdf_generator.generate_transactions_pdf(make_transactions(3), "1001").getvalue()
+        # The same characters drawn in another order
+        second = pdf_generator.generate_transactions_pdf(make_transactions(3)[::-1], "0110").getvalue()
+        assert b"DejaVuSans" in first and b"DejaVuSans-Bold" in second
+        info = font.subset_cache_info()
+        assert info.misses - misses == 1 and info.hits >= 1
+
+        # A used character keeps its fixed code; an unused one is not in the subset
+        text = pdf_generator.reshape_persian_text("موفق 12")
+        doc = canvas.Canvas(None)._doc
+        font.splitString(text, doc)
+        state = font.state[doc]
+        subset = state.subsets[0]
+        assert all(subset[state.assignments[ord(char)]] == ord(char) for char in text)
+        assert ord("9") in state.assignments and ord("9") not in subset
+
+    def test_configured_font_falls_back(self):
+        """تست: اگر فونت تنظیم‌شده خوانده نشود، فونت همراه برنامه استفاده می‌شود"""
+        font = pdf_generator._load_font("FallbackTest", "/nonexistent/font.ttf", pdf_generator.BUNDLED_FONT_PATH)
+        assert font.face.filename == pdf_generator.BUNDLED_FONT_PATH
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
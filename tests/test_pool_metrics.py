@@ -0,0 +1,110 @@
+"""
+تست برای تنظیمات و معیارهای استخر اتصال دیتابیس
+این تست بررسی می‌کند که:
+1. تنظیمات استخر برای هر نقش (ربات و پنل مدیریت) اعمال می‌شوند
+2. زمان انتظار دریافت اتصال، تعداد اتصال‌های در حال استفاده و سرریز ثبت می‌شوند
+3. نقطه پایانی معیارها در پنل وب در دسترس است
+"""
+import pytest
+import sys
+import os
+import threading
+from unittest.mock import patch
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from database.db_manager import DatabaseManager
+from database.pool import InstrumentedQueuePool, get_pool_stats
+
+
+SMALL_POOL = {
+    'pool_size': 1,
+    'max_overflow': 1,
+    'pool_timeout': 0.2,
+    'pool_recycle': 1800,
+    'pre_ping': True
+}
+
+
+class TestPoolMetrics:
+    """تست معیارهای استخر اتصال"""
+
+    def test_pool_settings_per_role(self, tmp_path):
+        """تست: هر نقش استخر جداگانه با تنظیمات خود دارد"""
+        settings = dict(config.DB_POOL_SETTINGS, admin=SMALL_POOL)
+        with patch.object(config, 'DB_POOL_SETTINGS', settings):
+            bot_db = DatabaseManager(db_url=f"sqlite:///{tmp_path / 'pool.db'}", role='bot')
+            admin_db = DatabaseManager(db_url=f"sqlite:///{tmp_path / 'pool.db'}", role='admin')
+
+        try:
+            assert isinstance(admin_db.engine.pool, InstrumentedQueuePool)
+            assert admin_db.engine.pool is not bot_db.engine.pool
+            assert admin_db.engine.pool.size() == 1
+            assert bot_db.engine.pool.size() == config.DB_POOL_SETTINGS['bot']['pool_size']
+            assert admin_db.engine.pool._pre_ping is True
+            assert set(get_pool_stats()) >= {'bot', 'admin'}
+        finally:
+            bot_db.engine.dispose()
+            admin_db.engine.dispose()
+        print("[TEST] ✅ استخرهای جداگانه برای ربات و پنل ساخته شدند")
+
+    def test_checkout_wait_in_use_and_overflow(self, tmp_path):
+        """تست: زمان انتظار، اتصال‌های در حال استفاده و سرریز ثبت می‌شوند"""
+        with patch.object(config, 'DB_POOL_SETTINGS', dict(config.DB_POOL_SETTINGS, metrics_test=SMALL_POOL)):
+            db = DatabaseManager(db_url=f"sqlite:///{tmp_path / 'pool.db'}", role='metrics_test')
+
+        try:
+            first = db.engine.connect()
+            second = db.engine.connect()
+            stats = db.get_pool_stats()
+            assert stats['in_use'] == 2
+            assert stats['overflow'] == 1
+            assert stats['peak_overflow'] == 1
+
+            # Pool is exhausted: a third checkout waits and times out
+            with pytest.raises(Exception):
+                db.engine.connect()
+            assert db.get_pool_stats()['checkout_timeouts'] == 1
+
+            # A checkout that waits for a released connection records its wait time
+            threading.Timer(0.05, first.close).start()
+            third = db.engine.connect()
+            stats = db.get_pool_stats()
+            assert stats['max_wait_ms'] >= 40
+            third.close()
+            second.close()
+
+            stats = db.get_pool_stats()
+            assert stats['in_use'] == 0
+            assert stats['checkouts'] >= 3
+            print(f"[TEST] ✅ معیارهای استخر: {stats}")
+        finally:
+            db.engine.dispose()
+
+    def test_metrics_survive_dispose(self, tmp_path):
+        """تست: پس از بازسازی استخر، معیارها همچنان ثبت می‌شوند"""
+        db = DatabaseManager(db_url=f"sqlite:///{tmp_path / 'pool.db'}", role='dispose_test')
+        try:
+            before = db.get_pool_stats()['checkouts']
+            db.engine.dispose()
+            with db.engine.connect():
+                pass
+            assert db.get_pool_stats()['checkouts'] == before + 1
+        finally:
+            db.engine.dispose()
+
+    def test_pool_metrics_endpoint(self):
+        """تست: نقطه پایانی معیارهای استخر در پنل وب"""
+        from web.app import app
+
+        response = app.test_client().get('/api/metrics/pool')
+        assert response.status_code == 200
+        data = response.get_json()
+        assert 'admin' in data
+        assert {'in_use', 'overflow', 'avg_wait_ms', 'max_wait_ms', 'checkout_timeouts'} <= set(data['admin'])
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
@@ -0,0 +1,162 @@
+"""
+تست برای ایندکس‌های جداول کاربر، حساب، تراکنش، لاگ، درخواست واریز و قفل
+این تست بررسی می‌کند که:
+1. مهاجرت، ایندکس‌ها را روی دیتابیس قدیمی (بدون ایندکس) می‌سازد
+2. کوئری‌های اصلی طبق EXPLAIN QUERY PLAN از ایندکس استفاده می‌کنند (SQLite)
+"""
+import pytest
+import sys
+import os
+from datetime import datetime, timedelta
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import inspect, text
+from database.db_manager import DatabaseManager
+from database.models import User, Account, Transaction, TransactionLog, WithdrawalRequest, Lock
+
+
+EXPECTED_INDEXES = {
+    'users': {'ix_users_created_at'},
+    'accounts': {'ix_accounts_user_id_is_active', 'ix_accounts_created_at', 'ix_accounts_balance'},
+    'transactions': {
+        'ix_transactions_from_account_created_at',
+        'ix_transactions_to_account_created_at',
+        'ix_transactions_status',
+        'ix_transactions_type_created_at'
+    },
+    'transaction_logs': {'ix_transaction_logs_user_id_created_at'},
+    'withdrawal_requests': {'ix_withdrawal_requests_status_created_at'},
+    'locks': {'ix_locks_locked_until'}
+}
+
+
+def query_plan(db_manager, query) -> str:
+    """EXPLAIN QUERY PLAN of an ORM query as one string"""
+    sql = str(query.statement.compile(db_manager.engine, compile_kwargs={'literal_binds': True}))
+    with db_manager.engine.connect() as conn:
+        rows = conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")).fetchall()
+    return "\n".join(row[-1] for row in rows)
+
+
+class TestQueryPlans:
+    """تست ایندکس‌ها و برنامه اجرای کوئری"""
+
+    def test_indexes_created(self, db_manager):
+        """تست: همه ایندکس‌ها ساخته می‌شوند"""
+        inspector = inspect(db_manager.engine)
+        for table, expected in EXPECTED_INDEXES.items():
+            existing = {index['name'] for index in inspector.get_indexes(table)}
+            assert expected <= existing, f"ایندکس‌های {table} ساخته نشده‌اند: {expected - existing}"
+        print("[TEST] ✅ همه ایندکس‌ها موجود هستند")
+
+    def test_migration_adds_indexes_to_existing_database(self, tmp_path):
+        """تست: مهاجرت ایندکس‌ها را به دیتابیس قدیمی اضافه می‌کند"""
+        db_url = f"sqlite:///{tmp_path / 'legacy.db'}"
+        manager = DatabaseManager(db_url=db_url)
+        with manager.engine.connect() as conn:
+            for names in EXPECTED_INDEXES.values():
+                for name in names:
+                    conn.execute(text(f"DROP INDEX {name}"))
+            conn.commit()
+        manager.engine.dispose()
+
+        manager = DatabaseManager(db_url=db_url)
+        try:
+            inspector = inspect(manager.engine)
+            for table, expected in EXPECTED_INDEXES.items():
+                assert expected <= {index['name'] for index in inspector.get_indexes(table)}
+        finally:
+            manager.engine.dispose()
+        print("[TEST] ✅ مهاجرت ایندکس‌ها را ساخت")
+
+    def test_account_transactions_use_indexes(self, db_manager):
+        """تست: تاریخچه تراکنش‌های حساب از ایندکس‌های from/to استفاده می‌کند"""
+        session = db_manager.get_session()
+        try:
+            query = session.query(Transaction).filter(
+                (Transaction.from_account == '1234567890123456') |
+                (Transaction.to_account == '1234567890123456')
+            ).order_by(Transaction.created_at.desc()).limit(10)
+            plan = query_plan(db_manager, query)
+        finally:
+            session.close()
+
+        assert 'ix_transactions_from_account_created_at' in plan
+        assert 'ix_transactions_to_account_created_at' in plan
+        print(f"[TEST] ✅ برنامه اجرا:\n{plan}")
+
+    def test_transactions_by_status_and_type(self, db_manager):
+        """تست: فیلتر وضعیت و نوع تراکنش از ایندکس استفاده می‌کند"""
+        session = db_manager.get_session()
+        try:
+            status_plan = query_plan(db_manager, session.query(Transaction).filter(Transaction.status == 'pending'))
+            type_plan = query_plan(db_manager, session.query(Transaction).filter(
+                Transaction.transaction_type == 'send'
+            ).order_by(Transaction.created_at.desc()).limit(100))
+        finally:
+            session.close()
+
+        assert 'ix_transactions_status' in status_plan
+        assert 'ix_transactions_type_created_at' in type_plan
+        assert 'TEMP B-TREE' not in type_plan, "مرتب‌سازی باید از ترتیب ایندکس استفاده کند"
+
+    def test_transaction_logs_by_user(self, db_manager):
+        """تست: لاگ‌های یک کاربر به ترتیب زمان از ایندکس خوانده می‌شوند"""
+        session = db_manager.get_session()
+        try:
+            plan = query_plan(db_manager, session.query(TransactionLog).filter(
+                TransactionLog.user_id == '123456789'
+            ).order_by(TransactionLog.created_at.desc()))
+        finally:
+            session.close()
+
+        assert 'ix_transaction_logs_user_id_created_at' in plan
+        assert 'TEMP B-TREE' not in plan
+
+    def test_withdrawal_requests_by_status(self, db_manager):
+        """تست: درخواست‌های واریز با وضعیت و ترتیب زمان از ایندکس خوانده می‌شوند"""
+        session = db_manager.get_session()
+        try:
+            plan = query_plan(db_manager, session.query(WithdrawalRequest).filter(
+                WithdrawalRequest.status == 'pending'
+            ).order_by(WithdrawalRequest.created_at.desc()).limit(100))
+        finally:
+            session.close()
+
+        assert 'ix_withdrawal_requests_status_created_at' in plan
+        assert 'TEMP B-TREE' not in plan
+
+    def test_active_locks(self, db_manager):
+        """تست: شمارش قفل‌های فعال از ایندکس locked_until استفاده می‌کند"""
+        session = db_manager.get_session()
+        try:
+            plan = query_plan(db_manager, session.query(Lock).filter(
+                Lock.locked_until > datetime(2024, 1, 1) + timedelta(minutes=10)
+            ))
+        finally:
+            session.close()
+
+        assert 'ix_locks_locked_until' in plan
+
+    def test_admin_list_pages(self, db_manager):
+        """تست: صفحه‌های لیست کاربران و حساب‌ها بدون مرتب‌سازی موقت از ایندکس خوانده می‌شوند"""
+        session = db_manager.get_session()
+        try:
+            users_plan = query_plan(db_manager, session.query(User).filter(
+                User.created_at < datetime(2024, 1, 1)
+            ).order_by(User.created_at.desc(), User.user_id.desc()).limit(51))
+            accounts_plan = query_plan(db_manager, session.query(Account).filter(
+                Account.balance > 100
+            ).order_by(Account.balance.desc(), Account.account_number.desc()).limit(51))
+        finally:
+            session.close()
+
+        assert 'ix_users_created_at' in users_plan
+        assert 'ix_accounts_balance' in accounts_plan
+        assert 'TEMP B-TREE' not in users_plan + accounts_plan
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
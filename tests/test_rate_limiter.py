@@ -0,0 +1,235 @@
+"""
+تست برای محدودکننده نرخ درخواست‌های تلگرام
+این تست بررسی می‌کند که:
+1. درخواست‌ها از سقف سراسری و سقف هر چت بیشتر نمی‌شوند و چت‌ها مستقل از هم محدود می‌شوند
+2. پاسخ‌های تعاملی جلوتر از اعلان‌ها و حذف پیام‌ها ارسال می‌شوند
+3. خطای RetryAfter چت را متوقف می‌کند و درخواست دوباره امتحان می‌شود
+4. عمق صف و هیستوگرام زمان انتظار گزارش می‌شود
+5. معیارها در حین اجرا به صورت دوره‌ای لاگ می‌شوند و از پنل ادمین خوانده می‌شوند
+"""
+import asyncio
+import logging
+import pytest
+import sys
+import os
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram.error import RetryAfter
+import config
+from utils.outbox import OutboxDispatcher
+from utils.rate_limiter import (PRIORITY_CLEANUP, PRIORITY_INTERACTIVE, PRIORITY_NOTIFICATION, TelegramRateLimiter,
+                                TokenBucket, get_running_rate_limiter)
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    """Small limits so the tests run in well under a second"""
+    monkeypatch.setattr(config, 'RATE_LIMIT_GLOBAL_PER_SECOND', 100)
+    monkeypatch.setattr(config, 'RATE_LIMIT_GLOBAL_BURST', 100)
+    monkeypatch.setattr(config, 'RATE_LIMIT_CHAT_PER_SECOND', 20)
+    monkeypatch.setattr(config, 'RATE_LIMIT_CHAT_BURST', 2)
+    monkeypatch.setattr(config, 'RATE_LIMIT_GROUP_PER_MINUTE', 600)
+    monkeypatch.setattr(config, 'RATE_LIMIT_GROUP_BURST', 1)
+
+
+def request(limiter, endpoint, chat_id, log, rate_limit_args=None, callback=None):
+    """Send one request through the limiter, recording (endpoint, chat_id) when it reaches the API"""
+    async def call():
+        log.append((endpoint, chat_id))
+        return True
+    return limiter.process_request(callback or call, (), {}, endpoint, {'chat_id': chat_id}, rate_limit_args)
+
+
+class TestTokenBucket:
+    """تست سطل توکن"""
+
+    @pytest.mark.asyncio
+    async def test_burst_then_rate(self):
+        """تست: پس از مصرف ذخیره، توکن‌ها با نرخ تعیین‌شده داده می‌شوند"""
+        bucket = TokenBucket(rate=50, capacity=3)
+        started_at = time.monotonic()
+        for _ in range(3):
+            await bucket.acquire(PRIORITY_INTERACTIVE)
+        assert time.monotonic() - started_at < 0.01
+
+        for _ in range(5):
+            await bucket.acquire(PRIORITY_INTERACTIVE)
+        assert time.monotonic() - started_at >= 5 / 50 - 0.01
+
+    @pytest.mark.asyncio
+    async def test_priority_order(self):
+        """تست: درخواست تعاملی دیرتر رسیده جلوتر از اعلان‌های در صف است"""
+        bucket = TokenBucket(rate=50, capacity=1)
+        order = []
+
+        async def take(name, priority):
+            await bucket.acquire(priority)
+            order.append(name)
+
+        await take('first', PRIORITY_INTERACTIVE)
+        tasks = [asyncio.create_task(take(f'cleanup-{index}', PRIORITY_CLEANUP)) for index in range(2)]
+        tasks += [asyncio.create_task(take(f'notification-{index}', PRIORITY_NOTIFICATION)) for index in range(2)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(take('reply', PRIORITY_INTERACTIVE)))
+        await asyncio.gather(*tasks)
+
+        assert order == ['first', 'reply', 'notification-0', 'notification-1', 'cleanup-0', 'cleanup-1']
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_leaves_queue(self):
+        """تست: درخواست لغوشده جای خود را آزاد می‌کند"""
+        bucket = TokenBucket(rate=20, capacity=1)
+        await bucket.acquire(PRIORITY_INTERACTIVE)
+        head = asyncio.create_task(bucket.acquire(PRIORITY_INTERACTIVE))
+        follower = asyncio.create_task(bucket.acquire(PRIORITY_NOTIFICATION))
+        await asyncio.sleep(0)
+        head.cancel()
+
+        await asyncio.wait_for(follower, 1)
+        assert bucket.waiting == 0
+
+
+class TestTelegramRateLimiter:
+    """تست محدودکننده نرخ درخواست‌ها"""
+
+    @pytest.mark.asyncio
+    async def test_chat_limits_are_independent(self, limits):
+        """تست: هر چت سقف خودش را دارد و حذف پیام شامل سقف چت نیست"""
+        limiter = TelegramRateLimiter()
+        log = []
+        started_at = time.monotonic()
+        await asyncio.gather(*(request(limiter, 'sendMessage', chat_id, log) for chat_id in (1, 2, 3)))
+        await asyncio.gather(*(request(limiter, 'deleteMessage', 1, log) for _ in range(5)))
+        assert time.monotonic() - started_at < 0.03
+
+        # Chat 1 has used its burst of 2
+        await asyncio.gather(*(request(limiter, 'sendMessage', 1, log) for _ in range(3)))
+        assert time.monotonic() - started_at >= 2 / 20 - 0.01
+        assert len(log) == 11
+        assert limiter.snapshot()['chats'] == 3
+
+    @pytest.mark.asyncio
+    async def test_group_chats_have_lower_limit(self, limits):
+        """تست: گروه‌ها (شناسه منفی) سقف دقیقه‌ای دارند"""
+        limiter = TelegramRateLimiter()
+        log = []
+        started_at = time.monotonic()
+        await asyncio.gather(*(request(limiter, 'sendMessage', -100123, log) for _ in range(3)))
+        assert time.monotonic() - started_at >= 2 / 10 - 0.01
+
+    @pytest.mark.asyncio
+    async def test_interactive_before_notifications(self, limits, monkeypatch):
+        """تست: پاسخ کاربر منتظر اعلان‌ها و حذف پیام‌های صف نمی‌ماند"""
+        monkeypatch.setattr(config, 'RATE_LIMIT_GLOBAL_PER_SECOND', 50)
+        monkeypatch.setattr(config, 'RATE_LIMIT_GLOBAL_BURST', 1)
+        limiter = TelegramRateLimiter()
+        log = []
+        bulk = [request(limiter, 'sendMessage', chat_id, log, {'priority': PRIORITY_NOTIFICATION})
+                for chat_id in range(10, 15)]
+        bulk += [request(limiter, 'deleteMessage', 9, log) for _ in range(3)]
+        tasks = [asyncio.create_task(coroutine) for coroutine in bulk]
+        await asyncio.sleep(0)
+        assert limiter.snapshot()['priorities']['notification']['queued'] == 4
+
+        await request(limiter, 'sendMessage', 1, log)
+        assert log.index(('sendMessage', 1)) <= 2
+        await asyncio.gather(*tasks)
+        assert [entry[0] for entry in log[-3:]] == ['deleteMessage'] * 3
+
+    @pytest.mark.asyncio
+    async def test_retry_after(self, limits):
+        """تست: RetryAfter چت را متوقف و درخواست را دوباره ارسال می‌کند"""
+        limiter = TelegramRateLimiter(max_retries=1)
+        calls = []
+
+        async def flood_once():
+            calls.append(time.monotonic())
+            if len(calls) == 1:
+                raise RetryAfter(0)
+            return True
+
+        assert await request(limiter, 'sendMessage', 1, [], callback=flood_once) is True
+        assert len(calls) == 2 and calls[1] - calls[0] >= 0.1
+
+        async def flood():
+            raise RetryAfter(0)
+        with pytest.raises(RetryAfter):
+            await request(limiter, 'sendMessage', 2, [], {'max_retries': 0}, callback=flood)
+
+        snapshot = limiter.snapshot()
+        assert (snapshot['retry_after'], snapshot['retries']) == (2, 1)
+
+    @pytest.mark.asyncio
+    async def test_wait_histogram(self, limits, monkeypatch):
+        """تست: زمان انتظار هر اولویت در هیستوگرام ثبت می‌شود"""
+        monkeypatch.setattr(config, 'RATE_LIMIT_CHAT_PER_SECOND', 5)
+        limiter = TelegramRateLimiter()
+        log = []
+        await asyncio.gather(*(request(limiter, 'sendMessage', 1, log) for _ in range(4)))
+        await request(limiter, 'deleteMessage', 1, log)
+
+        priorities = limiter.snapshot()['priorities']
+        assert priorities['interactive']['requests'] == 4
+        assert sum(priorities['interactive']['wait_histogram'].values()) == 4
+        # The burst of 2 went at once, the next two waited 0.2s and 0.4s for chat 1's tokens
+        histogram = priorities['interactive']['wait_histogram']
+        assert (histogram['le_0.05'], histogram['le_0.25'], histogram['le_0.5']) == (2, 1, 1)
+        assert priorities['cleanup']['requests'] == 1
+        assert all(entry['queued'] == 0 for entry in priorities.values())
+
+    @pytest.mark.asyncio
+    async def test_outbox_sends_as_notification(self):
+        """تست: پیام‌های outbox با اولویت اعلان و بدون تلاش دوباره در محدودکننده ارسال می‌شوند"""
+        class RateLimitedBot:
+            rate_limiter = TelegramRateLimiter()
+
+            def __init__(self):
+                self.calls = []
+
+            async def send_message(self, **kwargs):
+                self.calls.append(kwargs)
+
+        bot = RateLimitedBot()
+        assert await OutboxDispatcher(None, bot)._send({'chat_id': '1', 'text': 'hi'}) is None
+        assert bot.calls[0]['rate_limit_args'] == {'priority': PRIORITY_NOTIFICATION, 'max_retries': 0}
+
+
+class TestRateLimiterMetrics:
+    """تست گزارش زنده معیارهای محدودکننده"""
+
+    @pytest.mark.asyncio
+    async def test_reporter_logs_snapshot(self, caplog):
+        """تست: معیارها در حین اجرا به صورت دوره‌ای لاگ می‌شوند"""
+        limiter = TelegramRateLimiter()
+        with caplog.at_level(logging.INFO, logger='utils.rate_limiter'):
+            reporter = asyncio.create_task(limiter.run_reporter(0.01))
+            await asyncio.sleep(0.05)
+            reporter.cancel()
+        reports = [record.getMessage() for record in caplog.records if record.getMessage().startswith("Rate limiter:")]
+        assert len(reports) >= 2
+        assert "'interactive'" in reports[0]
+
+    @pytest.mark.asyncio
+    async def test_metrics_endpoint(self, limits):
+        """تست: نقطه پایانی پنل فقط وقتی ربات در همان پردازه اجرا می‌شود معیارها را برمی‌گرداند"""
+        from web.app import app
+        client = app.test_client()
+        assert client.get('/api/metrics/rate_limiter').status_code == 404
+
+        limiter = TelegramRateLimiter()
+        await limiter.initialize()
+        try:
+            assert get_running_rate_limiter() is limiter
+            await request(limiter, 'sendMessage', 1, [])
+            data = client.get('/api/metrics/rate_limiter').get_json()
+            assert data['priorities']['interactive']['requests'] == 1
+        finally:
+            await limiter.shutdown()
+        assert get_running_rate_limiter() is None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
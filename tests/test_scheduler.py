@@ -0,0 +1,173 @@
+"""
+تست برای صف پایدار کارهای زمان‌بندی‌شده (حذف خودکار پیام‌ها)
+این تست بررسی می‌کند که:
+1. کارها در جدول scheduled_tasks ذخیره می‌شوند و فقط کارهای سررسیده برداشته می‌شوند
+2. کار برداشته‌شده تا پایان مهلت دوباره برداشته نمی‌شود و پس از آن دوباره برداشته می‌شود
+3. زمان‌بند کارهای سررسیده را دسته‌ای اجرا می‌کند و پیام‌های هر چت با یک درخواست حذف می‌شوند
+4. کارها پس از راه‌اندازی مجدد از بین نمی‌روند و کار ناموفق دوباره امتحان یا کنار گذاشته می‌شود
+"""
+import asyncio
+import pytest
+import sys
+import os
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from database.db_manager import DatabaseManager
+from database.async_db_manager import AsyncDatabaseManager
+from handlers.account import AccountHandler
+from utils.scheduler import TaskScheduler
+
+
+class BulkBot:
+    def __init__(self):
+        self.calls = []
+
+    async def delete_messages(self, chat_id, message_ids):
+        self.calls.append((chat_id, sorted(message_ids)))
+        return True
+
+
+def ago(seconds):
+    return datetime.utcnow() - timedelta(seconds=seconds)
+
+
+class TestScheduledTasks:
+    """تست جدول کارهای زمان‌بندی‌شده"""
+
+    def test_claims_only_due_tasks(self, db_manager):
+        """تست: فقط کارهای سررسیده، به ترتیب سررسید، برداشته می‌شوند"""
+        later = db_manager.schedule_task('delete_message', datetime.utcnow() + timedelta(minutes=5), 1, 10)
+        second = db_manager.schedule_task('delete_message', ago(1), 1, 11)
+        first = db_manager.schedule_task('close', ago(2), payload={'request': 7})
+
+        tasks = db_manager.claim_due_tasks(10, 60)
+        assert [task['id'] for task in tasks] == [second, first]
+        assert tasks[0]['chat_id'] == '1' and tasks[0]['message_id'] == 11
+        assert tasks[1]['payload'] == {'request': 7}
+        # Claimed tasks wait for their lease; the next deadline is the pending task
+        assert db_manager.claim_due_tasks(10, 60) == []
+        assert db_manager.next_scheduled_task_due() < datetime.utcnow() + timedelta(minutes=5, seconds=1)
+
+        assert db_manager.complete_scheduled_tasks([first, second]) == 2
+        assert db_manager.complete_scheduled_tasks([later]) == 1
+        assert db_manager.next_scheduled_task_due() is None
+
+    def test_expired_lease_is_claimed_again(self, db_manager):
+        """تست: کار زمان‌بند ازکارافتاده پس از پایان مهلت دوباره برداشته می‌شود"""
+        task_id = db_manager.schedule_task('delete_message', ago(1), 1, 10)
+        assert len(db_manager.claim_due_tasks(10, 0)) == 1
+
+        tasks = db_manager.claim_due_tasks(10, 0)
+        assert [(task['id'], task['attempts']) for task in tasks] == [(task_id, 2)]
+
+
+class TestTaskScheduler:
+    """تست زمان‌بند"""
+
+    @pytest.mark.asyncio
+    async def test_fires_due_deletions_in_batches(self, db_manager, async_db):
+        """تست: پیام‌های سررسیده هر چت با یک درخواست حذف می‌شوند"""
+        for message_id in (10, 11, 12):
+            db_manager.schedule_task('delete_message', ago(1), 1, message_id)
+        db_manager.schedule_task('delete_message', ago(1), 2, 20)
+        db_manager.schedule_task('delete_message', datetime.utcnow() + timedelta(minutes=5), 2, 21)
+        bot = BulkBot()
+        scheduler = TaskScheduler(async_db, bot, batch_size=3)
+
+        assert await scheduler.run_once() == 3
+        assert await scheduler.run_once() == 1
+        assert await scheduler.run_once() == 0
+
+        assert sorted(bot.calls) == [('1', [10, 11, 12]), ('2', [20])]
+        assert scheduler.snapshot()['fired'] == 4
+        assert db_manager.next_scheduled_task_due() > datetime.utcnow()
+
+    @pytest.mark.asyncio
+    async def test_survives_restart(self, db_path):
+        """تست: کار زمان‌بندی‌شده پیش از راه‌اندازی مجدد بعد از آن اجرا می‌شود"""
+        first = DatabaseManager(db_url=db_path)
+        first.schedule_task('delete_message', ago(1), 1, 10)
+        first.engine.dispose()
+
+        restarted = AsyncDatabaseManager(DatabaseManager(db_url=db_path))
+        try:
+            bot = BulkBot()
+            assert await TaskScheduler(restarted, bot).run_once() == 1
+            assert bot.calls == [('1', [10])]
+        finally:
+            await restarted.dispose()
+            restarted.sync.engine.dispose()
+
+    @pytest.mark.asyncio
+    async def test_wakes_for_new_deadline(self, async_db, monkeypatch):
+        """تست: زمان‌بند تا سررسید کار جدید بیدار می‌شود، نه تا دوره poll"""
+        monkeypatch.setattr(config, 'SCHEDULER_POLL_SECONDS', 30)
+        bot = BulkBot()
+        scheduler = TaskScheduler(async_db, bot)
+        task = asyncio.create_task(scheduler.run())
+        try:
+            await asyncio.sleep(0.05)
+            await async_db.schedule_task('delete_message', datetime.utcnow() + timedelta(seconds=0.2), 1, 10)
+            for _ in range(100):
+                if bot.calls:
+                    break
+                await asyncio.sleep(0.02)
+            assert bot.calls == [('1', [10])]
+        finally:
+            scheduler.stop()
+            await task
+
+    @pytest.mark.asyncio
+    async def test_failed_tasks_retry_then_drop(self, db_manager, async_db, monkeypatch):
+        """تست: کار ناموفق پس از مهلت دوباره اجرا و پس از حداکثر تلاش کنار گذاشته می‌شود"""
+        monkeypatch.setattr(config, 'SCHEDULER_LEASE_SECONDS', 0)
+        monkeypatch.setattr(config, 'SCHEDULER_MAX_ATTEMPTS', 2)
+        calls = []
+
+        async def expire(tasks):
+            calls.append([task['payload'] for task in tasks])
+            raise RuntimeError("boom")
+
+        scheduler = TaskScheduler(async_db, BulkBot())
+        scheduler.register('expire', expire)
+        db_manager.schedule_task('expire', ago(1), payload={'id': 1})
+        db_manager.schedule_task('unknown', ago(1))
+
+        await scheduler.run_once()
+        await scheduler.run_once()
+        assert await scheduler.run_once() == 0
+
+        assert calls == [[{'id': 1}], [{'id': 1}]]
+        assert scheduler.snapshot()['dropped'] == 2
+        assert db_manager.next_scheduled_task_due() is None
+
+
+class TestAccountNumberTimeout:
+    """تست حذف خودکار پیام شماره اکانت"""
+
+    @pytest.mark.asyncio
+    async def test_account_number_message_is_scheduled(self, db_manager, async_db):
+        """تست: پیام شماره اکانت برای حذف پس از MESSAGE_TIMEOUT_MINUTES زمان‌بندی می‌شود"""
+        db_manager.get_or_create_user("600")
+
+        class SendBot:
+            async def send_message(self, **kwargs):
+                return SimpleNamespace(message_id=77)
+
+        lock_manager = SimpleNamespace(check_lock=lambda user_id: asyncio.sleep(0, (False, None)))
+        update = SimpleNamespace(callback_query=None, effective_user=SimpleNamespace(id=600),
+                                 effective_chat=SimpleNamespace(id=600))
+        await AccountHandler(async_db, lock_manager).start_create_account(update, SimpleNamespace(bot=SendBot()))
+
+        due_at = db_manager.next_scheduled_task_due()
+        expected = datetime.utcnow() + timedelta(minutes=config.MESSAGE_TIMEOUT_MINUTES)
+        assert abs((due_at - expected).total_seconds()) < 5
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
@@ -7,6 +7,7 @@
 4. تراکنش با fee درست ثبت می‌شود
 """
 import pytest
+import pytest_asyncio
 import sys
 import os
 from unittest.mock import Mock, AsyncMock, patch, MagicMock
@@ -16,6 +17,7 @@ from decimal import Decimal
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from database.db_manager import DatabaseManager
+from database.async_db_manager import AsyncDatabaseManager
 from handlers.sell import SellHandler
 from utils.lock_manager import LockManager
 from utils.encryption import encrypt_state, decrypt_state
@@ -30,15 +32,23 @@ class TestSellCommission:
         """ایجاد یک نمونه از DatabaseManager"""
         return DatabaseManager()
     
+    @pytest_asyncio.fixture
+    async def async_db_manager(self, db_manager):
+        """ایجاد یک نمونه از AsyncDatabaseManager روی همان دیتابیس"""
+        manager = AsyncDatabaseManager(db_manager)
+        yield manager
+        # Close aiosqlite connections (their threads keep pytest alive otherwise)
+        await manager.dispose()
+    
     @pytest.fixture
-    def lock_manager(self, db_manager):
+    def lock_manager(self, async_db_manager):
         """ایجاد یک نمونه از LockManager"""
-        return LockManager(db_manager)
+        return LockManager(async_db_manager)
     
     @pytest.fixture
-    def sell_handler(self, db_manager, lock_manager):
+    def sell_handler(self, async_db_manager, lock_manager):
         """ایجاد یک نمونه از SellHandler"""
-        return SellHandler(db_manager, lock_manager)
+        return SellHandler(async_db_manager, lock_manager)
     
     @pytest.fixture
     def test_user_and_account(self, db_manager):
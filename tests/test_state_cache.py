@@ -0,0 +1,151 @@
+"""
+تست برای کش وضعیت گفتگو (state cache)
+این تست بررسی می‌کند که:
+1. خواندن دوباره وضعیت از حافظه انجام می‌شود و کوئری نمی‌زند
+2. چند نوشتن در یک به‌روزرسانی یک بار در دیتابیس نوشته می‌شوند
+3. در حالت write_behind وضعیت تا flush در دیتابیس نوشته نمی‌شود و هنگام خاموش شدن نوشته می‌شود
+4. کش با LRU و TTL محدود می‌شود و وضعیت خارج شده از کش از دست نمی‌رود
+5. شمارنده‌های hit و miss درست ثبت می‌شوند
+"""
+import pytest
+import sys
+import os
+import uuid
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.state_cache import StateCache, WRITE_BEHIND
+from database.unit_of_work import track_queries
+from utils.encryption import decrypt_state, encrypt_state
+
+
+def create_user(db_manager, state=None) -> str:
+    user_id = f"state_{uuid.uuid4().hex[:8]}"
+    db_manager.get_or_create_user(user_id)
+    if state is not None:
+        db_manager.update_user_state(user_id, encrypt_state(state))
+    return user_id
+
+
+def stored_state(db_manager, user_id) -> dict:
+    return decrypt_state(db_manager.get_user_state(user_id))
+
+
+class TestStateCache:
+    """تست کش وضعیت"""
+
+    @pytest.mark.asyncio
+    async def test_second_read_is_a_hit(self, db_manager, async_db):
+        """تست: خواندن دوم وضعیت بدون کوئری انجام می‌شود"""
+        user_id = create_user(db_manager, {'action': 'buy_pers', 'step': 'enter_amount'})
+
+        assert (await async_db.get_state(user_id))['step'] == 'enter_amount'
+        with track_queries() as stats:
+            state = await async_db.get_state(user_id)
+
+        assert state == {'action': 'buy_pers', 'step': 'enter_amount'}
+        assert stats.queries == 0
+        cache_stats = async_db.get_state_cache_stats()
+        assert cache_stats['hits'] == 1
+        assert cache_stats['misses'] == 1
+        print(f"[TEST] ✅ کش وضعیت: {cache_stats}")
+
+    @pytest.mark.asyncio
+    async def test_returned_state_is_a_copy(self, db_manager, async_db):
+        """تست: تغییر دیکشنری برگشتی بدون set_state در کش اثر ندارد"""
+        user_id = create_user(db_manager, {'step': 'a'})
+
+        state = await async_db.get_state(user_id)
+        state['step'] = 'b'
+
+        assert (await async_db.get_state(user_id))['step'] == 'a'
+
+    @pytest.mark.asyncio
+    async def test_writes_of_one_update_are_coalesced(self, db_manager, async_db):
+        """تست: چند نوشتن در یک به‌روزرسانی با یک نوشتن در دیتابیس ذخیره می‌شوند"""
+        user_id = create_user(db_manager)
+
+        with track_queries() as stats:
+            async with async_db.state_cache.coalesce_writes():
+                await async_db.set_state(user_id, {'action': 'send_pers', 'step': 'enter_amount'})
+                state = await async_db.get_state(user_id)
+                state['last_bot_message_id'] = 10
+                await async_db.set_state(user_id, state)
+                # Nothing is written before the update ends
+                assert stored_state(db_manager, user_id) == {}
+
+        assert stats.commits == 1
+        assert stored_state(db_manager, user_id) == {
+            'action': 'send_pers', 'step': 'enter_amount', 'last_bot_message_id': 10
+        }
+        assert async_db.get_state_cache_stats()['coalesced_writes'] == 1
+        print("[TEST] ✅ نوشتن‌های یک به‌روزرسانی یک بار انجام شد")
+
+    @pytest.mark.asyncio
+    async def test_write_through_outside_update(self, db_manager, async_db):
+        """تست: بیرون از به‌روزرسانی هر نوشتن بلافاصله ذخیره می‌شود"""
+        user_id = create_user(db_manager, {'step': 'old'})
+
+        await async_db.set_state(user_id, {'step': 'new'})
+        assert stored_state(db_manager, user_id) == {'step': 'new'}
+
+        await async_db.clear_state(user_id)
+        assert db_manager.get_user_state(user_id) == ''
+
+    @pytest.mark.asyncio
+    async def test_write_behind_flushes_on_dispose(self, db_manager, async_db):
+        """تست: در حالت write_behind وضعیت هنگام خاموش شدن نوشته می‌شود"""
+        async_db.state_cache = StateCache(async_db, mode=WRITE_BEHIND)
+        user_id = create_user(db_manager)
+
+        async with async_db.state_cache.coalesce_writes():
+            await async_db.set_state(user_id, {'step': 'enter_sheba'})
+        assert stored_state(db_manager, user_id) == {}
+        assert async_db.get_state_cache_stats()['dirty'] == 1
+
+        await async_db.dispose()
+        assert stored_state(db_manager, user_id) == {'step': 'enter_sheba'}
+        print("[TEST] ✅ وضعیت write_behind هنگام خاموش شدن ذخیره شد")
+
+    @pytest.mark.asyncio
+    async def test_lru_eviction_writes_dirty_state(self, db_manager, async_db):
+        """تست: وضعیت خارج شده از کش (LRU) قبل از حذف نوشته می‌شود"""
+        async_db.state_cache = StateCache(async_db, max_entries=2, mode=WRITE_BEHIND)
+        users = [create_user(db_manager) for _ in range(3)]
+
+        for index, user_id in enumerate(users):
+            await async_db.set_state(user_id, {'index': index})
+
+        snapshot = async_db.get_state_cache_stats()
+        assert snapshot['size'] == 2
+        assert snapshot['evictions'] == 1
+        assert stored_state(db_manager, users[0]) == {'index': 0}
+        assert stored_state(db_manager, users[2]) == {}
+
+    @pytest.mark.asyncio
+    async def test_ttl_expiry_reloads(self, db_manager, async_db):
+        """تست: پس از انقضا (TTL) وضعیت دوباره از دیتابیس خوانده می‌شود"""
+        async_db.state_cache = StateCache(async_db, ttl_seconds=0)
+        user_id = create_user(db_manager, {'step': 'a'})
+
+        await async_db.get_state(user_id)
+        # Changed by another process
+        db_manager.update_user_state(user_id, encrypt_state({'step': 'b'}))
+
+        assert (await async_db.get_state(user_id)) == {'step': 'b'}
+        assert async_db.get_state_cache_stats()['expirations'] == 1
+
+    @pytest.mark.asyncio
+    async def test_raw_state_update_invalidates(self, db_manager, async_db):
+        """تست: ذخیره وضعیت رمزشده به صورت مستقیم کش را باطل می‌کند"""
+        user_id = create_user(db_manager, {'step': 'a'})
+        await async_db.get_state(user_id)
+
+        await async_db.update_user_state(user_id, encrypt_state({'step': 'b'}))
+
+        assert (await async_db.get_state(user_id)) == {'step': 'b'}
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
@@ -0,0 +1,170 @@
+"""
+تست برای کش گردش حساب‌های ساخته‌شده
+این تست بررسی می‌کند که:
+1. نسخه گردش حساب با تراکنش جدید یا تغییر وضعیت تراکنش عوض می‌شود
+2. کش حافظه محدود است و گردش‌های بیرون‌رفته روی دیسک نگه داشته و بعد از راه‌اندازی مجدد خوانده می‌شوند
+3. تراکنش جدید گردش‌های کش‌شده حساب را پاک می‌کند
+4. درخواست دوباره گردش بدون تغییر، PDF نمی‌سازد و فایل را با file_id می‌فرستد
+"""
+import asyncio
+import pytest
+import sys
+import os
+from types import SimpleNamespace
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram.error import BadRequest
+from database.events import EventBus
+from handlers import transactions as transactions_module
+from handlers.transactions import TransactionsHandler
+from utils.message_manager import get_message_deleter
+from utils.pdf_service import PdfRenderService
+from utils.statement_cache import StatementCache, statement_key
+
+ACCOUNT = "1234567890123456"
+OTHER = "6543210987654321"
+
+
+class StatementBot:
+    """Records what each send_document got: 'upload' for bytes, else the file_id"""
+
+    def __init__(self, rejected=()):
+        self.sent = []
+        self.rejected = set(rejected)
+
+    async def send_document(self, chat_id, document, filename=None, **kwargs):
+        if isinstance(document, str):
+            if document in self.rejected:
+                raise BadRequest("Wrong file identifier/http url specified")
+            self.sent.append(document)
+            return SimpleNamespace(document=SimpleNamespace(file_id=document))
+        self.sent.append('upload')
+        return SimpleNamespace(document=SimpleNamespace(file_id=f"statement-{len(self.sent)}"))
+
+    async def delete_messages(self, chat_id, message_ids):
+        return True
+
+
+class TestStatementVersion:
+    """تست نسخه گردش حساب"""
+
+    def test_changes_with_transactions(self, db_manager):
+        """تست: تراکنش جدید و تغییر وضعیت، نسخه را عوض می‌کنند"""
+        assert db_manager.get_statement_version(ACCOUNT) == (None, 0, None)
+
+        transaction = db_manager.create_transaction(OTHER, ACCOUNT, 10, 0.1, 'send')
+        first = db_manager.get_statement_version(ACCOUNT)
+        assert first[:2] == (transaction.id, 1)
+        assert db_manager.get_statement_version(ACCOUNT) == first
+
+        db_manager.update_transaction_status(transaction.id, 'success')
+        second = db_manager.get_statement_version(ACCOUNT)
+        assert second[:2] == first[:2] and second != first
+
+        db_manager.create_transaction(ACCOUNT, None, 5, 0, 'sell')
+        assert db_manager.get_statement_version(ACCOUNT)[1] == 2
+        assert statement_key(ACCOUNT, *second) != statement_key(ACCOUNT, *db_manager.get_statement_version(ACCOUNT))
+
+
+class TestStatementCache:
+    """تست کش گردش حساب"""
+
+    def test_lru_in_memory(self):
+        """تست: کش حافظه از سقف بیشتر نمی‌شود و کم‌استفاده‌ترین گردش بیرون می‌رود"""
+        cache = StatementCache(max_bytes=25, spill_dir='')
+        cache.put(ACCOUNT, "a", b"x" * 10)
+        cache.put(ACCOUNT, "b", b"y" * 10)
+        assert cache.get(ACCOUNT, "a") == b"x" * 10
+        cache.put(OTHER, "c", b"z" * 10)
+
+        assert cache.get(ACCOUNT, "b") is None
+        assert cache.get(ACCOUNT, "a") == b"x" * 10
+        snapshot = cache.snapshot()
+        assert (snapshot['entries'], snapshot['bytes'], snapshot['evictions']) == (2, 20, 1)
+        assert (snapshot['hits'], snapshot['misses']) == (2, 1)
+
+    def test_spills_to_disk(self, tmp_path):
+        """تست: گردش بیرون‌رفته از حافظه از دیسک خوانده می‌شود، حتی پس از راه‌اندازی مجدد"""
+        spill_dir = str(tmp_path / "statements")
+        cache = StatementCache(max_bytes=15, spill_dir=spill_dir, spill_max_bytes=25)
+        for key in ("a", "b", "c", "d"):
+            cache.put(ACCOUNT, key, key.encode() * 10)
+
+        # a and b were spilled, a was then dropped for the disk budget
+        assert cache.get(ACCOUNT, "a") is None
+        assert cache.get(ACCOUNT, "b") == b"b" * 10
+        assert cache.snapshot()['disk_hits'] == 1
+
+        restarted = StatementCache(max_bytes=15, spill_dir=spill_dir, spill_max_bytes=25)
+        assert restarted.get(ACCOUNT, "c") == b"c" * 10
+        assert restarted.invalidate(ACCOUNT) == 2
+        assert os.listdir(spill_dir) == []
+
+    def test_transaction_event_invalidates(self, tmp_path):
+        """تست: تراکنش جدید گردش‌های کش‌شده هر دو حساب را پاک می‌کند"""
+        bus = EventBus()
+        cache = StatementCache(max_bytes=10, spill_dir=str(tmp_path / "statements"))
+        cache.attach(bus)
+        cache.put(ACCOUNT, "a", b"a" * 10)
+        cache.put(ACCOUNT, "b", b"b" * 10)
+        cache.put(OTHER, "c", b"c")
+        cache.set_file_id("b", "file-b")
+
+        bus.publish('transaction', {'action': 'created', 'from_account': ACCOUNT, 'to_account': None})
+        assert cache.get(ACCOUNT, "a") is None and cache.get(ACCOUNT, "b") is None
+        assert cache.get_file_id("b") is None
+        assert cache.get(OTHER, "c") == b"c"
+        assert cache.snapshot()['invalidations'] == 2
+
+
+class TestTransactionsHandlerCache:
+    """تست استفاده از کش در دریافت ۱۰ گردش آخر"""
+
+    @pytest.mark.asyncio
+    async def test_repeated_request_reuses_file_id(self, db_manager, async_db, monkeypatch):
+        """تست: درخواست دوباره بدون تغییر، PDF نمی‌سازد و با file_id ارسال می‌شود"""
+        db_manager.get_or_create_user("800")
+        db_manager.create_account("800", ACCOUNT, "12345678")
+        db_manager.create_transaction(OTHER, ACCOUNT, 10, 0.1, 'send')
+
+        renders = []
+
+        class CountingService(PdfRenderService):
+            async def render_transactions(self, user_id, transactions, account_number):
+                renders.append(len(transactions))
+                return b"%PDF statement"
+
+        cache = StatementCache(spill_dir='')
+        monkeypatch.setattr(transactions_module, 'get_pdf_service', lambda: CountingService(use_processes=False))
+        monkeypatch.setattr(transactions_module, 'get_statement_cache', lambda: cache)
+
+        handler = TransactionsHandler(async_db, SimpleNamespace(check_lock=lambda user_id: asyncio.sleep(0, (False, None))))
+        bot = StatementBot(rejected={"statement-2"})
+
+        async def request(message_id):
+            await async_db.set_state("800", {'action': 'transactions', 'step': 'enter_password'})
+            update = SimpleNamespace(effective_user=SimpleNamespace(id=800), effective_chat=SimpleNamespace(id=800),
+                                     message=SimpleNamespace(text="12345678", message_id=message_id))
+            await handler.handle_password_input(update, SimpleNamespace(bot=bot))
+
+        await request(1)
+        await request(2)
+        assert renders == [1]
+        assert bot.sent == ['upload', 'statement-1']
+
+        # A new transaction gives a new statement; a rejected file_id falls back to the cached bytes
+        db_manager.create_transaction(ACCOUNT, None, 5, 0, 'sell')
+        await request(3)
+        cache.set_file_id(statement_key(ACCOUNT, *db_manager.get_statement_version(ACCOUNT)), "statement-2")
+        await request(4)
+        await get_message_deleter().drain()
+
+        assert renders == [1, 2]
+        assert bot.sent == ['upload', 'statement-1', 'upload', 'upload']
+        assert cache.snapshot()['hits'] == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
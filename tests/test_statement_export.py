@@ -0,0 +1,286 @@
+"""
+تست برای خروجی صورت‌حساب کامل در بازه تاریخ شمسی
+این تست بررسی می‌کند که:
+1. بازه تاریخ شمسی (با ارقام فارسی و جداکننده «تا») درست خوانده می‌شود و بازه نامعتبر رد می‌شود
+2. تراکنش‌های بازه به ترتیب زمان و دسته‌دسته از پایگاه داده خوانده می‌شوند
+3. خروجی CSV همه ردیف‌ها را با BOM و برچسب‌های فارسی دارد
+4. خروجی PDF چندصفحه‌ای است، تعداد ردیف‌هایش محدود است و فایل بزرگ به جای حافظه روی دیسک نوشته می‌شود
+5. صورت‌حساب از پنل ادمین دانلود می‌شود و پارامتر نامعتبر خطای 400 می‌دهد
+6. ربات پس از گرفتن بازه و رمز عبور، فایل صورت‌حساب را می‌فرستد
+7. صورت‌حساب در پردازه کارگری ساخته می‌شود که پایگاه داده را خودش باز می‌کند
+"""
+import asyncio
+import csv
+import io
+import pytest
+import sys
+import os
+from datetime import datetime, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert
+from database.models import Transaction
+from handlers.transactions import TransactionsHandler
+from utils.message_manager import get_message_deleter
+from utils import statement_export
+from utils.statement_export import (StatementExportService, StatementRangeError, StatementTooLarge, export_statement,
+                                    parse_jalali_date, parse_jalali_range, write_statement_csv)
+
+ACCOUNT = "1234567890123456"
+OTHER = "6543210987654321"
+ROWS = 120
+# 1403/01/01
+FIRST_DAY = datetime(2024, 3, 20)
+
+
+@pytest.fixture
+def seeded(db_manager):
+    """یک تراکنش در هر ساعت از 1403/01/01، به ترتیب معکوس درج شده"""
+    rows = [{
+        'from_account': ACCOUNT if i % 2 else OTHER,
+        'to_account': OTHER if i % 2 else ACCOUNT,
+        'amount': Decimal('10.5') + i,
+        'fee': Decimal('0.1'),
+        'transaction_type': 'send',
+        'status': 'success',
+        'created_at': FIRST_DAY + timedelta(hours=i)
+    } for i in reversed(range(ROWS))]
+    # A transaction of other accounts only
+    rows.append({'from_account': OTHER, 'to_account': None, 'amount': Decimal('1'), 'fee': Decimal('0'),
+                 'transaction_type': 'sell', 'status': 'pending', 'created_at': FIRST_DAY})
+    session = db_manager.get_session()
+    try:
+        session.execute(insert(Transaction), rows)
+        session.commit()
+    finally:
+        session.close()
+    return db_manager
+
+
+@pytest.fixture
+def export_service(monkeypatch):
+    """The shared export service with thread workers"""
+    service = StatementExportService(max_workers=1, use_processes=False)
+    monkeypatch.setattr(statement_export, '_export_service', service)
+    yield service
+    service.shutdown()
+
+
+class ExportBot:
+    """Keeps the documents and texts the handler sends"""
+
+    def __init__(self):
+        self.documents = []
+        self.texts = []
+
+    async def send_document(self, chat_id, document, filename=None, caption=None, **kwargs):
+        self.documents.append((filename, document.read(), caption))
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.texts.append(text)
+        return SimpleNamespace(message_id=len(self.texts))
+
+    async def send_chat_action(self, chat_id, action):
+        pass
+
+    async def delete_messages(self, chat_id, message_ids):
+        return True
+
+
+class TestJalaliRange:
+    """تست خواندن بازه تاریخ شمسی"""
+
+    def test_parse(self):
+        """تست: هر دو روز بازه شامل می‌شوند و ارقام فارسی پذیرفته می‌شوند"""
+        assert parse_jalali_date("1403/01/01") == FIRST_DAY
+        assert parse_jalali_range("۱۴۰۳/۰۱/۰۱ تا ۱۴۰۳/۰۱/۰۵") == (FIRST_DAY, FIRST_DAY + timedelta(days=5))
+        assert parse_jalali_range("1403-01-01 - 1403-01-01") == (FIRST_DAY, FIRST_DAY + timedelta(days=1))
+
+    @pytest.mark.parametrize("text", ["", "1403/01/01", "1403/13/01 تا 1403/01/02", "1403/02/01 تا 1403/01/01",
+                                      "یک تا دو"])
+    def test_invalid(self, text):
+        """تست: بازه نامعتبر خطا می‌دهد"""
+        with pytest.raises(StatementRangeError):
+            parse_jalali_range(text)
+
+
+class TestIterAccountTransactions:
+    """تست خواندن دسته‌ای تراکنش‌ها"""
+
+    def test_chunks_in_order(self, seeded):
+        """تست: تراکنش‌های بازه به ترتیب زمان و در دسته‌های محدود برگردانده می‌شوند"""
+        chunks = list(seeded.iter_account_transactions(ACCOUNT, FIRST_DAY, FIRST_DAY + timedelta(days=2),
+                                                       chunk_size=25))
+        assert [len(chunk) for chunk in chunks] == [25, 23]
+        rows = [row for chunk in chunks for row in chunk]
+        assert [row.created_at for row in rows] == [FIRST_DAY + timedelta(hours=i) for i in range(48)]
+        assert all(ACCOUNT in (row.from_account, row.to_account) for row in rows)
+
+        assert sum(len(chunk) for chunk in seeded.iter_account_transactions(ACCOUNT, chunk_size=50)) == ROWS
+
+
+class TestStatementFiles:
+    """تست ساخت فایل صورت‌حساب"""
+
+    def test_csv(self, seeded):
+        """تست: CSV با BOM، سرستون و برچسب‌های فارسی ساخته می‌شود"""
+        export = export_statement(seeded, ACCOUNT, FIRST_DAY, FIRST_DAY + timedelta(days=1), 'csv')
+        try:
+            data = export.file.read()
+        finally:
+            export.close()
+
+        assert data.startswith(b'\xef\xbb\xbf')
+        rows = list(csv.reader(io.StringIO(data.decode('utf-8-sig'))))
+        assert rows[0][0] == 'شناسه'
+        assert len(rows) == 25 and export.rows == 24 and export.size == len(data)
+        assert rows[1][1] == 'ارسال' and rows[1][6] == 'موفق'
+        assert rows[1][7].startswith('1403/01/01')
+        assert export.filename == f"statement_{ACCOUNT}_14030101_14030101.csv"
+        assert export.content_type == 'text/csv'
+
+    def test_pdf_pages(self, seeded):
+        """تست: همه تراکنش‌ها در چند صفحه PDF نوشته می‌شوند"""
+        export = export_statement(seeded, ACCOUNT, FIRST_DAY, FIRST_DAY + timedelta(days=30))
+        try:
+            data = export.file.read()
+        finally:
+            export.close()
+
+        assert data.startswith(b'%PDF') and export.rows == ROWS
+        assert data.count(b'/Type /Page\n') >= 3
+        print(f"[TEST] ✅ صورت‌حساب {ROWS} تراکنشی: {len(data)} بایت")
+
+    def test_spools_to_disk(self, seeded, monkeypatch):
+        """تست: فایل بزرگ‌تر از سقف حافظه روی دیسک نوشته می‌شود"""
+        monkeypatch.setattr(statement_export.config, 'STATEMENT_EXPORT_SPOOL_MB', 0.001)
+        export = export_statement(seeded, ACCOUNT, FIRST_DAY, FIRST_DAY + timedelta(days=30), 'csv')
+        try:
+            assert export.size > 1024
+            assert export.file._rolled
+        finally:
+            export.close()
+
+    def test_pdf_row_limit(self, seeded, monkeypatch):
+        """تست: PDF بیش از STATEMENT_PDF_MAX_ROWS تراکنش ساخته نمی‌شود ولی CSV محدودیتی ندارد"""
+        monkeypatch.setattr(statement_export.config, 'STATEMENT_PDF_MAX_ROWS', 50)
+        with pytest.raises(StatementTooLarge):
+            export_statement(seeded, ACCOUNT, FIRST_DAY, FIRST_DAY + timedelta(days=30))
+        export = export_statement(seeded, ACCOUNT, FIRST_DAY, FIRST_DAY + timedelta(days=30), 'csv')
+        export.close()
+        assert export.rows == ROWS
+
+    def test_empty_range(self, seeded):
+        """تست: بازه بدون تراکنش فقط سرستون دارد"""
+        out = io.BytesIO()
+        assert write_statement_csv(seeded.iter_account_transactions(ACCOUNT, end=FIRST_DAY), out) == 0
+        assert out.getvalue().decode('utf-8-sig').strip() == ','.join(statement_export.CSV_HEADER)
+
+
+class TestStatementExportService:
+    """تست ساخت صورت‌حساب در پردازه‌های جدا"""
+
+    def test_pdf_in_worker_process(self, seeded):
+        """تست: پردازه کارگر پایگاه داده را خودش باز می‌کند و فایل موقت با بستن صورت‌حساب حذف می‌شود"""
+        service = StatementExportService(max_workers=1)
+
+        async def scenario():
+            return await service.export(seeded, ACCOUNT, FIRST_DAY, FIRST_DAY + timedelta(days=30))
+
+        try:
+            export = asyncio.run(scenario())
+        finally:
+            service.shutdown()
+
+        try:
+            data = export.file.read()
+        finally:
+            export.close()
+        assert data.startswith(b'%PDF') and export.rows == ROWS and export.size == len(data)
+        assert not os.path.exists(export.path)
+        assert service.get_metrics()['completed'] == 1
+
+    def test_too_large(self, seeded, export_service, monkeypatch):
+        """تست: خطای PDF بزرگ از کارگر به ربات می‌رسد"""
+        monkeypatch.setattr(statement_export.config, 'STATEMENT_PDF_MAX_ROWS', 50)
+
+        async def scenario():
+            with pytest.raises(StatementTooLarge):
+                await export_service.export(seeded, ACCOUNT, FIRST_DAY, FIRST_DAY + timedelta(days=30))
+
+        asyncio.run(scenario())
+        metrics = export_service.get_metrics()
+        assert metrics['failed'] == 1 and metrics['completed'] == 0
+
+
+class TestStatementExportFlow:
+    """تست دریافت صورت‌حساب کامل در ربات"""
+
+    @pytest.mark.asyncio
+    async def test_range_then_password(self, seeded, async_db, export_service):
+        """تست: بازه نامعتبر دوباره پرسیده می‌شود و پس از رمز درست فایل ارسال می‌شود"""
+        seeded.get_or_create_user("900")
+        seeded.create_account("900", ACCOUNT, "12345678")
+        handler = TransactionsHandler(async_db, SimpleNamespace(check_lock=lambda user_id: asyncio.sleep(0, (False, None))))
+        bot = ExportBot()
+        context = SimpleNamespace(bot=bot)
+
+        def update(text, message_id):
+            return SimpleNamespace(effective_user=SimpleNamespace(id=900), effective_chat=SimpleNamespace(id=900),
+                                   message=SimpleNamespace(text=text, message_id=message_id))
+
+        await async_db.set_state("900", {'action': 'statement_export', 'step': 'enter_range', 'format': 'csv'})
+        await handler.handle_statement_range_input(update("1403/01/40", 1), context)
+        assert (await async_db.get_state("900"))['step'] == 'enter_range'
+
+        await handler.handle_statement_range_input(update("۱۴۰۳/۰۱/۰۱ تا ۱۴۰۳/۰۱/۰۱", 2), context)
+        state = await async_db.get_state("900")
+        assert state['step'] == 'enter_password' and state['format'] == 'csv'
+
+        await handler.handle_statement_password_input(update("12345678", 3), context)
+        await get_message_deleter().drain()
+
+        assert await async_db.get_state("900") == {}
+        [(filename, data, caption)] = bot.documents
+        assert filename == f"statement_{ACCOUNT}_14030101_14030101.csv"
+        assert len(data.decode('utf-8-sig').strip().splitlines()) == 25
+        assert '24' in caption
+
+
+@pytest.mark.usefixtures('seeded')
+class TestAdminStatement:
+    """تست دانلود صورت‌حساب از پنل ادمین"""
+
+    def test_download(self, client):
+        """تست: صورت‌حساب به صورت فایل پیوست دانلود می‌شود"""
+        response = client.get(f'/api/accounts/{ACCOUNT}/statement?from=1403/01/01&to=1403/01/02&format=csv')
+        assert response.status_code == 200
+        assert response.mimetype == 'text/csv'
+        assert 'attachment' in response.headers['Content-Disposition']
+        assert len(response.data.decode('utf-8-sig').strip().splitlines()) == 49
+
+        response = client.get(f'/api/accounts/{ACCOUNT}/statement?from=1403/01/01&to=1403/01/30')
+        assert response.mimetype == 'application/pdf' and response.data.startswith(b'%PDF')
+
+    def test_pdf_too_large(self, client, monkeypatch):
+        """تست: PDF بیش از سقف تراکنش خطای 400 می‌دهد"""
+        monkeypatch.setattr(statement_export.config, 'STATEMENT_PDF_MAX_ROWS', 50)
+        response = client.get(f'/api/accounts/{ACCOUNT}/statement?from=1403/01/01&to=1403/01/30')
+        assert response.status_code == 400
+        assert 'CSV' in response.get_json()['error']
+
+    @pytest.mark.parametrize("query", ["from=1403/01/01&to=1403/01/02&format=xls", "from=1403/01/01",
+                                       "from=1403/02/01&to=1403/01/01"])
+    def test_invalid(self, client, query):
+        """تست: پارامتر نامعتبر خطای 400 می‌دهد"""
+        response = client.get(f'/api/accounts/{ACCOUNT}/statement?{query}')
+        assert response.status_code == 400
+        assert 'error' in response.get_json()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
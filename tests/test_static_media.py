@@ -0,0 +1,154 @@
+"""
+تست برای ارسال فایل‌های ثابت با file_id (فایل PDF موافقت‌نامه)
+این تست بررسی می‌کند که:
+1. فایل فقط بار اول آپلود می‌شود و بعد از آن (حتی پس از راه‌اندازی مجدد) با file_id ارسال می‌شود
+2. با تغییر فایل، فایل دوباره آپلود می‌شود
+3. اگر تلگرام file_id را نامعتبر بداند فایل دوباره آپلود می‌شود، ولی خطاهای دیگر به فراخواننده می‌رسند
+4. چند درخواست هم‌زمان فقط یک آپلود انجام می‌دهند
+5. file_id با کلید (هش فایل، نوع) ذخیره می‌شود و جدول قدیمی مهاجرت داده می‌شود
+"""
+import asyncio
+import pytest
+import sys
+import os
+from types import SimpleNamespace
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from telegram.error import BadRequest
+from database.db_manager import DatabaseManager
+from utils.static_media import StaticMediaRegistry
+
+
+class DocumentBot:
+    """Records what each send_document got: 'upload' for a file, else the file_id"""
+
+    def __init__(self, rejected=None):
+        self.sent = []
+        # file_id -> message of the BadRequest Telegram answers it with
+        self.rejected = rejected or {}
+
+    async def send_document(self, chat_id, document, filename=None, **kwargs):
+        if isinstance(document, str):
+            if document in self.rejected:
+                raise BadRequest(self.rejected[document])
+            self.sent.append(document)
+            file_id = document
+        else:
+            await asyncio.sleep(0.01)
+            content = document.read()
+            self.sent.append('upload')
+            file_id = f"file-{len(content)}-{len(self.sent)}"
+        return SimpleNamespace(message_id=len(self.sent), document=SimpleNamespace(file_id=file_id))
+
+
+@pytest.fixture
+def pdf_path(tmp_path):
+    path = tmp_path / "agreement.pdf"
+    path.write_bytes(b"%PDF-1.4 agreement")
+    return str(path)
+
+
+class TestStaticMediaRegistry:
+    """تست ارسال فایل ثابت با file_id"""
+
+    @pytest.mark.asyncio
+    async def test_uploads_once(self, async_db, pdf_path):
+        """تست: فقط بار اول آپلود می‌شود، حتی پس از راه‌اندازی مجدد"""
+        bot = DocumentBot()
+        registry = StaticMediaRegistry(async_db)
+        await registry.send_document(bot, 1, pdf_path, caption="متن")
+        await registry.send_document(bot, 2, pdf_path, caption="متن")
+        # A new registry (bot restart) finds the file_id in the database
+        await StaticMediaRegistry(async_db).send_document(bot, 3, pdf_path)
+
+        assert bot.sent == ['upload', 'file-18-1', 'file-18-1']
+        assert registry.snapshot() == {'uploads': 1, 'reuses': 1, 'files': 1}
+        print("[TEST] ✅ فایل یک بار آپلود شد")
+
+    @pytest.mark.asyncio
+    async def test_changed_file_is_uploaded_again(self, async_db, pdf_path):
+        """تست: فایل تغییرکرده دوباره آپلود می‌شود"""
+        bot = DocumentBot()
+        registry = StaticMediaRegistry(async_db)
+        await registry.send_document(bot, 1, pdf_path)
+        with open(pdf_path, 'ab') as f:
+            f.write(b" v2")
+        await registry.send_document(bot, 1, pdf_path)
+        await registry.send_document(bot, 1, pdf_path)
+
+        assert bot.sent == ['upload', 'upload', 'file-21-2']
+
+    @pytest.mark.asyncio
+    async def test_rejected_file_id(self, db_manager, async_db, pdf_path):
+        """تست: file_id ردشده کنار گذاشته و فایل دوباره آپلود می‌شود"""
+        registry = StaticMediaRegistry(async_db)
+        db_manager.save_static_file_id(registry.file_hash(pdf_path), "agreement.pdf", 'document', "expired")
+        bot = DocumentBot(rejected={"expired": "Wrong file identifier/http url specified"})
+
+        await registry.send_document(bot, 1, pdf_path)
+        await registry.send_document(bot, 1, pdf_path)
+
+        assert bot.sent == ['upload', 'file-18-1']
+        assert db_manager.get_static_file_id(registry.file_hash(pdf_path), 'document') == "file-18-1"
+
+    @pytest.mark.asyncio
+    async def test_other_bad_request_keeps_file_id(self, db_manager, async_db, pdf_path):
+        """تست: خطایی غیر از file_id نامعتبر به فراخواننده می‌رسد و file_id حذف نمی‌شود"""
+        registry = StaticMediaRegistry(async_db)
+        file_hash = registry.file_hash(pdf_path)
+        db_manager.save_static_file_id(file_hash, "agreement.pdf", 'document', "stored")
+        bot = DocumentBot(rejected={"stored": "Bad Request: chat not found"})
+
+        with pytest.raises(BadRequest):
+            await registry.send_document(bot, 1, pdf_path)
+
+        assert bot.sent == []
+        assert db_manager.get_static_file_id(file_hash, 'document') == "stored"
+
+    def test_kinds_are_kept_apart(self, db_manager):
+        """تست: فایل یکسان به صورت سند و عکس file_id جدا دارد و فقط file_id همان نوع حذف می‌شود"""
+        db_manager.save_static_file_id("a" * 64, "logo.png", 'document', "as-document")
+        db_manager.save_static_file_id("a" * 64, "logo.png", 'photo', "as-photo")
+        db_manager.forget_static_file_id("a" * 64, 'document')
+
+        assert db_manager.get_static_file_id("a" * 64, 'document') is None
+        assert db_manager.get_static_file_id("a" * 64, 'photo') == "as-photo"
+
+    def test_old_table_is_migrated(self, db_path):
+        """تست: جدول قدیمی که فقط روی هش یکتا بود با کلید (هش، نوع) بازسازی می‌شود"""
+        engine = create_engine(db_path)
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE static_media (id INTEGER PRIMARY KEY, file_hash VARCHAR(64) NOT NULL UNIQUE, "
+                              "name VARCHAR(255) NOT NULL, kind VARCHAR(20) NOT NULL, "
+                              "file_id VARCHAR(255) NOT NULL, created_at DATETIME NOT NULL)"))
+        engine.dispose()
+
+        manager = DatabaseManager(db_url=db_path)
+        try:
+            manager.save_static_file_id("b" * 64, "logo.png", 'document', "as-document")
+            manager.save_static_file_id("b" * 64, "logo.png", 'photo', "as-photo")
+            assert manager.get_static_file_id("b" * 64, 'document') == "as-document"
+        finally:
+            manager.engine.dispose()
+
+    @pytest.mark.asyncio
+    async def test_concurrent_first_sends(self, async_db, pdf_path):
+        """تست: درخواست‌های هم‌زمان فقط یک آپلود انجام می‌دهند"""
+        bot = DocumentBot()
+        registry = StaticMediaRegistry(async_db)
+        await asyncio.gather(*(registry.send_document(bot, chat_id, pdf_path) for chat_id in range(5)))
+
+        assert bot.sent.count('upload') == 1
+        assert len(bot.sent) == 5
+
+    def test_missing_file(self, tmp_path):
+        """تست: نبود فایل خطا می‌دهد تا نسخه متنی نمایش داده شود"""
+        with pytest.raises(FileNotFoundError):
+            StaticMediaRegistry(None).file_hash(str(tmp_path / "missing.pdf"))
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
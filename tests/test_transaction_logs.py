@@ -8,6 +8,7 @@
 5. تمام اطلاعات تراکنش (مبلغ، کارمزد، حساب مبدأ/مقصد) ثبت می‌شود
 """
 import pytest
+import pytest_asyncio
 import sys
 import os
 from unittest.mock import Mock, AsyncMock, patch, MagicMock
@@ -18,6 +19,7 @@ from datetime import datetime, timedelta
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from database.db_manager import DatabaseManager
+from database.async_db_manager import AsyncDatabaseManager
 from database.models import TransactionLog, Transaction
 from handlers.buy import BuyHandler
 from handlers.send import SendHandler
@@ -35,10 +37,18 @@ class TestTransactionLogs:
         """ایجاد یک نمونه از DatabaseManager"""
         return DatabaseManager()
     
+    @pytest_asyncio.fixture
+    async def async_db_manager(self, db_manager):
+        """ایجاد یک نمونه از AsyncDatabaseManager روی همان دیتابیس"""
+        manager = AsyncDatabaseManager(db_manager)
+        yield manager
+        # Close aiosqlite connections (their threads keep pytest alive otherwise)
+        await manager.dispose()
+    
     @pytest.fixture
-    def lock_manager(self, db_manager):
+    def lock_manager(self, async_db_manager):
         """ایجاد یک نمونه از LockManager"""
-        return LockManager(db_manager)
+        return LockManager(async_db_manager)
     
     @pytest.fixture
     def test_user_and_account(self, db_manager):
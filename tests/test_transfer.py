@@ -0,0 +1,139 @@
+"""
+تست برای انتقال اتمی PERS
+این تست بررسی می‌کند که:
+1. کسر، واریز، کارمزد، رکورد تراکنش و لاگ در یک تراکنش دیتابیس ثبت می‌شوند
+2. در صورت کمبود موجودی هیچ تغییری اعمال نمی‌شود
+3. کلید یکتایی (idempotency key) از انتقال دوباره جلوگیری می‌کند
+4. انتقال‌های همزمان موجودی را منفی نمی‌کنند
+"""
+import pytest
+import sys
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.models import Transaction, TransactionLog
+
+
+@pytest.fixture
+def accounts(db_manager):
+    """Create sender, receiver and admin accounts"""
+    numbers = {}
+    for name, balance in (('sender', 100.0), ('receiver', 0.0), ('admin', 0.0)):
+        user_id = f"transfer_{name}_{uuid.uuid4().hex[:8]}"
+        account_number = str(uuid.uuid4().int)[:16]
+        db_manager.get_or_create_user(user_id, username=name)
+        db_manager._insert_account(user_id, account_number, "hash", "hash")
+        db_manager.set_account_balance(account_number, balance)
+        numbers[name] = account_number
+        numbers[f"{name}_user_id"] = user_id
+    return numbers
+
+
+class TestTransfer:
+    """تست انتقال اتمی"""
+
+    def test_transfer_moves_amount_and_fee(self, db_manager, accounts):
+        """تست: مبلغ و کارمزد در یک تراکنش جابجا می‌شوند"""
+        result = db_manager.transfer(
+            accounts['sender'], accounts['receiver'], accounts['admin'],
+            amount=10.0, fee=0.1, idempotency_key=uuid.uuid4().hex,
+            user_id=accounts['sender_user_id']
+        )
+
+        assert result is not None
+        assert result['duplicate'] is False
+        assert result['balances'][accounts['sender']] == pytest.approx(89.9)
+        assert result['balances'][accounts['receiver']] == pytest.approx(10.0)
+        assert result['balances'][accounts['admin']] == pytest.approx(0.1)
+        assert db_manager.get_account_balance(accounts['sender']) == pytest.approx(89.9)
+
+        session = db_manager.get_session()
+        try:
+            transaction = session.query(Transaction).filter(Transaction.id == result['transaction_id']).one()
+            assert transaction.status == 'success'
+            log = session.query(TransactionLog).filter(TransactionLog.transaction_id == transaction.id).one()
+            assert log.username == 'sender'
+            assert float(log.fee) == pytest.approx(0.1)
+        finally:
+            session.close()
+        print(f"[TEST] ✅ انتقال اتمی انجام شد: {result}")
+
+    def test_insufficient_balance_changes_nothing(self, db_manager, accounts):
+        """تست: کمبود موجودی هیچ تغییری ایجاد نمی‌کند"""
+        key = uuid.uuid4().hex
+        result = db_manager.transfer(
+            accounts['sender'], accounts['receiver'], accounts['admin'],
+            amount=100.0, fee=1.0, idempotency_key=key
+        )
+
+        assert result is None
+        assert db_manager.get_account_balance(accounts['sender']) == pytest.approx(100.0)
+        assert db_manager.get_account_balance(accounts['receiver']) == pytest.approx(0.0)
+        assert db_manager.get_account_balance(accounts['admin']) == pytest.approx(0.0)
+
+        session = db_manager.get_session()
+        try:
+            assert session.query(Transaction).filter(Transaction.idempotency_key == key).count() == 0
+        finally:
+            session.close()
+        print("[TEST] ✅ انتقال با موجودی ناکافی رد شد")
+
+    def test_missing_account_rolls_back(self, db_manager, accounts):
+        """تست: حساب مقصد ناموجود کل انتقال را برمی‌گرداند"""
+        result = db_manager.transfer(
+            accounts['sender'], '0000000000000000', accounts['admin'],
+            amount=10.0, fee=0.1, idempotency_key=uuid.uuid4().hex
+        )
+
+        assert result is None
+        assert db_manager.get_account_balance(accounts['sender']) == pytest.approx(100.0)
+
+    def test_idempotency_key_prevents_double_transfer(self, db_manager, accounts):
+        """تست: تکرار یک کلید، پول را دوباره جابجا نمی‌کند"""
+        key = uuid.uuid4().hex
+        first = db_manager.transfer(accounts['sender'], accounts['receiver'], accounts['admin'],
+                                    amount=10.0, fee=0.1, idempotency_key=key)
+        second = db_manager.transfer(accounts['sender'], accounts['receiver'], accounts['admin'],
+                                     amount=10.0, fee=0.1, idempotency_key=key)
+
+        assert second['duplicate'] is True
+        assert second['transaction_id'] == first['transaction_id']
+        assert db_manager.get_account_balance(accounts['sender']) == pytest.approx(89.9)
+        assert db_manager.get_account_balance(accounts['receiver']) == pytest.approx(10.0)
+        print("[TEST] ✅ تراکنش تکراری اعمال نشد")
+
+    def test_fee_account_same_as_sender(self, db_manager, accounts):
+        """تست: وقتی فرستنده همان حساب کارمزد است فقط مبلغ کسر می‌شود"""
+        result = db_manager.transfer(accounts['admin'], accounts['receiver'], accounts['admin'],
+                                     amount=0.0, fee=0.0, idempotency_key=uuid.uuid4().hex)
+        assert result is not None
+
+        db_manager.set_account_balance(accounts['admin'], 10.0)
+        result = db_manager.transfer(accounts['admin'], accounts['receiver'], accounts['admin'],
+                                     amount=5.0, fee=0.05, idempotency_key=uuid.uuid4().hex)
+        assert result['balances'][accounts['admin']] == pytest.approx(5.0)
+        assert result['balances'][accounts['receiver']] == pytest.approx(5.0)
+
+    def test_concurrent_transfers_never_overdraw(self, db_manager, accounts):
+        """تست: انتقال‌های همزمان موجودی را منفی نمی‌کنند"""
+        def send(_):
+            return db_manager.transfer(accounts['sender'], accounts['receiver'], accounts['admin'],
+                                       amount=9.0, fee=1.0, idempotency_key=uuid.uuid4().hex)
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(send, range(20)))
+
+        succeeded = [r for r in results if r is not None]
+        assert len(succeeded) == 10
+        assert db_manager.get_account_balance(accounts['sender']) == pytest.approx(0.0)
+        assert db_manager.get_account_balance(accounts['receiver']) == pytest.approx(90.0)
+        assert db_manager.get_account_balance(accounts['admin']) == pytest.approx(10.0)
+        print(f"[TEST] ✅ {len(succeeded)} انتقال از ۲۰ انتقال همزمان انجام شد")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
@@ -0,0 +1,156 @@
+"""
+تست برای واحد کار (unit of work) و شمارنده کوئری‌ها
+این تست بررسی می‌کند که:
+1. همه فراخوانی‌های دیتابیس داخل واحد کار از یک session استفاده می‌کنند و یک بار commit می‌شوند
+2. خطا داخل واحد کار همه تغییرات را برمی‌گرداند
+   و rollback یک متد مخزن داخل واحد کار، هیچ بخشی از بلوک را commit نمی‌کند
+3. تعداد کوئری‌ها، commit ها و session ها برای هر به‌روزرسانی شمرده می‌شود
+"""
+import pytest
+import sys
+import os
+import uuid
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.async_db_manager import AsyncDatabaseManager
+from database.unit_of_work import track_queries, get_query_stats, UnitOfWorkRolledBack
+from utils.lock_manager import LockManager
+
+
+@pytest.fixture
+def account_number(db_manager):
+    user_id = f"uow_user_{uuid.uuid4().hex[:8]}"
+    account_number = str(uuid.uuid4().int)[:16]
+    db_manager.get_or_create_user(user_id)
+    db_manager._insert_account(user_id, account_number, "hash", "hash")
+    db_manager.set_account_balance(account_number, 100.0)
+    return account_number
+
+
+class TestUnitOfWork:
+    """تست واحد کار"""
+
+    def test_one_session_and_one_commit(self, db_manager, account_number):
+        """تست: چند نوشتن داخل واحد کار با یک session و یک commit انجام می‌شود"""
+        with track_queries() as stats:
+            with db_manager.unit_of_work():
+                db_manager.update_account_balance(account_number, -10)
+                transaction = db_manager.create_transaction(account_number, None, 10, 0.1, 'sell')
+                db_manager.update_transaction_status(transaction.id, 'success')
+
+        assert stats.sessions == 1
+        assert stats.commits == 1
+        assert transaction.id is not None
+        assert transaction.status == 'success', "اشیاء پس از commit باید قابل استفاده باشند"
+        assert db_manager.get_account_balance(account_number) == pytest.approx(90.0)
+        print(f"[TEST] ✅ واحد کار: {stats.as_dict()}")
+
+    def test_without_unit_of_work_each_call_commits(self, db_manager, account_number):
+        """تست: بدون واحد کار هر فراخوانی session و commit جداگانه دارد"""
+        with track_queries() as stats:
+            db_manager.update_account_balance(account_number, -10)
+            transaction = db_manager.create_transaction(account_number, None, 10, 0.1, 'sell')
+            db_manager.update_transaction_status(transaction.id, 'success')
+
+        assert stats.sessions == 3
+        assert stats.commits == 3
+
+    def test_exception_rolls_back_everything(self, db_manager, account_number):
+        """تست: خطا داخل واحد کار همه تغییرات را برمی‌گرداند"""
+        with pytest.raises(RuntimeError):
+            with db_manager.unit_of_work():
+                db_manager.update_account_balance(account_number, -50)
+                db_manager.create_transaction(account_number, None, 50, 0.5, 'sell')
+                raise RuntimeError("خطای آزمایشی")
+
+        assert db_manager.get_account_balance(account_number) == pytest.approx(100.0)
+        assert db_manager.get_account_transactions(account_number) == []
+        print("[TEST] ✅ تغییرات پس از خطا برگردانده شدند")
+
+    def test_repository_rollback_aborts_whole_block(self, db_manager, account_number):
+        """تست: انتقال رد شده داخل واحد کار، نوشتن‌های قبل و بعد از آن را هم commit نمی‌کند"""
+        empty_account = str(uuid.uuid4().int)[:16]
+        db_manager._insert_account(db_manager.get_account_by_number(account_number).user_id,
+                                   empty_account, "hash", "hash")
+
+        with pytest.raises(UnitOfWorkRolledBack):
+            with db_manager.unit_of_work():
+                db_manager.update_account_balance(account_number, -50)
+                # Insufficient balance: transfer() rolls back and returns None
+                result = db_manager.transfer(empty_account, account_number, account_number, 10, 0,
+                                             idempotency_key=uuid.uuid4().hex)
+                assert result is None
+                db_manager.update_account_balance(empty_account, 7)
+
+        assert db_manager.get_account_balance(account_number) == pytest.approx(100.0)
+        assert db_manager.get_account_balance(empty_account) == pytest.approx(0.0)
+        print("[TEST] ✅ هیچ بخشی از بلوک پس از rollback مخزن commit نشد")
+
+    def test_nested_unit_of_work_joins_outer(self, db_manager, account_number):
+        """تست: واحد کار تو در تو به واحد کار بیرونی می‌پیوندد"""
+        with track_queries() as stats:
+            with db_manager.unit_of_work() as outer:
+                with db_manager.unit_of_work() as inner:
+                    assert inner is outer
+                    db_manager.update_account_balance(account_number, -1)
+                # Admin lookup uses its own unit of work internally
+                db_manager.get_admin_account_number()
+
+        assert stats.commits == 1
+        assert stats.sessions == 1
+
+    @pytest.mark.asyncio
+    async def test_check_lock_uses_one_session(self, db_manager):
+        """تست: بررسی قفل کاربر با یک session انجام می‌شود"""
+        user_id = f"uow_lock_{uuid.uuid4().hex[:8]}"
+        db_manager.get_or_create_user(user_id)
+        db_manager.lock_user(user_id, "تست")
+        async_db_manager = AsyncDatabaseManager(db_manager)
+        lock_manager = LockManager(async_db_manager)
+
+        try:
+            with track_queries() as stats:
+                is_locked, message = await lock_manager.check_lock(user_id)
+        finally:
+            await async_db_manager.dispose()
+
+        assert is_locked is True
+        assert message
+        assert stats.sessions == 1
+        assert stats.queries == 2
+
+    @pytest.mark.asyncio
+    async def test_async_unit_of_work_repository_rollback(self, db_manager, account_number):
+        """تست: در واحد کار async هم rollback مخزن کل بلوک را برمی‌گرداند"""
+        empty_account = str(uuid.uuid4().int)[:16]
+        db_manager._insert_account(db_manager.get_account_by_number(account_number).user_id,
+                                   empty_account, "hash", "hash")
+        async_db_manager = AsyncDatabaseManager(db_manager)
+        try:
+            with pytest.raises(UnitOfWorkRolledBack):
+                async with async_db_manager.unit_of_work():
+                    await async_db_manager.update_account_balance(account_number, -50)
+                    result = await async_db_manager.transfer(empty_account, account_number, account_number, 10, 0,
+                                                             idempotency_key=uuid.uuid4().hex)
+                    assert result is None
+                    await async_db_manager.update_account_balance(empty_account, 7)
+        finally:
+            await async_db_manager.dispose()
+
+        assert db_manager.get_account_balance(account_number) == pytest.approx(100.0)
+        assert db_manager.get_account_balance(empty_account) == pytest.approx(0.0)
+
+    def test_stats_only_inside_tracking(self, db_manager, account_number):
+        """تست: شمارنده فقط داخل track_queries فعال است"""
+        assert get_query_stats() is None
+        with track_queries() as stats:
+            db_manager.get_account_balance(account_number)
+            assert get_query_stats() is stats
+        assert stats.queries == 1
+        assert get_query_stats() is None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
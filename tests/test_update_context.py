@@ -0,0 +1,147 @@
+"""
+تست برای زمینه به‌روزرسانی (UpdateContext)
+این تست بررسی می‌کند که:
+1. کاربر، قفل فعال، موافقت‌نامه، وضعیت و اکانت فعال با یک کوئری خوانده می‌شوند
+2. داخل به‌روزرسانی بررسی قفل، موافقت‌نامه، اکانت و وضعیت کوئری جدید نمی‌زنند
+3. پس از تغییر (مثلا قفل کردن کاربر) داده‌ها دوباره از دیتابیس خوانده می‌شوند
+4. زمینه تغییرناپذیر است و بعد از پایان به‌روزرسانی استفاده نمی‌شود
+"""
+import asyncio
+import dataclasses
+import pytest
+import sys
+import os
+import uuid
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.update_context import bind_update_context, get_update_context
+from database.unit_of_work import track_queries
+from utils.encryption import encrypt_state
+from utils.lock_manager import LockManager
+
+
+@pytest.fixture
+def user_with_account(db_manager):
+    user_id = f"ctx_{uuid.uuid4().hex[:8]}"
+    account_number = str(uuid.uuid4().int)[:16]
+    db_manager.get_or_create_user(user_id, username="ctx_user")
+    db_manager.accept_agreement(user_id)
+    db_manager._insert_account(user_id, account_number, "hash", "hash")
+    db_manager.set_account_balance(account_number, 42.5)
+    db_manager.update_user_state(user_id, encrypt_state({'action': 'send_pers', 'step': 'enter_amount'}))
+    return user_id, account_number
+
+
+class TestUpdateContext:
+    """تست زمینه به‌روزرسانی"""
+
+    @pytest.mark.asyncio
+    async def test_loaded_with_one_query(self, async_db, user_with_account):
+        """تست: همه اطلاعات با یک کوئری خوانده می‌شوند"""
+        user_id, account_number = user_with_account
+
+        with track_queries() as stats:
+            context = await async_db.load_update_context(user_id)
+
+        assert stats.queries == 1
+        assert context.user_exists is True
+        assert context.username == "ctx_user"
+        assert context.agreement_accepted is True
+        assert context.is_locked is False
+        assert context.account.account_number == account_number
+        assert float(context.account.balance) == pytest.approx(42.5)
+        assert context.state['step'] == 'enter_amount'
+        print(f"[TEST] ✅ زمینه به‌روزرسانی با {stats.queries} کوئری ساخته شد")
+
+    @pytest.mark.asyncio
+    async def test_preamble_reads_from_context(self, async_db, user_with_account):
+        """تست: بررسی‌های ابتدای به‌روزرسانی از زمینه خوانده می‌شوند"""
+        user_id, account_number = user_with_account
+        lock_manager = LockManager(async_db)
+
+        with track_queries() as stats:
+            context = await async_db.load_update_context(user_id)
+            with bind_update_context(context):
+                is_locked, _ = await lock_manager.check_lock(user_id)
+                accepted = await async_db.has_accepted_agreement(user_id)
+                state = await async_db.get_state(user_id)
+                account = await async_db.get_active_account(user_id)
+
+        assert stats.queries == 1, f"انتظار یک کوئری، {stats.queries} کوئری اجرا شد"
+        assert is_locked is False
+        assert accepted is True
+        assert state == {'action': 'send_pers', 'step': 'enter_amount'}
+        assert account.account_number == account_number
+
+    @pytest.mark.asyncio
+    async def test_lock_inside_update_is_seen(self, async_db, user_with_account):
+        """تست: قفل شدن کاربر داخل به‌روزرسانی در بررسی بعدی دیده می‌شود"""
+        user_id, _ = user_with_account
+        lock_manager = LockManager(async_db)
+
+        context = await async_db.load_update_context(user_id)
+        with bind_update_context(context):
+            assert (await lock_manager.check_lock(user_id))[0] is False
+            await lock_manager.lock_user(user_id, "تست")
+            is_locked, message = await lock_manager.check_lock(user_id)
+
+        assert is_locked is True
+        assert message
+
+    @pytest.mark.asyncio
+    async def test_locked_user(self, db_manager, async_db, user_with_account):
+        """تست: قفل فعال در زمینه ثبت می‌شود"""
+        user_id, _ = user_with_account
+        db_manager.lock_user(user_id, "تست")
+
+        context = await async_db.load_update_context(user_id)
+
+        assert context.is_locked is True
+        assert context.lock_reason == "تست"
+        with bind_update_context(context):
+            is_locked, message = await LockManager(async_db).check_lock(user_id)
+        assert is_locked is True
+        assert message
+
+    @pytest.mark.asyncio
+    async def test_unknown_user(self, async_db):
+        """تست: برای کاربر ناموجود زمینه خالی ساخته می‌شود"""
+        context = await async_db.load_update_context("no_such_user")
+
+        assert context.user_exists is False
+        assert context.agreement_accepted is False
+        assert context.account is None
+        assert dict(context.state) == {}
+
+    @pytest.mark.asyncio
+    async def test_context_is_immutable_and_scoped(self, async_db, user_with_account):
+        """تست: زمینه تغییرناپذیر است و بعد از پایان به‌روزرسانی در دسترس نیست"""
+        user_id, _ = user_with_account
+        context = await async_db.load_update_context(user_id)
+
+        with pytest.raises(dataclasses.FrozenInstanceError):
+            context.agreement_accepted = False
+        with pytest.raises(TypeError):
+            context.state['step'] = 'x'
+
+        release = asyncio.Event()
+
+        async def background():
+            await release.wait()
+            return get_update_context(user_id)
+
+        with bind_update_context(context):
+            assert get_update_context(user_id) is context
+            assert get_update_context("someone_else") is None
+            # A task started by a handler outlives the update
+            task = asyncio.create_task(background())
+
+        release.set()
+        assert await task is None
+        assert get_update_context(user_id) is None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
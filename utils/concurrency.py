@@ -0,0 +1,114 @@
+"""Per-user ordering for concurrently processed updates"""
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Dict
+
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+class _KeyEntry:
+    __slots__ = ('lock', 'users')
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        # Tasks holding or waiting for the lock; the entry is dropped at zero
+        self.users = 0
+
+
+class KeyedLock:
+    """
+    One asyncio mutex per key (user id, account number)
+
+    Locks exist only while someone holds or waits for them, so the map does
+    not grow with the number of users ever seen. Several keys are acquired in
+    sorted order, so two tasks locking the same pair of accounts cannot
+    deadlock.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, _KeyEntry] = {}
+
+    @asynccontextmanager
+    async def hold(self, *keys):
+        """Hold the locks of all given keys (None keys are ignored)"""
+        keys = sorted({str(key) for key in keys if key is not None})
+        entries = [self._ref(key) for key in keys]
+        locked = []
+        try:
+            for entry in entries:
+                await entry.lock.acquire()
+                locked.append(entry)
+            yield
+        finally:
+            for entry in reversed(locked):
+                entry.lock.release()
+            for key in keys:
+                self._unref(key)
+
+    def is_locked(self, key) -> bool:
+        entry = self._entries.get(str(key))
+        return entry is not None and entry.lock.locked()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _ref(self, key: str) -> _KeyEntry:
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _KeyEntry()
+        entry.users += 1
+        return entry
+
+    def _unref(self, key: str):
+        entry = self._entries[key]
+        entry.users -= 1
+        if entry.users == 0:
+            del self._entries[key]
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Process updates concurrently, but the updates of one user one at a time
+
+    Up to max_concurrent_updates updates run at once, so a user waiting on a
+    password hash, a PDF or a payment delay no longer holds up everyone else.
+    Updates of the same user wait for each other and run in arrival order,
+    so a conversation's steps never interleave. Updates without a user (e.g.
+    channel posts) are not serialized.
+
+    Waiting updates count towards max_concurrent_updates; keep the limit well
+    above the number of updates one user can send while an update is handled.
+    """
+
+    __slots__ = ('user_locks', 'processed', 'waited')
+
+    def __init__(self, max_concurrent_updates: int, user_locks: KeyedLock = None):
+        super().__init__(max_concurrent_updates)
+        self.user_locks = user_locks or KeyedLock()
+        self.processed = 0
+        # Updates that had to wait for an earlier update of the same user
+        self.waited = 0
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        user = getattr(update, 'effective_user', None)
+        if user is None:
+            await coroutine
+            self.processed += 1
+            return
+
+        if self.user_locks.is_locked(user.id):
+            self.waited += 1
+        async with self.user_locks.hold(user.id):
+            await coroutine
+        self.processed += 1
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        logger.info(f"Update processor: {self.processed} updates processed, "
+                    f"{self.waited} waited for an earlier update of the same user")
@@ -1,4 +1,4 @@
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, MultiFernet, InvalidToken
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from cryptography.hazmat.backends import default_backend
@@ -6,15 +6,17 @@ from argon2 import PasswordHasher
 from argon2.exceptions import VerifyMismatchError
 import base64
 import json
+import threading
+import time
 import config
 
 
-def get_encryption_key() -> bytes:
+def derive_encryption_key(raw_key) -> bytes:
     """
-    Get or generate encryption key from config
+    Derive a Fernet key from a raw configured key
     Fernet requires a URL-safe base64-encoded 32-byte key
     """
-    key = config.ENCRYPTION_KEY
+    key = raw_key
     if isinstance(key, str):
         key = key.encode()
     
@@ -35,15 +37,167 @@ def get_encryption_key() -> bytes:
     return key
 
 
+class KeyManager:
+    """
+    Holds the derived state encryption keys and reusable cipher objects
+    
+    Keys are derived once when the manager is created. The first key is the
+    primary key used for encryption; the remaining keys are only used to
+    decrypt states written before a key rotation.
+    """
+    
+    def __init__(self, primary_key, previous_keys=None):
+        self._lock = threading.Lock()
+        self._raw_keys = []
+        self._keys = []
+        self._fernets = []
+        self.cipher = None
+        
+        self.derive_seconds = 0.0
+        self.encrypt_count = 0
+        self.encrypt_seconds = 0.0
+        self.decrypt_count = 0
+        self.decrypt_seconds = 0.0
+        self.decrypt_failures = 0
+        self.rotate_count = 0
+        
+        for raw_key in [primary_key] + list(previous_keys or []):
+            self._append_key(raw_key)
+        self._rebuild_cipher()
+    
+    def _append_key(self, raw_key, primary: bool = False):
+        if isinstance(raw_key, str):
+            raw_key = raw_key.encode()
+        if not raw_key or raw_key in self._raw_keys:
+            return
+        
+        start = time.perf_counter()
+        key = derive_encryption_key(raw_key)
+        self.derive_seconds += time.perf_counter() - start
+        
+        if primary:
+            self._raw_keys.insert(0, raw_key)
+            self._keys.insert(0, key)
+            self._fernets.insert(0, Fernet(key))
+        else:
+            self._raw_keys.append(raw_key)
+            self._keys.append(key)
+            self._fernets.append(Fernet(key))
+    
+    def _rebuild_cipher(self):
+        self.cipher = MultiFernet(self._fernets)
+    
+    @property
+    def primary_key(self) -> bytes:
+        """The derived key currently used for encryption"""
+        return self._keys[0]
+    
+    @property
+    def key_count(self) -> int:
+        return len(self._keys)
+    
+    def add_primary_key(self, raw_key):
+        """
+        Rotate to a new primary key
+        Older keys stay active for decryption until retire_key is called
+        """
+        with self._lock:
+            if isinstance(raw_key, str):
+                raw_key = raw_key.encode()
+            if raw_key in self._raw_keys:
+                index = self._raw_keys.index(raw_key)
+                self._raw_keys.insert(0, self._raw_keys.pop(index))
+                self._keys.insert(0, self._keys.pop(index))
+                self._fernets.insert(0, self._fernets.pop(index))
+            else:
+                self._append_key(raw_key, primary=True)
+            self._rebuild_cipher()
+    
+    def retire_key(self, raw_key) -> bool:
+        """Remove a non-primary key once no state is encrypted with it"""
+        with self._lock:
+            if isinstance(raw_key, str):
+                raw_key = raw_key.encode()
+            if raw_key not in self._raw_keys:
+                return False
+            index = self._raw_keys.index(raw_key)
+            if index == 0:
+                return False
+            del self._raw_keys[index]
+            del self._keys[index]
+            del self._fernets[index]
+            self._rebuild_cipher()
+            return True
+    
+    def encrypt(self, data: bytes) -> bytes:
+        start = time.perf_counter()
+        token = self.cipher.encrypt(data)
+        self.encrypt_seconds += time.perf_counter() - start
+        self.encrypt_count += 1
+        return token
+    
+    def decrypt(self, token: bytes) -> bytes:
+        start = time.perf_counter()
+        try:
+            return self.cipher.decrypt(token)
+        except InvalidToken:
+            self.decrypt_failures += 1
+            raise
+        finally:
+            self.decrypt_seconds += time.perf_counter() - start
+            self.decrypt_count += 1
+    
+    def rotate(self, token: bytes) -> bytes:
+        """Re-encrypt a token with the primary key"""
+        rotated = self.cipher.rotate(token)
+        self.rotate_count += 1
+        return rotated
+    
+    def get_timings(self) -> dict:
+        """Return key derivation and encryption timings (seconds)"""
+        return {
+            'key_count': self.key_count,
+            'derive_seconds': self.derive_seconds,
+            'encrypt_count': self.encrypt_count,
+            'encrypt_seconds': self.encrypt_seconds,
+            'encrypt_avg_seconds': self.encrypt_seconds / self.encrypt_count if self.encrypt_count else 0.0,
+            'decrypt_count': self.decrypt_count,
+            'decrypt_seconds': self.decrypt_seconds,
+            'decrypt_avg_seconds': self.decrypt_seconds / self.decrypt_count if self.decrypt_count else 0.0,
+            'decrypt_failures': self.decrypt_failures,
+            'rotate_count': self.rotate_count
+        }
+
+
+_key_manager = None
+_key_manager_lock = threading.Lock()
+
+
+def get_key_manager() -> KeyManager:
+    """
+    Get the shared key manager, deriving keys from config on first use
+    """
+    global _key_manager
+    if _key_manager is None:
+        with _key_manager_lock:
+            if _key_manager is None:
+                _key_manager = KeyManager(config.ENCRYPTION_KEY, config.ENCRYPTION_KEY_PREVIOUS)
+    return _key_manager
+
+
+def get_encryption_key() -> bytes:
+    """
+    Get the primary encryption key derived from config
+    """
+    return get_key_manager().primary_key
+
+
 def encrypt_state(state_data: dict) -> str:
     """
     Encrypt user state data
     """
-    key = get_encryption_key()
-    f = Fernet(key)
-    
     state_json = json.dumps(state_data)
-    encrypted = f.encrypt(state_json.encode())
+    encrypted = get_key_manager().encrypt(state_json.encode())
     
     return encrypted.decode()
 
@@ -56,10 +210,7 @@ def decrypt_state(encrypted_state: str) -> dict:
         return {}
     
     try:
-        key = get_encryption_key()
-        f = Fernet(key)
-        
-        decrypted = f.decrypt(encrypted_state.encode())
+        decrypted = get_key_manager().decrypt(encrypted_state.encode())
         state_data = json.loads(decrypted.decode())
         
         return state_data
@@ -67,6 +218,16 @@ def decrypt_state(encrypted_state: str) -> dict:
         return {}
 
 
+def rotate_state(encrypted_state: str) -> str:
+    """
+    Re-encrypt user state data with the primary key
+    """
+    if not encrypted_state:
+        return encrypted_state
+    
+    return get_key_manager().rotate(encrypted_state.encode()).decode()
+
+
 # ARGON2ID Configuration
 # Using recommended parameters for password hashing
 # time_cost: number of iterations (higher = more secure but slower)
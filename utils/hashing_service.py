@@ -0,0 +1,77 @@
+"""Async ARGON2ID hashing service backed by a bounded process pool"""
+
+import threading
+from typing import Optional
+
+import config
+from utils.encryption import ARGON2_PH, hash_password, verify_password, hash_account_number, verify_account_number
+from utils.worker_pool import BoundedProcessPool
+
+# Memory used by one ARGON2ID hash/verify (memory_cost is in KB)
+HASH_MEMORY_MB = max(1, ARGON2_PH.memory_cost // 1024)
+
+
+def workers_for_budget(memory_budget_mb: int) -> int:
+    """
+    Number of concurrent hashes that fit into the memory budget
+    Each hash needs HASH_MEMORY_MB (64 MB with the current parameters)
+    """
+    return max(1, int(memory_budget_mb) // HASH_MEMORY_MB)
+
+
+class HashingService(BoundedProcessPool):
+    """
+    Runs ARGON2ID hashing off the event loop
+
+    Work is sent to a process pool so hashing never holds the GIL of the bot
+    process. At most max_workers hashes run at the same time, which caps the
+    memory used by hashing to max_workers x HASH_MEMORY_MB. Extra requests wait
+    in a queue and are counted in the metrics.
+    """
+
+    def __init__(self, memory_budget_mb: int = None, max_workers: int = None, use_processes: bool = True):
+        if memory_budget_mb is None:
+            memory_budget_mb = config.HASH_MEMORY_BUDGET_MB
+        if max_workers is None:
+            max_workers = config.HASH_WORKERS or workers_for_budget(memory_budget_mb)
+
+        super().__init__('hashing', max_workers, use_processes=use_processes)
+        self.memory_budget_mb = memory_budget_mb
+
+    async def hash_password_async(self, password: str) -> str:
+        """Hash a password using ARGON2ID without blocking the event loop"""
+        return await self._run(hash_password, password)
+
+    async def verify_password_async(self, password_hash: str, password: str) -> bool:
+        """Verify a password against its hash without blocking the event loop"""
+        return await self._run(verify_password, password_hash, password)
+
+    async def hash_account_number_async(self, account_number: str) -> str:
+        """Hash an account number using ARGON2ID without blocking the event loop"""
+        return await self._run(hash_account_number, account_number)
+
+    async def verify_account_number_async(self, account_number_hash: str, account_number: str) -> bool:
+        """Verify an account number against its hash without blocking the event loop"""
+        return await self._run(verify_account_number, account_number_hash, account_number)
+
+    def get_metrics(self) -> dict:
+        """Return queue depth and timing metrics"""
+        return {
+            **super().get_metrics(),
+            'memory_budget_mb': self.memory_budget_mb,
+            'hash_memory_mb': HASH_MEMORY_MB
+        }
+
+
+_hashing_service: Optional[HashingService] = None
+_hashing_service_lock = threading.Lock()
+
+
+def get_hashing_service() -> HashingService:
+    """Get the shared hashing service"""
+    global _hashing_service
+    if _hashing_service is None:
+        with _hashing_service_lock:
+            if _hashing_service is None:
+                _hashing_service = HashingService()
+    return _hashing_service
@@ -1,36 +1,44 @@
 from datetime import datetime
 from typing import Tuple
-from database.db_manager import DatabaseManager
+from database.async_db_manager import AsyncDatabaseManager
+from database.update_context import get_update_context
 import config
 
 
 class LockManager:
-    def __init__(self, db_manager: DatabaseManager):
+    def __init__(self, db_manager: AsyncDatabaseManager):
         self.db = db_manager
     
-    def check_lock(self, user_id: str) -> Tuple[bool, str]:
+    async def check_lock(self, user_id: str) -> Tuple[bool, str]:
         """
         Check if user is locked
         Returns: (is_locked, message)
         """
-        if self.db.is_user_locked(user_id):
-            lock_info = self.db.get_lock_info(user_id)
-            if lock_info:
-                remaining = lock_info.locked_until - datetime.utcnow()
-                minutes = int(remaining.total_seconds() / 60)
-                seconds = int(remaining.total_seconds() % 60)
-                return True, f"اکانت شما به مدت {minutes} دقیقه و {seconds} ثانیه قفل شده است. لطفا صبر کنید."
+        update_context = get_update_context(user_id)
+        if update_context is not None:
+            # Loaded with the rest of the update's context, no query
+            locked_until = update_context.locked_until if update_context.is_locked else None
+        else:
+            # One session for both lookups
+            async with self.db.unit_of_work():
+                lock_info = await self.db.get_lock_info(user_id) if await self.db.is_user_locked(user_id) else None
+            locked_until = lock_info.locked_until if lock_info else None
+        if locked_until:
+            remaining = locked_until - datetime.utcnow()
+            minutes = int(remaining.total_seconds() / 60)
+            seconds = int(remaining.total_seconds() % 60)
+            return True, f"اکانت شما به مدت {minutes} دقیقه و {seconds} ثانیه قفل شده است. لطفا صبر کنید."
         return False, ""
     
-    def lock_user(self, user_id: str, reason: str = "تعداد تلاش‌های ناموفق بیش از حد"):
+    async def lock_user(self, user_id: str, reason: str = "تعداد تلاش‌های ناموفق بیش از حد"):
         """
         Lock user for 10 minutes
         """
-        self.db.lock_user(user_id, reason)
+        await self.db.lock_user(user_id, reason)
     
-    def unlock_user(self, user_id: str):
+    async def unlock_user(self, user_id: str):
         """
         Unlock user
         """
-        self.db.unlock_user(user_id)
+        await self.db.unlock_user(user_id)
 
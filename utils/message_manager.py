@@ -1,14 +1,99 @@
 """Utility functions for managing bot messages and deletion"""
 
+import asyncio
+import logging
+from typing import Dict, Optional, Tuple
+
 from telegram import Update
 from telegram.ext import ContextTypes
-from utils.encryption import decrypt_state, encrypt_state
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# deleteMessages accepts at most this many message ids per call
+DELETE_MESSAGES_LIMIT = 100
+
+
+class MessageDeleter:
+    """
+    Deletes messages in the background, grouped per chat
+
+    schedule() returns at once; a background task collects the messages
+    scheduled within MESSAGE_DELETE_BATCH_SECONDS and removes each chat's
+    messages with one deleteMessages call (or one deleteMessage per message
+    on a Bot API client without it). Failures are counted and logged only:
+    the message may already be gone or too old to delete.
+    """
+
+    def __init__(self, batch_seconds: float = None):
+        self.batch_seconds = config.MESSAGE_DELETE_BATCH_SECONDS if batch_seconds is None else batch_seconds
+        self._pending: Dict[int, Tuple[object, Dict[int, None]]] = {}  # chat id -> (bot, ordered message ids)
+        self._task: Optional[asyncio.Task] = None
+        self.scheduled = 0
+        self.deleted = 0
+        self.failed = 0
+        self.requests = 0
+
+    def schedule(self, bot, chat_id: int, *message_ids):
+        """Queue messages of chat_id for deletion (None ids are ignored)"""
+        message_ids = [message_id for message_id in message_ids if message_id]
+        if not message_ids:
+            return
+        _, pending = self._pending.setdefault(chat_id, (bot, {}))
+        pending.update(dict.fromkeys(message_ids))
+        self.scheduled += len(message_ids)
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        await asyncio.sleep(self.batch_seconds)
+        while self._pending:
+            pending, self._pending = self._pending, {}
+            await asyncio.gather(*(self._delete(bot, chat_id, list(message_ids))
+                                   for chat_id, (bot, message_ids) in pending.items()))
+
+    async def _delete(self, bot, chat_id: int, message_ids: list):
+        if hasattr(bot, 'delete_messages'):
+            chunks = [message_ids[start:start + DELETE_MESSAGES_LIMIT]
+                      for start in range(0, len(message_ids), DELETE_MESSAGES_LIMIT)]
+            for chunk in chunks:
+                await self._call(chat_id, len(chunk), lambda: bot.delete_messages(chat_id=chat_id, message_ids=chunk))
+        else:
+            for message_id in message_ids:
+                await self._call(chat_id, 1, lambda: bot.delete_message(chat_id=chat_id, message_id=message_id))
+
+    async def _call(self, chat_id: int, count: int, request):
+        self.requests += 1
+        try:
+            await request()
+            self.deleted += count
+        except Exception as e:
+            self.failed += count
+            logger.debug(f"Could not delete {count} message(s) in chat {chat_id}: {e}")
+
+    async def drain(self):
+        """Wait for the scheduled deletions to finish (shutdown, tests)"""
+        while self._task is not None and not self._task.done():
+            await self._task
+
+    def snapshot(self) -> dict:
+        return {'scheduled': self.scheduled, 'deleted': self.deleted, 'failed': self.failed,
+                'requests': self.requests, 'pending': sum(len(ids) for _, ids in self._pending.values())}
+
+
+_message_deleter = MessageDeleter()
+
+
+def get_message_deleter() -> MessageDeleter:
+    return _message_deleter
 
 
 async def delete_previous_messages(update: Update, context: ContextTypes.DEFAULT_TYPE, 
                                    db_manager, user_id: str, delete_user_message: bool = True):
     """
-    Delete previous bot message (if stored in state) and optionally user message
+    Schedule deletion of the previous bot message (if stored in state) and optionally the user message
     
     Args:
         update: Telegram update object
@@ -20,38 +105,19 @@ async def delete_previous_messages(update: Update, context: ContextTypes.DEFAULT
     Returns:
         None
     """
-    # Delete user message if requested
+    message_ids = []
     if delete_user_message and update.message:
-        try:
-            await update.message.delete()
-        except:
-            pass
+        message_ids.append(update.message.message_id)
     
-    # Get state and delete previous bot message
-    encrypted_state = db_manager.get_user_state(user_id)
-    if encrypted_state:
-        state = decrypt_state(encrypted_state)
-        last_bot_message_id = state.get('last_bot_message_id')
-        
-        if last_bot_message_id:
-            try:
-                await context.bot.delete_message(
-                    chat_id=update.effective_chat.id,
-                    message_id=last_bot_message_id
-                )
-                # Clear the message ID from state after successful deletion
-                state.pop('last_bot_message_id', None)
-                encrypted_state = encrypt_state(state)
-                db_manager.update_user_state(user_id, encrypted_state)
-            except Exception as e:
-                # Message might already be deleted or not accessible
-                # Try to clear from state anyway to prevent stale references
-                try:
-                    state.pop('last_bot_message_id', None)
-                    encrypted_state = encrypt_state(state)
-                    db_manager.update_user_state(user_id, encrypted_state)
-                except:
-                    pass
+    # Drop the previous bot message id whether or not its deletion succeeds; inside an update
+    # this is written together with the handler's other state changes
+    state = await db_manager.get_state(user_id)
+    if state and state.get('last_bot_message_id'):
+        message_ids.append(state.pop('last_bot_message_id'))
+        await db_manager.set_state(user_id, state)
+    
+    # Deleted in the background, so the reply does not wait for the Bot API
+    get_message_deleter().schedule(context.bot, update.effective_chat.id, *message_ids)
 
 
 async def send_and_save_message(context: ContextTypes.DEFAULT_TYPE, chat_id: int, 
@@ -73,7 +139,6 @@ async def send_and_save_message(context: ContextTypes.DEFAULT_TYPE, chat_id: int
     Returns:
         Message object
     """
-    from utils.encryption import decrypt_state, encrypt_state
     
     # Send message
     message = await context.bot.send_message(
@@ -85,15 +150,9 @@ async def send_and_save_message(context: ContextTypes.DEFAULT_TYPE, chat_id: int
     )
     
     # Save message ID in state
-    encrypted_state = db_manager.get_user_state(user_id)
-    if encrypted_state:
-        state = decrypt_state(encrypted_state)
-    else:
-        state = {}
-    
+    state = await db_manager.get_state(user_id)
     state['last_bot_message_id'] = message.message_id
-    encrypted_state = encrypt_state(state)
-    db_manager.update_user_state(user_id, encrypted_state)
+    await db_manager.set_state(user_id, state)
     
     return message
 
@@ -117,7 +176,6 @@ async def edit_and_save_message(update: Update, context: ContextTypes.DEFAULT_TY
     Returns:
         Message object
     """
-    from utils.encryption import decrypt_state, encrypt_state
     
     if not update.callback_query:
         return None
@@ -131,14 +189,8 @@ async def edit_and_save_message(update: Update, context: ContextTypes.DEFAULT_TY
     )
     
     # Save message ID in state
-    encrypted_state = db_manager.get_user_state(user_id)
-    if encrypted_state:
-        state = decrypt_state(encrypted_state)
-    else:
-        state = {}
-    
+    state = await db_manager.get_state(user_id)
     state['last_bot_message_id'] = message.message_id
-    encrypted_state = encrypt_state(state)
-    db_manager.update_user_state(user_id, encrypted_state)
+    await db_manager.set_state(user_id, state)
     
     return message
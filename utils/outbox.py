@@ -0,0 +1,138 @@
+"""Dispatcher that delivers the messages queued in the outbox table"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from telegram.error import BadRequest, ChatMigrated, Forbidden, RetryAfter
+
+import config
+from utils.rate_limiter import PRIORITY_NOTIFICATION
+from database.events import Event, get_event_bus
+
+logger = logging.getLogger(__name__)
+
+# Errors that resending the same message cannot fix (chat not found, bot blocked, ...)
+PERMANENT_ERRORS = (BadRequest, Forbidden, ChatMigrated)
+
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff after the given number of failed attempts"""
+    return min(config.OUTBOX_BACKOFF_SECONDS * 2 ** (attempts - 1), config.OUTBOX_MAX_BACKOFF_SECONDS)
+
+
+class OutboxDispatcher:
+    """
+    Drains the outbox with the bot's (connection-pooled) Bot
+
+    Each round claims a batch of due messages (the oldest pending one of each
+    chat, see DatabaseManager.claim_outbox_batch), sends them with at most
+    OUTBOX_WORKERS requests in flight, then records the outcome: delivered
+    messages in one write, failures with a retry time (the RetryAfter of a
+    flood limit, otherwise exponential backoff) or, after OUTBOX_MAX_ATTEMPTS
+    or a permanent error, as dead letters.
+
+    Messages committed in this process wake the dispatcher at once; others
+    (e.g. from the web panel) are picked up within OUTBOX_POLL_SECONDS.
+    """
+
+    def __init__(self, db, bot, workers: int = None, batch_size: int = None):
+        self.db = db
+        self.bot = bot
+        self.workers = workers or config.OUTBOX_WORKERS
+        self.batch_size = batch_size or config.OUTBOX_BATCH_SIZE
+        self._semaphore = asyncio.Semaphore(self.workers)
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._last_prune = 0.0
+        self.sent = 0
+        self.retried = 0
+        self.dead = 0
+        self.rounds = 0
+
+    def _on_event(self, event: Event):
+        # Runs in the committing thread
+        if event.type == 'outbox' and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    async def run(self):
+        """Deliver messages until stop() is called"""
+        self._loop = asyncio.get_running_loop()
+        get_event_bus().add_listener(self._on_event)
+        try:
+            while not self._stopping:
+                try:
+                    claimed = await self.run_once()
+                except Exception as e:
+                    logger.error(f"Outbox dispatcher error: {e}", exc_info=True)
+                    claimed = 0
+                if claimed == 0 and not self._stopping:
+                    # Nothing due: sleep until a new message is committed or the poll interval ends
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), config.OUTBOX_POLL_SECONDS)
+                    except asyncio.TimeoutError:
+                        pass
+                    self._wake.clear()
+        finally:
+            get_event_bus().remove_listener(self._on_event)
+
+    async def run_once(self) -> int:
+        """Claim and send one batch; returns the number of messages claimed"""
+        if time.monotonic() - self._last_prune > 3600:
+            self._last_prune = time.monotonic()
+            await self.db.prune_outbox(datetime.utcnow() - timedelta(hours=config.OUTBOX_RETENTION_HOURS))
+
+        batch = await self.db.claim_outbox_batch(self.batch_size, config.OUTBOX_LEASE_SECONDS)
+        if not batch:
+            return 0
+        self.rounds += 1
+        errors = await asyncio.gather(*(self._send(message) for message in batch))
+
+        sent_ids = [message['id'] for message, error in zip(batch, errors) if error is None]
+        if sent_ids:
+            await self.db.mark_outbox_sent(sent_ids)
+            self.sent += len(sent_ids)
+        for message, error in zip(batch, errors):
+            if error is not None:
+                await self._record_failure(message, error)
+        return len(batch)
+
+    async def _send(self, message: Dict) -> Optional[Exception]:
+        async with self._semaphore:
+            try:
+                if getattr(self.bot, 'rate_limiter', None):
+                    # Behind interactive replies; a flood limit is rescheduled here rather than waited out
+                    await self.bot.send_message(chat_id=message['chat_id'], text=message['text'],
+                                                rate_limit_args={'priority': PRIORITY_NOTIFICATION,
+                                                                 'max_retries': 0})
+                else:
+                    await self.bot.send_message(chat_id=message['chat_id'], text=message['text'])
+                return None
+            except Exception as e:
+                return e
+
+    async def _record_failure(self, message: Dict, error: Exception):
+        if isinstance(error, PERMANENT_ERRORS) or message['attempts'] >= config.OUTBOX_MAX_ATTEMPTS:
+            retry_at = None
+            self.dead += 1
+            logger.error(f"Outbox message {message['id']} ({message['kind']}) to {message['chat_id']} "
+                         f"dead-lettered after {message['attempts']} attempts: {error}")
+        else:
+            delay = error.retry_after if isinstance(error, RetryAfter) else retry_delay(message['attempts'])
+            retry_at = datetime.utcnow() + timedelta(seconds=delay)
+            self.retried += 1
+            logger.warning(f"Outbox message {message['id']} to {message['chat_id']} failed, retrying in {delay}s: "
+                           f"{error}")
+        await self.db.mark_outbox_failed(message['id'], f"{type(error).__name__}: {error}", retry_at)
+
+    def stop(self):
+        """Finish the current batch and return from run()"""
+        self._stopping = True
+        self._wake.set()
+
+    def snapshot(self) -> Dict:
+        return {'sent': self.sent, 'retried': self.retried, 'dead': self.dead, 'rounds': self.rounds,
+                'workers': self.workers, 'batch_size': self.batch_size}
@@ -5,13 +5,22 @@ from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph,
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_CENTER, TA_RIGHT
 from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfbase.ttfonts import TTFont, TTFontMaker
 from io import BytesIO
 from datetime import datetime
-from typing import List
+from functools import lru_cache
+from types import SimpleNamespace
+from typing import Dict, List
+import logging
 import os
+import re
+import struct
+import threading
+import config
 from database.models import Transaction
 
+logger = logging.getLogger(__name__)
+
 # Import for Persian (Jalali) date conversion
 try:
     import jdatetime
@@ -62,225 +71,300 @@ def convert_to_jalali_short(dt: datetime) -> str:
         return dt.strftime('%Y/%m/%d %H:%M')
 
 
+# Markup tags (<b>...) are kept as they are; only the text between them is shaped
+TAG_PATTERN = re.compile(r'(<[^>]+>)')
+# Text without Arabic-script letters or digits (amounts, account numbers, dates) needs no shaping
+# and is not cached
+PERSIAN_PATTERN = re.compile(r'[\u0600-\u06FF\uFB50-\uFDFF\uFE70-\uFEFF]')
+
+# Distinct strings kept shaped; labels repeat on every statement
+SHAPING_CACHE_SIZE = 4096
+
+
 def reshape_persian_text(text: str) -> str:
     """
     Reshape Persian text for proper rendering and apply RTL direction
     Handles HTML tags by reshaping only the text content
     """
-    if not PERSIAN_SUPPORT:
+    if not PERSIAN_SUPPORT or not PERSIAN_PATTERN.search(text):
         return text
-    
+    return _shape_text(text)
+
+
+@lru_cache(maxsize=SHAPING_CACHE_SIZE)
+def _shape_text(text: str) -> str:
     try:
-        # Check if text contains HTML tags
-        import re
-        # Find all HTML tags
-        html_pattern = r'<[^>]+>'
-        tags = re.findall(html_pattern, text)
-        
-        if tags:
-            # Extract text parts and HTML tags separately
-            parts = re.split(html_pattern, text)
-            result_parts = []
-            tag_index = 0
-            
-            for i, part in enumerate(parts):
-                if part:  # Text part
-                    # Reshape only the text part
-                    reshaped = arabic_reshaper.reshape(part)
-                    bidi_text = bidi_algorithm.get_display(reshaped)
-                    result_parts.append(bidi_text)
-                
-                # Add HTML tag if exists
-                if tag_index < len(tags):
-                    result_parts.append(tags[tag_index])
-                    tag_index += 1
-            
-            return ''.join(result_parts)
-        else:
-            # No HTML tags, reshape directly
-            reshaped_text = arabic_reshaper.reshape(text)
-            bidi_text = bidi_algorithm.get_display(reshaped_text)
-            return bidi_text
+        # Odd positions of the split are the tags
+        parts = TAG_PATTERN.split(text)
+        for i in range(0, len(parts), 2):
+            if parts[i]:
+                parts[i] = bidi_algorithm.get_display(arabic_reshaper.reshape(parts[i]))
+        return ''.join(parts)
     except Exception:
         # If reshaping fails, return original text
         return text
 
-# Register Persian-supporting fonts
-# Try common Windows Persian fonts
-PERSIAN_FONT = None
-PERSIAN_FONT_BOLD = None
-
-# Common Persian font paths on Windows
-# Priority: Persian-specific fonts first, then Unicode-supporting fonts
-font_paths = [
-    (r"C:\Windows\Fonts\BNazanin.ttf", "B-Nazanin"),
-    (r"C:\Windows\Fonts\BNazaninBd.ttf", "B-Nazanin-Bold"),
-    (r"C:\Windows\Fonts\BTitrBd.ttf", "B-Titr-Bold"),
-    (r"C:\Windows\Fonts\tahoma.ttf", "Tahoma"),
-    (r"C:\Windows\Fonts\tahomabd.ttf", "Tahoma-Bold"),
-    (r"C:\Windows\Fonts\arial.ttf", "Arial"),
-    (r"C:\Windows\Fonts\arialbd.ttf", "Arial-Bold"),
-]
-
-# Register fonts - try to find both regular and bold versions
-regular_font_path = None
-bold_font_path = None
-
-for font_path, font_name in font_paths:
-    if os.path.exists(font_path):
+# Persian fonts are registered on the first PDF (register_fonts), not at import: parsing the
+# two faces takes ~40ms and most processes that import this module never render a PDF.
+# The names are fixed so the styles below can refer to them before that.
+PERSIAN_FONT = 'PersianSans'
+PERSIAN_FONT_BOLD = 'PersianSans-Bold'
+
+FONT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fonts')
+BUNDLED_FONT_PATH = os.path.join(FONT_DIR, 'DejaVuSans.ttf')
+BUNDLED_FONT_BOLD_PATH = os.path.join(FONT_DIR, 'DejaVuSans-Bold.ttf')
+
+# Font subsets kept per font; statements draw the same labels in the same order, so their
+# subsets repeat from one document to the next
+SUBSET_CACHE_SIZE = 256
+
+# Tables a PDF viewer does not read from an embedded TrueType font; 'name' alone is ~15KB
+# of DejaVu's copyright and naming strings in every subset
+UNUSED_SUBSET_TABLES = ('name',)
+
+_fonts_lock = threading.Lock()
+_fonts_registered = False
+
+
+def _register_font_family():
+    # Paragraphs look the family up when they are built (and for <b>), before any font is loaded
+    pdfmetrics.registerFontFamily(PERSIAN_FONT, normal=PERSIAN_FONT, bold=PERSIAN_FONT_BOLD)
+
+
+_register_font_family()
+
+
+def _without_tables(font: bytes, tags) -> bytes:
+    """A TrueType font file without the given tables"""
+    maker = TTFontMaker()
+    count = struct.unpack('>H', font[4:6])[0]
+    for index in range(count):
+        tag, _, offset, length = struct.unpack('>4sIII', font[12 + 16*index:28 + 16*index])
+        tag = tag.decode('latin1')
+        if tag not in tags:
+            maker.add(tag, font[offset:offset + length])
+    return maker.makeStream()
+
+
+class SubsetCachingTTFont(TTFont):
+    """
+    TTFont that embeds only the glyphs a document uses and reuses the subsets it builds
+
+    reportlab builds each font subset (up to 256 glyphs) from the full font
+    when a document is saved, and by default puts all of ASCII in the first
+    one so the PDF source stays readable. Here only used characters go in
+    and unused tables are dropped.
+
+    A subset's bytes depend on its characters and their codes, which
+    reportlab hands out in the order a document first draws them. The
+    characters of glyph_order (what statements are made of) get fixed codes
+    instead, filled in only when a document uses them, so documents drawing
+    the same characters share one cached subset.
+    """
+
+    def __init__(self, name: str, filename: str, glyph_order: str = ''):
+        super().__init__(name, filename, asciiReadable=False)
+        self._codes: Dict[int, int] = {}
+        code = 1
+        for char in sorted(set(glyph_order)):
+            if ord(char) == 32 or ord(char) not in self.face.charToGlyph:
+                continue
+            if code == 32:
+                # Code 32 is always the space
+                code += 1
+            if code > 0xFF:
+                break
+            self._codes[ord(char)] = code
+            code += 1
+        self._next_code = code
+
+        make_subset = self.face.makeSubset
+        self._make_subset = lru_cache(maxsize=SUBSET_CACHE_SIZE)(
+            lambda codes: _without_tables(make_subset(list(codes)), UNUSED_SUBSET_TABLES)
+        )
+        self.face.makeSubset = lambda subset: self._make_subset(tuple(subset))
+
+    def splitString(self, text, doc, encoding='utf-8'):
+        state = self.state.get(doc)
+        if state is None:
+            state = self.state[doc] = TTFont.State(False, self)
+            state.assignments.update(self._codes)
+            # Unused fixed codes stay spaces, like reportlab's own unused codes below 32
+            state.subsets[0].extend([32] * (self._next_code - len(state.subsets[0])))
+            state.nextCode = self._next_code
+        if not isinstance(text, str):
+            text = text.decode(encoding)
+        first = state.subsets[0]
+        for char in text:
+            code = self._codes.get(ord(char))
+            if code is not None:
+                first[code] = ord(char)
+        return super().splitString(text, doc, encoding)
+
+    def subset_cache_info(self):
+        return self._make_subset.cache_info()
+
+
+def _statement_glyphs() -> str:
+    """The characters statements are drawn from: digits, number punctuation and the shaped labels"""
+    labels = [TITLE_TEXT, "شماره حساب:", "تاریخ گزارش:", *TABLE_HEADER_LABELS,
+              *TRANSACTION_TYPE_LABELS.values(), *STATUS_LABELS.values()]
+    return "0123456789,.:/-" + ''.join(reshape_persian_text(label) for label in labels)
+
+
+def _load_font(name: str, path: str, bundled_path: str) -> TTFont:
+    if path:
         try:
-            pdfmetrics.registerFont(TTFont(font_name, font_path))
-            if "Bold" in font_name or "bd" in font_path.lower() or "Bd" in font_path:
-                if bold_font_path is None:
-                    bold_font_path = font_name
-                    PERSIAN_FONT_BOLD = font_name
-            else:
-                if regular_font_path is None:
-                    regular_font_path = font_name
-                    PERSIAN_FONT = font_name
-        except Exception:
-            continue
-
-# If we found a regular font but no bold, use the regular font for both
-if PERSIAN_FONT and not PERSIAN_FONT_BOLD:
-    PERSIAN_FONT_BOLD = PERSIAN_FONT
-
-# If no font found, use default (will have encoding issues but won't crash)
-if PERSIAN_FONT is None:
-    PERSIAN_FONT = 'Helvetica'
-    PERSIAN_FONT_BOLD = 'Helvetica-Bold'
-if PERSIAN_FONT_BOLD is None:
-    PERSIAN_FONT_BOLD = PERSIAN_FONT
+            return SubsetCachingTTFont(name, path, _statement_glyphs())
+        except Exception as e:
+            logger.warning(f"Could not load PDF font {path}, using the bundled one: {e}")
+    return SubsetCachingTTFont(name, bundled_path, _statement_glyphs())
+
+
+def register_fonts():
+    """Register PERSIAN_FONT and PERSIAN_FONT_BOLD with reportlab; cheap after the first call"""
+    global _fonts_registered
+    if _fonts_registered:
+        return
+    with _fonts_lock:
+        if _fonts_registered:
+            return
+        pdfmetrics.registerFont(_load_font(PERSIAN_FONT, config.PDF_FONT_PATH, BUNDLED_FONT_PATH))
+        pdfmetrics.registerFont(_load_font(PERSIAN_FONT_BOLD, config.PDF_FONT_BOLD_PATH or config.PDF_FONT_PATH,
+                                           BUNDLED_FONT_BOLD_PATH))
+        # registerFont maps <b> of PERSIAN_FONT to itself
+        _register_font_family()
+        _fonts_registered = True
+
+
+# Styles and the table's fixed parts, built once per process instead of per statement
+_SAMPLE_STYLES = getSampleStyleSheet()
+
+TITLE_STYLE = ParagraphStyle(
+    'CustomTitle',
+    parent=_SAMPLE_STYLES['Heading1'],
+    fontName=PERSIAN_FONT_BOLD,
+    fontSize=18,
+    textColor=colors.HexColor('#1a1a1a'),
+    spaceAfter=30,
+    alignment=TA_CENTER
+)
+
+NORMAL_STYLE = ParagraphStyle(
+    'CustomNormal',
+    parent=_SAMPLE_STYLES['Normal'],
+    fontName=PERSIAN_FONT,
+    fontSize=10,
+    alignment=TA_RIGHT
+)
+
+TABLE_CELL_STYLE = ParagraphStyle(
+    'TableCell',
+    parent=_SAMPLE_STYLES['Normal'],
+    fontName=PERSIAN_FONT,
+    fontSize=9,
+    alignment=TA_CENTER
+)
+
+TABLE_HEADER_STYLE = ParagraphStyle(
+    'TableHeader',
+    parent=_SAMPLE_STYLES['Normal'],
+    fontName=PERSIAN_FONT_BOLD,
+    fontSize=10,
+    alignment=TA_CENTER,
+    textColor=colors.whitesmoke
+)
+
+TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4a90e2')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), PERSIAN_FONT_BOLD),
+    ('FONTSIZE', (0, 0), (-1, 0), 10),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+    ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+    ('FONTNAME', (0, 1), (-1, -1), PERSIAN_FONT),
+    ('FONTSIZE', (0, 1), (-1, -1), 9),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey]),
+])
+
+TABLE_COL_WIDTHS = [2*cm, 3*cm, 3*cm, 2.5*cm, 2*cm, 2*cm, 3*cm]
+
+TABLE_HEADER_LABELS = ('نوع', 'از حساب', 'به حساب', 'مبلغ', 'کارمزد', 'وضعیت', 'تاریخ')
+
+# Header row, shared by every statement (a worker process renders one statement at a time)
+TABLE_HEADER = [Paragraph(reshape_persian_text(label), TABLE_HEADER_STYLE) for label in TABLE_HEADER_LABELS]
+
+TITLE_TEXT = reshape_persian_text("۱۰ گردش آخر حساب")
+
+TRANSACTION_TYPE_LABELS = {
+    'buy': 'خرید',
+    'send': 'ارسال',
+    'sell': 'فروش'
+}
+
+STATUS_LABELS = {
+    'pending': 'در انتظار',
+    'success': 'موفق',
+    'failed': 'ناموفق'
+}
+
+
+def statement_cells(trans) -> List[str]:
+    """The table cells of one transaction, in TABLE_HEADER_LABELS order (not yet reshaped)"""
+    trans_type = TRANSACTION_TYPE_LABELS.get(trans.transaction_type, trans.transaction_type)
+    status = STATUS_LABELS.get(trans.status, trans.status)
+    
+    from_acc = trans.from_account or '-'
+    to_acc = trans.to_account or '-'
+    amount = f"{float(trans.amount):,.2f}"
+    # Ensure fee is properly converted from Decimal/None to float
+    fee_value = float(trans.fee) if trans.fee is not None else 0.0
+    fee = f"{fee_value:,.2f}"
+    date = convert_to_jalali_short(trans.created_at)
+    return [trans_type, str(from_acc), str(to_acc), amount, fee, status, date]
 
 
 def generate_transactions_pdf(transactions: List[Transaction], account_number: str) -> BytesIO:
     """
     Generate PDF file for last 10 transactions
     """
+    register_fonts()
     buffer = BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=2*cm, leftMargin=2*cm, topMargin=2*cm, bottomMargin=2*cm)
     
     # Container for the 'Flowable' objects
     elements = []
     
-    # Define styles
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontName=PERSIAN_FONT_BOLD,
-        fontSize=18,
-        textColor=colors.HexColor('#1a1a1a'),
-        spaceAfter=30,
-        alignment=TA_CENTER
-    )
-    
-    normal_style = ParagraphStyle(
-        'CustomNormal',
-        parent=styles['Normal'],
-        fontName=PERSIAN_FONT,
-        fontSize=10,
-        alignment=TA_RIGHT
-    )
-    
     # Title
-    title_text = reshape_persian_text("۱۰ گردش آخر حساب")
-    title = Paragraph(title_text, title_style)
-    elements.append(title)
+    elements.append(Paragraph(TITLE_TEXT, TITLE_STYLE))
     elements.append(Spacer(1, 0.5*cm))
     
     # Account number
     account_text_raw = f"شماره حساب: <b>{account_number}</b>"
-    account_text = Paragraph(reshape_persian_text(account_text_raw), normal_style)
+    account_text = Paragraph(reshape_persian_text(account_text_raw), NORMAL_STYLE)
     elements.append(account_text)
     elements.append(Spacer(1, 0.3*cm))
     
     # Date (using Jalali calendar)
     report_date = convert_to_jalali(datetime.now())
     date_text_raw = f"تاریخ گزارش: {report_date}"
-    date_text = Paragraph(reshape_persian_text(date_text_raw), normal_style)
+    date_text = Paragraph(reshape_persian_text(date_text_raw), NORMAL_STYLE)
     elements.append(date_text)
     elements.append(Spacer(1, 0.5*cm))
     
-    # Table cell style
-    table_cell_style = ParagraphStyle(
-        'TableCell',
-        parent=styles['Normal'],
-        fontName=PERSIAN_FONT,
-        fontSize=9,
-        alignment=TA_CENTER
-    )
-    
-    table_header_style = ParagraphStyle(
-        'TableHeader',
-        parent=styles['Normal'],
-        fontName=PERSIAN_FONT_BOLD,
-        fontSize=10,
-        alignment=TA_CENTER,
-        textColor=colors.whitesmoke
-    )
-    
     # Table data - use Paragraph objects for proper Persian text rendering
-    table_data = [[
-        Paragraph(reshape_persian_text('نوع'), table_header_style),
-        Paragraph(reshape_persian_text('از حساب'), table_header_style),
-        Paragraph(reshape_persian_text('به حساب'), table_header_style),
-        Paragraph(reshape_persian_text('مبلغ'), table_header_style),
-        Paragraph(reshape_persian_text('کارمزد'), table_header_style),
-        Paragraph(reshape_persian_text('وضعیت'), table_header_style),
-        Paragraph(reshape_persian_text('تاریخ'), table_header_style)
-    ]]
+    table_data = [TABLE_HEADER]
     
     for trans in transactions:
-        trans_type = {
-            'buy': 'خرید',
-            'send': 'ارسال',
-            'sell': 'فروش'
-        }.get(trans.transaction_type, trans.transaction_type)
-        
-        status = {
-            'pending': 'در انتظار',
-            'success': 'موفق',
-            'failed': 'ناموفق'
-        }.get(trans.status, trans.status)
-        
-        from_acc = trans.from_account or '-'
-        to_acc = trans.to_account or '-'
-        amount = f"{float(trans.amount):,.2f}"
-        # Ensure fee is properly converted from Decimal/None to float
-        fee_value = float(trans.fee) if trans.fee is not None else 0.0
-        fee = f"{fee_value:,.2f}"
-        date = convert_to_jalali_short(trans.created_at)
-        
         # Use Paragraph objects for all cells and reshape Persian text
-        table_data.append([
-            Paragraph(reshape_persian_text(trans_type), table_cell_style),
-            Paragraph(reshape_persian_text(str(from_acc)), table_cell_style),
-            Paragraph(reshape_persian_text(str(to_acc)), table_cell_style),
-            Paragraph(reshape_persian_text(amount), table_cell_style),
-            Paragraph(reshape_persian_text(fee), table_cell_style),
-            Paragraph(reshape_persian_text(status), table_cell_style),
-            Paragraph(reshape_persian_text(date), table_cell_style)
-        ])
+        table_data.append([Paragraph(reshape_persian_text(cell), TABLE_CELL_STYLE) for cell in statement_cells(trans)])
     
     # Create table
-    table = Table(table_data, colWidths=[2*cm, 3*cm, 3*cm, 2.5*cm, 2*cm, 2*cm, 3*cm])
-    
-    # Style the table
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4a90e2')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), PERSIAN_FONT_BOLD),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-        ('FONTNAME', (0, 1), (-1, -1), PERSIAN_FONT),
-        ('FONTSIZE', (0, 1), (-1, -1), 9),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey]),
-    ]))
+    table = Table(table_data, colWidths=TABLE_COL_WIDTHS)
+    table.setStyle(TABLE_STYLE)
     
     elements.append(table)
     
@@ -290,3 +374,20 @@ def generate_transactions_pdf(transactions: List[Transaction], account_number: s
     
     return buffer
 
+
+def transaction_rows(transactions: List[Transaction]) -> List[Dict]:
+    """The fields generate_transactions_pdf uses, as plain dicts that can be sent to a worker process"""
+    return [{
+        'transaction_type': trans.transaction_type,
+        'from_account': trans.from_account,
+        'to_account': trans.to_account,
+        'amount': trans.amount,
+        'fee': trans.fee,
+        'status': trans.status,
+        'created_at': trans.created_at
+    } for trans in transactions]
+
+
+def render_transactions_pdf(rows: List[Dict], account_number: str) -> bytes:
+    """generate_transactions_pdf for transaction_rows(); runs in the PDF worker processes"""
+    return generate_transactions_pdf([SimpleNamespace(**row) for row in rows], account_number).getvalue()
@@ -0,0 +1,94 @@
+"""Async PDF rendering service backed by a bounded process pool"""
+
+import asyncio
+import threading
+from typing import Dict, Hashable, List, Optional
+
+import config
+from utils.pdf_generator import render_transactions_pdf, transaction_rows
+from utils.worker_pool import BoundedProcessPool
+
+
+class RenderQueueFull(Exception):
+    """More statements are waiting for a worker than PDF_QUEUE_LIMIT allows"""
+
+
+class PdfRenderService(BoundedProcessPool):
+    """
+    Renders PDFs off the event loop
+
+    reportlab is pure Python, so a statement rendered in the bot process
+    holds the GIL and stalls every other update. Jobs are sent to a process
+    pool instead; at most max_workers render at the same time and at most
+    queue_limit wait for a free worker. Beyond that render() raises
+    RenderQueueFull so the handler can ask the user to try again.
+
+    A request for a key that is already queued or rendering (the same user
+    asking twice) waits for that job instead of starting another. A render
+    that takes longer than timeout seconds raises asyncio.TimeoutError.
+    """
+
+    def __init__(self, max_workers: int = None, queue_limit: int = None, timeout: float = None,
+                 use_processes: bool = True):
+        super().__init__('pdf', max_workers or config.PDF_WORKERS, use_processes=use_processes,
+                         timeout=config.PDF_RENDER_TIMEOUT_SECONDS if timeout is None else timeout)
+        self.queue_limit = max(0, int(config.PDF_QUEUE_LIMIT if queue_limit is None else queue_limit))
+        self._jobs: Dict[Hashable, asyncio.Future] = {}
+
+        self.rejected = 0
+        self.deduplicated = 0
+
+    async def render(self, key: Optional[Hashable], func, *args) -> bytes:
+        """
+        func(*args) in a worker; func must be a module-level function returning bytes
+        Requests with the same key (None: never shared) share one job.
+        """
+        job = self._jobs.get(key) if key is not None else None
+        if job is not None:
+            self.deduplicated += 1
+        else:
+            if self.queue_depth + self.in_flight >= self.max_workers + self.queue_limit:
+                self.rejected += 1
+                raise RenderQueueFull(f"{self.queue_depth} PDF jobs already waiting")
+            # Counted here, not in the job, so a burst in one loop iteration cannot pass the limit
+            job = asyncio.ensure_future(self._execute(func, args, self._enqueue()))
+            if key is not None:
+                self._jobs[key] = job
+            job.add_done_callback(lambda done: self._job_done(key, done))
+        # The job keeps running for the other requesters if this one is cancelled
+        return await asyncio.shield(job)
+
+    def _job_done(self, key, job: asyncio.Future):
+        if key is not None and self._jobs.get(key) is job:
+            del self._jobs[key]
+        if not job.cancelled():
+            # Retrieved here so a job whose requesters all went away does not log "never retrieved"
+            job.exception()
+
+    async def render_transactions(self, user_id: str, transactions: List, account_number: str) -> bytes:
+        """Statement PDF of transactions; one job per user and account at a time"""
+        return await self.render((user_id, account_number), render_transactions_pdf,
+                                 transaction_rows(transactions), account_number)
+
+    def get_metrics(self) -> dict:
+        """Return queue depth and timing metrics"""
+        metrics = super().get_metrics()
+        metrics['avg_render_seconds'] = metrics.pop('avg_run_seconds')
+        metrics['max_render_seconds'] = metrics.pop('max_run_seconds')
+        metrics['avg_failed_render_seconds'] = metrics.pop('avg_failed_seconds')
+        return {**metrics, 'queue_limit': self.queue_limit, 'rejected': self.rejected,
+                'deduplicated': self.deduplicated}
+
+
+_pdf_service: Optional[PdfRenderService] = None
+_pdf_service_lock = threading.Lock()
+
+
+def get_pdf_service() -> PdfRenderService:
+    """Get the shared PDF rendering service"""
+    global _pdf_service
+    if _pdf_service is None:
+        with _pdf_service_lock:
+            if _pdf_service is None:
+                _pdf_service = PdfRenderService()
+    return _pdf_service
@@ -0,0 +1,236 @@
+"""Rate limiting and prioritisation of the bot's Telegram API requests"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Any, Callable, Coroutine, Dict, List, Optional
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Request priorities, lowest value first: replies to the user, then queued notifications, then cleanup
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NOTIFICATION = 1
+PRIORITY_CLEANUP = 2
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: 'interactive', PRIORITY_NOTIFICATION: 'notification',
+                  PRIORITY_CLEANUP: 'cleanup'}
+
+# Upper bounds (seconds) of the wait time histogram buckets; the last bucket is everything above
+WAIT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Endpoints that post or change a message in a chat, and so count against the chat's limit
+CHAT_LIMITED_PREFIXES = ('send', 'edit', 'copy', 'forward')
+
+# Limiter of the bot running in this process (run_all.py runs the web panel beside it)
+_running_limiter: Optional['TelegramRateLimiter'] = None
+
+
+class TokenBucket:
+    """
+    rate tokens per second, at most capacity saved up, handed out by priority
+
+    A request takes a token at once if nobody is waiting; otherwise it joins
+    a heap ordered by (priority, arrival) and only the head of the heap waits
+    for the next token, so a later interactive request overtakes queued
+    notifications.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._waiters: List[list] = []  # [priority, seq, future]
+        self._seq = itertools.count()
+
+    def _delay(self, now: float) -> float:
+        """Seconds until the next token may be taken"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        shortfall = (1 - self.tokens) / self.rate if self.tokens < 1 else 0.0
+        return max(shortfall, self.paused_until - now, 0.0)
+
+    def pause(self, seconds: float):
+        """Hand out no tokens for seconds (after a RetryAfter)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def idle(self) -> bool:
+        """Full and unused, i.e. the same as a new bucket"""
+        return not self._waiters and self._delay(time.monotonic()) == 0 and self.tokens >= self.capacity
+
+    async def acquire(self, priority: int):
+        if not self._waiters and self._delay(time.monotonic()) == 0:
+            self.tokens -= 1
+            return
+        loop = asyncio.get_running_loop()
+        entry = [priority, next(self._seq), loop.create_future()]
+        heapq.heappush(self._waiters, entry)
+        try:
+            while True:
+                wait = None
+                if self._waiters[0] is entry:
+                    wait = self._delay(time.monotonic())
+                    if wait == 0:
+                        heapq.heappop(self._waiters)
+                        self.tokens -= 1
+                        return
+                # The head sleeps until its token; the others until they become the head
+                entry[2] = loop.create_future()
+                await asyncio.wait([entry[2]], timeout=wait)
+        except BaseException:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            raise
+        finally:
+            self._wake_head()
+
+    def _wake_head(self):
+        if self._waiters and not self._waiters[0][2].done():
+            self._waiters[0][2].set_result(None)
+
+
+class TelegramRateLimiter(BaseRateLimiter[Dict[str, Any]]):
+    """
+    Keeps every Bot API request of the application within Telegram's limits
+
+    Requests take a token from a global bucket (RATE_LIMIT_GLOBAL_PER_SECOND)
+    and, if they post or edit a message, from their chat's bucket
+    (RATE_LIMIT_CHAT_PER_SECOND for private chats, RATE_LIMIT_GROUP_PER_MINUTE
+    for groups). Waiting requests are served by priority: interactive replies,
+    then outbox notifications, then message deletions. A RetryAfter pauses the
+    chat's bucket (or the global one for requests without a chat) for the
+    time Telegram asks and the request is retried up to max_retries times.
+
+    rate_limit_args may set 'priority' and 'max_retries' per request, e.g.
+    bot.send_message(..., rate_limit_args={'priority': PRIORITY_NOTIFICATION}).
+    """
+
+    def __init__(self, max_retries: int = None):
+        self.max_retries = config.RATE_LIMIT_MAX_RETRIES if max_retries is None else max_retries
+        self._global = TokenBucket(config.RATE_LIMIT_GLOBAL_PER_SECOND, config.RATE_LIMIT_GLOBAL_BURST)
+        self._chats: Dict[str, TokenBucket] = {}
+        self._prune_at = 1000
+        self.queued = {priority: 0 for priority in PRIORITY_NAMES}
+        self.requests = {priority: 0 for priority in PRIORITY_NAMES}
+        self.wait_histogram = {priority: [0] * (len(WAIT_BUCKETS) + 1) for priority in PRIORITY_NAMES}
+        self.total_wait_seconds = {priority: 0.0 for priority in PRIORITY_NAMES}
+        self.max_wait_seconds = {priority: 0.0 for priority in PRIORITY_NAMES}
+        self.retry_after = 0
+        self.retries = 0
+
+    async def initialize(self) -> None:
+        global _running_limiter
+        _running_limiter = self
+
+    async def shutdown(self) -> None:
+        global _running_limiter
+        if _running_limiter is self:
+            _running_limiter = None
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        key = str(chat_id)
+        bucket = self._chats.get(key)
+        if bucket is None:
+            if len(self._chats) >= self._prune_at:
+                # Drop the buckets of chats that have been quiet long enough to refill
+                self._chats = {key: bucket for key, bucket in self._chats.items() if not bucket.idle()}
+                self._prune_at = max(1000, 2 * len(self._chats))
+            if key.startswith('-'):
+                bucket = TokenBucket(config.RATE_LIMIT_GROUP_PER_MINUTE / 60, config.RATE_LIMIT_GROUP_BURST)
+            else:
+                bucket = TokenBucket(config.RATE_LIMIT_CHAT_PER_SECOND, config.RATE_LIMIT_CHAT_BURST)
+            self._chats[key] = bucket
+        return bucket
+
+    @staticmethod
+    def request_priority(endpoint: str, rate_limit_args: Optional[Dict[str, Any]]) -> int:
+        if rate_limit_args and 'priority' in rate_limit_args:
+            return rate_limit_args['priority']
+        if endpoint.startswith('delete'):
+            return PRIORITY_CLEANUP
+        return PRIORITY_INTERACTIVE
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Any]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[Dict[str, Any]],
+    ):
+        priority = self.request_priority(endpoint, rate_limit_args)
+        max_retries = (rate_limit_args or {}).get('max_retries', self.max_retries)
+        chat_id = data.get('chat_id')
+        chat_bucket = None
+        if chat_id is not None and endpoint.startswith(CHAT_LIMITED_PREFIXES):
+            chat_bucket = self._chat_bucket(chat_id)
+
+        for attempt in range(max_retries + 1):
+            await self._acquire(priority, chat_bucket)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                self.retry_after += 1
+                (chat_bucket or self._global).pause(e.retry_after + 0.1)
+                if attempt == max_retries:
+                    raise
+                self.retries += 1
+                logger.warning(f"Flood limit on {endpoint} (chat {chat_id}), retrying in {e.retry_after}s")
+
+    async def _acquire(self, priority: int, chat_bucket: Optional[TokenBucket]):
+        started_at = time.monotonic()
+        self.queued[priority] += 1
+        try:
+            if chat_bucket is not None:
+                await chat_bucket.acquire(priority)
+            await self._global.acquire(priority)
+        finally:
+            self.queued[priority] -= 1
+        self._record_wait(priority, time.monotonic() - started_at)
+
+    def _record_wait(self, priority: int, wait_seconds: float):
+        self.requests[priority] += 1
+        self.total_wait_seconds[priority] += wait_seconds
+        self.max_wait_seconds[priority] = max(self.max_wait_seconds[priority], wait_seconds)
+        bucket = next((index for index, bound in enumerate(WAIT_BUCKETS) if wait_seconds <= bound), len(WAIT_BUCKETS))
+        self.wait_histogram[priority][bucket] += 1
+
+    def snapshot(self) -> Dict:
+        """Queue depth, request counts and wait time histogram per priority"""
+        labels = [f"le_{bound}" for bound in WAIT_BUCKETS] + ['inf']
+        priorities = {}
+        for priority, name in PRIORITY_NAMES.items():
+            requests = self.requests[priority]
+            priorities[name] = {
+                'queued': self.queued[priority],
+                'requests': requests,
+                'avg_wait_ms': self.total_wait_seconds[priority] / requests * 1000 if requests else 0.0,
+                'max_wait_ms': self.max_wait_seconds[priority] * 1000,
+                'wait_histogram': dict(zip(labels, self.wait_histogram[priority])),
+            }
+        return {'priorities': priorities, 'retry_after': self.retry_after, 'retries': self.retries,
+                'chats': len(self._chats)}
+
+    async def run_reporter(self, interval_seconds: float):
+        """Log the snapshot every interval_seconds until cancelled"""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            logger.info(f"Rate limiter: {self.snapshot()}")
+
+
+def get_running_rate_limiter() -> Optional[TelegramRateLimiter]:
+    """The limiter of the bot running in this process, None if the bot runs elsewhere"""
+    return _running_limiter
@@ -0,0 +1,129 @@
+"""Scheduler that fires the deadlines stored in the scheduled_tasks table"""
+
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import config
+from database.events import Event, get_event_bus
+from utils.message_manager import get_message_deleter
+
+logger = logging.getLogger(__name__)
+
+TaskHandler = Callable[[List[Dict]], Awaitable[None]]
+
+
+class TaskScheduler:
+    """
+    One task for all pending deadlines of the bot
+
+    Instead of a sleeping coroutine per message, deadlines are rows of
+    scheduled_tasks (see DatabaseManager.schedule_task). The scheduler sleeps
+    until the earliest one, claims up to SCHEDULER_BATCH_SIZE due tasks and
+    hands each kind's tasks to its handler in one call; 'delete_message'
+    tasks go to the message deleter, one deleteMessages request per chat.
+
+    A task is removed once its handler returns. If the handler raises, the
+    task is retried when its lease ends, and dropped after
+    SCHEDULER_MAX_ATTEMPTS. Tasks scheduled in this process wake the
+    scheduler at once; others are seen within SCHEDULER_POLL_SECONDS.
+    """
+
+    def __init__(self, db, bot, batch_size: int = None):
+        self.db = db
+        self.bot = bot
+        self.batch_size = batch_size or config.SCHEDULER_BATCH_SIZE
+        self.handlers: Dict[str, TaskHandler] = {'delete_message': self._delete_messages}
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.fired = 0
+        self.failed = 0
+        self.dropped = 0
+        self.rounds = 0
+
+    def register(self, kind: str, handler: TaskHandler):
+        """Handle tasks of kind with handler(tasks) (tasks as returned by claim_due_tasks)"""
+        self.handlers[kind] = handler
+
+    def _on_event(self, event: Event):
+        # Runs in the committing thread
+        if event.type == 'scheduled_task' and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    async def run(self):
+        """Fire due tasks until stop() is called"""
+        self._loop = asyncio.get_running_loop()
+        get_event_bus().add_listener(self._on_event)
+        try:
+            while not self._stopping:
+                try:
+                    claimed = await self.run_once()
+                    timeout = 0 if claimed >= self.batch_size else await self._seconds_until_next()
+                except Exception as e:
+                    logger.error(f"Task scheduler error: {e}", exc_info=True)
+                    timeout = config.SCHEDULER_POLL_SECONDS
+                if timeout > 0 and not self._stopping:
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                    self._wake.clear()
+        finally:
+            get_event_bus().remove_listener(self._on_event)
+
+    async def _seconds_until_next(self) -> float:
+        due_at = await self.db.next_scheduled_task_due()
+        if due_at is None:
+            return config.SCHEDULER_POLL_SECONDS
+        return min(config.SCHEDULER_POLL_SECONDS, max(0.0, (due_at - datetime.utcnow()).total_seconds()))
+
+    async def run_once(self) -> int:
+        """Claim and fire one batch of due tasks; returns the number claimed"""
+        tasks = await self.db.claim_due_tasks(self.batch_size, config.SCHEDULER_LEASE_SECONDS)
+        if not tasks:
+            return 0
+        self.rounds += 1
+        by_kind = defaultdict(list)
+        for task in tasks:
+            by_kind[task['kind']].append(task)
+
+        done = []
+        for kind, kind_tasks in by_kind.items():
+            handler = self.handlers.get(kind)
+            try:
+                if handler is None:
+                    raise LookupError(f"no handler for {kind} tasks")
+                await handler(kind_tasks)
+                done += kind_tasks
+                self.fired += len(kind_tasks)
+            except Exception as e:
+                self.failed += len(kind_tasks)
+                # Left for a retry when the lease ends, unless out of attempts
+                exhausted = [task for task in kind_tasks if task['attempts'] >= config.SCHEDULER_MAX_ATTEMPTS]
+                done += exhausted
+                self.dropped += len(exhausted)
+                logger.error(f"{len(kind_tasks)} {kind} task(s) failed ({len(exhausted)} dropped): {e}")
+        await self.db.complete_scheduled_tasks([task['id'] for task in done])
+        return len(tasks)
+
+    async def _delete_messages(self, tasks: List[Dict]):
+        deleter = get_message_deleter()
+        by_chat = defaultdict(list)
+        for task in tasks:
+            by_chat[task['chat_id']].append(task['message_id'])
+        for chat_id, message_ids in by_chat.items():
+            deleter.schedule(self.bot, chat_id, *message_ids)
+        # Done only once the requests are made, so a crash before then retries them
+        await deleter.drain()
+
+    def stop(self):
+        """Finish the current batch and return from run()"""
+        self._stopping = True
+        self._wake.set()
+
+    def snapshot(self) -> Dict:
+        return {'fired': self.fired, 'failed': self.failed, 'dropped': self.dropped, 'rounds': self.rounds,
+                'batch_size': self.batch_size}
@@ -0,0 +1,253 @@
+"""Cache of generated transaction statements, keyed by what they contain"""
+
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Set
+
+import config
+from database.events import Event, get_event_bus
+
+logger = logging.getLogger(__name__)
+
+# Telegram file_ids kept (a few dozen bytes each)
+FILE_ID_LIMIT = 10000
+
+
+def statement_key(account_number: str, newest_id: Optional[int], count: int,
+                  updated_at: Optional[datetime], kind: str = 'last10') -> str:
+    """Cache key of a statement; see DatabaseManager.get_statement_version"""
+    version = f"{kind}:{account_number}:{newest_id}:{count}:{updated_at.isoformat() if updated_at else ''}"
+    return hashlib.sha256(version.encode()).hexdigest()
+
+
+class StatementCache:
+    """
+    Generated statement PDFs, so an unchanged statement is not rendered again
+
+    Statements are keyed by statement_key(): a new or updated transaction of
+    the account gives a new key, so a stale statement is never returned.
+    Transaction events of this process also drop the account's entries at
+    once instead of leaving them to age out.
+
+    Up to max_bytes of PDFs are kept in memory, least recently used first
+    out. With a spill_dir, evicted PDFs are written there (up to
+    spill_max_bytes) and read back on a hit; the directory is not cleared on
+    restart since its keys stay valid. The Telegram file_id of each sent
+    statement is kept too, so a repeated statement is sent without
+    uploading it again.
+    """
+
+    def __init__(self, max_bytes: int = None, spill_dir: str = None, spill_max_bytes: int = None):
+        self.max_bytes = config.STATEMENT_CACHE_MEMORY_MB * 1024 * 1024 if max_bytes is None else max_bytes
+        self.spill_dir = config.STATEMENT_CACHE_DIR if spill_dir is None else spill_dir
+        self.spill_max_bytes = (config.STATEMENT_CACHE_DISK_MB * 1024 * 1024
+                                if spill_max_bytes is None else spill_max_bytes)
+
+        self._lock = threading.Lock()
+        self._memory: OrderedDict = OrderedDict()  # key -> pdf bytes
+        self._memory_bytes = 0
+        self._disk: OrderedDict = OrderedDict()  # key -> size, oldest first
+        self._disk_bytes = 0
+        self._file_ids: OrderedDict = OrderedDict()  # key -> Telegram file_id
+        self._accounts: Dict[str, Set[str]] = {}  # account number -> keys
+        self._account_of: Dict[str, str] = {}
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.file_id_hits = 0
+        self.evictions = 0
+        self.spilled = 0
+        self.invalidations = 0
+
+        if self.spill_dir:
+            os.makedirs(self.spill_dir, mode=0o700, exist_ok=True)
+            self._load_spilled()
+
+    def _spill_path(self, account_number: str, key: str) -> str:
+        return os.path.join(self.spill_dir, f"{account_number}-{key}.pdf")
+
+    def _load_spilled(self):
+        entries = []
+        for entry in os.scandir(self.spill_dir):
+            if entry.name.endswith('.tmp'):
+                # Interrupted spill
+                os.remove(entry.path)
+                continue
+            account_number, _, rest = entry.name.partition('-')
+            if entry.is_file() and rest.endswith('.pdf'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, rest[:-4], account_number, stat.st_size))
+        for _, key, account_number, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+            self._track(account_number, key)
+
+    def _track(self, account_number: str, key: str):
+        self._accounts.setdefault(account_number, set()).add(key)
+        self._account_of[key] = account_number
+
+    def _untrack(self, key: str):
+        account_number = self._account_of.pop(key, None)
+        keys = self._accounts.get(account_number)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._accounts[account_number]
+
+    def get(self, account_number: str, key: str) -> Optional[bytes]:
+        """The cached PDF, or None"""
+        with self._lock:
+            pdf = self._memory.get(key)
+            if pdf is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return pdf
+            if key not in self._disk:
+                self.misses += 1
+                return None
+        try:
+            with open(self._spill_path(account_number, key), 'rb') as f:
+                pdf = f.read()
+        except OSError as e:
+            logger.warning(f"Spilled statement {key} unreadable: {e}")
+            with self._lock:
+                self._drop_disk(key)
+                self.misses += 1
+            return None
+        with self._lock:
+            self.disk_hits += 1
+            self._store(account_number, key, pdf)
+        return pdf
+
+    def put(self, account_number: str, key: str, pdf: bytes):
+        with self._lock:
+            self._store(account_number, key, pdf)
+
+    def _store(self, account_number: str, key: str, pdf: bytes):
+        if len(pdf) > self.max_bytes:
+            return
+        if key in self._memory:
+            self._memory_bytes -= len(self._memory.pop(key))
+        self._memory[key] = pdf
+        self._memory_bytes += len(pdf)
+        self._track(account_number, key)
+        while self._memory_bytes > self.max_bytes:
+            old_key, old_pdf = self._memory.popitem(last=False)
+            self._memory_bytes -= len(old_pdf)
+            self.evictions += 1
+            self._spill(old_key, old_pdf)
+
+    def _spill(self, key: str, pdf: bytes):
+        if key in self._disk:
+            return
+        if not self.spill_dir or len(pdf) > self.spill_max_bytes:
+            self._untrack(key)
+            return
+        path = self._spill_path(self._account_of[key], key)
+        try:
+            with open(f"{path}.tmp", 'wb') as f:
+                f.write(pdf)
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            logger.warning(f"Could not spill statement {key}: {e}")
+            self._untrack(key)
+            return
+        self._disk[key] = len(pdf)
+        self._disk_bytes += len(pdf)
+        self.spilled += 1
+        while self._disk_bytes > self.spill_max_bytes:
+            self._drop_disk(next(iter(self._disk)))
+
+    def _drop_disk(self, key: str):
+        size = self._disk.pop(key, None)
+        if size is None:
+            return
+        self._disk_bytes -= size
+        try:
+            os.remove(self._spill_path(self._account_of[key], key))
+        except OSError:
+            pass
+        if key not in self._memory:
+            self._untrack(key)
+
+    def get_file_id(self, key: str) -> Optional[str]:
+        """Telegram file_id of the statement sent under key, or None"""
+        with self._lock:
+            file_id = self._file_ids.get(key)
+            if file_id is not None:
+                self._file_ids.move_to_end(key)
+                self.file_id_hits += 1
+            return file_id
+
+    def set_file_id(self, key: str, file_id: str):
+        with self._lock:
+            self._file_ids[key] = file_id
+            self._file_ids.move_to_end(key)
+            while len(self._file_ids) > FILE_ID_LIMIT:
+                self._file_ids.popitem(last=False)
+
+    def forget_file_id(self, key: str):
+        with self._lock:
+            self._file_ids.pop(key, None)
+
+    def invalidate(self, account_number: str) -> int:
+        """Drop every cached statement of an account; returns how many"""
+        with self._lock:
+            keys = list(self._accounts.get(account_number, ()))
+            for key in keys:
+                pdf = self._memory.pop(key, None)
+                if pdf is not None:
+                    self._memory_bytes -= len(pdf)
+                self._drop_disk(key)
+                self._file_ids.pop(key, None)
+                self._untrack(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def _on_event(self, event: Event):
+        # Runs in the committing thread
+        if event.type == 'transaction':
+            for account_number in (event.data.get('from_account'), event.data.get('to_account')):
+                if account_number:
+                    self.invalidate(account_number)
+
+    def attach(self, bus=None):
+        """Invalidate on the transaction events of bus (default: this process's)"""
+        (bus or get_event_bus()).add_listener(self._on_event)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                'entries': len(self._memory),
+                'bytes': self._memory_bytes,
+                'spilled_entries': len(self._disk),
+                'spilled_bytes': self._disk_bytes,
+                'file_ids': len(self._file_ids),
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'file_id_hits': self.file_id_hits,
+                'evictions': self.evictions,
+                'spilled': self.spilled,
+                'invalidations': self.invalidations,
+            }
+
+
+_statement_cache: Optional[StatementCache] = None
+_statement_cache_lock = threading.Lock()
+
+
+def get_statement_cache() -> StatementCache:
+    """Get the shared statement cache"""
+    global _statement_cache
+    if _statement_cache is None:
+        with _statement_cache_lock:
+            if _statement_cache is None:
+                _statement_cache = StatementCache()
+                _statement_cache.attach()
+    return _statement_cache
@@ -0,0 +1,333 @@
+"""Full-history statement export (PDF or CSV) over a Jalali date range"""
+
+import csv
+import io
+import os
+import re
+import tempfile
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import BinaryIO, Iterable, List, Optional, Tuple
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+from reportlab.pdfgen import canvas
+
+import config
+from database.db_manager import DatabaseManager
+from utils.pdf_generator import (
+    JALALI_SUPPORT, PERSIAN_FONT, PERSIAN_FONT_BOLD, STATUS_LABELS, TABLE_COL_WIDTHS, TABLE_HEADER_LABELS,
+    TRANSACTION_TYPE_LABELS, convert_to_jalali, register_fonts, reshape_persian_text, statement_cells
+)
+from utils.worker_pool import BoundedProcessPool
+
+if JALALI_SUPPORT:
+    import jdatetime
+
+FORMATS = {
+    'pdf': 'application/pdf',
+    'csv': 'text/csv',
+}
+
+# Largest file a bot can send
+TELEGRAM_UPLOAD_LIMIT = 50 * 1024 * 1024
+
+_PERSIAN_DIGITS = str.maketrans('۰۱۲۳۴۵۶۷۸۹٠١٢٣٤٥٦٧٨٩', '01234567890123456789')
+_DATE_PATTERN = re.compile(r'(\d{4})[/\-.](\d{1,2})[/\-.](\d{1,2})')
+
+CSV_HEADER = ('شناسه', 'نوع', 'از حساب', 'به حساب', 'مبلغ', 'کارمزد', 'وضعیت', 'تاریخ')
+
+# PDF page layout
+PAGE_WIDTH, PAGE_HEIGHT = A4
+MARGIN = 2*cm
+ROW_HEIGHT = 0.65*cm
+HEADER_ROW_HEIGHT = 0.8*cm
+
+
+class StatementRangeError(ValueError):
+    """A date range the user typed could not be understood"""
+
+
+class StatementTooLarge(ValueError):
+    """A PDF statement would have more rows than STATEMENT_PDF_MAX_ROWS"""
+
+
+def parse_jalali_date(text: str) -> datetime:
+    """Gregorian midnight of a Jalali date like 1403/01/31 (Persian digits allowed)"""
+    match = _DATE_PATTERN.fullmatch(text.strip().translate(_PERSIAN_DIGITS))
+    if not match:
+        raise StatementRangeError(f"Not a date: {text!r}")
+    year, month, day = (int(part) for part in match.groups())
+    try:
+        if not JALALI_SUPPORT:
+            return datetime(year, month, day)
+        return datetime.combine(jdatetime.date(year, month, day).togregorian(), datetime.min.time())
+    except ValueError as e:
+        raise StatementRangeError(f"Not a date: {text!r}") from e
+
+
+def parse_jalali_range(text: str) -> Tuple[datetime, datetime]:
+    """
+    (start, end) of a range like "1403/01/01 - 1403/06/31" or "1403/01/01 تا 1403/06/31"
+    Both days are included: end is the midnight after the last day.
+    """
+    parts = [part for part in re.split(r'\s+(?:-|تا)\s+|\s+', text.strip()) if part]
+    if len(parts) != 2:
+        raise StatementRangeError(f"Not a date range: {text!r}")
+    start = parse_jalali_date(parts[0])
+    end = parse_jalali_date(parts[1]) + timedelta(days=1)
+    if end <= start:
+        raise StatementRangeError(f"Range ends before it starts: {text!r}")
+    return start, end
+
+
+def jalali_label(dt: datetime) -> str:
+    """The Jalali date of dt as YYYY/MM/DD"""
+    return convert_to_jalali(dt)[:10]
+
+
+def write_statement_csv(chunks: Iterable[List], out: BinaryIO) -> int:
+    """Write the rows of iter_account_transactions chunks as CSV; returns the row count"""
+    # BOM so spreadsheet programs read the Persian text as UTF-8
+    text = io.TextIOWrapper(out, encoding='utf-8-sig', newline='', write_through=True)
+    try:
+        writer = csv.writer(text)
+        writer.writerow(CSV_HEADER)
+        count = 0
+        for rows in chunks:
+            writer.writerows((
+                row.id,
+                TRANSACTION_TYPE_LABELS.get(row.transaction_type, row.transaction_type),
+                row.from_account or '',
+                row.to_account or '',
+                row.amount,
+                row.fee if row.fee is not None else 0,
+                STATUS_LABELS.get(row.status, row.status),
+                convert_to_jalali(row.created_at) if row.created_at else '',
+            ) for row in rows)
+            count += len(rows)
+        return count
+    finally:
+        # Leave out open for the caller
+        text.detach()
+
+
+class _StatementPages:
+    """Draws rows straight onto canvas pages, a header on each page, so no table is kept in memory"""
+
+    def __init__(self, out: BinaryIO, account_number: str, period: str):
+        register_fonts()
+        self.canvas = canvas.Canvas(out, pagesize=A4, pageCompression=1)
+        self.account_number = account_number
+        self.period = period
+        self.page = 0
+        self.y = 0.0
+        self.row_index = 0
+        self.column_x = [MARGIN]
+        for width in TABLE_COL_WIDTHS:
+            self.column_x.append(self.column_x[-1] + width)
+        self.header_cells = [reshape_persian_text(label) for label in TABLE_HEADER_LABELS]
+
+    def _start_page(self):
+        if self.page:
+            self._footer()
+            self.canvas.showPage()
+        self.page += 1
+        top = PAGE_HEIGHT - MARGIN
+        c = self.canvas
+        c.setFillColor(colors.HexColor('#1a1a1a'))
+        c.setFont(PERSIAN_FONT_BOLD, 14)
+        c.drawCentredString(PAGE_WIDTH / 2, top - 14, reshape_persian_text("صورت‌حساب"))
+        c.setFont(PERSIAN_FONT, 10)
+        c.drawRightString(self.column_x[-1], top - 36,
+                          reshape_persian_text(f"شماره حساب: {self.account_number}"))
+        c.drawRightString(self.column_x[-1], top - 52, reshape_persian_text(f"بازه: {self.period}"))
+
+        self.y = top - 64 - HEADER_ROW_HEIGHT
+        c.setFillColor(colors.HexColor('#4a90e2'))
+        c.rect(self.column_x[0], self.y, self.column_x[-1] - self.column_x[0], HEADER_ROW_HEIGHT, stroke=1, fill=1)
+        c.setFillColor(colors.whitesmoke)
+        c.setFont(PERSIAN_FONT_BOLD, 10)
+        self._cells(self.header_cells, self.y, HEADER_ROW_HEIGHT)
+        self.row_index = 0
+
+    def _cells(self, cells: List[str], y: float, height: float):
+        for index, cell in enumerate(cells):
+            center = (self.column_x[index] + self.column_x[index + 1]) / 2
+            self.canvas.drawCentredString(center, y + height / 2 - 3, cell)
+
+    def add(self, row):
+        if not self.page or self.y - ROW_HEIGHT < MARGIN:
+            self._start_page()
+        self.y -= ROW_HEIGHT
+        c = self.canvas
+        c.setFillColor(colors.lightgrey if self.row_index % 2 else colors.white)
+        c.rect(self.column_x[0], self.y, self.column_x[-1] - self.column_x[0], ROW_HEIGHT, stroke=1, fill=1)
+        c.setFillColor(colors.black)
+        c.setFont(PERSIAN_FONT, 8)
+        self._cells([reshape_persian_text(cell) for cell in statement_cells(row)], self.y, ROW_HEIGHT)
+        self.row_index += 1
+
+    def _footer(self):
+        self.canvas.setFillColor(colors.black)
+        self.canvas.setFont(PERSIAN_FONT, 8)
+        self.canvas.drawCentredString(PAGE_WIDTH / 2, MARGIN / 2, reshape_persian_text(f"صفحه {self.page}"))
+
+    def finish(self, count: int):
+        if not self.page or self.y - ROW_HEIGHT < MARGIN:
+            self._start_page()
+        self.canvas.setFillColor(colors.black)
+        self.canvas.setFont(PERSIAN_FONT_BOLD, 10)
+        self.canvas.drawRightString(self.column_x[-1], self.y - ROW_HEIGHT,
+                                    reshape_persian_text(f"تعداد تراکنش‌ها: {count}"))
+        self._footer()
+        self.canvas.save()
+
+
+def write_statement_pdf(chunks: Iterable[List], out: BinaryIO, account_number: str, period: str,
+                        max_rows: int = None) -> int:
+    """
+    Write the rows of iter_account_transactions chunks as a paged PDF table; returns the row count
+    reportlab keeps every page in memory until the document is saved, so
+    more than max_rows rows raise StatementTooLarge.
+    """
+    pages = _StatementPages(out, account_number, period)
+    count = 0
+    for rows in chunks:
+        if max_rows is not None and count + len(rows) > max_rows:
+            raise StatementTooLarge(max_rows)
+        for row in rows:
+            pages.add(row)
+        count += len(rows)
+    pages.finish(count)
+    return count
+
+
+@dataclass
+class StatementExport:
+    """An exported statement; file is positioned at its start, path is set when it was written by a worker"""
+    file: BinaryIO
+    filename: str
+    content_type: str
+    rows: int
+    size: int
+    path: Optional[str] = None
+
+    def close(self):
+        self.file.close()
+        if self.path:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+def _statement_filename(account_number: str, start: datetime, end: datetime, fmt: str) -> str:
+    first_day, last_day = jalali_label(start), jalali_label(end - timedelta(days=1))
+    return f"statement_{account_number}_{first_day.replace('/', '')}_{last_day.replace('/', '')}.{fmt}"
+
+
+def _write_statement(db, account_number: str, start: datetime, end: datetime, fmt: str, out: BinaryIO) -> int:
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown statement format: {fmt}")
+    chunks = db.iter_account_transactions(account_number, start, end, config.STATEMENT_EXPORT_CHUNK_SIZE)
+    if fmt == 'csv':
+        return write_statement_csv(chunks, out)
+    period = f"{jalali_label(start)} تا {jalali_label(end - timedelta(days=1))}"
+    return write_statement_pdf(chunks, out, account_number, period, config.STATEMENT_PDF_MAX_ROWS or None)
+
+
+def export_statement(db, account_number: str, start: datetime, end: datetime, fmt: str = 'pdf') -> StatementExport:
+    """
+    Statement of the account's transactions in [start, end) as a PDF or CSV file
+
+    Rows are read STATEMENT_EXPORT_CHUNK_SIZE at a time from a server-side
+    cursor and written as they arrive into a temporary file that stays in
+    memory up to STATEMENT_EXPORT_SPOOL_MB and moves to disk beyond that.
+    db is a (sync) DatabaseManager. A PDF of more than
+    STATEMENT_PDF_MAX_ROWS rows raises StatementTooLarge.
+    """
+    out = tempfile.SpooledTemporaryFile(max_size=config.STATEMENT_EXPORT_SPOOL_MB * 1024 * 1024)
+    try:
+        rows = _write_statement(db, account_number, start, end, fmt, out)
+        size = out.tell()
+        out.seek(0)
+    except BaseException:
+        out.close()
+        raise
+    return StatementExport(out, _statement_filename(account_number, start, end, fmt), FORMATS[fmt], rows, size)
+
+
+# Database managers of this worker process, by URL
+_worker_dbs = {}
+
+
+def _export_to_file(db_url: str, account_number: str, start: datetime, end: datetime,
+                    fmt: str) -> Tuple[str, int, int]:
+    """Runs in an export worker: write the statement to a temporary file; returns (path, rows, size)"""
+    db = _worker_dbs.get(db_url)
+    if db is None:
+        db = _worker_dbs[db_url] = DatabaseManager(db_url=db_url)
+    fd, path = tempfile.mkstemp(prefix='statement_', suffix=f'.{fmt}')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            rows = _write_statement(db, account_number, start, end, fmt, out)
+            size = out.tell()
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, rows, size
+
+
+class StatementExportService(BoundedProcessPool):
+    """
+    Runs full-history statement exports in worker processes
+
+    Writing thousands of rows holds the GIL for seconds, so exports run in
+    at most STATEMENT_EXPORT_WORKERS processes. Each worker opens its own
+    DatabaseManager on the bot's database, streams the rows into a temporary
+    file and returns its path; the file is removed when the export is closed.
+    """
+
+    def __init__(self, max_workers: int = None, use_processes: bool = True):
+        super().__init__('statement-export', max_workers or config.STATEMENT_EXPORT_WORKERS,
+                         use_processes=use_processes)
+
+    async def export(self, db, account_number: str, start: datetime, end: datetime,
+                     fmt: str = 'pdf') -> StatementExport:
+        """export_statement in a worker; db is the bot's (sync) DatabaseManager"""
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown statement format: {fmt}")
+        db_url = db.engine.url.render_as_string(hide_password=False)
+        path, rows, size = await self._run(_export_to_file, db_url, account_number, start, end, fmt)
+        try:
+            file = open(path, 'rb')
+        except BaseException:
+            os.remove(path)
+            raise
+        return StatementExport(file, _statement_filename(account_number, start, end, fmt), FORMATS[fmt], rows,
+                               size, path)
+
+    def shutdown(self):
+        """Stop the worker pool"""
+        super().shutdown()
+        # Only filled here when the workers are threads
+        for db in _worker_dbs.values():
+            db.engine.dispose()
+        _worker_dbs.clear()
+
+
+_export_service: Optional[StatementExportService] = None
+_export_service_lock = threading.Lock()
+
+
+def get_statement_export_service() -> StatementExportService:
+    """Get the shared statement export service"""
+    global _export_service
+    if _export_service is None:
+        with _export_service_lock:
+            if _export_service is None:
+                _export_service = StatementExportService()
+    return _export_service
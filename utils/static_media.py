@@ -0,0 +1,118 @@
+"""Send files the bot uses over and over (the agreement PDF) by Telegram file_id"""
+
+import hashlib
+import logging
+import os
+from typing import Dict, Tuple
+
+from telegram.error import BadRequest
+
+from utils.concurrency import KeyedLock
+
+logger = logging.getLogger(__name__)
+
+# BadRequest messages meaning the file_id itself is no longer usable (compared lower case, "_" as space)
+FILE_ID_ERRORS = ('wrong file identifier', 'wrong remote file identifier', 'wrong file id', 'file reference expired')
+
+
+def is_file_id_error(error: BadRequest) -> bool:
+    message = error.message.lower().replace('_', ' ')
+    return any(text in message for text in FILE_ID_ERRORS)
+
+
+def _sent_file_id(message, kind: str) -> str:
+    if kind == 'photo':
+        # Largest size; Telegram makes the smaller ones from it
+        return message.photo[-1].file_id
+    return message.document.file_id
+
+
+class StaticMediaRegistry:
+    """
+    Uploads each static file once and sends it by file_id afterwards
+
+    The file_id Telegram returns for the first upload is stored in the
+    static_media table under the SHA-256 of the file's bytes and the kind
+    it was sent as. A changed file has a new hash, so it is uploaded again;
+    a file_id Telegram rejects as invalid or expired is dropped and the
+    file uploaded again as well. Other BadRequests (a bad caption, a chat
+    that does not exist) are raised to the caller. Hashes are recomputed
+    only when a file's size or modification time changes.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._hashes: Dict[str, Tuple[int, int, str]] = {}  # path -> (mtime_ns, size, sha256)
+        self._file_ids: Dict[Tuple[str, str], str] = {}  # (sha256, kind) -> file_id
+        self._uploads = KeyedLock()
+        self.uploads = 0
+        self.reuses = 0
+
+    def file_hash(self, path: str) -> str:
+        """SHA-256 of the file (raises FileNotFoundError if it is missing)"""
+        stat = os.stat(path)
+        cached = self._hashes.get(path)
+        if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            return cached[2]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b''):
+                digest.update(chunk)
+        self._hashes[path] = (stat.st_mtime_ns, stat.st_size, digest.hexdigest())
+        return digest.hexdigest()
+
+    async def send_document(self, bot, chat_id, path: str, **kwargs):
+        """bot.send_document of the file at path; kwargs (caption, reply_markup, ...) are passed on"""
+        return await self._send(bot, 'document', chat_id, path, kwargs)
+
+    async def send_photo(self, bot, chat_id, path: str, **kwargs):
+        """bot.send_photo of the image at path; kwargs (caption, reply_markup, ...) are passed on"""
+        return await self._send(bot, 'photo', chat_id, path, kwargs)
+
+    async def _send(self, bot, kind: str, chat_id, path: str, kwargs: dict):
+        send = getattr(bot, f"send_{kind}")
+        file_hash = self.file_hash(path)
+        key = (file_hash, kind)
+
+        file_id = self._file_ids.get(key)
+        if file_id is None:
+            file_id = await self.db.get_static_file_id(file_hash, kind)
+        if file_id is not None:
+            message = await self._send_file_id(send, key, file_id, chat_id, path, kwargs)
+            if message is not None:
+                return message
+
+        # One upload per file even when many users ask for it at once
+        async with self._uploads.hold(f"{kind}:{file_hash}"):
+            uploaded = self._file_ids.get(key)
+            if uploaded is not None and uploaded != file_id:
+                message = await self._send_file_id(send, key, uploaded, chat_id, path, kwargs)
+                if message is not None:
+                    return message
+
+            with open(path, 'rb') as f:
+                message = await send(chat_id=chat_id, **{kind: f}, filename=os.path.basename(path), **kwargs)
+            self.uploads += 1
+            self._file_ids[key] = _sent_file_id(message, kind)
+            await self.db.save_static_file_id(file_hash, os.path.basename(path), kind, self._file_ids[key])
+            return message
+
+    async def _send_file_id(self, send, key: Tuple[str, str], file_id: str, chat_id, path: str, kwargs: dict):
+        """The sent message, or None if Telegram no longer accepts file_id"""
+        file_hash, kind = key
+        try:
+            message = await send(chat_id=chat_id, **{kind: file_id}, **kwargs)
+        except BadRequest as e:
+            if not is_file_id_error(e):
+                raise
+            logger.warning(f"file_id of {path} rejected ({e}), uploading it again")
+            if self._file_ids.get(key) == file_id:
+                del self._file_ids[key]
+            await self.db.forget_static_file_id(file_hash, kind)
+            return None
+        self._file_ids[key] = file_id
+        self.reuses += 1
+        return message
+
+    def snapshot(self) -> dict:
+        return {'uploads': self.uploads, 'reuses': self.reuses, 'files': len(self._hashes)}
@@ -0,0 +1,170 @@
+"""Bounded process pool for running CPU-bound work off the event loop"""
+
+import asyncio
+import logging
+import multiprocessing
+import threading
+import time
+import weakref
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedProcessPool:
+    """
+    Runs functions in worker processes, at most max_workers at a time
+
+    Work sent from the event loop waits for a free worker in a queue whose
+    depth and wait times are measured. A worker that dies (e.g. killed by
+    the OOM killer) breaks the pool; it is restarted and the job retried
+    once. With a timeout, a job running longer raises asyncio.TimeoutError
+    and the workers are terminated so the stuck job does not hold a slot.
+
+    Only jobs that returned are counted as completed; errors and timeouts
+    are counted as failed and their run time is averaged separately.
+    """
+
+    def __init__(self, name: str, max_workers: int, use_processes: bool = True, timeout: Optional[float] = None):
+        self.name = name
+        self.max_workers = max(1, int(max_workers))
+        self.use_processes = use_processes
+        self.timeout = timeout
+
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._semaphores = weakref.WeakKeyDictionary()
+
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.in_flight = 0
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.total_run_seconds = 0.0
+        self.max_run_seconds = 0.0
+        self.total_failed_seconds = 0.0
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    if self.use_processes:
+                        # spawn: workers must not inherit the bot's threads and DB connections
+                        self._executor = ProcessPoolExecutor(
+                            max_workers=self.max_workers,
+                            mp_context=multiprocessing.get_context('spawn')
+                        )
+                    else:
+                        self._executor = ThreadPoolExecutor(
+                            max_workers=self.max_workers,
+                            thread_name_prefix=self.name
+                        )
+        return self._executor
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # One semaphore per event loop (the bot and tests may run several loops)
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_workers)
+            self._semaphores[loop] = semaphore
+        return semaphore
+
+    def _enqueue(self) -> float:
+        """Count a job as waiting; returns the time it was queued at"""
+        self.queue_depth += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        return time.perf_counter()
+
+    async def _run(self, func, *args):
+        """func(*args) in a worker; func must be a module-level function"""
+        return await self._execute(func, args, self._enqueue())
+
+    async def _execute(self, func, args, queued_at: float):
+        """Run a job already counted by _enqueue()"""
+        acquired = False
+        try:
+            async with self._get_semaphore():
+                acquired = True
+                self.queue_depth -= 1
+                wait = time.perf_counter() - queued_at
+                self.started += 1
+                self.total_wait_seconds += wait
+                self.max_wait_seconds = max(self.max_wait_seconds, wait)
+
+                self.in_flight += 1
+                started_at = time.perf_counter()
+                try:
+                    try:
+                        result = await self._submit(func, args)
+                    except BrokenProcessPool:
+                        logger.warning(f"{self.name} process pool broken, restarting it")
+                        self._reset_executor()
+                        result = await self._submit(func, args)
+                except asyncio.TimeoutError:
+                    self.timeouts += 1
+                    self._failed(started_at)
+                    logger.error(f"{self.name} job took more than {self.timeout}s, restarting the pool")
+                    self._reset_executor(terminate=True)
+                    raise
+                except Exception:
+                    self._failed(started_at)
+                    raise
+                finally:
+                    self.in_flight -= 1
+
+                self.completed += 1
+                elapsed = time.perf_counter() - started_at
+                self.total_run_seconds += elapsed
+                self.max_run_seconds = max(self.max_run_seconds, elapsed)
+                return result
+        finally:
+            if not acquired:
+                # Cancelled while still waiting for a free worker
+                self.queue_depth -= 1
+
+    def _failed(self, started_at: float):
+        self.failed += 1
+        self.total_failed_seconds += time.perf_counter() - started_at
+
+    async def _submit(self, func, args):
+        loop = asyncio.get_running_loop()
+        return await asyncio.wait_for(loop.run_in_executor(self._get_executor(), func, *args), self.timeout)
+
+    def _reset_executor(self, terminate: bool = False):
+        with self._executor_lock:
+            executor = self._executor
+            self._executor = None
+        if executor is not None:
+            # shutdown() does not stop a running job, so a stuck worker is terminated
+            processes = list((getattr(executor, '_processes', None) or {}).values()) if terminate else []
+            executor.shutdown(wait=False, cancel_futures=True)
+            for process in processes:
+                process.terminate()
+
+    def get_metrics(self) -> dict:
+        """Return queue depth and timing metrics"""
+        return {
+            'max_workers': self.max_workers,
+            'queue_depth': self.queue_depth,
+            'max_queue_depth': self.max_queue_depth,
+            'in_flight': self.in_flight,
+            'completed': self.completed,
+            'failed': self.failed,
+            'timeouts': self.timeouts,
+            'avg_wait_seconds': self.total_wait_seconds / self.started if self.started else 0.0,
+            'max_wait_seconds': self.max_wait_seconds,
+            'avg_run_seconds': self.total_run_seconds / self.completed if self.completed else 0.0,
+            'max_run_seconds': self.max_run_seconds,
+            'avg_failed_seconds': self.total_failed_seconds / self.failed if self.failed else 0.0
+        }
+
+    def shutdown(self):
+        """Stop the worker pool"""
+        self._reset_executor()
@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_file
 from datetime import datetime, timedelta
 import os
 import sys
@@ -8,10 +8,19 @@ import json
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from database.db_manager import DatabaseManager
+from database.pool import get_pool_stats
 from database.models import User, Account, Transaction, Lock, WithdrawalRequest
 import config
-from web.utils import format_number, format_date, calculate_stats
-from sqlalchemy import func, or_
+from web.utils import format_number, format_date, calculate_stats, stats_cache
+from web.pagination import (PageRequestError, decode_cursor, encode_cursor, estimate_total, keyset_page,
+                            parse_bool, parse_decimal, parse_limit)
+from web.sync import changed_keys, delta_response, reset_response, sync_window_from
+from web.events import EventStreams
+from utils.statement_export import FORMATS, StatementRangeError, StatementTooLarge, export_statement, parse_jalali_date
+from utils.rate_limiter import get_running_rate_limiter
+from database.events import get_event_bus
+from sqlalchemy import func, or_, and_
+from decimal import Decimal
 from sqlalchemy.orm import joinedload
 
 # Get the directory of this file
@@ -22,8 +31,10 @@ STATIC_DIR = os.path.join(BASE_DIR, 'static')
 app = Flask(__name__, template_folder=TEMPLATE_DIR, static_folder=STATIC_DIR)
 app.secret_key = os.getenv('WEB_SECRET_KEY', 'change-this-secret-key-in-production-12345')
 
-# Initialize database
-db_manager = DatabaseManager()
+# Initialize database (separate 'admin' connection pool from the bot)
+db_manager = DatabaseManager(role='admin')
+# Resolved on use so tests can swap db_manager
+event_streams = EventStreams(get_event_bus(), lambda: db_manager)
 
 
 @app.route('/')
@@ -52,6 +63,45 @@ def api_stats():
     return jsonify(stats)
 
 
+@app.route('/api/metrics/pool')
+def api_pool_metrics():
+    """Connection pool telemetry for every pool role in this process (bot and admin when run together)"""
+    return jsonify(get_pool_stats())
+
+
+@app.route('/api/metrics/stats-cache')
+def api_stats_cache_metrics():
+    """Hits and computations of the dashboard statistics cache"""
+    return jsonify(stats_cache.snapshot())
+
+
+@app.route('/api/events')
+def api_events():
+    """
+    Server-sent events: new and changed transactions and withdrawal requests,
+    user lock/unlock/delete, and dashboard statistics deltas
+
+    Streams are served by the event stream server (web/events.py), which
+    holds no thread per client; this sends the browser there.
+    """
+    try:
+        port = event_streams.start()
+    except OSError as e:
+        import logging
+        logging.getLogger(__name__).error(f"Event stream server could not start: {e}")
+        return jsonify({'error': 'رویدادهای زنده در دسترس نیستند'}), 503
+    if config.SSE_PUBLIC_URL:
+        return redirect(config.SSE_PUBLIC_URL, code=307)
+    host = request.host if request.host.endswith(']') else request.host.rsplit(':', 1)[0]
+    return redirect(f"{request.scheme}://{host}:{port}/api/events", code=307)
+
+
+@app.route('/api/metrics/events')
+def api_events_metrics():
+    """Connected SSE clients and event bus counters"""
+    return jsonify(event_streams.snapshot())
+
+
 @app.route('/users')
 def users():
     """Users management page"""
@@ -60,54 +110,120 @@ def users():
 
 @app.route('/api/users')
 def api_users():
-    """API endpoint for users list - optimized with joins"""
+    """
+    API endpoint for users list, one keyset-paginated page at a time
+
+    Query parameters: limit, after (next_cursor of the previous page),
+    sort (created_at | balance), order (desc | asc), q (user id prefix or
+    username), locked, admin, active (true | false), min_balance, max_balance.
+    balance is the balance of the user's active account.
+    
+    With since (the cursor of an earlier response) only the users changed
+    since then are returned: those matching the filters in users, the rest
+    (deleted, or no longer matching) in deleted.
+    """
+    try:
+        window = sync_window_from(request.args)
+        limit = parse_limit(request.args.get('limit'))
+        sort = request.args.get('sort', 'created_at')
+        if sort not in ('created_at', 'balance'):
+            raise PageRequestError(f"sort نامعتبر است: {sort}")
+        descending = request.args.get('order', 'desc') != 'asc'
+        after = decode_cursor(request.args['after'], sort) if request.args.get('after') else None
+        locked = parse_bool(request.args.get('locked'))
+        is_admin = parse_bool(request.args.get('admin'))
+        active = parse_bool(request.args.get('active'))
+        min_balance = parse_decimal(request.args.get('min_balance'))
+        max_balance = parse_decimal(request.args.get('max_balance'))
+    except PageRequestError as e:
+        return jsonify({'error': str(e)}), 400
+    search = request.args.get('q', '').strip()
+    
     db_session = db_manager.get_session()
     try:
-        # Get all users with eager loading of accounts and locks
-        users_list = db_session.query(User).options(
-            joinedload(User.accounts),
-            joinedload(User.lock)
-        ).order_by(User.created_at.desc()).all()
-        
-        # Pre-load all locks in one query
-        user_ids = [user.user_id for user in users_list]
-        locks = db_session.query(Lock).filter(Lock.user_id.in_(user_ids)).all()
-        locks_dict = {lock.user_id: lock for lock in locks}
-        
         now = datetime.utcnow()
-        result = []
-        for user in users_list:
-            # Use eager-loaded accounts to calculate stats (no extra queries)
-            accounts = user.accounts if user.accounts else []
-            account_count = len(accounts)
-            
-            # Find active account balance
-            balance = 0.0
-            for acc in accounts:
-                if acc.is_active:
-                    balance = float(acc.balance)
-                    break  # Use first active account
-            
-            # Get lock info from eager-loaded or dict
-            lock_info = user.lock if hasattr(user, 'lock') and user.lock else locks_dict.get(user.user_id)
-            is_locked = lock_info is not None and now < lock_info.locked_until if lock_info else False
-            
-            result.append({
-                'user_id': user.user_id,
-                'username': user.username if user.username else None,
-                'created_at': user.created_at.isoformat() if user.created_at else None,
-                'account_count': account_count,
-                'balance': balance,
-                'is_locked': is_locked,
-                'lock_reason': lock_info.reason if lock_info else None,
-                'lock_until': lock_info.locked_until.isoformat() if lock_info and lock_info.locked_until else None,
-                'is_admin': user.is_admin if user.is_admin else False
-            })
-        return jsonify({'users': result})
+        balance = func.coalesce(Account.balance, 0)
+        query = db_session.query(User, Account, Lock).outerjoin(
+            Account, and_(Account.user_id == User.user_id, Account.is_active == True)
+        ).outerjoin(Lock, Lock.user_id == User.user_id)
+        
+        if search:
+            query = query.filter(or_(User.user_id.like(f"{search}%"), User.username.ilike(f"%{search}%")))
+        if locked is True:
+            query = query.filter(Lock.locked_until > now)
+        elif locked is False:
+            query = query.filter(or_(Lock.user_id.is_(None), Lock.locked_until <= now))
+        if is_admin is not None:
+            query = query.filter(User.is_admin == True) if is_admin else query.filter(or_(User.is_admin == False, User.is_admin.is_(None)))
+        if active is not None:
+            query = query.filter(Account.account_number.isnot(None) if active else Account.account_number.is_(None))
+        if min_balance is not None:
+            query = query.filter(balance >= min_balance)
+        if max_balance is not None:
+            query = query.filter(balance <= max_balance)
+        filtered = bool(search) or any(value is not None for value in (locked, is_admin, active, min_balance, max_balance))
+        
+        if window.since is not None:
+            if window.expired:
+                return jsonify(reset_response(window))
+            # Users changed themselves (including lock changes) or through one of their accounts
+            changed = changed_keys(db_session.query(User).filter(or_(
+                User.updated_at >= window.changed_after,
+                User.user_id.in_(db_session.query(Account.user_id).filter(Account.updated_at >= window.changed_after))
+            )), User.user_id)
+            if changed is None:
+                return jsonify(reset_response(window))
+            rows = query.filter(User.user_id.in_(changed)).all() if changed else []
+            result = _serialize_users(db_session, rows, now)
+            removed = (set(changed) - {row['user_id'] for row in result}) | set(
+                db_manager.get_deleted_row_keys('users', window.changed_after))
+            return jsonify(delta_response('users', result, removed, window))
+        
+        sort_column = User.created_at if sort == 'created_at' else balance
+        rows, has_more = keyset_page(query, sort_column, User.user_id, descending, after, limit)
+        result = _serialize_users(db_session, rows, now)
+        
+        next_cursor = None
+        if has_more:
+            user, account, _ = rows[-1]
+            last_value = user.created_at if sort == 'created_at' else (account.balance if account and account.balance is not None else Decimal('0'))
+            next_cursor = encode_cursor(last_value, user.user_id)
+        total, total_is_estimate = estimate_total(db_session, query, 'users', filtered)
+        return jsonify({
+            'users': result,
+            'next_cursor': next_cursor,
+            'total': total,
+            'total_is_estimate': total_is_estimate,
+            'cursor': window.cursor
+        })
     finally:
         db_session.close()
 
 
+def _serialize_users(db_session, rows, now):
+    """JSON rows of (User, active Account, Lock) tuples for the users list"""
+    # Account counts of these users only
+    user_ids = [user.user_id for user, _, _ in rows]
+    account_counts = dict(db_session.query(Account.user_id, func.count(Account.account_number)).filter(
+        Account.user_id.in_(user_ids)
+    ).group_by(Account.user_id).all()) if user_ids else {}
+    
+    result = []
+    for user, account, lock_info in rows:
+        result.append({
+            'user_id': user.user_id,
+            'username': user.username if user.username else None,
+            'created_at': user.created_at.isoformat() if user.created_at else None,
+            'account_count': account_counts.get(user.user_id, 0),
+            'balance': float(account.balance) if account and account.balance is not None else 0.0,
+            'is_locked': lock_info is not None and now < lock_info.locked_until,
+            'lock_reason': lock_info.reason if lock_info else None,
+            'lock_until': lock_info.locked_until.isoformat() if lock_info and lock_info.locked_until else None,
+            'is_admin': user.is_admin if user.is_admin else False
+        })
+    return result
+
+
 @app.route('/api/users/<user_id>/lock', methods=['POST'])
 def api_lock_user(user_id):
     """Lock a user"""
@@ -230,30 +346,86 @@ def accounts():
 
 @app.route('/api/accounts')
 def api_accounts():
-    """API endpoint for accounts list - optimized (removed unnecessary transaction count)"""
+    """
+    API endpoint for accounts list, one keyset-paginated page at a time
+
+    Query parameters: limit, after (next_cursor of the previous page),
+    sort (created_at | balance), order (desc | asc), q (account number or
+    user id prefix, or username), active (true | false), min_balance,
+    max_balance.
+    
+    With since (the cursor of an earlier response) only the accounts changed
+    since then are returned: those matching the filters in accounts, the
+    rest (deleted, or no longer matching) in deleted.
+    """
+    try:
+        window = sync_window_from(request.args)
+        limit = parse_limit(request.args.get('limit'))
+        sort = request.args.get('sort', 'created_at')
+        if sort not in ('created_at', 'balance'):
+            raise PageRequestError(f"sort نامعتبر است: {sort}")
+        descending = request.args.get('order', 'desc') != 'asc'
+        after = decode_cursor(request.args['after'], sort) if request.args.get('after') else None
+        active = parse_bool(request.args.get('active'))
+        min_balance = parse_decimal(request.args.get('min_balance'))
+        max_balance = parse_decimal(request.args.get('max_balance'))
+    except PageRequestError as e:
+        return jsonify({'error': str(e)}), 400
+    search = request.args.get('q', '').strip()
+    
     db_session = db_manager.get_session()
     try:
-        # Get all accounts except admin/system accounts with user info
-        # Note: Removed transaction count query as it was causing performance issues
-        # and the count wasn't being displayed in the UI anyway
-        accounts_list = db_session.query(Account).options(
-            joinedload(Account.user)
+        # All accounts except admin/system accounts, with the owner's username
+        query = db_session.query(Account, User.username).outerjoin(
+            User, User.user_id == Account.user_id
         ).filter(
             Account.user_id != "admin",
             Account.account_number != "0000000000000001"
-        ).order_by(Account.created_at.desc()).all()
-        
-        result = []
-        for account in accounts_list:
-            result.append({
-                'account_number': account.account_number,
-                'user_id': account.user_id,
-                'username': account.user.username if account.user and account.user.username else None,
-                'balance': float(account.balance),
-                'is_active': account.is_active,
-                'created_at': account.created_at.isoformat() if account.created_at else None
-            })
-        return jsonify({'accounts': result})
+        )
+        if search:
+            query = query.filter(or_(
+                Account.account_number.like(f"{search}%"),
+                Account.user_id.like(f"{search}%"),
+                User.username.ilike(f"%{search}%")
+            ))
+        if active is not None:
+            query = query.filter(Account.is_active == active)
+        if min_balance is not None:
+            query = query.filter(Account.balance >= min_balance)
+        if max_balance is not None:
+            query = query.filter(Account.balance <= max_balance)
+        filtered = bool(search) or any(value is not None for value in (active, min_balance, max_balance))
+        
+        if window.since is not None:
+            if window.expired:
+                return jsonify(reset_response(window))
+            changed = changed_keys(db_session.query(Account).filter(
+                Account.updated_at >= window.changed_after
+            ), Account.account_number)
+            if changed is None:
+                return jsonify(reset_response(window))
+            rows = query.filter(Account.account_number.in_(changed)).all() if changed else []
+            result = [_serialize_account(account, username) for account, username in rows]
+            removed = (set(changed) - {row['account_number'] for row in result}) | set(
+                db_manager.get_deleted_row_keys('accounts', window.changed_after))
+            return jsonify(delta_response('accounts', result, removed, window))
+        
+        sort_column = Account.created_at if sort == 'created_at' else Account.balance
+        rows, has_more = keyset_page(query, sort_column, Account.account_number, descending, after, limit)
+        result = [_serialize_account(account, username) for account, username in rows]
+        
+        next_cursor = None
+        if has_more:
+            account, _ = rows[-1]
+            next_cursor = encode_cursor(getattr(account, sort), account.account_number)
+        total, total_is_estimate = estimate_total(db_session, query, 'accounts', filtered)
+        return jsonify({
+            'accounts': result,
+            'next_cursor': next_cursor,
+            'total': total,
+            'total_is_estimate': total_is_estimate,
+            'cursor': window.cursor
+        })
     except Exception as e:
         import logging
         logger = logging.getLogger(__name__)
@@ -263,6 +435,17 @@ def api_accounts():
         db_session.close()
 
 
+def _serialize_account(account, username):
+    return {
+        'account_number': account.account_number,
+        'user_id': account.user_id,
+        'username': username if username else None,
+        'balance': float(account.balance),
+        'is_active': account.is_active,
+        'created_at': account.created_at.isoformat() if account.created_at else None
+    }
+
+
 @app.route('/api/accounts/<account_number>/toggle', methods=['POST'])
 def api_toggle_account(account_number):
     """Activate/Deactivate an account"""
@@ -325,6 +508,35 @@ def api_reset_account_password(account_number):
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/accounts/<account_number>/statement')
+def api_account_statement(account_number):
+    """Download the account's statement over a Jalali date range as PDF or CSV"""
+    fmt = request.args.get('format', 'pdf')
+    if fmt not in FORMATS:
+        return jsonify({'error': 'نوع فایل نامعتبر است'}), 400
+    try:
+        start = parse_jalali_date(request.args.get('from', ''))
+        end = parse_jalali_date(request.args.get('to', '')) + timedelta(days=1)
+    except StatementRangeError:
+        return jsonify({'error': 'تاریخ نامعتبر است (مثال: 1403/01/01)'}), 400
+    if end <= start:
+        return jsonify({'error': 'تاریخ پایان قبل از تاریخ شروع است'}), 400
+    
+    try:
+        export = export_statement(db_manager, account_number, start, end, fmt)
+    except StatementTooLarge:
+        return jsonify({'error': f'فایل PDF حداکثر {config.STATEMENT_PDF_MAX_ROWS:,} تراکنش دارد؛ '
+                                 f'بازه کوتاه‌تر یا CSV را انتخاب کنید'}), 400
+    except Exception as e:
+        import logging
+        logger = logging.getLogger(__name__)
+        logger.error(f"Error exporting statement of {account_number}: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+    # The spooled file is streamed and closed by the response
+    return send_file(export.file, mimetype=export.content_type, as_attachment=True,
+                     download_name=export.filename)
+
+
 @app.route('/transactions')
 def transactions():
     """Transactions management page"""
@@ -345,29 +557,35 @@ def withdrawals():
 
 @app.route('/api/withdrawals')
 def api_withdrawals():
-    """API endpoint for withdrawal requests list"""
+    """
+    API endpoint for withdrawal requests list
+    
+    With since (the cursor of an earlier response) only the requests changed
+    since then are returned (those no longer matching status in deleted).
+    """
+    try:
+        window = sync_window_from(request.args)
+    except PageRequestError as e:
+        return jsonify({'error': str(e)}), 400
     session = db_manager.get_session()
     try:
         status = request.args.get('status', None)
-        withdrawals_list = db_manager.get_withdrawal_requests(status=status, limit=500)
+        if window.since is not None:
+            if window.expired:
+                return jsonify(reset_response(window))
+            changed_query = session.query(WithdrawalRequest).filter(WithdrawalRequest.updated_at >= window.changed_after)
+            changed = changed_keys(changed_query, WithdrawalRequest.id)
+            if changed is None:
+                return jsonify(reset_response(window))
+            rows = changed_query.filter(WithdrawalRequest.id.in_(changed)).order_by(WithdrawalRequest.created_at.desc()).all() if changed else []
+            result = [_serialize_withdrawal(w) for w in rows if not status or w.status == status]
+            removed = {str(key) for key in changed} - {str(row['id']) for row in result}
+            return jsonify(delta_response('withdrawals', result, removed, window))
         
-        result = []
-        for w in withdrawals_list:
-            result.append({
-                'id': w.id,
-                'user_id': w.user_id,
-                'account_number': w.account_number,
-                'amount_pers': float(w.amount_pers),
-                'amount_toman': float(w.amount_toman),
-                'sheba': w.sheba,
-                'status': w.status,
-                'transaction_id': w.transaction_id,
-                'confirmed_at': w.confirmed_at.isoformat() if w.confirmed_at else None,
-                'confirmed_by': w.confirmed_by,
-                'created_at': w.created_at.isoformat() if w.created_at else None
-            })
+        withdrawals_list = db_manager.get_withdrawal_requests(status=status, limit=500)
+        result = [_serialize_withdrawal(w) for w in withdrawals_list]
         
-        return jsonify({'withdrawals': result})
+        return jsonify({'withdrawals': result, 'cursor': window.cursor})
     except Exception as e:
         import logging
         logger = logging.getLogger(__name__)
@@ -377,9 +595,25 @@ def api_withdrawals():
         session.close()
 
 
+def _serialize_withdrawal(w):
+    return {
+        'id': w.id,
+        'user_id': w.user_id,
+        'account_number': w.account_number,
+        'amount_pers': float(w.amount_pers),
+        'amount_toman': float(w.amount_toman),
+        'sheba': w.sheba,
+        'status': w.status,
+        'transaction_id': w.transaction_id,
+        'confirmed_at': w.confirmed_at.isoformat() if w.confirmed_at else None,
+        'confirmed_by': w.confirmed_by,
+        'created_at': w.created_at.isoformat() if w.created_at else None
+    }
+
+
 @app.route('/api/withdrawals/<int:request_id>/confirm', methods=['POST'])
 def api_confirm_withdrawal(request_id):
-    """Confirm a withdrawal request and send confirmation message to user"""
+    """Confirm a withdrawal request and queue the confirmation message to the user"""
     try:
         # Get withdrawal request
         withdrawal = db_manager.get_withdrawal_request(request_id)
@@ -389,29 +623,24 @@ def api_confirm_withdrawal(request_id):
         if withdrawal.status != 'pending':
             return jsonify({'error': 'این درخواست قبلا پردازش شده است'}), 400
         
-        # Confirm the withdrawal
         confirmed_by = 'admin'  # You can get this from session if you have admin login
-        success = db_manager.confirm_withdrawal_request(request_id, confirmed_by)
+        # The confirmation and its message to the user commit together; the bot's outbox
+        # dispatcher sends the message and then marks the request completed
+        with db_manager.unit_of_work():
+            success = db_manager.confirm_withdrawal_request(request_id, confirmed_by)
+            if success:
+                notification_id = db_manager.enqueue_notification(
+                    withdrawal.user_id,
+                    create_withdrawal_confirmation_message(withdrawal),
+                    'withdrawal_confirmed',
+                    withdrawal_request_id=request_id
+                )
         
         if not success:
             return jsonify({'error': 'خطا در تایید درخواست'}), 500
         
-        # Send confirmation message to user via Telegram
-        try:
-            send_telegram_message(
-                user_id=withdrawal.user_id,
-                message=create_withdrawal_confirmation_message(withdrawal)
-            )
-        except Exception as e:
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.error(f"Error sending Telegram message: {e}", exc_info=True)
-            # Don't fail the request if message sending fails
-        
-        # Mark as completed after sending message
-        db_manager.complete_withdrawal_request(request_id)
-        
-        return jsonify({'success': True, 'message': 'درخواست با موفقیت تایید شد و پیام به کاربر ارسال شد'})
+        return jsonify({'success': True, 'message': 'درخواست تایید شد و پیام تایید در صف ارسال به کاربر قرار گرفت',
+                        'notification_id': notification_id})
     except Exception as e:
         import logging
         logger = logging.getLogger(__name__)
@@ -419,27 +648,45 @@ def api_confirm_withdrawal(request_id):
         return jsonify({'error': str(e)}), 500
 
 
-def send_telegram_message(user_id: str, message: str):
-    """Send a Telegram message to a user"""
-    try:
-        from telegram import Bot
-        import asyncio
-        
-        if not config.BOT_TOKEN:
-            raise Exception("BOT_TOKEN is not set")
-        
-        bot = Bot(token=config.BOT_TOKEN)
-        
-        # Run async function
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(bot.send_message(chat_id=user_id, text=message))
-        loop.close()
-    except Exception as e:
-        import logging
-        logger = logging.getLogger(__name__)
-        logger.error(f"Error sending Telegram message to {user_id}: {e}")
-        raise
+@app.route('/api/notifications/<int:message_id>')
+def api_notification_status(message_id):
+    """Delivery status of a message in the outbox"""
+    message = db_manager.get_outbox_message(message_id)
+    if not message:
+        return jsonify({'error': 'پیام یافت نشد'}), 404
+    return jsonify({
+        'id': message.id,
+        'chat_id': message.chat_id,
+        'kind': message.kind,
+        'status': message.status,
+        'attempts': message.attempts,
+        'last_error': message.last_error,
+        'created_at': message.created_at.isoformat() if message.created_at else None,
+        'sent_at': message.sent_at.isoformat() if message.sent_at else None
+    })
+
+
+@app.route('/api/notifications/<int:message_id>/retry', methods=['POST'])
+def api_retry_notification(message_id):
+    """Queue a dead-lettered message again"""
+    if not db_manager.retry_outbox_message(message_id):
+        return jsonify({'error': 'پیام در صف پیام‌های ناموفق نیست'}), 400
+    return jsonify({'success': True})
+
+
+@app.route('/api/metrics/outbox')
+def api_outbox_metrics():
+    """Pending, sent and dead-lettered outbox messages"""
+    return jsonify(db_manager.get_outbox_stats())
+
+
+@app.route('/api/metrics/rate_limiter')
+def api_rate_limiter_metrics():
+    """Telegram rate limiter queues and wait times; only when the bot runs in this process (run_all.py)"""
+    limiter = get_running_rate_limiter()
+    if limiter is None:
+        return jsonify({'error': 'ربات در این پردازه اجرا نمی‌شود'}), 404
+    return jsonify(limiter.snapshot())
 
 
 def create_withdrawal_confirmation_message(withdrawal: WithdrawalRequest) -> str:
@@ -460,7 +707,17 @@ def create_withdrawal_confirmation_message(withdrawal: WithdrawalRequest) -> str
 
 @app.route('/api/transactions')
 def api_transactions():
-    """API endpoint for transactions list"""
+    """
+    API endpoint for transactions list
+    
+    With since (the cursor of an earlier response) only the transactions
+    changed since then are returned: those matching the filters in
+    transactions, the rest (deleted, or no longer matching) in deleted.
+    """
+    try:
+        window = sync_window_from(request.args)
+    except PageRequestError as e:
+        return jsonify({'error': str(e)}), 400
     session = db_manager.get_session()
     try:
         # Get query parameters
@@ -483,28 +740,42 @@ def api_transactions():
         if status:
             query = query.filter(Transaction.status == status)
         
-        transactions_list = query.order_by(Transaction.created_at.desc()).limit(limit).all()
+        if window.since is not None:
+            if window.expired:
+                return jsonify(reset_response(window))
+            changed = changed_keys(session.query(Transaction).filter(
+                Transaction.updated_at >= window.changed_after
+            ), Transaction.id)
+            if changed is None:
+                return jsonify(reset_response(window))
+            rows = query.filter(Transaction.id.in_(changed)).order_by(Transaction.created_at.desc()).all() if changed else []
+            result = [_serialize_transaction(trans) for trans in rows]
+            removed = ({str(key) for key in changed} - {str(row['id']) for row in result}) | set(
+                db_manager.get_deleted_row_keys('transactions', window.changed_after))
+            return jsonify(delta_response('transactions', result, removed, window))
         
-        result = []
-        for trans in transactions_list:
-            # Ensure fee is properly converted from Decimal/None to float
-            fee_value = float(trans.fee) if trans.fee is not None else 0.0
-            result.append({
-                'id': trans.id,
-                'from_account': trans.from_account,
-                'to_account': trans.to_account,
-                'amount': float(trans.amount),
-                'fee': fee_value,
-                'transaction_type': trans.transaction_type,
-                'status': trans.status,
-                'created_at': trans.created_at.isoformat() if trans.created_at else None
-            })
+        transactions_list = query.order_by(Transaction.created_at.desc()).limit(limit).all()
+        result = [_serialize_transaction(trans) for trans in transactions_list]
         
-        return jsonify({'transactions': result})
+        return jsonify({'transactions': result, 'cursor': window.cursor})
     finally:
         session.close()
 
 
+def _serialize_transaction(trans):
+    return {
+        'id': trans.id,
+        'from_account': trans.from_account,
+        'to_account': trans.to_account,
+        'amount': float(trans.amount),
+        # Ensure fee is properly converted from Decimal/None to float
+        'fee': float(trans.fee) if trans.fee is not None else 0.0,
+        'transaction_type': trans.transaction_type,
+        'status': trans.status,
+        'created_at': trans.created_at.isoformat() if trans.created_at else None
+    }
+
+
 def create_app():
     """Create and configure the Flask app"""
     return app
@@ -526,4 +797,5 @@ if __name__ == '__main__':
     print("  از IP عمومی سرور خود استفاده کنید")
     print("  مطمئن شوید پورت 5000 در فایروال باز است")
     print("\n" + "="*60 + "\n")
+    event_streams.start()
     app.run(debug=False, host='0.0.0.0', port=5000)
@@ -0,0 +1,265 @@
+"""Server-sent events (/api/events) for the admin panel"""
+
+import asyncio
+import json
+import logging
+import threading
+from collections import deque
+from typing import Callable, Optional, Set
+
+import config
+from database.events import Event, EventBus, PostgresEventListener
+from web.utils import calculate_stats, stats_cache
+
+logger = logging.getLogger(__name__)
+
+# Event types that can change the dashboard statistics
+STATS_EVENT_TYPES = {'transaction', 'withdrawal', 'user'}
+
+
+def format_sse(data, event: str = None, id: int = None) -> str:
+    lines = []
+    if id is not None:
+        lines.append(f"id: {id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, default=str, separators=(',', ':'))}")
+    return '\n'.join(lines) + '\n\n'
+
+
+class _Client:
+    """One open stream: a bounded buffer of formatted messages"""
+
+    __slots__ = ('messages', 'wakeup', 'dropped')
+
+    def __init__(self, max_messages: int):
+        self.messages = deque(maxlen=max_messages)
+        self.wakeup = asyncio.Event()
+        self.dropped = 0
+
+    def put(self, message: str):
+        if len(self.messages) == self.messages.maxlen:
+            self.dropped += 1
+        self.messages.append(message)
+        self.wakeup.set()
+
+
+def _http_response(status: str, body: str) -> bytes:
+    return (f"HTTP/1.1 {status}\r\nContent-Type: application/json; charset=utf-8\r\n"
+            f"Access-Control-Allow-Origin: *\r\nConnection: close\r\n\r\n{body}").encode()
+
+
+class EventStreams:
+    """
+    SSE clients of this web process, all served by one asyncio loop
+
+    A blocked WSGI request thread per client would cap the admin panel at a
+    few hundred open tabs. Instead /api/events is served by a small HTTP
+    server on SSE_PORT running in a single thread (Flask redirects there):
+    every stream is a coroutine, and each event of the bus is formatted once
+    and fanned out to all of them. Streams keep up to SSE_QUEUE_SIZE
+    messages for a slow client, dropping the oldest beyond that.
+
+    Statistics come from the shared stats cache. They are read one cache
+    TTL after a change, when any cached value predating the change has
+    expired, and the figures that changed are sent to every client, so the
+    database sees one statistics query per TTL however many are connected.
+    """
+
+    def __init__(self, bus: EventBus, get_db: Callable):
+        self.bus = bus
+        self.get_db = get_db
+        self._lock = threading.Lock()
+        self._listeners = {}  # engine url -> PostgresEventListener
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server = None
+        self._clients: Set[_Client] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._stats: Optional[dict] = None
+        self._stats_dirty = False
+        self._stats_task: Optional[asyncio.Task] = None
+        self.port: Optional[int] = None
+        self.refused = 0
+        self.dropped = 0
+
+    @property
+    def clients(self) -> int:
+        return len(self._clients)
+
+    def start(self) -> int:
+        """Start the stream server if it is not running; returns its port"""
+        with self._lock:
+            if self._thread is None:
+                ready = threading.Event()
+                errors = []
+                self._thread = threading.Thread(target=self._run, args=(ready, errors), name='sse-server',
+                                                daemon=True)
+                self._thread.start()
+                ready.wait()
+                if errors:
+                    self._thread = None
+                    raise errors[0]
+                self.bus.add_listener(self._on_event)
+                self._start_listener(self.get_db().engine)
+            return self.port
+
+    def _run(self, ready: threading.Event, errors: list):
+        loop = asyncio.new_event_loop()
+        try:
+            self._server = loop.run_until_complete(
+                asyncio.start_server(self._handle, config.SSE_HOST, config.SSE_PORT)
+            )
+        except Exception as e:
+            errors.append(e)
+            loop.close()
+            ready.set()
+            return
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._loop = loop
+        logger.info(f"Event stream server listening on port {self.port}")
+        ready.set()
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
+
+    def stop(self):
+        """Close every stream and stop the server"""
+        with self._lock:
+            thread, loop = self._thread, self._loop
+            self._thread = None
+            if thread is None:
+                return
+            self.bus.remove_listener(self._on_event)
+        asyncio.run_coroutine_threadsafe(self._shutdown(), loop).result(timeout=5)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+        self._loop = None
+        self._stats = None
+
+    async def _shutdown(self):
+        self._server.close()
+        tasks = list(self._tasks) + ([self._stats_task] if self._stats_task else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self._server.wait_closed()
+
+    def _start_listener(self, engine):
+        # Writes of the bot process arrive through PostgreSQL NOTIFY; SQLite only has this process's events
+        if engine.dialect.name != 'postgresql' or not config.EVENT_BUS_PG_NOTIFY:
+            return
+        key = str(engine.url)
+        if key not in self._listeners:
+            self._listeners[key] = PostgresEventListener(self.bus, engine)
+            self._listeners[key].start()
+
+    def _on_event(self, event: Event):
+        # Runs in the publishing thread; hand the event to the loop without blocking
+        loop = self._loop
+        if loop is None:
+            return
+        try:
+            loop.call_soon_threadsafe(self._fan_out, event)
+        except RuntimeError:
+            # Loop closed by stop()
+            pass
+
+    def _broadcast(self, message: str):
+        for client in self._clients:
+            client.put(message)
+
+    def _fan_out(self, event: Event):
+        self._broadcast(format_sse(event.data, event=event.type, id=event.id))
+        if event.type in STATS_EVENT_TYPES:
+            self._stats_dirty = True
+            if self._stats_task is None:
+                self._stats_task = asyncio.ensure_future(self._refresh_stats())
+
+    async def _read_stats(self) -> dict:
+        return await asyncio.get_running_loop().run_in_executor(None, calculate_stats, self.get_db())
+
+    async def _refresh_stats(self):
+        try:
+            # Changes during a refresh are picked up by another round
+            while self._stats_dirty:
+                self._stats_dirty = False
+                await asyncio.sleep(stats_cache.ttl_seconds)
+                try:
+                    stats = await self._read_stats()
+                except Exception as e:
+                    logger.error(f"Error reading statistics for event streams: {e}")
+                    continue
+                last = self._stats or {}
+                changed = {key: value for key, value in stats.items() if last.get(key) != value}
+                self._stats = stats
+                if changed:
+                    self._broadcast(format_sse(changed, event='stats'))
+        finally:
+            self._stats_task = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        client = None
+        closed = None
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), 10)
+            method, _, target = request.split(b'\r\n', 1)[0].decode('latin1').partition(' ')
+            if method != 'GET' or target.split(' ')[0].split('?')[0] != '/api/events':
+                writer.write(_http_response('404 Not Found', '{"error":"not found"}'))
+                return
+            if len(self._clients) >= config.SSE_MAX_CLIENTS:
+                self.refused += 1
+                writer.write(_http_response('503 Service Unavailable', '{"error":"too many streams"}'))
+                return
+
+            client = _Client(config.SSE_QUEUE_SIZE)
+            self._clients.add(client)
+            # The panel is on another port, so the stream is a cross-origin request
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream; charset=utf-8\r\n"
+                         b"Cache-Control: no-cache\r\nX-Accel-Buffering: no\r\n"
+                         b"Access-Control-Allow-Origin: *\r\nConnection: close\r\n\r\n")
+            writer.write(f"retry: {int(config.SSE_HEARTBEAT_SECONDS * 1000)}\n\n".encode())
+            stats = await self._read_stats()
+            if self._stats is None:
+                self._stats = stats
+            writer.write(format_sse(stats, event='stats').encode())
+            await writer.drain()
+
+            # Completes when the client disconnects
+            closed = asyncio.ensure_future(reader.read())
+            while True:
+                if not client.messages:
+                    woken = asyncio.ensure_future(client.wakeup.wait())
+                    await asyncio.wait({woken, closed}, timeout=config.SSE_HEARTBEAT_SECONDS,
+                                       return_when=asyncio.FIRST_COMPLETED)
+                    woken.cancel()
+                    if closed.done():
+                        return
+                client.wakeup.clear()
+                if client.messages:
+                    writer.write(''.join(client.messages).encode())
+                    client.messages.clear()
+                else:
+                    writer.write(b": keepalive\n\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError):
+            pass
+        except Exception as e:
+            logger.error(f"Error in event stream: {e}")
+        finally:
+            if closed is not None:
+                closed.cancel()
+            if client is not None:
+                self._clients.discard(client)
+                self.dropped += client.dropped
+            writer.close()
+            self._tasks.discard(task)
+
+    def snapshot(self) -> dict:
+        clients = list(self._clients)
+        return {'clients': len(clients), 'refused': self.refused, 'max_clients': config.SSE_MAX_CLIENTS,
+                'dropped': self.dropped + sum(client.dropped for client in clients), 'port': self.port,
+                'bus': self.bus.snapshot()}
@@ -0,0 +1,115 @@
+"""Keyset pagination for the admin panel lists"""
+
+import base64
+import binascii
+import json
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from sqlalchemy import and_, func, or_, text
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# Filtered totals are counted up to this many rows, then reported as "at least"
+COUNT_CAP = 10000
+
+
+class PageRequestError(ValueError):
+    """Invalid page request parameter (HTTP 400)"""
+
+
+def parse_limit(value) -> int:
+    if value in (None, ''):
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(value)
+    except ValueError:
+        raise PageRequestError(f"limit نامعتبر است: {value}")
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def parse_bool(value):
+    """'true' / 'false' query parameters; None when not given"""
+    if value in (None, ''):
+        return None
+    if value.lower() in ('1', 'true', 'yes'):
+        return True
+    if value.lower() in ('0', 'false', 'no'):
+        return False
+    raise PageRequestError(f"مقدار نامعتبر: {value}")
+
+
+def parse_decimal(value):
+    if value in (None, ''):
+        return None
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise PageRequestError(f"عدد نامعتبر: {value}")
+
+
+def encode_cursor(sort_value, key) -> str:
+    """Opaque cursor for the row after which the next page starts"""
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat()
+    elif isinstance(sort_value, Decimal):
+        sort_value = str(sort_value)
+    raw = json.dumps([sort_value, key], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, sort: str):
+    """(sort_value, key) of a cursor made by encode_cursor for the same sort key"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        sort_value, key = json.loads(raw)
+        if sort == 'created_at':
+            sort_value = datetime.fromisoformat(sort_value)
+        else:
+            sort_value = Decimal(sort_value)
+        return sort_value, key
+    except (binascii.Error, ValueError, TypeError, InvalidOperation):
+        raise PageRequestError("cursor نامعتبر است")
+
+
+def keyset_page(query, sort_column, key_column, descending: bool, after, limit: int):
+    """
+    One page of query ordered by (sort_column, key_column)
+
+    after is the decoded cursor of the previous page's last row. The page
+    starts right after that row with a range condition on the ordering
+    columns, so deep pages cost the same as the first one (no OFFSET).
+    Returns (rows, has_more).
+    """
+    if after is not None:
+        sort_value, key = after
+        if descending:
+            query = query.filter(or_(sort_column < sort_value, and_(sort_column == sort_value, key_column < key)))
+        else:
+            query = query.filter(or_(sort_column > sort_value, and_(sort_column == sort_value, key_column > key)))
+    if descending:
+        query = query.order_by(sort_column.desc(), key_column.desc())
+    else:
+        query = query.order_by(sort_column.asc(), key_column.asc())
+    rows = query.limit(limit + 1).all()
+    return rows[:limit], len(rows) > limit
+
+
+def estimate_total(session, query, table_name: str, filtered: bool):
+    """
+    (total, is_estimate) for a list without reading all of it
+
+    Unfiltered lists on PostgreSQL use the planner's row estimate from
+    pg_class; otherwise matching rows are counted up to COUNT_CAP.
+    """
+    if not filtered and session.get_bind().dialect.name == 'postgresql':
+        estimate = session.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table)"),
+            {'table': table_name}
+        ).scalar()
+        # -1 until the table is first analyzed
+        if estimate is not None and estimate >= 0:
+            return int(estimate), True
+    capped = query.order_by(None).limit(COUNT_CAP + 1).subquery()
+    count = session.query(func.count()).select_from(capped).scalar()
+    return min(count, COUNT_CAP), count > COUNT_CAP
@@ -36,3 +36,51 @@ function showToast(message, type = 'info') {
 function confirmAction(message) {
     return confirm(message);
 }
+
+// Merge a "since" delta into a loaded list: changed rows replace their old copy
+// (or are added), deleted keys are removed
+function mergeDelta(rows, changedRows, deletedKeys, keyField, compare) {
+    const drop = new Set(deletedKeys.map(String));
+    changedRows.forEach(row => drop.add(String(row[keyField])));
+    const merged = rows.filter(row => !drop.has(String(row[keyField]))).concat(changedRows);
+    return compare ? merged.sort(compare) : merged;
+}
+
+// Append a page to a list, skipping rows a delta already added
+function appendPage(rows, pageRows, keyField) {
+    const seen = new Set(rows.map(row => String(row[keyField])));
+    return rows.concat(pageRows.filter(row => !seen.has(String(row[keyField]))));
+}
+
+// Comparator for lists sorted by sortField, then keyField
+function compareBy(sortField, keyField, descending) {
+    return (a, b) => {
+        const x = sortField === 'created_at' ? a[sortField] || '' : parseFloat(a[sortField]);
+        const y = sortField === 'created_at' ? b[sortField] || '' : parseFloat(b[sortField]);
+        let result = x < y ? -1 : x > y ? 1 : 0;
+        if (result === 0) result = String(a[keyField]) < String(b[keyField]) ? -1 : String(a[keyField]) > String(b[keyField]) ? 1 : 0;
+        return descending ? -result : result;
+    };
+}
+
+// Call onChange when /api/events pushes one of eventTypes (several events in a
+// row cause one call); while the stream is unavailable, poll every fallbackMs
+function liveUpdates(eventTypes, onChange, fallbackMs = 30000) {
+    let pending = null;
+    let polling = null;
+    const startPolling = () => { if (!polling) polling = setInterval(onChange, fallbackMs); };
+    const stopPolling = () => { if (polling) { clearInterval(polling); polling = null; } };
+    if (!window.EventSource) {
+        startPolling();
+        return null;
+    }
+    const source = new EventSource('/api/events');
+    // After a (re)connect, catch up on what was missed while disconnected
+    source.onopen = () => { stopPolling(); onChange(); };
+    // The browser reconnects by itself unless the server refused the stream
+    source.onerror = startPolling;
+    eventTypes.forEach(type => source.addEventListener(type, () => {
+        if (!pending) pending = setTimeout(() => { pending = null; onChange(); }, 300);
+    }));
+    return source;
+}
@@ -0,0 +1,64 @@
+"""Change sync ("since" cursors) for the admin panel lists"""
+
+from datetime import datetime, timedelta
+
+import config
+from web.pagination import PageRequestError
+
+# More changed rows than this and the client reloads the list instead
+MAX_DELTA_ROWS = 1000
+
+
+class SyncWindow:
+    """
+    The changes a client with cursor since has not seen yet
+
+    cursor is taken before the rows are read and goes back to the client
+    for its next request. Rows are selected from SYNC_OVERLAP_SECONDS before
+    since, so a write that committed after the previous read but carries an
+    earlier updated_at is still picked up; clients merge rows by key, so
+    rows sent twice do no harm.
+    """
+
+    def __init__(self, since: datetime = None):
+        now = datetime.utcnow()
+        self.cursor = encode_sync_cursor(now)
+        self.since = since
+        self.changed_after = since - timedelta(seconds=config.SYNC_OVERLAP_SECONDS) if since else None
+        # Deletions older than the tombstone retention are gone; such a client must reload
+        self.expired = since is not None and since < now - timedelta(hours=config.SYNC_TOMBSTONE_RETENTION_HOURS)
+
+
+def encode_sync_cursor(moment: datetime) -> str:
+    return moment.isoformat()
+
+
+def decode_sync_cursor(value: str) -> datetime:
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise PageRequestError("since نامعتبر است")
+
+
+def sync_window_from(args) -> SyncWindow:
+    """SyncWindow of a request's since parameter (no since: a full load)"""
+    since = args.get('since')
+    return SyncWindow(decode_sync_cursor(since) if since else None)
+
+
+def changed_keys(query, key_column):
+    """
+    Keys selected by query (already restricted to changed rows), or None if
+    there are more than MAX_DELTA_ROWS and the client should reload
+    """
+    keys = [row[0] for row in query.with_entities(key_column).limit(MAX_DELTA_ROWS + 1).all()]
+    return None if len(keys) > MAX_DELTA_ROWS else keys
+
+
+def delta_response(key: str, rows, removed, window: SyncWindow) -> dict:
+    return {key: rows, 'deleted': sorted(removed), 'cursor': window.cursor, 'reset': False}
+
+
+def reset_response(window: SyncWindow) -> dict:
+    """Too much changed (or the cursor is too old) to send as a delta"""
+    return {'deleted': [], 'cursor': window.cursor, 'reset': True}
@@ -1,7 +1,8 @@
-from datetime import datetime, timedelta
-from database.models import User, Account, Transaction, Lock
-from sqlalchemy import func
+from datetime import datetime
 import logging
+import threading
+import time
+import config
 
 logger = logging.getLogger(__name__)
 
@@ -20,75 +21,79 @@ def format_date(date_obj):
     return date_obj.strftime('%Y-%m-%d %H:%M:%S')
 
 
+class SingleFlightCache:
+    """
+    Values kept for ttl_seconds, computed by at most one thread per key at a time
+
+    When a value expires, the first caller recomputes it; callers arriving
+    meanwhile get the previous value (or wait for the first one if there is
+    none yet) instead of running the same computation again.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._values = {}  # key -> (value, expires_at)
+        self._refreshing = {}  # key -> Event set when the running computation ends
+        self.hits = 0
+        self.computations = 0
+        self.waits = 0
+
+    def get(self, key, compute):
+        while True:
+            with self._lock:
+                cached = self._values.get(key)
+                if cached and time.monotonic() < cached[1]:
+                    self.hits += 1
+                    return cached[0]
+                refreshing = self._refreshing.get(key)
+                if refreshing is None:
+                    refreshing = self._refreshing[key] = threading.Event()
+                    self.computations += 1
+                    break
+                if cached:
+                    # Someone is already refreshing it; the previous value is good enough
+                    self.hits += 1
+                    return cached[0]
+                self.waits += 1
+            refreshing.wait()
+            with self._lock:
+                if key in self._values:
+                    return self._values[key][0]
+            # The computation failed; try it ourselves
+
+        try:
+            value = compute()
+            with self._lock:
+                self._values[key] = (value, time.monotonic() + self.ttl_seconds)
+            return value
+        finally:
+            with self._lock:
+                self._refreshing.pop(key).set()
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._values.clear()
+            else:
+                self._values.pop(key, None)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {'hits': self.hits, 'computations': self.computations, 'waits': self.waits,
+                    'ttl_seconds': self.ttl_seconds}
+
+
+# Shared by every request thread, so admins polling /api/stats cause one query per TTL
+stats_cache = SingleFlightCache(config.STATS_CACHE_TTL_SECONDS)
+
+
 def calculate_stats(db_manager):
-    """Calculate statistics for dashboard"""
-    session = db_manager.get_session()
+    """Calculate statistics for dashboard (cached for STATS_CACHE_TTL_SECONDS)"""
     try:
-        # Total users
-        total_users = session.query(User).count()
-        
-        # Total accounts
-        total_accounts = session.query(Account).count()
-        active_accounts = session.query(Account).filter(Account.is_active == True).count()
-        
-        # Total transactions
-        total_transactions = session.query(Transaction).count()
-        pending_transactions = session.query(Transaction).filter(Transaction.status == 'pending').count()
-        success_transactions = session.query(Transaction).filter(Transaction.status == 'success').count()
-        
-        # Total balance
-        accounts = session.query(Account).all()
-        total_balance = sum(float(acc.balance) if acc.balance is not None else 0.0 for acc in accounts)
-        
-        # Transactions by type
-        buy_count = session.query(Transaction).filter(Transaction.transaction_type == 'buy').count()
-        sell_count = session.query(Transaction).filter(Transaction.transaction_type == 'sell').count()
-        send_count = session.query(Transaction).filter(Transaction.transaction_type == 'send').count()
-        
-        # Recent transactions (last 24 hours)
-        yesterday = datetime.utcnow() - timedelta(days=1)
-        recent_transactions = session.query(Transaction).filter(
-            Transaction.created_at >= yesterday
-        ).count()
-        
-        # Locked users
-        locked_users = session.query(Lock).filter(
-            Lock.locked_until > datetime.utcnow()
-        ).count()
-        
-        # Get current admin account number
-        admin_account_number = db_manager.get_admin_account_number()
-        admin_balance = 0.0
-        if admin_account_number:
-            admin_account = session.query(Account).filter(
-                Account.account_number == admin_account_number
-            ).first()
-            if admin_account:
-                admin_balance = float(admin_account.balance) if admin_account.balance is not None else 0.0
-        
-        # Total fees collected (sum of all fees from successful transactions)
-        total_fees = session.query(func.sum(Transaction.fee)).filter(
-            Transaction.status == 'success'
-        ).scalar()
-        total_fees = float(total_fees) if total_fees is not None else 0.0
-        
-        return {
-            'total_users': total_users,
-            'total_accounts': total_accounts,
-            'active_accounts': active_accounts,
-            'total_transactions': total_transactions,
-            'pending_transactions': pending_transactions,
-            'success_transactions': success_transactions,
-            'total_balance': total_balance,
-            'buy_count': buy_count,
-            'sell_count': sell_count,
-            'send_count': send_count,
-            'recent_transactions': recent_transactions,
-            'locked_users': locked_users,
-            'admin_account_number': admin_account_number or 'ندارد',
-            'admin_balance': admin_balance,
-            'total_fees': total_fees
-        }
+        stats = dict(stats_cache.get(str(db_manager.engine.url), db_manager.get_dashboard_stats))
+        stats['admin_account_number'] = stats['admin_account_number'] or 'ندارد'
+        return stats
     except Exception as e:
         logger.error(f"Error calculating stats: {e}", exc_info=True)
         # Return default values on error
@@ -109,5 +114,3 @@ def calculate_stats(db_manager):
             'admin_balance': 0.0,
             'total_fees': 0.0
         }
-    finally:
-        session.close()